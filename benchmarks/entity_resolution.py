@@ -0,0 +1,184 @@
+"""
+Benchmark of the `EntityResolver` on a synthetic graph seeded with near-duplicate entities, reporting the reduction
+in node and edge count, the candidates generated by each blocking strategy, the precision and recall of the merges
+(pairs of names merged together, against the variants each canonical name was generated from) and the time taken.
+
+Each canonical entity (i.e. `Kavenra Harbor`) is mentioned under variants: with an article (`The Kavenra Harbor`),
+a legal form (`Kavenra Harbor Spa`), accents (`Kávenra Harbor`), which share its blocking key, and typos (`Kavenr Harbor`),
+which only nearest neighbours of name embeddings can catch. Names are embedded with hashed character trigrams,
+so that similar spellings get similar vectors offline; Chunk embeddings are the deterministic fake ones.
+The graph is the embedded `InMemoryKnowledgeGraph`, or a real Neo4j (with APOC) given with `--neo4j-uri`.
+
+Usage (from the root of the repository):
+
+    python -m benchmarks.entity_resolution --entities 500 --mentions 5000
+    python -m benchmarks.entity_resolution --similarity-threshold 0.85 --min-name-similarity 0.85
+    python -m benchmarks.entity_resolution --no-embeddings
+    python -m benchmarks.entity_resolution --neo4j-uri bolt://localhost:7687 --neo4j-password password123
+
+Against a real database, use an empty one: documents are written to it.
+"""
+import argparse
+import itertools
+import numpy as np
+
+from hashlib import md5
+from typing import Dict, List, Set, Tuple
+
+from langchain_core.embeddings import Embeddings
+from langchain_neo4j.graphs.graph_document import Node, Relationship
+
+from benchmarks.ingestion import entity_names
+from src.config import EmbedderConf, EntityResolutionConf, FakeModelConf, GraphBackend, KnowledgeGraphConfig
+from src.factory.embeddings import get_embeddings
+from src.factory.graph import get_knowledge_graph
+from src.ingestion.entity_resolver import EntityResolver
+from src.schema import Chunk, ProcessedDocument
+
+
+_KINDS = ["Harbor", "Council", "Archive", "Bank", "Market", "Treaty"]
+_ACCENTS = {"a": "á", "e": "é", "o": "ó", "u": "ú"}
+
+
+class TrigramEmbeddings(Embeddings):
+    """ Hashed character trigrams of the lowercased text, L2-normalized: similar spellings get similar vectors. """
+
+    def __init__(self, dimensions: int = 256):
+        self.dimensions = dimensions
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.dimensions)
+        padded = f"  {text.lower()} "
+        for i in range(len(padded) - 2):
+            vector[int(md5(padded[i:i + 3].encode("utf-8")).hexdigest()[:8], 16) % self.dimensions] += 1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+def variants(name: str, args: argparse.Namespace, rng: np.random.Generator) -> List[str]:
+    """ The canonical name with its variants: article, legal form, accents and, with probability `--typo-rate`, a typo. """
+    names = [name, f"The {name}", f"{name} Spa", "".join(_ACCENTS.get(c, c) if i == 1 else c for i, c in enumerate(name))]
+    if rng.random() < args.typo_rate:
+        first = name.split()[0]
+        position = int(rng.integers(1, len(first)))
+        names.append(first[:position] + first[position + 1:] + name[len(first):])
+    return list(dict.fromkeys(names))
+
+
+def synthetic_docs(args: argparse.Namespace, rng: np.random.Generator) -> Tuple[List[ProcessedDocument], Dict[str, str]]:
+    """ Documents whose Chunks mention random variants of canonical entities, related in order of mention. """
+    canonical = [f"{name} {rng.choice(_KINDS)}" for name in entity_names(args.entities, rng)]
+    truth = {variant: name for name in canonical for variant in variants(name, args, rng)}
+    pool = list(truth)
+    embeddings = get_embeddings(EmbedderConf(type="fake", model="fake", fake_conf=FakeModelConf(dimensions=64, seed=args.seed)))
+
+    docs = []
+    mentions_per_chunk = 5
+    n_chunks = args.mentions // mentions_per_chunk
+    for d, chunk_ids in enumerate(np.array_split(np.arange(n_chunks), args.docs)):
+        chunks = []
+        for chunk_id in range(1, len(chunk_ids) + 1):
+            names = list(dict.fromkeys(rng.choice(pool, size=mentions_per_chunk)))
+            nodes = [Node(id=name, type="Organization", properties={"name": name}) for name in names]
+            text = f"Chunk {chunk_id} of document {d} mentions " + ", ".join(names) + "."
+            chunks.append(
+                Chunk(
+                    chunk_id=chunk_id,
+                    text=text,
+                    embedding=embeddings.embed_query(text),
+                    embeddings_model="fake",
+                    nodes=nodes,
+                    relationships=[Relationship(source=a, target=b, type="RELATED_TO") for a, b in zip(nodes, nodes[1:])]
+                )
+            )
+        docs.append(ProcessedDocument(filename=f"doc_{d:05d}.txt", chunks=chunks))
+    return docs, truth
+
+
+def merged_pairs(entities: List[dict]) -> Set[Tuple[str, str]]:
+    """ Pairs of names merged into the same entity, from the surviving entities and their aliases. """
+    pairs = set()
+    for entity in entities:
+        names = sorted({entity["id"], *(entity["aliases"] or [])})
+        pairs.update(itertools.combinations(names, 2))
+    return pairs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entities", type=int, default=300, help="canonical entities, each mentioned under several variants")
+    parser.add_argument("--mentions", type=int, default=5000, help="entity mentions across the corpus")
+    parser.add_argument("--docs", type=int, default=20, help="documents of the corpus")
+    parser.add_argument("--typo-rate", type=float, default=0.5, help="share of canonical entities with a misspelled variant too")
+    parser.add_argument("--no-embeddings", action="store_true", help="generate candidates by blocking key only")
+    parser.add_argument("--similarity-threshold", type=float, default=EntityResolutionConf().similarity_threshold)
+    parser.add_argument("--min-name-similarity", type=float, default=EntityResolutionConf().min_name_similarity)
+    parser.add_argument("--n-neighbours", type=int, default=EntityResolutionConf().n_neighbours)
+    parser.add_argument("--neo4j-uri", type=str, default=None, help="real Neo4j to seed and resolve, embedded in-memory graph if omitted")
+    parser.add_argument("--neo4j-user", type=str, default="neo4j")
+    parser.add_argument("--neo4j-password", type=str, default="password")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    docs, truth = synthetic_docs(args, rng)
+    knowledge_graph = get_knowledge_graph(
+        conf=KnowledgeGraphConfig(
+            uri=args.neo4j_uri or "bolt://localhost:7687",
+            user=args.neo4j_user,
+            password=args.neo4j_password,
+            backend=GraphBackend.NEO4J if args.neo4j_uri else GraphBackend.MEMORY
+        ),
+        embeddings_model=TrigramEmbeddings()
+    )
+    knowledge_graph.add_documents(docs)
+
+    before = {
+        "entities": len(knowledge_graph.get_entities()),
+        "nodes": knowledge_graph.number_of_nodes,
+        "edges": knowledge_graph.number_of_relationships
+    }
+    resolver = EntityResolver(
+        EntityResolutionConf(
+            use_embeddings=not args.no_embeddings,
+            similarity_threshold=args.similarity_threshold,
+            min_name_similarity=args.min_name_similarity,
+            n_neighbours=args.n_neighbours
+        ),
+        embeddings=knowledge_graph.embeddings
+    )
+    stats = resolver.resolve(knowledge_graph)
+    entities = knowledge_graph.get_entities()
+    after = {"entities": len(entities), "nodes": knowledge_graph.number_of_nodes, "edges": knowledge_graph.number_of_relationships}
+
+    # only the names actually mentioned can be merged
+    mentioned = sorted({node.id for doc in docs for chunk in doc.chunks for node in chunk.nodes}, key=truth.get)
+    predicted = merged_pairs(entities)
+    expected = {
+        pair for _, names in itertools.groupby(mentioned, key=truth.get) for pair in itertools.combinations(sorted(names), 2)
+    }
+    correct = len(predicted & expected)
+
+    print(f"{len(truth)} names of {args.entities} canonical entities, {sum(len(doc.chunks) for doc in docs)} chunks, database: {args.neo4j_uri or 'embedded in-memory graph'}")
+    print(f"\n{'':<10}{'before':>10}{'after':>10}{'reduction':>12}")
+    for name in ("entities", "nodes", "edges"):
+        print(f"{name:<10}{before[name]:>10}{after[name]:>10}{1 - after[name] / before[name]:>12.1%}")
+    print(
+        f"\ncandidates: {stats.key_candidates} by blocking key, {stats.embedding_candidates} by embeddings; "
+        f"{stats.merged} duplicates merged into {stats.clusters} entities in {stats.seconds:.2f}s"
+    )
+    print(
+        f"pairwise precision {correct / len(predicted) if predicted else 1.0:.3f}, "
+        f"recall {correct / len(expected) if expected else 1.0:.3f}"
+    )
+    knowledge_graph.close()
+
+
+if __name__ == "__main__":
+    main()
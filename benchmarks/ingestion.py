@@ -0,0 +1,205 @@
+"""
+Benchmark of the ingestion pipeline (`LocalIngestor` -> `Cleaner` -> `Chunker` -> `ChunkEmbedder` -> `GraphMiner`
+-> `KnowledgeGraph.add_documents`) on synthetic corpora of increasing size, reporting for each stage
+docs/sec, chunks/sec, database round trips and the peak RSS of the process.
+
+Embeddings and graph extraction are the deterministic, offline models of type `fake` (see `src.factory.fake`),
+with configurable latency and error rate; the database is an in-memory stand-in accepting every query,
+or a real Neo4j (i.e. the `neo4j` service of `docker-compose.yml`) with `--neo4j-uri`, 
+or the embedded `InMemoryKnowledgeGraph` with `--backend memory`.
+With `--checkpoints`, stages are checkpointed (see `IngestionCheckpoints`) and each corpus is ingested twice,
+the second time resuming from the checkpoints of the first: the cost of writing and of reading them back.
+
+Usage (from the root of the repository):
+
+    python -m benchmarks.ingestion --sizes 10 50 200 --llm-latency 0.2 --embedding-latency 0.02
+    python -m benchmarks.ingestion --llm-latency 0.2 --llm-jitter 0.3 --llm-error-rate 0.05
+    python -m benchmarks.ingestion --neo4j-uri bolt://localhost:7687 --neo4j-password password123
+    python -m benchmarks.ingestion --backend memory
+    python -m benchmarks.ingestion --llm-latency 0.2 --checkpoints
+
+Against a real database, use an empty one: documents are written to it.
+"""
+import argparse
+import os
+import resource
+import sys
+import tempfile
+import time
+import numpy as np
+
+from typing import Callable, List, Optional
+
+from benchmarks.stand_ins import recording_neo4j
+from src.config import CheckpointConf, ChunkerConf, EmbedderConf, FakeModelConf, KnowledgeGraphConfig, LLMConf, Source
+from src.factory.graph import get_knowledge_graph
+from src.ingestion.checkpoints import IngestionCheckpoints
+from src.ingestion.chunker import Chunker
+from src.ingestion.cleaner import Cleaner
+from src.ingestion.embedder import ChunkEmbedder
+from src.ingestion.graph_miner import GraphMiner
+from src.ingestion.local_ingestor import LocalIngestor
+from src.schema import ProcessedDocument
+
+
+_SYLLABLES = ["ka", "lo", "mi", "ra", "ven", "tor", "sel", "dra", "nu", "fe", "gor", "thal"]
+_WORDS = [
+    "the", "of", "and", "a", "to", "in", "is", "was", "for", "with", "as", "by", "on", "that", "from",
+    "system", "report", "process", "river", "market", "council", "treaty", "archive", "engine", "harbor",
+    "signed", "built", "described", "moved", "managed", "studied", "expanded", "opened", "during", "after",
+]
+
+
+def entity_names(n: int, rng: np.random.Generator) -> List[str]:
+    names = set()
+    while len(names) < n:
+        names.add("".join(rng.choice(_SYLLABLES, size=rng.integers(2, 4))).capitalize())
+    return sorted(names)
+
+
+def synthetic_text(paragraphs: int, entities: List[str], rng: np.random.Generator) -> str:
+    """ Text of `paragraphs` paragraphs of random sentences, each mentioning entities from a shared pool. """
+    text = []
+    for _ in range(paragraphs):
+        sentences = []
+        for _ in range(rng.integers(4, 8)):
+            words = list(rng.choice(_WORDS, size=rng.integers(8, 16)))
+            for position in rng.integers(0, len(words), size=2):
+                words[position] = rng.choice(entities)
+            sentences.append(" ".join(words).capitalize() + ".")
+        text.append(" ".join(sentences))
+    return "\n\n".join(text)
+
+
+def synthetic_corpus(folder: str, n_docs: int, paragraphs: int, entities: List[str], rng: np.random.Generator):
+    """ Writes `n_docs` text files of `paragraphs` paragraphs, mentioning entities from a shared pool. """
+    for i in range(n_docs):
+        with open(os.path.join(folder, f"doc_{i:05d}.txt"), "w") as f:
+            f.write(synthetic_text(paragraphs, entities, rng))
+
+
+def peak_rss_mb() -> float:
+    """ Peak resident set size of the process so far (`ru_maxrss` is in KB on Linux, bytes on macOS). """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_pipeline(folder: str, args: argparse.Namespace, checkpoint_path: Optional[str] = None) -> List[dict]:
+    checkpoints = IngestionCheckpoints(CheckpointConf(path=checkpoint_path, keep_completed=True)) if checkpoint_path else None
+    embedder = ChunkEmbedder(
+        conf=EmbedderConf(
+            type="fake", 
+            model="fake", 
+            fake_conf=FakeModelConf(dimensions=args.dimensions, latency=args.embedding_latency, seed=args.seed)
+        )
+    )
+    graph_miner = GraphMiner(
+        conf=LLMConf(
+            type="fake", 
+            model="fake", 
+            fake_conf=FakeModelConf(
+                latency=args.llm_latency, 
+                latency_jitter=args.llm_jitter, 
+                error_rate=args.llm_error_rate, 
+                seed=args.seed
+            )
+        ),
+        checkpoints=checkpoints
+    )
+
+    with recording_neo4j(in_memory=args.neo4j_uri is None) as drivers:
+        knowledge_graph = get_knowledge_graph(
+            conf=KnowledgeGraphConfig(
+                uri=args.neo4j_uri or "bolt://localhost:7687",
+                user=args.neo4j_user,
+                password=args.neo4j_password,
+                backend=args.backend
+            ),
+            embeddings_model=embedder.embeddings,
+            refresh_schema=False
+        )
+
+        ingestor = LocalIngestor(source=Source(folder=folder))
+        cleaner = Cleaner()
+        chunker = Chunker(conf=ChunkerConf(type="recursive", chunk_size=args.chunk_size, chunk_overlap=args.chunk_overlap))
+
+        stages: List[tuple[str, Callable[[List[ProcessedDocument]], List[ProcessedDocument]]]] = [
+            ("load", lambda _: checkpoints.resume(ingestor.batch_ingest()) if checkpoints else ingestor.batch_ingest()),
+            ("clean", cleaner.clean_documents),
+            ("chunk", chunker.chunk_documents),
+            ("embed", embedder.embed_documents_chunks),
+            ("mine", lambda docs: graph_miner.mine_graph_from_docs(docs=docs)),
+            ("store", lambda docs: knowledge_graph.add_documents(docs) or docs),
+        ]
+
+        docs: List[ProcessedDocument] = []
+        results = []
+        for name, stage in stages:
+            round_trips = sum(driver.round_trips for driver in drivers)
+            start = time.perf_counter()
+            docs = checkpoints.run(name, docs, stage) if checkpoints and name != "load" else stage(docs)
+            seconds = time.perf_counter() - start
+            chunks = sum(len(doc.chunks or []) for doc in docs)
+            results.append({
+                "stage": name,
+                "seconds": seconds,
+                "docs_per_sec": len(docs) / seconds if seconds else float("inf"),
+                "chunks_per_sec": chunks / seconds if chunks and seconds else float("nan"),
+                "round_trips": sum(driver.round_trips for driver in drivers) - round_trips,
+                "peak_rss_mb": peak_rss_mb(),
+            })
+
+        knowledge_graph._driver.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 50, 100], help="number of documents of each corpus")
+    parser.add_argument("--paragraphs", type=int, default=20, help="paragraphs per document")
+    parser.add_argument("--entities", type=int, default=500, help="size of the pool of entity names")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--chunk-overlap", type=int, default=100)
+    parser.add_argument("--dimensions", type=int, default=768, help="dimensions of fake embeddings")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="seconds per graph extraction call")
+    parser.add_argument("--llm-jitter", type=float, default=0.0, help="maximum random seconds added to each graph extraction call")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0, help="share of graph extraction calls failing")
+    parser.add_argument("--embedding-latency", type=float, default=0.0, help="seconds per embedding call")
+    parser.add_argument("--backend", type=str, choices=["neo4j", "memory"], default="neo4j", help="graph backend, `memory` for the embedded graph")
+    parser.add_argument("--neo4j-uri", type=str, default=None, help="real Neo4j to write to, in-memory stand-in if omitted")
+    parser.add_argument("--neo4j-user", type=str, default="neo4j")
+    parser.add_argument("--neo4j-password", type=str, default="password")
+    parser.add_argument("--checkpoints", action="store_true", help="checkpoint stages, then ingest each corpus again resuming from them")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    entities = entity_names(args.entities, rng)
+    backend = "embedded in-memory graph" if args.backend == "memory" else args.neo4j_uri or "in-memory stand-in"
+    print(
+        f"LLM latency {args.llm_latency}s (+ up to {args.llm_jitter}s, {args.llm_error_rate:.0%} errors), "
+        f"embedding latency {args.embedding_latency}s, database: {backend}"
+    )
+
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as folder, tempfile.TemporaryDirectory() as checkpoint_path:
+            synthetic_corpus(folder, size, args.paragraphs, entities, rng)
+            runs = [("", run_pipeline(folder, args, checkpoint_path if args.checkpoints else None))]
+            if args.checkpoints:
+                runs.append((", resumed from checkpoints", run_pipeline(folder, args, checkpoint_path)))
+
+        for label, results in runs:
+            total = sum(result["seconds"] for result in results)
+            print(f"\n{size} documents{label}, {total:.2f}s end to end ({size / total:.2f} docs/sec)")
+            print(f"{'stage':<8}{'seconds':>10}{'docs/sec':>12}{'chunks/sec':>13}{'round trips':>14}{'peak RSS MB':>14}")
+            for result in results:
+                print(
+                    f"{result['stage']:<8}{result['seconds']:>10.3f}{result['docs_per_sec']:>12.1f}"
+                    f"{result['chunks_per_sec']:>13.1f}{result['round_trips']:>14}{result['peak_rss_mb']:>14.1f}"
+                )
+
+    print("\nPeak RSS is the peak of the whole process so far, so it only grows across stages and corpora.")
+
+
+if __name__ == "__main__":
+    main()
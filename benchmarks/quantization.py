@@ -0,0 +1,134 @@
+"""
+Benchmark of quantized vector storage in the local index: memory saved and recall lost
+compared with exact `float32` search, with and without full precision rescoring.
+
+Usage (from the root of the repository):
+
+    python -m benchmarks.quantization --vectors 20000 --dimensions 1536 --k 10
+    python -m benchmarks.quantization --from-index .cache/index/chunks
+
+With `--from-index`, the vectors of a persisted local index are used instead of synthetic clustered ones,
+and queries are perturbed copies of indexed vectors.
+"""
+import argparse
+import tempfile
+import time
+import numpy as np
+
+from typing import Optional
+
+from src.config import QuantizationType
+from src.index.ivf import IVFIndex
+from src.index.quantization import QuantizedVectors
+
+
+def synthetic_vectors(n: int, dimensions: int, clusters: int, rng: np.random.Generator) -> np.ndarray:
+    """ Clustered gaussian vectors, closer to real embeddings than uniform noise. """
+    centers = rng.normal(size=(clusters, dimensions))
+    vectors = centers[rng.integers(clusters, size=n)] + 0.6 * rng.normal(size=(n, dimensions))
+    return vectors.astype(np.float32)
+
+
+def load_index_vectors(path: str) -> np.ndarray:
+    storage = QuantizedVectors.load(path)
+    return storage.get(np.arange(len(storage)))
+
+
+def run(
+    vectors: np.ndarray,
+    queries: np.ndarray,
+    k: int,
+    quantization: Optional[QuantizationType],
+    rescore: bool,
+    ivf: bool,
+    truth: np.ndarray
+) -> dict:
+    def new_index() -> IVFIndex:
+        return IVFIndex(
+            n_probe=8,
+            min_train_size=1024 if ivf else len(vectors) + 1,
+            quantization=quantization,
+            rescore=rescore
+        )
+
+    index = new_index()
+    index.add([str(i) for i in range(len(vectors))], vectors, [""] * len(vectors))
+    if ivf:
+        index.train()
+
+    # measure the index as it is served: persisted and loaded back, with full precision vectors memory-mapped
+    with tempfile.TemporaryDirectory() as path:
+        index.save(path)
+        index = new_index()
+        index.load(path)
+        return _evaluate(index, queries, k, truth)
+
+
+def _evaluate(index: IVFIndex, queries: np.ndarray, k: int, truth: np.ndarray) -> dict:
+    recalls, latencies = [], []
+    for query, expected in zip(queries, truth):
+        start = time.perf_counter()
+        results = index.search(query, k=k)
+        latencies.append(time.perf_counter() - start)
+        recalls.append(len({int(id) for id, _, _, _ in results} & set(expected)) / k)
+
+    return {
+        "bytes_per_vector": index.nbytes / len(index),
+        "recall": float(np.mean(recalls)),
+        "latency_ms": 1000 * float(np.mean(latencies)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectors", type=int, default=20000, help="number of synthetic vectors")
+    parser.add_argument("--dimensions", type=int, default=1536, help="dimensions of synthetic vectors")
+    parser.add_argument("--clusters", type=int, default=100, help="clusters of synthetic vectors")
+    parser.add_argument("--from-index", type=str, default=None, help="directory of a persisted local index")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--ivf", action="store_true", help="probe IVF clusters instead of scanning every vector")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    if args.from_index:
+        vectors = load_index_vectors(args.from_index)
+    else:
+        vectors = synthetic_vectors(args.vectors, args.dimensions, args.clusters, rng)
+
+    queries = vectors[rng.integers(len(vectors), size=args.queries)]
+    queries = queries + 0.3 * np.std(vectors) * rng.normal(size=queries.shape).astype(np.float32)
+
+    # ground truth: exact float32 cosine similarity
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    truth = []
+    for query in queries:
+        scores = normalized @ (query / np.linalg.norm(query))
+        truth.append(np.argpartition(-scores, args.k - 1)[: args.k])
+
+    print(f"{len(vectors)} vectors of {vectors.shape[1]} dimensions, {len(queries)} queries, recall@{args.k}")
+    print(f"{'storage':<18}{'bytes/vector':>14}{'memory saved':>15}{'recall':>10}{'recall lost':>14}{'ms/query':>11}")
+
+    baseline = None
+    for quantization, rescore in (
+        (None, False),
+        (QuantizationType.FLOAT16, False),
+        (QuantizationType.INT8, False),
+        (QuantizationType.INT8, True),
+    ):
+        result = run(vectors, queries, args.k, quantization, rescore, args.ivf, truth)
+        if baseline is None:
+            baseline = result
+        name = (quantization.value if quantization else "float32") + (" + rescore" if rescore else "")
+        saved = 1 - result["bytes_per_vector"] / baseline["bytes_per_vector"]
+        print(
+            f"{name:<18}{result['bytes_per_vector']:>14.0f}{saved:>14.1%}"
+            f"{result['recall']:>10.3f}{baseline['recall'] - result['recall']:>14.3f}{result['latency_ms']:>11.2f}"
+        )
+
+    print("\nWith rescoring, full precision vectors are memory-mapped from disk and only candidates are read.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Benchmark of the provider-aware rate limiter (see `src.factory.rate_limiter`): concurrent workers call a chat model
+whose provider only accepts `--quota` calls in flight, failing the others with a rate limit error (429) that the workers
+retry after `--backoff` seconds. The same workload runs without a limiter, then through a `ProviderLimiter`
+starting at `--max-concurrency` calls in flight, reporting the calls issued, the 429s received, the throughput,
+the mean and maximum wait in the limiter and its final (adapted) concurrency limit.
+
+The model is the deterministic, offline one of type `fake` (see `src.factory.fake`), called through LangChain
+as the QA agent does; its quota of calls in flight is `FakeModelConf.max_concurrency`.
+
+Usage (from the root of the repository):
+
+    python -m benchmarks.rate_limiter --calls 500 --workers 32 --quota 8 --latency 0.05
+    python -m benchmarks.rate_limiter --requests-per-minute 3000 --latency-target 0.2
+"""
+import argparse
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+
+from src.config import FakeModelConf, LLMConf, MetricsConf, RateLimitConf
+from src.factory.fake import FakeRateLimitError
+from src.factory.llm import fetch_llm
+from src.factory.rate_limiter import get_provider_limiter
+from src.utils.metrics import configure_metrics
+
+
+def run(args: argparse.Namespace, rate_limit: Optional[RateLimitConf]) -> Dict[str, float]:
+    """ Runs `--calls` calls on `--workers` workers, retrying rate limited ones, with or without a limiter. """
+    model = f"benchmark-{'limited' if rate_limit else 'unlimited'}"
+    conf = LLMConf(
+        type="fake",
+        model=model,
+        fake_conf=FakeModelConf(latency=args.latency, latency_jitter=args.jitter, max_concurrency=args.quota, seed=args.seed),
+        rate_limit=rate_limit
+    )
+    llm = fetch_llm(conf)
+
+    def call(i: int):
+        while True:
+            try:
+                return llm.invoke(f"Question {i}")
+            except FakeRateLimitError:
+                time.sleep(args.backoff)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        list(pool.map(call, range(args.calls)))
+    seconds = time.perf_counter() - start
+
+    result = {"issued": llm.calls, "rate_limited": llm.rate_limited, "seconds": seconds, "throughput": args.calls / seconds}
+    limiter = get_provider_limiter("fake", model, rate_limit)
+    if limiter is not None:
+        waits = configure_metrics(MetricsConf(port=None)).histogram(
+            "rate_limiter_wait_seconds", "Seconds waited for a rate limiter", provider="fake", model=model
+        )
+        result["mean_wait"] = waits.sum / max(1, sum(waits.counts))
+        result["concurrency"] = limiter.concurrency
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=400, help="successful calls to make")
+    parser.add_argument("--workers", type=int, default=32, help="concurrent workers making them")
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds of each call")
+    parser.add_argument("--jitter", type=float, default=0.02, help="maximum seconds randomly added to the latency")
+    parser.add_argument("--quota", type=int, default=8, help="calls in flight accepted by the provider, the others get a 429")
+    parser.add_argument("--backoff", type=float, default=0.05, help="seconds waited by a worker before retrying a rate limited call")
+    parser.add_argument("--max-concurrency", type=int, default=RateLimitConf().max_concurrency)
+    parser.add_argument("--requests-per-minute", type=float, default=None)
+    parser.add_argument("--latency-target", type=float, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    # metrics are enabled before building the models, to record the waits in the limiter
+    configure_metrics(MetricsConf(port=None))
+    results = {
+        "unlimited": run(args, None),
+        "limited": run(args, RateLimitConf(
+            requests_per_minute=args.requests_per_minute,
+            max_concurrency=args.max_concurrency,
+            latency_target=args.latency_target
+        ))
+    }
+
+    print(f"{args.calls} calls on {args.workers} workers, provider quota of {args.quota} calls in flight, {args.latency}s per call")
+    print(f"\n{'':<12}{'issued':>10}{'429s':>10}{'seconds':>10}{'calls/s':>10}{'mean wait':>12}{'limit':>8}")
+    for name, result in results.items():
+        mean_wait = f"{result['mean_wait']:.3f}s" if "mean_wait" in result else "-"
+        limit = f"{result['concurrency']:.1f}" if "concurrency" in result else "-"
+        print(
+            f"{name:<12}{result['issued']:>10}{result['rate_limited']:>10}{result['seconds']:>10.2f}"
+            f"{result['throughput']:>10.1f}{mean_wait:>12}{limit:>8}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Benchmark of the retries, deadlines and circuit breaker of model calls (see `src.factory.resilience`) and of the dead letters
+of the ingestion pipeline (see `src.ingestion.dead_letters`), mining graphs from synthetic Chunks with a flaky provider:
+
+* `transient`: each call fails with probability `--error-rate`;
+* `outage`: the provider is down, every call fails after `--latency` seconds.
+
+Each scenario runs without resilience (a call fails on its first error) and with it, reporting the Chunks mined,
+the Chunks dead-lettered, the calls issued and the time taken. The dead letters are then replayed once the provider
+has recovered, into the embedded `InMemoryKnowledgeGraph`, reporting the Chunks recovered.
+Models are the deterministic, offline ones of type `fake` (see `src.factory.fake`).
+
+Usage (from the root of the repository):
+
+    python -m benchmarks.resilience --chunks 200 --error-rate 0.1 --latency 0.02
+    python -m benchmarks.resilience --max-attempts 6 --failure-threshold 10 --backoff 0.01
+"""
+import argparse
+import os
+import tempfile
+import time
+import numpy as np
+
+from typing import Dict, List, Optional
+
+from benchmarks.ingestion import entity_names, synthetic_text
+from src.config import (
+    DeadLetterConf, EmbedderConf, FakeModelConf, GraphBackend, KnowledgeGraphConfig, LLMConf, ResilienceConf
+)
+from src.factory.graph import get_knowledge_graph
+from src.ingestion.dead_letters import DeadLetters
+from src.ingestion.embedder import ChunkEmbedder
+from src.ingestion.graph_miner import GraphMiner
+from src.ingestion.replay import replay_dead_letters
+from src.schema import Chunk, ProcessedDocument
+
+
+def synthetic_docs(args: argparse.Namespace, rng: np.random.Generator) -> List[ProcessedDocument]:
+    """ Documents of `--chunks` Chunks in total, each a paragraph mentioning entities from a shared pool. """
+    entities = entity_names(50, rng)
+    return [
+        ProcessedDocument(
+            filename=f"doc_{d:05d}.txt",
+            chunks=[
+                Chunk(chunk_id=chunk_id, text=synthetic_text(1, entities, rng), filename=f"doc_{d:05d}.txt")
+                for chunk_id in range(1, len(chunk_ids) + 1)
+            ]
+        )
+        for d, chunk_ids in enumerate(np.array_split(np.arange(args.chunks), args.docs))
+    ]
+
+
+def run(
+        name: str,
+        docs: List[ProcessedDocument],
+        error_rate: float,
+        resilience: Optional[ResilienceConf],
+        dead_letters: DeadLetters,
+        args: argparse.Namespace
+    ) -> Dict[str, float]:
+    """ Mines the graphs of the Chunks of `docs` with a fake provider failing with probability `error_rate`. """
+    graph_miner = GraphMiner(
+        conf=LLMConf(
+            type="fake",
+            model=name,
+            fake_conf=FakeModelConf(latency=args.latency, error_rate=error_rate, seed=args.seed),
+            resilience=resilience
+        ),
+        dead_letters=dead_letters
+    )
+    start = time.perf_counter()
+    graph_miner.mine_graph_from_docs(docs)
+    return {
+        "mined": sum(chunk.graph is not None for doc in docs for chunk in doc.chunks),
+        "dead_letters": len(dead_letters),
+        "calls": graph_miner.graph_extractor.llm.calls,
+        "seconds": time.perf_counter() - start
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=200, help="Chunks to mine")
+    parser.add_argument("--docs", type=int, default=10, help="documents of the Chunks")
+    parser.add_argument("--error-rate", type=float, default=0.1, help="probability of each call to fail in the transient scenario")
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds of each call")
+    parser.add_argument("--max-attempts", type=int, default=ResilienceConf().max_attempts)
+    parser.add_argument("--backoff", type=float, default=0.02, help="seconds waited before the first retry")
+    parser.add_argument("--timeout", type=float, default=ResilienceConf().timeout, help="deadline of each attempt in seconds, none by default")
+    parser.add_argument("--failure-threshold", type=int, default=ResilienceConf().failure_threshold)
+    parser.add_argument("--recovery-seconds", type=float, default=ResilienceConf().recovery_seconds)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    resilience = ResilienceConf(
+        max_attempts=args.max_attempts,
+        initial_backoff=args.backoff,
+        timeout=args.timeout,
+        failure_threshold=args.failure_threshold,
+        recovery_seconds=args.recovery_seconds
+    )
+    embedder_conf = EmbedderConf(type="fake", model="fake", fake_conf=FakeModelConf(dimensions=64, seed=args.seed))
+    embedder = ChunkEmbedder(embedder_conf)
+
+    print(f"{args.chunks} chunks, {args.latency}s per call, up to {args.max_attempts} attempts, breaker opening after {args.failure_threshold} failures")
+    print(f"\n{'':<22}{'mined':>8}{'dead':>8}{'calls':>8}{'seconds':>10}{'replayed':>10}")
+    with tempfile.TemporaryDirectory() as folder:
+        for scenario, error_rate in (("transient", args.error_rate), ("outage", 1.0)):
+            for mode, conf in (("no retries", None), ("resilience", resilience)):
+                rng = np.random.default_rng(args.seed)
+                docs = embedder.embed_documents_chunks(synthetic_docs(args, rng))
+                dead_letters = DeadLetters(DeadLetterConf(path=os.path.join(folder, f"{scenario}-{mode}.jsonl")))
+                result = run(f"{scenario}-{mode}", docs, error_rate, conf, dead_letters, args)
+
+                # the provider is back: Chunks stored without a graph are replayed from the dead letters
+                knowledge_graph = get_knowledge_graph(
+                    conf=KnowledgeGraphConfig(uri="bolt://localhost:7687", user="neo4j", password="password", backend=GraphBackend.MEMORY),
+                    embeddings_model=embedder.embeddings
+                )
+                knowledge_graph.add_documents(docs)
+                recovered_miner = GraphMiner(
+                    conf=LLMConf(type="fake", model=f"{scenario}-{mode}-recovered", fake_conf=FakeModelConf(seed=args.seed)),
+                    dead_letters=dead_letters
+                )
+                replayed = replay_dead_letters(dead_letters, embedder, recovered_miner, knowledge_graph)
+                knowledge_graph.close()
+
+                print(
+                    f"{f'{scenario}, {mode}':<22}{result['mined']:>8}{result['dead_letters']:>8}{result['calls']:>8}"
+                    f"{result['seconds']:>10.2f}{replayed:>10}"
+                )
+
+
+if __name__ == "__main__":
+    main()
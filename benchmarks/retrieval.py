@@ -0,0 +1,242 @@
+"""
+Benchmark of the answer modes of `GraphAgentResponder` on a seeded graph: a fixed set of questions is answered
+by each mode, reporting p50/p95/p99 latency end to end and broken down into embedding, database, LLM and
+context building time, with the tokens of the built context.
+
+The graph is seeded with a synthetic corpus through the ingestion pipeline (see `benchmarks.ingestion`),
+with an in-memory local index mirroring the vector indexes. Embeddings and LLMs are the deterministic, offline models
+of type `fake` with configurable latency (see `src.factory.fake`); the database is an in-memory stand-in accepting every query
+and returning no rows (so only vector retrieval, served by the local index, finds context), or a real Neo4j with
+`--neo4j-uri`, or the embedded `InMemoryKnowledgeGraph` with `--backend memory`: on both, communities and their reports 
+are computed too.
+
+Usage (from the root of the repository):
+
+    python -m benchmarks.retrieval --questions 50 --llm-latency 0.3 --embedding-latency 0.02
+    python -m benchmarks.retrieval --neo4j-uri bolt://localhost:7687 --neo4j-password password123
+    python -m benchmarks.retrieval --backend memory
+
+Against a real database, use an empty one: documents are written to it.
+Categories overlap when steps run concurrently (`answer(concurrent=True)`, the map calls of the global search),
+so their sum may exceed the end to end latency.
+"""
+import argparse
+import time
+import numpy as np
+
+from typing import Callable, Dict, List
+
+from langchain_core.embeddings import Embeddings
+
+from benchmarks.ingestion import entity_names, synthetic_text
+from benchmarks.stand_ins import RecordingDriver, recording_neo4j
+from src.agents.community_summarizer import CommunitiesSummarizer
+from src.agents.graph_qa import GraphAgentResponder
+from src.config import ChunkerConf, EmbedderConf, FakeModelConf, KnowledgeGraphConfig, LLMConf, LocalIndexConf
+from src.factory.embeddings import get_embeddings
+from src.factory.fake import FakeChatModel
+from src.factory.graph import get_knowledge_graph
+from src.graph.graph_model import CommunityReport
+from src.graph.knowledge_graph import KnowledgeGraph
+from src.ingestion.chunker import Chunker
+from src.ingestion.cleaner import Cleaner
+from src.ingestion.embedder import ChunkEmbedder
+from src.ingestion.graph_miner import GraphMiner
+from src.schema import ProcessedDocument
+
+
+CATEGORIES = ["embedding", "db", "llm", "context"]
+
+CYPHER_RESPONSE = "MATCH (c:Chunk)-[:MENTIONS]->(e) RETURN e.id AS entity, count(c) AS mentions LIMIT 10"
+MAP_RESPONSE = "The reports describe the entities of the question. SCORE: 60"
+
+
+def questions(n: int, entities: List[str], rng: np.random.Generator) -> List[str]:
+    """ A fixed mix of local (one or two entities) and global (corpus-wide) questions. """
+    templates = [
+        lambda: f"What do the documents say about {rng.choice(entities)}?",
+        lambda: f"How is {rng.choice(entities)} related to {rng.choice(entities)}?",
+        lambda: "What are the main themes of the documents?",
+    ]
+    return [templates[i % len(templates)]() for i in range(n)]
+
+
+def fake_embedder_conf(args: argparse.Namespace, latency: float = 0.0) -> EmbedderConf:
+    """ Configuration of fake embeddings: all of them embed a text in the same vector, whatever their latency. """
+    return EmbedderConf(type="fake", model="fake", fake_conf=FakeModelConf(dimensions=args.dimensions, latency=latency, seed=args.seed))
+
+
+def fake_llm_conf(args: argparse.Namespace, response: str = FakeModelConf().response, latency: float = 0.0) -> LLMConf:
+    return LLMConf(type="fake", model="fake", fake_conf=FakeModelConf(response=response, latency=latency, seed=args.seed))
+
+
+def seed_graph(knowledge_graph: KnowledgeGraph, embeddings: Embeddings, entities: List[str], args: argparse.Namespace, rng: np.random.Generator):
+    """
+    Ingests a synthetic corpus and stores Community Reports: summarized by the `CommunitiesSummarizer` on a real graph
+    (Neo4j or the in-memory backend), synthetic ones (a report every `--chunks-per-report` Chunks) on the in-memory stand-in, 
+    which has no communities.
+    """
+    docs = [
+        ProcessedDocument(filename=f"doc_{i:05d}.txt", source=synthetic_text(args.paragraphs, entities, rng))
+        for i in range(args.docs)
+    ]
+    embedder = ChunkEmbedder(conf=fake_embedder_conf(args))
+    graph_miner = GraphMiner(conf=fake_llm_conf(args))
+    chunker = Chunker(conf=ChunkerConf(type="recursive", chunk_size=args.chunk_size, chunk_overlap=args.chunk_overlap))
+
+    docs = graph_miner.mine_graph_from_docs(
+        docs=embedder.embed_documents_chunks(chunker.chunk_documents(Cleaner().clean_documents(docs)))
+    )
+    knowledge_graph.add_documents(docs)
+
+    if real_graph(args):
+        knowledge_graph.update_centralities_and_communities()
+        summarizer = CommunitiesSummarizer(
+            llm_conf=fake_llm_conf(args, response="A community of related entities."),
+            embeddings_conf=fake_embedder_conf(args)
+        )
+        summarizer.update_reports(knowledge_graph)
+        return
+
+    chunks = [chunk for doc in docs for chunk in doc.chunks or []]
+    reports = [
+        CommunityReport(
+            communtiy_type="leiden",
+            community_id=i,
+            summary=" ".join(chunk.text for chunk in chunks[start:start + args.chunks_per_report])[:2000],
+            community_size=args.chunks_per_report
+        )
+        for i, start in enumerate(range(0, len(chunks), args.chunks_per_report))
+    ]
+    for report, embedding in zip(reports, embeddings.embed_documents([report.summary for report in reports])):
+        report.summary_embeddings = embedding
+    knowledge_graph.store_community_reports(reports)
+
+
+def real_graph(args: argparse.Namespace) -> bool:
+    """ Whether the graph holds what is written to it, i.e. it is not the in-memory stand-in of Neo4j. """
+    return args.neo4j_uri is not None or args.backend == "memory"
+
+
+class Meter:
+    """ Reads the time spent so far in each category, from the counters of the stand-ins and of the timed `_build_context`. """
+
+    def __init__(self, responder: GraphAgentResponder, embeddings: Embeddings, llms: List[FakeChatModel], drivers: List[RecordingDriver]):
+        self.embeddings = embeddings
+        self.llms = llms
+        self.drivers = drivers
+        self.context_seconds = 0.0
+
+        build_context = responder._build_context
+
+        def _timed_build_context(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return build_context(*args, **kwargs)
+            finally:
+                self.context_seconds += time.perf_counter() - start
+
+        responder._build_context = _timed_build_context
+
+    def read(self) -> Dict[str, float]:
+        return {
+            "embedding": self.embeddings.seconds,
+            "db": sum(driver.seconds for driver in self.drivers),
+            "llm": sum(llm.seconds for llm in self.llms),
+            "context": self.context_seconds,
+        }
+
+
+def run_mode(answer: Callable[[str], str], responder: GraphAgentResponder, meter: Meter, question_set: List[str]) -> Dict[str, List[float]]:
+    samples: Dict[str, List[float]] = {name: [] for name in ["total", *CATEGORIES, "tokens"]}
+    for question in question_set:
+        responder.last_context = None
+        before = meter.read()
+        start = time.perf_counter()
+        answer(question)
+        samples["total"].append(time.perf_counter() - start)
+        after = meter.read()
+        for name in CATEGORIES:
+            samples[name].append(after[name] - before[name])
+        samples["tokens"].append(responder.last_context.total_tokens if responder.last_context else 0)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", type=int, default=30, help="questions answered by each mode")
+    parser.add_argument("--docs", type=int, default=50, help="documents of the seeded corpus")
+    parser.add_argument("--paragraphs", type=int, default=20, help="paragraphs per document")
+    parser.add_argument("--entities", type=int, default=500, help="size of the pool of entity names")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--chunk-overlap", type=int, default=100)
+    parser.add_argument("--chunks-per-report", type=int, default=20, help="chunks summarized by each synthetic report (in-memory stand-in only)")
+    parser.add_argument("--dimensions", type=int, default=768, help="dimensions of fake embeddings")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="seconds per LLM call")
+    parser.add_argument("--embedding-latency", type=float, default=0.0, help="seconds per embedding call")
+    parser.add_argument("--backend", type=str, choices=["neo4j", "memory"], default="neo4j", help="graph backend, `memory` for the embedded graph")
+    parser.add_argument("--neo4j-uri", type=str, default=None, help="real Neo4j to seed and query, in-memory stand-in if omitted")
+    parser.add_argument("--neo4j-user", type=str, default="neo4j")
+    parser.add_argument("--neo4j-password", type=str, default="password")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    entities = entity_names(args.entities, rng)
+    backend = "embedded in-memory graph" if args.backend == "memory" else args.neo4j_uri or "in-memory stand-in"
+    print(f"LLM latency {args.llm_latency}s, embedding latency {args.embedding_latency}s, database: {backend}")
+
+    embeddings = get_embeddings(fake_embedder_conf(args, latency=args.embedding_latency))
+
+    with recording_neo4j(in_memory=args.neo4j_uri is None) as drivers:
+        knowledge_graph = get_knowledge_graph(
+            conf=KnowledgeGraphConfig(
+                uri=args.neo4j_uri or "bolt://localhost:7687",
+                user=args.neo4j_user,
+                password=args.neo4j_password,
+                local_index=LocalIndexConf(),
+                backend=args.backend
+            ),
+            embeddings_model=embeddings,
+            refresh_schema=args.neo4j_uri is not None
+        )
+        seed_graph(knowledge_graph, get_embeddings(fake_embedder_conf(args)), entities, args, rng)
+
+        responder = GraphAgentResponder(
+            qa_llm_conf=fake_llm_conf(args, response=MAP_RESPONSE, latency=args.llm_latency),
+            cypher_llm_conf=fake_llm_conf(args, response=CYPHER_RESPONSE, latency=args.llm_latency),
+            graph=knowledge_graph
+        )
+        meter = Meter(responder, embeddings, [responder.qa_llm, responder.cypher_llm], drivers)
+        question_set = questions(args.questions, entities, rng)
+
+        modes: Dict[str, Callable[[str], str]] = {
+            "context": responder.answer_with_context,
+            "cypher": responder.answer_with_cypher,
+            "community_reports": responder.answer_with_community_reports,
+            "community_subgraph": responder.answer_with_community_subgraph,
+            "global_search": responder.answer_with_global_search,
+            "combined": responder.answer,
+            "combined_concurrent": lambda q: responder.answer(q, concurrent=True),
+        }
+        if real_graph(args):
+            # adjacent chunks are looked up by id in the graph, which the in-memory stand-in does not hold
+            modes["context+adjacent"] = lambda q: responder.answer_with_context(q, use_adjacent_chunks=True)
+
+        print(f"\n{len(question_set)} questions per mode, latencies in ms")
+        header = f"{'mode':<21}{'':<5}{'total':>9}" + "".join(f"{name:>11}" for name in CATEGORIES)
+        print(f"{header}{'tokens':>9}")
+        for mode, answer in modes.items():
+            samples = run_mode(answer, responder, meter, question_set)
+            for p in (50, 95, 99):
+                row = "".join(f"{np.percentile(samples[name], p) * 1000:>11.1f}" for name in CATEGORIES)
+                print(
+                    f"{mode if p == 50 else '':<21}{f'p{p}':<5}{np.percentile(samples['total'], p) * 1000:>9.1f}"
+                    f"{row}{np.percentile(samples['tokens'], p):>9.0f}"
+                )
+
+        knowledge_graph._driver.close()
+
+
+if __name__ == "__main__":
+    main()
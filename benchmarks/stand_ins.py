@@ -0,0 +1,187 @@
+"""
+Local stand-in for the database, so that benchmarks run offline: a Neo4j driver wrapper counting database
+round trips (around a real driver, or an in-memory one that accepts every query and returns no rows).
+Embeddings and LLMs are the deterministic models of type `fake` of the factory (see `src.factory.fake`).
+"""
+import threading
+import time
+import neo4j
+
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+
+class _Record(dict):
+    def data(self) -> Dict[str, Any]:
+        return dict(self)
+
+    def value(self, key: int = 0) -> Any:
+        return list(self.values())[key]
+
+
+class _Result:
+    def __init__(self, records: List[Dict[str, Any]]):
+        self._records = [_Record(record) for record in records]
+
+    def __iter__(self) -> Iterator[_Record]:
+        return iter(self._records)
+
+    def single(self) -> Optional[_Record]:
+        return self._records[0] if self._records else None
+
+    def data(self) -> List[Dict[str, Any]]:
+        return [record.data() for record in self._records]
+
+    def consume(self):
+        return None
+
+
+def _stand_in_rows(query: Any) -> List[Dict[str, Any]]:
+    text = getattr(query, "text", query)
+    if "dbms.components" in text:
+        return [{"name": "Neo4j Kernel", "versions": ["5.26.0"], "edition": "community"}]
+    return []
+
+
+class _InMemorySession:
+    """ Session of the in-memory stand-in: every query succeeds and returns no rows. """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def run(self, query: Any, parameters: Optional[dict] = None, **kwargs) -> _Result:
+        return _Result(_stand_in_rows(query))
+
+    def execute_write(self, fn, *args, **kwargs):
+        return fn(self, *args, **kwargs)
+
+    execute_read = execute_write
+
+    def close(self):
+        pass
+
+
+class _InMemoryDriver:
+    def verify_connectivity(self, **kwargs):
+        pass
+
+    def verify_authentication(self, *args, **kwargs) -> bool:
+        return True
+
+    def session(self, **kwargs) -> _InMemorySession:
+        return _InMemorySession()
+
+    def execute_query(self, query: Any, *args, **kwargs) -> neo4j.EagerResult:
+        return neo4j.EagerResult(list(_Result(_stand_in_rows(query))), None, [])
+
+    def close(self):
+        pass
+
+
+class _CountingTransaction:
+    def __init__(self, tx, driver: "RecordingDriver"):
+        self._tx = tx
+        self._driver = driver
+
+    def run(self, *args, **kwargs):
+        with self._driver.record():
+            return self._tx.run(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._tx, name)
+
+
+class _CountingSession:
+    def __init__(self, session, driver: "RecordingDriver"):
+        self._session = session
+        self._driver = driver
+
+    def __enter__(self):
+        self._session.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        return self._session.__exit__(*exc)
+
+    def run(self, *args, **kwargs):
+        with self._driver.record():
+            return self._session.run(*args, **kwargs)
+
+    def execute_write(self, fn, *args, **kwargs):
+        return self._session.execute_write(lambda tx: fn(_CountingTransaction(tx, self._driver), *args, **kwargs))
+
+    def execute_read(self, fn, *args, **kwargs):
+        return self._session.execute_read(lambda tx: fn(_CountingTransaction(tx, self._driver), *args, **kwargs))
+
+    def __getattr__(self, name):
+        return getattr(self._session, name)
+
+
+class RecordingDriver(neo4j.Driver):
+    """
+    Wraps a Neo4j driver (or the in-memory stand-in) and counts the queries sent to the database, and the seconds spent
+    sending them (results streamed lazily by a real driver are only partly accounted for).
+    It is a `neo4j.Driver` only to pass the type checks of `neo4j_graphrag`: every call goes to the wrapped driver.
+    """
+
+    def __init__(self, driver):
+        self._driver = driver
+        self._lock = threading.Lock()
+        self.round_trips = 0
+        self.seconds = 0.0
+
+    def __del__(self):
+        pass
+
+    @contextmanager
+    def record(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.round_trips += 1
+                self.seconds += time.perf_counter() - start
+
+    def session(self, **kwargs) -> _CountingSession:
+        return _CountingSession(self._driver.session(**kwargs), self)
+
+    def execute_query(self, *args, **kwargs):
+        with self.record():
+            return self._driver.execute_query(*args, **kwargs)
+
+    def verify_connectivity(self, **kwargs):
+        return self._driver.verify_connectivity(**kwargs)
+
+    def verify_authentication(self, *args, **kwargs) -> bool:
+        return self._driver.verify_authentication(*args, **kwargs)
+
+    def close(self):
+        self._driver.close()
+
+    def __getattr__(self, name):
+        return getattr(self._driver, name)
+
+
+@contextmanager
+def recording_neo4j(in_memory: bool = True) -> Iterator[List[RecordingDriver]]:
+    """
+    Makes every driver created by `neo4j.GraphDatabase.driver` a `RecordingDriver`, around the in-memory stand-in
+    if `in_memory` or around a real driver otherwise. Yields the list of the drivers created so far.
+    """
+    create_driver = neo4j.GraphDatabase.driver
+    drivers: List[RecordingDriver] = []
+
+    def _driver(*args, **kwargs) -> RecordingDriver:
+        driver = RecordingDriver(_InMemoryDriver() if in_memory else create_driver(*args, **kwargs))
+        drivers.append(driver)
+        return driver
+
+    neo4j.GraphDatabase.driver = _driver
+    try:
+        yield drivers
+    finally:
+        neo4j.GraphDatabase.driver = create_driver
@@ -3,6 +3,8 @@ import os
 import streamlit as st
 
 from src.config import Configuration
+from src.utils.metrics import configure_metrics
+from src.utils.tracing import configure_tracing
 
 from pgs.utils import get_configuration_from_env, get_embedder, get_knowledge_graph, get_responder
 
@@ -34,14 +36,19 @@ conf = None
 st.session_state["answer_method"] = None
 st.session_state["community_to_use"] = None
 st.session_state["adjacent_chunks"] = False
+st.session_state["concurrent_retrieval"] = False
 
-answering_options = ["Similarity Search", "Cypher", "Communities", "Subgraph", "Combine"]
+answering_options = ["Similarity Search", "Cypher", "Communities", "Subgraph", "Global Search", "Combine"]
 community_options = ["leiden", "louvain"]
 
 try:
     conf = Configuration.from_file(CONF_PATH)
 except Exception as e:
     conf = get_configuration_from_env()
+
+if conf:
+    configure_tracing(conf.tracing_conf)
+    configure_metrics(conf.metrics_conf)
     
 if conf:
     embedder = get_embedder(conf.embedder_conf)
@@ -110,6 +117,11 @@ with st.sidebar:
         label="Use neighbouring Chunks",
         help="When performing similarity-based generation, the Agent will also look for Chunk nearing each other in the same Document."
     )
+    
+    st.session_state["concurrent_retrieval"] = st.checkbox(
+        label="Parallel retrieval",
+        help="When combining approaches, the Agent will run Similarity Search and Cypher Queries at the same time, skipping the ones that time out."
+    )
 
     st.session_state["community_to_use"] = st.selectbox(
         label="Select the reference Community",
@@ -138,37 +150,47 @@ if prompt := st.chat_input("What are the available nodes in the Graph?"):
         elif m["role"] == "assistant":
             chat_history += f"Assistant: {m['content']}\n"
         
-    if st.session_state["answer_method"] == "Similarity Search":
-        response = responder.answer_with_context(
-            query=prompt, 
-            use_adjacent_chunks=st.session_state["adjacent_chunks"],
-            history=chat_history
-        )
-    elif st.session_state["answer_method"] == "Cypher":
-        response = responder.answer_with_cypher(
-            query=prompt, 
-            intermediate_steps=False,
-            history=chat_history
-        )
-    elif st.session_state["answer_method"] == "Communities":
-        response = responder.answer_with_community_reports(
-            query=prompt, 
-            use_adjacent_chunks=st.session_state["adjacent_chunks"],
-            community_type=st.session_state["community_to_use"]
-        )
-    elif st.session_state["answer_method"] == "Subgraph":
-        response = responder.answer_with_community_subgraph(
-            query=prompt, 
-            community_type=st.session_state["community_to_use"]
-        )
-    else:
-        response = responder.answer(
-            query=prompt, 
-            use_adjacent_chunks=st.session_state["adjacent_chunks"]
-        )
-        
     with st.chat_message("assistant"):
-        st.write(response)
+        
+        # retrieval completes first, then the answer is streamed as the LLM generates it
+        with st.spinner("Retrieving context.."):
+            
+            if st.session_state["answer_method"] == "Similarity Search":
+                stream = responder.stream_answer_with_context(
+                    query=prompt, 
+                    use_adjacent_chunks=st.session_state["adjacent_chunks"],
+                    history=chat_history
+                )
+            elif st.session_state["answer_method"] == "Cypher":
+                stream = responder.stream_answer_with_cypher(
+                    query=prompt, 
+                    history=chat_history
+                )
+            elif st.session_state["answer_method"] == "Communities":
+                stream = responder.stream_answer_with_community_reports(
+                    query=prompt, 
+                    use_adjacent_chunks=st.session_state["adjacent_chunks"],
+                    community_type=st.session_state["community_to_use"]
+                )
+            elif st.session_state["answer_method"] == "Subgraph":
+                stream = responder.stream_answer_with_community_subgraph(
+                    query=prompt, 
+                    community_type=st.session_state["community_to_use"]
+                )
+            elif st.session_state["answer_method"] == "Global Search":
+                stream = responder.stream_answer_with_global_search(
+                    query=prompt, 
+                    community_type=st.session_state["community_to_use"],
+                    history=chat_history
+                )
+            else:
+                stream = responder.stream_answer(
+                    query=prompt, 
+                    use_adjacent_chunks=st.session_state["adjacent_chunks"],
+                    concurrent=st.session_state["concurrent_retrieval"]
+                )
+            
+        response = st.write_stream(stream)
     
     # Add user message to chat history
     st.session_state.messages.append({"role": "user", "content": prompt})
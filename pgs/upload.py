@@ -3,14 +3,19 @@ import shutil
 import streamlit as st
 
 from src.config import Configuration
-from src.graph.knowledge_graph import KnowledgeGraph
 from src.ingestion.local_ingestor import LocalIngestor
 from src.ingestion.chunker import Chunker
+from src.ingestion.checkpoints import IngestionCheckpoints
 from src.ingestion.cleaner import Cleaner
+from src.ingestion.dead_letters import DeadLetters
 from src.ingestion.embedder import ChunkEmbedder
+from src.ingestion.entity_resolver import EntityResolver
 from src.ingestion.graph_miner import GraphMiner
+from src.ingestion.replay import replay_dead_letters
+from src.utils.metrics import configure_metrics
+from src.utils.tracing import configure_tracing
 
-from pgs.utils import get_configuration_from_env
+from pgs.utils import get_configuration_from_env, get_knowledge_graph
 
 st.set_page_config(
     page_title="Upload",
@@ -33,6 +38,7 @@ st.markdown(
     * embed each chunk into its vector representation;
     * use a LLM model to extract a graph of concepts from each chunk;
     * upload the obtained vectors and entities into the Knowledge Graph;
+    * merge duplicate entities, if entity resolution is enabled;
     * update the centralities measures and the division of the Graph into communities.
     """
 )
@@ -53,6 +59,10 @@ try:
     conf = Configuration.from_file(CONF_PATH)
 except Exception as e:
     conf = get_configuration_from_env()
+
+if conf:
+    configure_tracing(conf.tracing_conf)
+    configure_metrics(conf.metrics_conf)
     
 
 if conf or env:
@@ -89,15 +99,20 @@ if len(uploaded_files) > 0:
             ingestor = LocalIngestor(source=conf.source_conf)
             cleaner = Cleaner()
             chunker = Chunker(conf=conf.chunker_conf)
-            embedder = ChunkEmbedder(conf=conf.embedder_conf)
+            dead_letters = DeadLetters(conf.dead_letter_conf) if conf.dead_letter_conf else None
+            embedder = ChunkEmbedder(conf=conf.embedder_conf, dead_letters=dead_letters)
+            checkpoints = IngestionCheckpoints(conf.checkpoint_conf) if conf.checkpoint_conf else None
             graph_miner = GraphMiner(
                 conf=conf.re_model_conf, 
-                ontology=conf.database.ontology
-            )
-            knowledge_graph = KnowledgeGraph(
-                conf=conf.database, 
-                embeddings_model=embedder.embeddings,
+                ontology=conf.database.ontology,
+                checkpoints=checkpoints,
+                dead_letters=dead_letters
             )
+
+            def run_stage(name, stage, docs):
+                """ Runs a stage of the pipeline, only on the documents not past it if checkpoints are enabled. """
+                return checkpoints.run(name, docs, stage) if checkpoints else stage(docs)
+            knowledge_graph = get_knowledge_graph(conf, embedder)
             if not knowledge_graph._driver.verify_authentication():
                 st.error("Check your Neo4j Configuration!")
             
@@ -107,23 +122,36 @@ if len(uploaded_files) > 0:
             #         st.session_state["index_created"] = knowledge_graph.create_index()
             
             else:
+                if dead_letters is not None and len(dead_letters):
+                    st.write(f"Replaying {len(dead_letters)} Chunks that failed in previous ingestions..")
+                    replay_dead_letters(dead_letters, embedder, graph_miner, knowledge_graph)
+
                 st.write("Loading..")
                 docs = ingestor.batch_ingest()
+                if checkpoints:
+                    docs = checkpoints.resume(docs)
 
                 st.write("Cleaning..")
-                docs = cleaner.clean_documents(docs)
+                docs = run_stage("clean", cleaner.clean_documents, docs)
 
                 st.write("Chunking..")
-                docs = chunker.chunk_documents(docs)
+                docs = run_stage("chunk", chunker.chunk_documents, docs)
 
                 st.write("Embedding..")
-                docs = embedder.embed_documents_chunks(docs)
+                docs = run_stage("embed", embedder.embed_documents_chunks, docs)
 
                 st.write("Extracting a Knowledge Graph from each file..")
-                docs = graph_miner.mine_graph_from_docs(docs=docs)
+                docs = run_stage("mine", graph_miner.mine_graph_from_docs, docs)
 
                 st.write("Uploading Data to Knowledge Graph..")
-                knowledge_graph.add_documents(docs)
+                docs = run_stage("store", lambda docs: knowledge_graph.add_documents(docs) or docs, docs)
+
+                if dead_letters is not None and len(dead_letters):
+                    st.warning(f"{len(dead_letters)} Chunks failed after retries, they will be replayed by the next ingestion")
+
+                if conf.entity_resolution_conf:
+                    st.write("Resolving duplicate Entities..")
+                    EntityResolver(conf.entity_resolution_conf, embedder.embeddings).resolve(knowledge_graph)
                 
                 st.write("Updating Communities and computing Centralities in the Graph..")
                 knowledge_graph.update_centralities_and_communities()
@@ -1,15 +1,38 @@
 import os
+from typing import Optional
 from dotenv import load_dotenv
 
 import streamlit as st
 
 from src.agents.graph_qa import GraphAgentResponder
-from src.config import Configuration, Source, ChunkerConf, LLMConf, EmbedderConf, KnowledgeGraphConfig
+from src.config import Configuration, Source, ChunkerConf, LLMConf, EmbedderConf, KnowledgeGraphConfig, SemanticCacheConf, CypherCacheConf, ContextConf, LocalIndexConf, RetrievalConf, GlobalSearchConf, TracingConf, MetricsConf, EntityResolutionConf, CheckpointConf, RateLimitConf, ResilienceConf, DeadLetterConf
+from src.factory.graph import get_knowledge_graph as build_knowledge_graph
 from src.graph.knowledge_graph import KnowledgeGraph
 from src.ingestion.embedder import ChunkEmbedder
 
 SOURCE_FOLDER = f"{os.getcwd()}/source_docs"
 
+def get_rate_limit_from_env(prefix: str) -> Optional[RateLimitConf]:
+    """ Rate limits of a model from `<prefix>_REQUESTS_PER_MINUTE`, `<prefix>_TOKENS_PER_MINUTE` and `<prefix>_MAX_CONCURRENCY`, `None` if none is set. """
+    limits = {
+        field: os.getenv(f"{prefix}_{field.upper()}")
+        for field in ("requests_per_minute", "tokens_per_minute", "max_concurrency")
+    }
+    limits = {field: value for field, value in limits.items() if value}
+    return RateLimitConf(**limits) if limits else None
+
+
+def get_resilience_from_env() -> Optional[ResilienceConf]:
+    """ Retries and circuit breaking of the models, from `RETRY_MAX_ATTEMPTS`, `CALL_TIMEOUT_SECONDS` and `CIRCUIT_BREAKER_THRESHOLD`. """
+    if os.getenv("RESILIENCE_ENABLED", "true").lower() != "true":
+        return None
+    return ResilienceConf(
+        max_attempts=os.getenv("RETRY_MAX_ATTEMPTS", ResilienceConf().max_attempts),
+        timeout=os.getenv("CALL_TIMEOUT_SECONDS", ResilienceConf().timeout) or None,
+        failure_threshold=os.getenv("CIRCUIT_BREAKER_THRESHOLD", ResilienceConf().failure_threshold)
+    )
+
+
 @st.cache_data
 def get_configuration_from_env() -> Configuration:
     env = load_dotenv('config_example.env')
@@ -19,7 +42,18 @@ def get_configuration_from_env() -> Configuration:
                 uri=os.getenv("NEO4J_URI"),
                 user=os.getenv("NEO4J_USERNAME"),
                 password=os.getenv("NEO4J_PASSWORD"),
-                index_name=os.getenv("INDEX_NAME")
+                index_name=os.getenv("INDEX_NAME"),
+                schema_cache_path=os.getenv("SCHEMA_CACHE_PATH") or None,
+                backend=os.getenv("GRAPH_BACKEND", "neo4j"),
+                memory_path=os.getenv("GRAPH_MEMORY_PATH") or None,
+                leiden_max_levels=os.getenv("LEIDEN_MAX_LEVELS", 1),
+                leiden_max_community_size=os.getenv("LEIDEN_MAX_COMMUNITY_SIZE", 50),
+                local_index=LocalIndexConf(
+                    path=os.getenv("LOCAL_INDEX_PATH") or None,
+                    n_probe=os.getenv("LOCAL_INDEX_N_PROBE", 8),
+                    quantization=os.getenv("LOCAL_INDEX_QUANTIZATION") or None,
+                    rescore=os.getenv("LOCAL_INDEX_RESCORE", "false")
+                ) if os.getenv("LOCAL_INDEX_ENABLED", "false").lower() == "true" else None
             ),
             source_conf=Source(folder=SOURCE_FOLDER),
             chunker_conf=ChunkerConf(
@@ -33,7 +67,9 @@ def get_configuration_from_env() -> Configuration:
                 api_key=os.getenv("EMBEDDINGS_API_KEY"),
                 deployment=os.getenv("EMBEDDINGS_DEPLOYMENT"),
                 endpoint=os.getenv("EMBEDDINGS_ENDPOINT"), 
-                api_version=os.getenv("EMBEDDINGS_API_VERSION")
+                api_version=os.getenv("EMBEDDINGS_API_VERSION"),
+                rate_limit=get_rate_limit_from_env("EMBEDDINGS"),
+                resilience=get_resilience_from_env()
             ),
             re_model_conf=LLMConf(
                 type=os.getenv("RE_MODEL_TYPE"),
@@ -42,7 +78,9 @@ def get_configuration_from_env() -> Configuration:
                 deployment=os.getenv("RE_MODEL_DEPLOYMENT"),
                 api_key=os.getenv("RE_API_KEY"),
                 endpoint=os.getenv("RE_MODEL_ENDPOINT"),
-                api_version=os.getenv("RE_MODEL_API_VERSION") or None
+                api_version=os.getenv("RE_MODEL_API_VERSION") or None,
+                rate_limit=get_rate_limit_from_env("RE_MODEL"),
+                resilience=get_resilience_from_env()
             ),
             qa_model=LLMConf(
                 type=os.getenv("QA_MODEL_TYPE"),
@@ -51,8 +89,54 @@ def get_configuration_from_env() -> Configuration:
                 deployment=os.getenv("QA_MODEL_DEPLOYMENT"),
                 api_key=os.getenv("QA_API_KEY"),
                 endpoint=os.getenv("QA_MODEL_ENDPOINT"),
-                api_version=os.getenv("QA_MODEL_API_VERSION") or None
-            )
+                api_version=os.getenv("QA_MODEL_API_VERSION") or None,
+                rate_limit=get_rate_limit_from_env("QA_MODEL"),
+                resilience=get_resilience_from_env()
+            ),
+            cache_conf=SemanticCacheConf(
+                similarity_threshold=os.getenv("SEMANTIC_CACHE_THRESHOLD", 0.95),
+                max_entries=os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", 256),
+                ttl_seconds=os.getenv("SEMANTIC_CACHE_TTL_SECONDS", 3600) or None
+            ) if os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() == "true" else None,
+            cypher_cache_conf=CypherCacheConf(
+                max_entries=os.getenv("CYPHER_CACHE_MAX_ENTRIES", 512),
+                fuzzy_matching=os.getenv("CYPHER_CACHE_FUZZY_MATCHING", "false").lower() == "true",
+                similarity_threshold=os.getenv("CYPHER_CACHE_THRESHOLD", 0.97)
+            ) if os.getenv("CYPHER_CACHE_ENABLED", "false").lower() == "true" else None,
+            retrieval_conf=RetrievalConf(
+                mode=os.getenv("RETRIEVAL_MODE", "vector"),
+                k=os.getenv("RETRIEVAL_K", 4),
+                fetch_k=os.getenv("RETRIEVAL_FETCH_K", 20)
+            ),
+            global_search_conf=GlobalSearchConf(
+                level=os.getenv("GLOBAL_SEARCH_LEVEL") or None,
+                max_reports=os.getenv("GLOBAL_SEARCH_MAX_REPORTS", 50),
+                max_workers=os.getenv("GLOBAL_SEARCH_MAX_WORKERS", 4)
+            ),
+            context_conf=ContextConf(
+                chunks_budget=os.getenv("CONTEXT_CHUNKS_BUDGET", 4000),
+                reports_budget=os.getenv("CONTEXT_REPORTS_BUDGET", 2000),
+                graph_budget=os.getenv("CONTEXT_GRAPH_BUDGET", 2000),
+                cypher_budget=os.getenv("CONTEXT_CYPHER_BUDGET", 2000)
+            ),
+            entity_resolution_conf=EntityResolutionConf(
+                use_embeddings=os.getenv("ENTITY_RESOLUTION_USE_EMBEDDINGS", "true").lower() == "true",
+                similarity_threshold=os.getenv("ENTITY_RESOLUTION_THRESHOLD", 0.92)
+            ) if os.getenv("ENTITY_RESOLUTION_ENABLED", "false").lower() == "true" else None,
+            checkpoint_conf=CheckpointConf(
+                path=os.getenv("CHECKPOINTS_PATH", ".cache/checkpoints"),
+                resume=os.getenv("CHECKPOINTS_RESUME", "true").lower() == "true"
+            ) if os.getenv("CHECKPOINTS_ENABLED", "false").lower() == "true" else None,
+            dead_letter_conf=DeadLetterConf(
+                path=os.getenv("DEAD_LETTERS_PATH", ".cache/dead_letters.jsonl")
+            ) if os.getenv("DEAD_LETTERS_ENABLED", "false").lower() == "true" else None,
+            tracing_conf=TracingConf(
+                exporter=os.getenv("TRACING_EXPORTER", "file"),
+                path=os.getenv("TRACING_PATH", "traces.jsonl")
+            ) if os.getenv("TRACING_ENABLED", "false").lower() == "true" else None,
+            metrics_conf=MetricsConf(
+                port=int(os.getenv("METRICS_PORT")) if os.getenv("METRICS_PORT") else None
+            ) if os.getenv("METRICS_ENABLED", "false").lower() == "true" else None
         )
         return conf
     else: 
@@ -61,7 +145,7 @@ def get_configuration_from_env() -> Configuration:
 
 @st.cache_resource
 def get_knowledge_graph(_conf: Configuration, _embedder: ChunkEmbedder):
-    kg = KnowledgeGraph(
+    kg = build_knowledge_graph(
         conf=_conf.database, 
         embeddings_model=_embedder.embeddings,
     )
@@ -79,7 +163,12 @@ def get_responder(_conf: Configuration, _kg: KnowledgeGraph):
     responder = GraphAgentResponder(
         qa_llm_conf=_conf.qa_model,
         cypher_llm_conf=_conf.qa_model,
-        graph=_kg
+        graph=_kg,
         # rephrase_llm_conf=conf.qa_model
+        cache_conf=_conf.cache_conf,
+        cypher_cache_conf=_conf.cypher_cache_conf,
+        context_conf=_conf.context_conf,
+        retrieval_conf=_conf.retrieval_conf,
+        global_search_conf=_conf.global_search_conf
     )
     return responder
\ No newline at end of file
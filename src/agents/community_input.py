@@ -0,0 +1,96 @@
+import heapq
+from typing import List, Tuple
+
+from src.schema import Chunk
+from src.utils.logger import get_logger
+from src.utils.tokens import count_tokens, truncate_to_tokens
+
+
+logger = get_logger(__name__)
+
+
+def _entity_weights(chunk: Chunk) -> dict:
+    """ Pagerank of each entity mentioned by a Chunk (its `nodes`), by entity id. """
+    return {
+        node.id: float((node.properties or {}).get("pagerank") or 0.0)
+        for node in chunk.nodes or []
+    }
+
+
+def rank_chunks(chunks: List[Chunk]) -> List[Chunk]:
+    """
+    Orders the Chunks of a community by how much of the community they cover:
+    greedily, each Chunk is picked for the `pagerank` mass of the entities it mentions
+    that no previously picked Chunk mentions, ties broken by the total `pagerank` of its entities.
+    Once every entity is covered, the remaining Chunks follow by total `pagerank`, Chunks without entities last.
+
+    Coverage gains only decrease as Chunks are picked, so scores are re-evaluated lazily (lazy greedy)
+    instead of re-scoring every Chunk at each step.
+    """
+    weights = [_entity_weights(chunk) for chunk in chunks]
+    totals = [sum(w.values()) for w in weights]
+    covered = set()
+
+    heap = [(-totals[i], -totals[i], i) for i in range(len(chunks))]
+    heapq.heapify(heap)
+
+    ranked = []
+    while heap:
+        neg_gain, neg_total, i = heapq.heappop(heap)
+        gain = sum(weight for entity, weight in weights[i].items() if entity not in covered)
+        if heap and gain < -neg_gain and (-gain, neg_total, i) > heap[0]:
+            heapq.heappush(heap, (-gain, neg_total, i))
+            continue
+        ranked.append(chunks[i])
+        covered.update(weights[i])
+
+    return ranked
+
+
+def select_chunks(chunks: List[Chunk], max_tokens: int) -> Tuple[List[Chunk], int]:
+    """
+    Keeps the Chunks (already ranked) that fit in `max_tokens`, skipping those that would overflow it.
+    If even the first Chunk does not fit, it is truncated. Returns the selected Chunks and their tokens.
+    """
+    selected, tokens = [], 0
+    for chunk in chunks:
+        chunk_tokens = count_tokens(chunk.text)
+        if tokens + chunk_tokens > max_tokens:
+            if not selected:
+                text = truncate_to_tokens(chunk.text, max_tokens)
+                selected.append(chunk.model_copy(update={"text": text}))
+                tokens += count_tokens(text)
+            continue
+        selected.append(chunk)
+        tokens += chunk_tokens
+
+    if len(selected) < len(chunks):
+        logger.info(f"Selected {len(selected)}/{len(chunks)} Chunks within {max_tokens} tokens")
+    return selected, tokens
+
+
+def pack_chunks(chunks: List[Chunk], max_tokens: int) -> List[List[Chunk]]:
+    """
+    Splits Chunks (already ranked) into consecutive groups of at most `max_tokens` tokens each,
+    so that the first groups hold the most central Chunks.
+    """
+    groups, group, tokens = [], [], 0
+    for chunk in chunks:
+        chunk_tokens = count_tokens(chunk.text)
+        if group and tokens + chunk_tokens > max_tokens:
+            groups.append(group)
+            group, tokens = [], 0
+        if chunk_tokens > max_tokens:
+            chunk = chunk.model_copy(update={"text": truncate_to_tokens(chunk.text, max_tokens)})
+            chunk_tokens = max_tokens
+        group.append(chunk)
+        tokens += chunk_tokens
+
+    if group:
+        groups.append(group)
+    return groups
+
+
+def format_chunks(chunks: List[Chunk]) -> str:
+    """ Text of Chunks as passed to the summarization prompt. """
+    return "".join(chunk.text.replace("\n\n", "\n") + "\n\n" for chunk in chunks)
@@ -1,87 +1,298 @@
-from typing import List
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, List, Optional
 from src.graph.knowledge_graph import KnowledgeGraph
 from src.factory.embeddings import get_embeddings
 from src.factory.llm import fetch_llm
-from src.config import LLMConf, EmbedderConf
+from src.factory.resilience import call_with_resilience, get_resilience
+from src.agents.community_input import format_chunks, pack_chunks, rank_chunks, select_chunks
+from src.config import CommunityReportsConf, LLMConf, EmbedderConf
 from src.graph.graph_model import Community, CommunityReport
 from src.prompts.communities import get_summarize_community_prompt
+from src.schema import Chunk
 from src.utils.logger import get_logger
+from src.utils.metrics import gauge
+from src.utils.tokens import count_tokens, truncate_to_tokens
+from src.utils.tracing import current_span, propagate, traced
 
 
 logger = get_logger(__name__)
 
 
 class CommunitiesSummarizer:
-    """ 
-    Agent in charge of producing summaries of Community Reports. 
     """
-    
+    Agent in charge of producing summaries of Community Reports.
+
+    Communities are summarized concurrently by up to `reports_conf.max_workers` workers, their calls held back
+    by the limiter shared by every client of the summarizer LLM (see `LLMConf.rate_limit`).
+
+    The input of each summary is capped to `reports_conf.max_input_tokens`: Chunks are ranked by the coverage
+    and the pagerank of the entities they mention, and very large communities are summarized with map-reduce.
+
+    Failed calls are retried (see `ResilienceConf`); communities still failing get no report, and are summarized again
+    by the next `update_reports`, as their fingerprint matches no stored report.
+    """
+
     def __init__(
-        self, 
-        llm_conf: LLMConf, 
-        embeddings_conf: EmbedderConf
+        self,
+        llm_conf: LLMConf,
+        embeddings_conf: EmbedderConf,
+        reports_conf: Optional[CommunityReportsConf] = None
         ):
         self.llm = fetch_llm(llm_conf)
+        self.resilience = get_resilience(llm_conf.type, llm_conf.model, llm_conf.resilience)
         self.embeddings = get_embeddings(embeddings_conf)
         self.summarize_community_prompt = get_summarize_community_prompt()
-        
-        
-    def get_reports(self, communities: List[Community]) -> List[CommunityReport]:
-        """ 
-        Generate Community Reports for available communities in the Graph. 
+
+        self.reports_conf = reports_conf or CommunityReportsConf()
+
+
+    @traced("communities.get_reports")
+    def get_reports(
+        self,
+        communities: List[Community],
+        on_reports: Optional[Callable[[List[CommunityReport]], None]] = None
+        ) -> List[CommunityReport]:
+        """
+        Generate Community Reports for available communities in the Graph.
+
+        Summaries are generated concurrently and embedded in batches of `reports_conf.embedding_batch_size`
+        as they complete. Each embedded batch is passed to `on_reports` (i.e. `KnowledgeGraph.store_community_reports`)
+        right away, so that finished reports are not lost if generation is interrupted.
+        Reports of a batch whose embedding failed are embedded again once every community is summarized,
+        and returned without embeddings if it fails again.
         """
         reports = []
-        
-        for comm in communities:
-            
-            report = self.get_community_report(comm)
-            
-            reports.append(report)
-            
+        pending: List[CommunityReport] = []
+        unembedded: List[CommunityReport] = []
+        batch_size = max(1, self.reports_conf.embedding_batch_size)
+
+        def _flush(batch: List[CommunityReport]):
+            batch = self.embed_reports(batch)
+            embedded = [report for report in batch if report.summary_embeddings is not None]
+            unembedded.extend(report for report in batch if report.summary_embeddings is None)
+            if embedded and on_reports is not None:
+                try:
+                    on_reports(embedded)
+                except Exception as e:
+                    logger.warning(f"Issue handing over a batch of {len(embedded)} Community Reports: {e}")
+            reports.extend(embedded)
+
+        with ThreadPoolExecutor(
+            max_workers=max(1, self.reports_conf.max_workers),
+            thread_name_prefix="community-summarizer"
+        ) as executor:
+            futures = [executor.submit(propagate(self.summarize_community), comm) for comm in communities]
+            queue_depth = gauge("ingestion_queue_depth", "Items waiting for an ingestion stage", stage="summarize")
+            queue_depth.inc(len(futures))
+            done = 0
+
+            try:
+                for i, future in enumerate(as_completed(futures), start=1):
+                    done += 1
+                    queue_depth.dec()
+                    report = future.result()
+                    if report is not None:
+                        pending.append(report)
+                    if len(pending) >= batch_size:
+                        _flush(pending[:])
+                        pending.clear()
+                    if i % batch_size == 0:
+                        logger.info(f"Summarized {i}/{len(communities)} communities")
+            finally:
+                queue_depth.dec(len(futures) - done)
+
+        if pending:
+            _flush(pending[:])
+
+        if unembedded:
+            # summaries are not generated again for a failed embedding call, it is only retried
+            retried = unembedded[:]
+            unembedded.clear()
+            for start in range(0, len(retried), batch_size):
+                _flush(retried[start:start + batch_size])
+        if unembedded:
+            logger.warning(f"{len(unembedded)} Community Reports could not be embedded, they are returned without embeddings")
+            reports.extend(unembedded)
+
+        current_span().set_attributes({"communities": len(communities), "reports": len(reports)})
+        logger.info(f"Generated {len(reports)} Community Reports out of {len(communities)} communities")
         return reports
-            
-    
-    def get_community_report(self, community: Community) -> CommunityReport | None:
-        """ 
-        Generates a CommunityReport for a given community, out of chunks available in said community. 
-        It will also embed the summary to make it retrievable
+
+
+    @traced("communities.update_reports")
+    def update_reports(self, graph: KnowledgeGraph, comm_type: str = "leiden", level: int = 0) -> List[CommunityReport]:
+        """
+        Incrementally updates the Community Reports stored in the graph after communities have been recomputed:
+
+        * communities whose fingerprint (see `Community.fingerprint`) matches a stored report are skipped,
+        their report is only relabeled if community detection assigned them a new id;
+        * the others are summarized, embedded and stored;
+        * reports whose fingerprint no longer matches any community are deleted, once their replacements are stored:
+        if communities cannot be fetched, or a report cannot be regenerated or stored, stale reports are kept.
+
+        Returns the newly generated reports.
         """
-        if not community.chunks: 
+        try:
+            communities = graph.get_communities(comm_type, level)
+            stored_reports = graph.get_report_fingerprints(comm_type, level)
+        except Exception as e:
+            current_span().record_exception(e)
+            logger.warning(f"Unable to fetch the communities or reports of {comm_type} level {level}, Community Reports left as they are: {e}")
+            return []
+
+        stored = {}
+        for record in stored_reports:
+            if record["fingerprint"] is not None:
+                stored[record["fingerprint"]] = record
+            else:
+                stored[record["id"]] = record  # legacy reports without fingerprint are always regenerated
+
+        changed, relabeled, kept = [], {}, set()
+        for community in communities:
+            record = stored.get(community.fingerprint())
+            if record is None:
+                changed.append(community)
+                continue
+            kept.add(record["id"])
+            if record["community_id"] != community.community_id:
+                relabeled[record["id"]] = community.community_id
+
+        stale = [record for record in stored.values() if record["id"] not in kept]
+        logger.info(
+            f"{len(communities) - len(changed)}/{len(communities)} communities unchanged ({len(relabeled)} relabeled), "
+            f"regenerating {len(changed)} Community Reports"
+        )
+
+        graph.relabel_community_reports(relabeled)
+        replaced = set()
+
+        def _store(batch: List[CommunityReport]):
+            # raises if the batch could not be stored: its communities are then not replaced
+            graph.store_community_reports(batch)
+            replaced.update(report.fingerprint for report in batch if report.summary_embeddings is not None)
+
+        reports = self.get_reports(changed, on_reports=_store)
+
+        # a stale report is deleted once the changed communities with its id have a stored replacement;
+        # reports of communities that disappeared only once every changed community has one
+        failed_ids = {community.community_id for community in changed if community.fingerprint() not in replaced}
+        replaced_ids = {community.community_id for community in changed if community.fingerprint() in replaced}
+        deleted = [
+            record["id"] for record in stale
+            if record["community_id"] not in failed_ids
+            and (not failed_ids or record["community_id"] in replaced_ids)
+        ]
+        if failed_ids:
+            logger.warning(
+                f"{len(failed_ids)} Community Reports could not be regenerated, "
+                f"keeping {len(stale) - len(deleted)} stale Community Reports until they are"
+            )
+        graph.delete_community_reports(deleted)
+        logger.info(f"Deleted {len(deleted)} stale Community Reports")
+
+        return reports
+
+
+    def _invoke(self, prompt: str) -> str:
+        return self.llm.invoke(input=prompt).content
+
+
+    def _summarize(self, context: str) -> str:
+        return call_with_resilience(
+            self.resilience,
+            self._invoke,
+            self.summarize_community_prompt.format(
+                context=context
+            )
+        )
+
+
+    def _map_reduce_summary(self, community: Community, ranked_chunks: List[Chunk]) -> str:
+        """
+        Summarizes groups of `max_input_tokens` tokens of Chunks (at most `max_map_calls`, most central first),
+        then summarizes the partial summaries.
+        """
+        groups = pack_chunks(ranked_chunks, self.reports_conf.max_input_tokens)
+        if len(groups) > self.reports_conf.max_map_calls:
+            logger.info(
+                f"Community {community.community_type}: {community.community_id} summarized out of "
+                f"{self.reports_conf.max_map_calls}/{len(groups)} groups of its most central Chunks"
+            )
+            groups = groups[:self.reports_conf.max_map_calls]
+
+        partial_summaries = [self._summarize(format_chunks(group)) for group in groups]
+        context = truncate_to_tokens("\n\n".join(partial_summaries), self.reports_conf.max_input_tokens)
+        return self._summarize(context)
+
+
+    @traced("communities.summarize")
+    def summarize_community(self, community: Community) -> CommunityReport | None:
+        """
+        Generates the CommunityReport of a given community, out of chunks available in said community,
+        without embedding its summary.
+
+        Only the Chunks covering the most central entities that fit in `max_input_tokens` are summarized;
+        communities larger than `max_input_tokens * map_reduce_factor` are summarized with map-reduce.
+        """
+        if not community.chunks:
             logger.warning(f"There are no Chunks to summarize for community {community.community_type}: {community.community_id}")
             return None
-        
-        chunks_content = ""
-        for chunk in community.chunks:
-            chunks_content+=chunk.text.replace("\n\n","\n")+("\n\n")
-        
-        try:    
-            summary = self.llm.invoke(
-                input=self.summarize_community_prompt.format(
-                    context=chunks_content
-                )
-            ).content
+
+        ranked_chunks = rank_chunks(community.chunks)
+        total_tokens = sum(count_tokens(chunk.text) for chunk in ranked_chunks)
+        current_span().set_attributes({
+            "community.type": community.community_type, 
+            "community.id": community.community_id, 
+            "community.chunks": len(ranked_chunks), 
+            "community.tokens": total_tokens
+        })
+
+        try:
+            if total_tokens > self.reports_conf.max_input_tokens * self.reports_conf.map_reduce_factor:
+                summary = self._map_reduce_summary(community, ranked_chunks)
+            else:
+                selected_chunks, _ = select_chunks(ranked_chunks, self.reports_conf.max_input_tokens)
+                summary = self._summarize(format_chunks(selected_chunks))
         except Exception as e:
+            current_span().record_exception(e)
             logger.warning(f"Issue summarizing Chunks for community {community.community_type}: {community.community_id}: {e}")
             return None
-        
-        try:
-            summary_embeddings = self.embeddings.embed_documents([summary])[0]
-        except Exception as e:
-            logger.warning(f"Issue embedding Summary for community {community.community_type}: {community.community_id}: {e}")
-        
-        report = CommunityReport(
+
+        return CommunityReport(
             communtiy_type=community.community_type,
+            fingerprint=community.fingerprint(),
             community_id=community.community_id,
+            community_level=community.level,
             summary=summary,
-            community_size=community.community_size,
-            summary_embeddings=summary_embeddings
+            community_size=community.community_size
         )
-        
-        return report
-        
-    
-        
-        
-        
-        
-        
\ No newline at end of file
+
+
+    def embed_reports(self, reports: List[CommunityReport]) -> List[CommunityReport]:
+        """
+        Embeds the summaries of a batch of reports with a single call, to make them retrievable.
+        If the call fails, the reports are returned without embeddings.
+        """
+        if not reports:
+            return []
+        try:
+            summary_embeddings = self.embeddings.embed_documents([report.summary for report in reports])
+        except Exception as e:
+            logger.warning(f"Issue embedding a batch of {len(reports)} Community Report summaries: {e}")
+            return list(reports)
+
+        for report, embeddings in zip(reports, summary_embeddings):
+            report.summary_embeddings = embeddings
+        return list(reports)
+
+
+    def get_community_report(self, community: Community) -> CommunityReport | None:
+        """
+        Generates a CommunityReport for a given community, out of chunks available in said community.
+        It will also embed the summary to make it retrievable
+        """
+        report = self.summarize_community(community)
+        if report is None:
+            return None
+
+        return self.embed_reports([report])[0]
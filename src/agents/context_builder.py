@@ -0,0 +1,193 @@
+from pydantic import BaseModel
+from typing import Any, Dict, List, Optional
+
+from src.config import ContextConf
+from src.utils.logger import get_logger
+from src.utils.tokens import count_tokens
+
+
+logger = get_logger(__name__)
+
+
+class ContextPiece(BaseModel):
+    """
+    A piece of context retrieved for a question.
+
+    -----------
+    attributes:
+    -----------
+    `text`: `str`
+        Retrieved text, de-duplicated against the other pieces of the same section
+    `key`: `Optional[Any]`
+        Identity of the piece (i.e. `(filename, chunk_id)` for a Chunk): pieces with the same key are kept once
+    `score`: `float`
+        Retrieval score, pieces with higher scores are kept first when the budget is tight
+    `extra`: `str`
+        Text appended to the piece when rendering (i.e. mentioned entities), counted in the budget but never de-duplicated
+    """
+    text: str
+    key: Optional[Any] = None
+    score: float = 0.0
+    extra: str = ""
+
+
+class SectionUsage(BaseModel):
+    """
+    Token accounting of a section of the context.
+    """
+    budget: Optional[int] = None
+    tokens: int = 0
+    pieces: int = 0
+    duplicates: int = 0
+    trimmed: int = 0
+    dropped: int = 0
+
+
+class BuiltContext(BaseModel):
+    """
+    Context assembled by the `ContextBuilder`: rendered text and token accounting for each section.
+    """
+    sections: Dict[str, str] = {}
+    usage: Dict[str, SectionUsage] = {}
+
+    @property
+    def total_tokens(self) -> int:
+        return sum(usage.tokens for usage in self.usage.values())
+
+    def text(self, section: str) -> str:
+        return self.sections.get(section, "")
+
+
+def _boundary_overlap(left: str, right: str, min_overlap: int, max_overlap: int) -> int:
+    """ Length of the longest suffix of `left` that is also a prefix of `right`, if at least `min_overlap` long. """
+    for size in range(min(len(left), len(right), max_overlap), min_overlap - 1, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+class ContextBuilder:
+    """
+    Assembles the context passed to the QA LLM out of retrieved pieces, grouped in sections
+    (i.e. `chunks`, `reports`, `graph`):
+
+    * pieces with the same key are kept once, pieces contained in (or overlapping the boundary of)
+    a piece with a higher score are dropped (or trimmed), as it happens with overlapping chunks or adjacent chunks windows;
+    * pieces are ranked by retrieval score and kept until the token budget of their section is exhausted;
+    * kept pieces are rendered in the order they were added, and the tokens used by each section are reported.
+
+    Rows returned by a Cypher query (`cypher`) are not de-duplicated, only kept within their budget.
+    """
+
+    SECTIONS = ("chunks", "reports", "graph", "cypher")
+
+    def __init__(self, conf: Optional[ContextConf] = None):
+        conf = conf or ContextConf()
+        self.budgets: Dict[str, Optional[int]] = {
+            "chunks": conf.chunks_budget,
+            "reports": conf.reports_budget,
+            "graph": conf.graph_budget,
+            "cypher": conf.cypher_budget,
+        }
+        self.min_overlap = conf.min_overlap_chars
+        self.max_overlap = conf.max_overlap_chars
+        self._pieces: Dict[str, List[ContextPiece]] = {}
+
+
+    def add(self, section: str, text: str, key: Optional[Any] = None, score: float = 0.0, extra: str = ""):
+        """ Adds a piece of context to a section. """
+        if text or extra:
+            self._pieces.setdefault(section, []).append(
+                ContextPiece(text=text or "", key=key, score=score, extra=extra)
+            )
+
+
+    def extend(self, section: str, pieces: List[ContextPiece]):
+        """ Adds already built pieces of context to a section. """
+        for piece in pieces:
+            self.add(section, piece.text, piece.key, piece.score, piece.extra)
+
+
+    def _deduplicate(self, pieces: List[ContextPiece], usage: SectionUsage) -> List[ContextPiece]:
+        """
+        Drops pieces with a known key or contained in a kept one, trims overlaps with kept pieces.
+        Pieces are considered by decreasing score, so that the copy kept is the one with the highest score
+        (i.e. a retrieved chunk rather than the discounted copy of it from the window of another one).
+        """
+        kept: Dict[int, ContextPiece] = {}
+        seen_keys = set()
+
+        for i in sorted(range(len(pieces)), key=lambda i: pieces[i].score, reverse=True):
+            piece = pieces[i]
+            if piece.key is not None and piece.key in seen_keys:
+                usage.duplicates += 1
+                continue
+
+            text = piece.text.strip()
+            if text and any(text in other.text for other in kept.values()):
+                usage.duplicates += 1
+                continue
+
+            trimmed = False
+            for other in kept.values():
+                # overlapping windows: drop the part of the new piece already in context
+                overlap = _boundary_overlap(other.text, text, self.min_overlap, self.max_overlap)
+                if overlap:
+                    text = text[overlap:].strip()
+                    trimmed = True
+                overlap = _boundary_overlap(text, other.text, self.min_overlap, self.max_overlap)
+                if overlap:
+                    text = text[:-overlap].strip()
+                    trimmed = True
+
+            if not text and not piece.extra:
+                usage.duplicates += 1
+                continue
+            usage.trimmed += int(trimmed)
+
+            if piece.key is not None:
+                seen_keys.add(piece.key)
+            kept[i] = piece.model_copy(update={"text": text})
+
+        # kept pieces are rendered in the order they were added
+        return [kept[i] for i in sorted(kept)]
+
+
+    def build(self, separators: Optional[Dict[str, str]] = None) -> BuiltContext:
+        """
+        De-duplicates, ranks and selects the pieces of each section within its token budget.
+        `separators` maps sections to the string used to join their pieces (a new line by default).
+        """
+        separators = separators or {}
+        built = BuiltContext()
+
+        for section, pieces in self._pieces.items():
+            budget = self.budgets.get(section)
+            usage = SectionUsage(budget=budget)
+
+            if section != "cypher":
+                pieces = self._deduplicate(pieces, usage)
+
+            # rank by score (stable, so equal scores keep retrieval order) and fill the budget
+            ranked = sorted(range(len(pieces)), key=lambda i: pieces[i].score, reverse=True)
+            selected = set()
+            for i in ranked:
+                tokens = count_tokens(pieces[i].text + pieces[i].extra)
+                if budget is not None and usage.tokens + tokens > budget:
+                    usage.dropped += 1
+                    continue
+                usage.tokens += tokens
+                selected.add(i)
+
+            usage.pieces = len(selected)
+            separator = separators.get(section, "\n")
+            built.sections[section] = separator.join(
+                pieces[i].text + pieces[i].extra for i in range(len(pieces)) if i in selected
+            )
+            built.usage[section] = usage
+
+        logger.info(
+            f"Built context of {built.total_tokens} tokens: "
+            + ", ".join(f"{name}={usage.tokens}/{usage.budget}" for name, usage in built.usage.items())
+        )
+        return built
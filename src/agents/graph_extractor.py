@@ -1,13 +1,18 @@
+import time
 from src.utils.logger import get_logger
 from typing import Optional
 
 # from langchain_neo4j.graphs.graph_document import Relationship, Node
 from langchain_core.documents import Document
 
-from src.factory.llm import fetch_llm
+from src.factory.llm import fetch_llm, record_llm_metrics
+from src.factory.rate_limiter import get_provider_limiter, rate_limited
+from src.factory.resilience import call_with_resilience, get_resilience
 from src.config import LLMConf
 from src.graph.graph_model import Ontology, _Graph
 from src.prompts.graph_extractor import get_graph_extractor_prompt
+from src.utils.tokens import count_tokens
+from src.utils.tracing import span
 
 
 logger = get_logger(__name__)
@@ -20,6 +25,9 @@ class GraphExtractor:
     def __init__(self, conf: LLMConf, ontology: Optional[Ontology]=None):
         self.conf = conf
         self.llm = fetch_llm(conf)
+        # structured outputs are requested from the client of the provider, not through LangChain callbacks
+        self.limiter = get_provider_limiter(conf.type, conf.model, conf.rate_limit)
+        self.resilience = get_resilience(conf.type, conf.model, conf.resilience)
         self.prompt = get_graph_extractor_prompt()
 
         self.prompt.partial_variables = {
@@ -29,13 +37,21 @@ class GraphExtractor:
         }
 
 
-    def extract_graph(self, text: str) -> _Graph:
+    def _parse(self, input_prompt: str, estimated_tokens: int) -> _Graph:
         """ 
-        Extracts a graph from a text.
+        Requests the graph of a prompt from the model, as a structured output, within its rate limits.
         """
-        input_prompt=self.prompt.format(input_text=text)
-        if self.llm is not None:
-            try:
+        start = time.perf_counter()
+        try:
+            with span(
+                "llm.extract_graph", 
+                kind="CLIENT", 
+                **{
+                    "gen_ai.operation.name": "chat", 
+                    "gen_ai.request.model": self.conf.model, 
+                    "gen_ai.usage.input_tokens": count_tokens(input_prompt)
+                }
+            ) as llm_span, rate_limited(self.limiter, estimated_tokens) as permit:
                 raw=self.llm.chat.completions.parse(
                 messages=[
                 {
@@ -51,8 +67,28 @@ class GraphExtractor:
                 max_completion_tokens=20000,
                 response_format=_Graph
                 )
-                graph=raw.choices[0].message.parsed
-                return graph 
-                
-            except Exception as e:
-                logger.warning(f"Error while extracting graph: {e}")
\ No newline at end of file
+                usage = getattr(raw, "usage", None)
+                input_tokens = getattr(usage, "prompt_tokens", None)
+                output_tokens = getattr(usage, "completion_tokens", None)
+                if permit is not None and input_tokens is not None:
+                    permit.tokens = input_tokens + (output_tokens or 0)
+                llm_span.set_attributes({
+                    "gen_ai.usage.input_tokens": input_tokens, 
+                    "gen_ai.usage.output_tokens": output_tokens
+                })
+        except Exception:
+            record_llm_metrics(self.conf.model, self.conf.type, time.perf_counter() - start, error=True)
+            raise
+        record_llm_metrics(self.conf.model, self.conf.type, time.perf_counter() - start, input_tokens, output_tokens)
+        return raw.choices[0].message.parsed
+
+
+    def extract_graph(self, text: str) -> Optional[_Graph]:
+        """ 
+        Extracts a graph from a text. Failed calls are retried (see `ResilienceConf`):
+        the last error is raised once retries are exhausted, so that the Chunk can be dead-lettered.
+        """
+        input_prompt=self.prompt.format(input_text=text)
+        estimated_tokens = count_tokens(input_prompt) if self.limiter is not None and self.limiter.counts_tokens else 0
+        if self.llm is not None:
+            return call_with_resilience(self.resilience, self._parse, input_prompt, estimated_tokens)
@@ -1,19 +1,67 @@
-from typing import List, Optional, Any, Dict, Tuple
+import contextvars
+import json
+import re
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError, wait
+from hashlib import md5
+from typing import Iterator, List, Optional, Any, Dict, Tuple
 
 from langchain_core.messages import BaseMessage
-from langchain_neo4j.chains.graph_qa.cypher import GraphCypherQAChain
+from langchain_neo4j.chains.graph_qa.cypher import (
+    CypherQueryCorrector, 
+    GraphCypherQAChain, 
+    Schema, 
+    construct_schema, 
+    extract_cypher
+)
 
-from src.config import LLMConf
-from src.graph.graph_queries import get_adjacent_chunks, get_mentioned_entities, filter_graph_by_communities
+from src.agents.context_builder import BuiltContext, ContextBuilder, ContextPiece
+from src.cache.cypher_cache import CypherQueryCache
+from src.cache.semantic_cache import CacheProbe, SemanticAnswerCache
+from src.config import ContextConf, CypherCacheConf, GlobalSearchConf, LLMConf, RetrievalConf, RetrievalMode, SemanticCacheConf
+from src.graph.graph_model import CommunityReport
+from src.graph.graph_queries import expand_mentioned_entities, get_adjacent_chunks, filter_graph_by_communities
 from src.graph.knowledge_graph import KnowledgeGraph
 from src.factory.llm import fetch_llm
-from src.prompts.graph_qa import get_qa_prompt_with_subgraph, get_question_answering_prompt, get_rephrase_prompt, get_summarization_prompt
+from src.prompts.graph_qa import (
+    get_global_map_prompt,
+    get_global_reduce_prompt,
+    get_qa_prompt_with_subgraph, 
+    get_question_answering_prompt, 
+    get_rephrase_prompt, 
+    get_summarization_prompt
+)
 from src.schema import Chunk
+from src.utils.fusion import reciprocal_rank_fusion
 from src.utils.logger import get_logger
+from src.utils.metrics import counter
+from src.utils.tokens import count_tokens, truncate_to_tokens
+from src.utils.tracing import current_span, propagate, traced
 
 
 logger = get_logger(__name__)
 
+# adjacent chunks are ranked right below the chunk they were retrieved with
+ADJACENT_CHUNK_DISCOUNT = 0.9
+
+_MAP_SCORE = re.compile(r"SCORE:\s*(\d+)", re.IGNORECASE)
+
+# set when part of the context of the answer being generated was dropped on a timeout (a retrieval branch, map calls):
+# such an answer is not cached, as the same question may get a complete one next time
+_degraded: contextvars.ContextVar[bool] = contextvars.ContextVar("degraded_answer", default=False)
+
+
+def _parse_partial_answer(text: str) -> Tuple[str, int]:
+    """ 
+    Splits the answer of a map call of the global search into the partial answer and its helpfulness score (0-100). 
+    Answers without a score are rated `50`.
+    """
+    matches = list(_MAP_SCORE.finditer(text))
+    if not matches:
+        return text.strip(), 50
+    last = matches[-1]
+    return text[:last.start()].strip(), min(100, int(last.group(1)))
+
 
 class GraphAgentResponder:
     """
@@ -26,7 +74,12 @@ class GraphAgentResponder:
         qa_llm_conf: LLMConf,
         cypher_llm_conf: LLMConf, 
         graph: KnowledgeGraph,
-        rephrase_llm_conf: Optional[LLMConf]=None
+        rephrase_llm_conf: Optional[LLMConf]=None,
+        cache_conf: Optional[SemanticCacheConf]=None,
+        cypher_cache_conf: Optional[CypherCacheConf]=None,
+        context_conf: Optional[ContextConf]=None,
+        retrieval_conf: Optional[RetrievalConf]=None,
+        global_search_conf: Optional[GlobalSearchConf]=None
     ):
         self.graph = graph
         self.qa_llm = fetch_llm(qa_llm_conf)
@@ -35,6 +88,8 @@ class GraphAgentResponder:
         self.qa_prompt_with_subgraph = get_qa_prompt_with_subgraph()
 
         self.summarize_prompt = get_summarization_prompt()
+        self.global_map_prompt = get_global_map_prompt()
+        self.global_reduce_prompt = get_global_reduce_prompt()
 
         self.graph_qa_chain = GraphCypherQAChain.from_llm(
             qa_llm=self.qa_llm, 
@@ -45,118 +100,402 @@ class GraphAgentResponder:
             validate_cypher=True, 
             return_intermediate_steps=True
         )
+        self._chain_structured_schema = self.graph.get_structured_schema
         self.rephrase_llm = None
         if rephrase_llm_conf:
             self.rephrase_llm = fetch_llm(rephrase_llm_conf)
             self.rephrase_prompt = get_rephrase_prompt()
-            self.rephrase_prompt.partial_variables = {
-                "graph_labels": self.graph.labels,
-                "graph_relationships": self.graph.relationships
-            }
             
+        self.cache = None
+        if cache_conf:
+            self.cache = SemanticAnswerCache(self.graph.embeddings, cache_conf)
+            
+        self.cypher_cache = None
+        if cypher_cache_conf:
+            self.cypher_cache = CypherQueryCache(cypher_cache_conf, self.graph.embeddings)
+            
+        self.context_conf = context_conf or ContextConf()
+        self.last_context: Optional[BuiltContext] = None
         
-    def answer_with_cypher(
+        self.retrieval_conf = retrieval_conf or RetrievalConf()
+        if self.retrieval_conf.mode == RetrievalMode.HYBRID:
+            self.graph.create_fulltext_index()
+            
+        self.global_search_conf = global_search_conf or GlobalSearchConf()
+        
+        
+    def _rephrase(self, query: str, history: str=None) -> str | None:
+        """ 
+        Rephrases the user's question according to the graph schema, if a rephrasing LLM is available.
+        Labels and relationships are read at each call, so that the schema refreshed after an ingestion is used.
+        """
+        if not self.rephrase_llm:
+            return None
+        try: 
+            prompt = self.rephrase_prompt.format(
+                question=query, 
+                history=history,
+                graph_labels=self.graph.labels,
+                graph_relationships=self.graph.relationships
+            )
+            rephrased_question = self.rephrase_llm.invoke(input=prompt).content
+            logger.info(f"Rephrased Question: {rephrased_question}")
+            return rephrased_question
+        except Exception as e:
+            logger.warning(f"Failed to rephrase user question with exception: {e}")
+            return None
+        
+        
+    @traced("responder.chunk_pieces")
+    def _chunk_pieces(
         self, 
-        query: str, 
-        intermediate_steps: bool=False, 
-        history: str=None
-        ) -> str | Tuple[str, List]:
+        docs_and_scores: List[Tuple[Any, float]], 
+        use_adjacent_chunks: bool=False
+        ) -> List[ContextPiece]:
         """ 
-        Uses only the Cypher chain to answer the user's question.
+        Turns Chunks retrieved by similarity search into scored pieces of context, 
+        optionally expanded with their adjacent chunks.
         """
+        pieces = []
+        current_span().set_attributes({"retrieval.chunks": len(docs_and_scores), "retrieval.adjacent_chunks": use_adjacent_chunks})
         
-        if self.rephrase_llm:
-            try: 
-                rephrased_question = self.rephrase_llm.invoke(input=self.rephrase_prompt.format(question=query, history=history)).content
-                logger.info(f"Rephrased Question: {rephrased_question}")
-            except Exception as e:
-                logger.warning(f"Failed to rephrase user question with exception: {e}")
-                rephrased_question = None
-        else:
-            rephrased_question = None
+        if not use_adjacent_chunks:
+            for doc, score in docs_and_scores:
+                pieces.append(
+                    ContextPiece(
+                        text=doc.page_content, 
+                        key=(doc.metadata.get("filename"), doc.metadata.get("chunk_id")), 
+                        score=score
+                    )
+                )
+            return pieces
+        
+        # search adjacent chunks 
+        with self.graph._driver.session() as session:
+            for doc, score in docs_and_scores:
+                current_chunk = Chunk(
+                    chunk_id=doc.metadata["chunk_id"],
+                    text=doc.page_content,
+                    filename=doc.metadata["filename"]
+                )
+                prev_chunk, current_chunk, next_chunk = get_adjacent_chunks(session, current_chunk)
+                
+                for chunk, chunk_score in (
+                    (prev_chunk, score * ADJACENT_CHUNK_DISCOUNT), 
+                    (current_chunk, score), 
+                    (next_chunk, score * ADJACENT_CHUNK_DISCOUNT)
+                ):
+                    if chunk is not None:
+                        pieces.append(
+                            ContextPiece(text=chunk.text, key=(chunk.filename, chunk.chunk_id), score=chunk_score)
+                        )
+            session.close()
             
+        return pieces
+        
+        
+    @traced("responder.search_chunks")
+    def _search_chunks(self, query: str, filter: Optional[Dict[str, Any]]=None) -> List[Tuple[Any, float]]:
+        """ 
+        First-stage retrieval of Chunks, by similarity search or, in `hybrid` mode, by fusing similarity search 
+        and full-text search with reciprocal rank fusion. A retriever that fails is skipped.
+        """
+        conf = self.retrieval_conf
+        current_span().set_attributes({"retrieval.mode": conf.mode.value, "retrieval.filter": json.dumps(filter, default=str) if filter else None})
+        if conf.mode == RetrievalMode.VECTOR:
+            docs_and_scores = self.graph.chunk_store.similarity_search_with_score(query=query, k=conf.k, filter=filter)
+            current_span().set_attribute("retrieval.chunks", len(docs_and_scores))
+            return docs_and_scores
+        
+        rankings = []
         try:
-            graph_qa_output = self.graph_qa_chain._call(
-                inputs={"query": rephrased_question} if rephrased_question is not None else {"query": query}
-            )
-            if intermediate_steps:
-                return graph_qa_output["result"], graph_qa_output["intermediate_steps"]
-            else: 
-                return graph_qa_output["result"]
+            rankings.append(self.graph.chunk_store.similarity_search_with_score(query=query, k=conf.fetch_k, filter=filter))
         except Exception as e:
-            logger.warning(f"Problem Answering with CYPHER chain: {e}")
-            
+            logger.warning(f"Vector search failed in hybrid retrieval: {e}")
+        try:
+            rankings.append(self.graph.fulltext_search(query, k=conf.fetch_k, filter=filter))
+        except Exception as e:
+            logger.warning(f"Full-text search failed in hybrid retrieval: {e}")
             
-    def answer_with_context(
+        docs_and_scores = reciprocal_rank_fusion(rankings, k=conf.rrf_k, top_n=conf.k)
+        current_span().set_attribute("retrieval.chunks", len(docs_and_scores))
+        return docs_and_scores
+        
+        
+    def _retrieve_vector_context(
         self, 
         query: str, 
         use_adjacent_chunks: bool=False, 
-        history: str=None
-        )-> str:
+        filter: Optional[Dict[str, Any]]=None
+        ) -> List[ContextPiece]:
         """ 
-        Uses only vanilla RAG to answer the user's question.  
-        If `use_adjacent_chunks=True` will query the graph for additional context 
-        compared to the Chunks retrieved by the similarity search. Latency will be higher due to expanded context. 
+        Retrieves Chunks (see `_search_chunks`, optionally expanded with adjacent chunks) 
+        and returns them as scored pieces of context.
         """
-        context = ""
-        
         try:
-            context_docs = self.graph.vector_store.similarity_search(query=query)
+            docs_and_scores = self._search_chunks(query, filter)
         except Exception as e:
             logger.warning(f"Failed to retrieve context with exception: {e}")
-            context_docs = []
+            docs_and_scores = []
+                
+        return self._chunk_pieces(docs_and_scores, use_adjacent_chunks)
+    
+    
+    @traced("responder.build_context")
+    def _build_context(self, builder: ContextBuilder, separators: Optional[Dict[str, str]]=None) -> BuiltContext:
+        """ 
+        Builds the context within the configured token budgets and keeps its accounting in `last_context`.
+        """
+        built = builder.build(separators)
+        self.last_context = built
+        current_span().set_attributes({
+            "context.tokens": built.total_tokens,
+            **{f"context.{section}.tokens": usage.tokens for section, usage in built.usage.items()}
+        })
+        return built
+    
+    
+    def _sync_chain_schema(self):
+        """ 
+        Rebuilds the schema used by the Cypher chain if the graph schema has been refreshed since 
+        (e.g. in the background after an ingestion). Every refresh assigns a new structured schema object, 
+        so an identity check is enough to detect it.
+        """
+        structured_schema = self.graph.get_structured_schema
+        if structured_schema is self._chain_structured_schema:
+            return
+        
+        self.graph_qa_chain.graph_schema = construct_schema(
+            structured_schema, 
+            [], 
+            [], 
+            self.graph._enhanced_schema
+        )
+        if self.graph_qa_chain.cypher_query_corrector:
+            self.graph_qa_chain.cypher_query_corrector = CypherQueryCorrector(
+                [Schema(el["start"], el["type"], el["end"]) for el in structured_schema.get("relationships", [])]
+            )
+        self._chain_structured_schema = structured_schema
+        logger.info("Cypher chain schema updated")
         
-        if use_adjacent_chunks:
-            for doc in context_docs:
+        
+    @traced("responder.generate_cypher")
+    def _generate_cypher(self, question: str) -> str:
+        """ 
+        Generates (and corrects, if enabled) a Cypher query for the (rephrased) question with the Cypher LLM.
+        """
+        generated_cypher = self.graph_qa_chain.cypher_generation_chain.invoke(
+            {
+                "question": question, 
+                "examples": None, 
+                "schema": self.graph_qa_chain.graph_schema
+            }
+        )
+        generated_cypher = extract_cypher(generated_cypher)
+        
+        if self.graph_qa_chain.cypher_query_corrector:
+            generated_cypher = self.graph_qa_chain.cypher_query_corrector(generated_cypher)
+            
+        logger.info(f"Generated Cypher: {generated_cypher}")
+        current_span().set_attribute("db.query.text", generated_cypher)
+        
+        return generated_cypher
     
-                current_chunk = Chunk(
-                    chunk_id=doc.metadata["chunk_id"],
-                    text=doc.page_content,
-                    filename=doc.metadata["filename"]
-                )
-                # search adjacent chunks 
-                with self.graph._driver.session() as session:
-                    prev_chunk, current_chunk, next_chunk = get_adjacent_chunks(session, current_chunk)
-                    session.close()
-                
-                context += f"\n {prev_chunk.text}" if prev_chunk is not None else ""
-                context += f"\n {current_chunk.text}"
-                context += f"\n {next_chunk.text}" if next_chunk is not None else ""
-        else: 
-            for doc in context_docs:
-                context += f"\n {doc.page_content}"
+    
+    @traced("responder.cypher")
+    def _run_cypher_steps(self, query: str, history: str=None) -> Tuple[str, List[Dict[str, Any]]]:
+        """ 
+        Generates a Cypher query for the (rephrased) question and runs it against the graph, 
+        skipping the QA step of the Cypher chain.  
+        Returns the question the query was generated for (rephrased, if a rephrasing LLM is available) 
+        and the same intermediate steps as `GraphCypherQAChain`: `[{"query": ...}, {"context": ...}]`.
+        
+        If the Cypher cache is enabled, queries already validated for the same (rephrased) question, or a paraphrase of it, 
+        on the same schema skip the Cypher LLM call and go straight to execution. 
+        """
+        self._sync_chain_schema()
+        schema = self.graph_qa_chain.graph_schema
+        # the rephrased question depends on the history: it is the one the cached queries answer
+        question = self._rephrase(query, history) or query
+        
+        if self.cypher_cache is not None:
+            cached_cypher = self.cypher_cache.get(question, schema)
+            if cached_cypher is not None:
+                try:
+                    context = self.graph.query(cached_cypher)[: self.graph_qa_chain.top_k]
+                    logger.info(f"Cached Cypher: {cached_cypher}")
+                    current_span().set_attributes({"cypher.cached": True, "db.response.returned_rows": len(context)})
+                    return question, [{"query": cached_cypher}, {"context": context}]
+                except Exception as e:
+                    logger.warning(f"Cached Cypher query failed, generating a new one: {e}")
+                    self.cypher_cache.evict(schema, cached_cypher)
+        
+        generated_cypher = self._generate_cypher(question)
+        
+        if generated_cypher:
+            context = self.graph.query(generated_cypher)[: self.graph_qa_chain.top_k]
+        else:
+            context = []
             
-        answer: BaseMessage = self.qa_llm.invoke(
-            input=self.qa_prompt.format(
-                history=history,
-                question=query, 
-                context=context
+        current_span().set_attributes({"cypher.cached": False, "db.response.returned_rows": len(context)})
+            
+        # only queries that ran and returned something are considered validated
+        if self.cypher_cache is not None and generated_cypher and context:
+            self.cypher_cache.put(question, schema, generated_cypher)
+            
+        return question, [{"query": generated_cypher}, {"context": context}]
+    
+    
+    @traced("responder.concurrent_retrieval")
+    def _concurrent_retrieval(
+        self, 
+        query: str, 
+        use_adjacent_chunks: bool=False, 
+        filter: Optional[Dict[str, Any]]=None, 
+        history: str=None,
+        vector_timeout: Optional[float]=None,
+        cypher_timeout: Optional[float]=None
+        ) -> Tuple[List[ContextPiece], List[Dict[str, Any]] | None]:
+        """ 
+        Runs vector retrieval and Cypher generation/execution concurrently. 
+        Each branch is awaited until its own timeout (in seconds, measured from the fan-out); 
+        branches that fail or do not finish in time are dropped, the others are kept. 
+        
+        A running branch cannot be interrupted: one that times out is abandoned and completes in the background. 
+        Branches run on a pool of the request, so that abandoned ones never hold the workers of other requests. 
+        """
+        start = time.perf_counter()
+        executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="graph-responder-retrieval")
+        
+        def _collect(future: Future, timeout: Optional[float], branch: str) -> Any:
+            remaining = None if timeout is None else max(0.0, timeout - (time.perf_counter() - start))
+            try:
+                return future.result(timeout=remaining)
+            except FutureTimeoutError:
+                _degraded.set(True)
+                logger.warning(f"{branch} retrieval timed out after {timeout}s, abandoned, proceeding without it")
+            except Exception as e:
+                logger.warning(f"{branch} retrieval failed with exception: {e}")
+            return None
+        
+        try:
+            vector_future: Future = executor.submit(
+                propagate(self._retrieve_vector_context), 
+                query, 
+                use_adjacent_chunks, 
+                filter
+            )
+            cypher_future: Future = executor.submit(
+                propagate(self._run_cypher_steps), 
+                query, 
+                history
             )
+            pieces = _collect(vector_future, vector_timeout, "Vector") or []
+            cypher_output = _collect(cypher_future, cypher_timeout, "Cypher")
+            cypher_steps = cypher_output[1] if cypher_output is not None else None
+        finally:
+            # abandoned branches are not waited for, their thread exits once they complete
+            executor.shutdown(wait=False)
+        
+        logger.info(f"Concurrent retrieval completed in {time.perf_counter() - start:.2f}s")
+        
+        return pieces, cypher_steps
+        
+        
+    def _stream_tokens(self, prompt: str) -> Iterator[str]:
+        """ 
+        Streams the answer of the QA LLM for an already built prompt, one token (message chunk) at a time.
+        """
+        for chunk in self.qa_llm.stream(input=prompt):
+            if chunk.content:
+                yield chunk.content
+                
+                
+    def _cache_lookup(self, query: str, method: str, history: str=None, **options) -> CacheProbe | None:
+        """ 
+        Looks for a cached answer to a similar question, scoped by answer method and its options 
+        (e.g. the community type), by the conversation history and by the current graph version. 
+        Returns `None` if caching is disabled.
+        """
+        _degraded.set(False)
+        if self.cache is None:
+            return None
+        
+        # the same question may refer to something else in another conversation
+        history_hash = md5(history.encode("utf-8")).hexdigest() if history else None
+        scope = (method, json.dumps(options, sort_keys=True, default=str), history_hash)
+        try:
+            return self.cache.lookup(query, scope, self.graph.graph_version)
+        except Exception as e:
+            logger.warning(f"Semantic cache lookup failed with exception: {e}")
+            return None
+        
+        
+    def _cache_store(self, probe: CacheProbe | None, answer: str | None):
+        if probe is None or not answer:
+            return
+        if _degraded.get():
+            logger.info("Answer generated without part of its context, not cached")
+            return
+        self.cache.store(probe, answer)
+            
+            
+    def _cache_stream(self, probe: CacheProbe | None, stream: Iterator[str]) -> Iterator[str]:
+        """ 
+        Yields the tokens of a streamed answer and caches the full answer once the stream is exhausted 
+        (unless its context was degraded while building the prompt, i.e. before streaming).
+        """
+        if _degraded.get():
+            logger.info("Answer generated without part of its context, not cached")
+            probe = None
+        
+        def _tokens() -> Iterator[str]:
+            tokens = []
+            for token in stream:
+                tokens.append(token)
+                yield token
+            self._cache_store(probe, "".join(tokens))
+            
+        return _tokens()
+        
+        
+    @traced("responder.context_prompt")
+    def _context_prompt(
+        self, 
+        query: str, 
+        use_adjacent_chunks: bool=False, 
+        history: str=None
+        ) -> str:
+        """ 
+        Retrieves context via vector search and builds the QA prompt for `answer_with_context`.
+        """
+        builder = ContextBuilder(self.context_conf)
+        builder.extend("chunks", self._retrieve_vector_context(query, use_adjacent_chunks))
+        context = self._build_context(builder)
+        
+        return self.qa_prompt.format(
+            history=history,
+            question=query, 
+            context=context.text("chunks")
         )
-
-        return answer.content
     
     
-    def answer_with_community_reports(
+    @traced("responder.community_reports_prompt")
+    def _community_reports_prompt(
         self, 
         query: str, 
         use_adjacent_chunks: bool=False, 
         community_type: str="leiden",
         history: str=None
-        ) -> str: 
+        ) -> str:
         """ 
-        Queries two vector indexes to get the user's answer out of an ensemble of contexts:
-            1. one made of a list of `CommunityReport`
-            2. one made of a list of `Chunk` from the same communities of the reports. 
-            
-        If `use_adjacent_chunks=True` will query the graph for additional context 
-        compared to the Chunks retrieved by the similarity search. Latency will be higher due to expanded context. 
+        Retrieves Community Reports and their Chunks, then builds the QA prompt for `answer_with_community_reports`.
         """
-        
-        context = ""
+        builder = ContextBuilder(self.context_conf)
+        reports_and_scores = []
         
         try:
-            reports_and_scores = self.graph.cr_store.similarity_search_with_relevance_scores(
+            reports_and_scores = self.graph.report_store.similarity_search_with_relevance_scores(
                 query=query, 
                 k=3, 
                 filter={"community_type": community_type},
@@ -170,74 +509,48 @@ class GraphAgentResponder:
             
         for report, score in reports_and_scores:
             
-            context += f"SUMMARY OF CHUNKS: \n {report.page_content} \n"
+            builder.add("reports", report.page_content, key=report.metadata.get("community_id"), score=score)
+            community_chunks = []
             
             try: 
                 # fetch only similar chunks in the community 
-                community_chunks = self.graph.vector_store.similarity_search(
-                    query=query,
+                community_chunks = self._search_chunks(
+                    query,
                     filter={f"community_{community_type}": report.metadata['community_id']}
                 )
                 logger.info(f"Retrieved {len(community_chunks)} Chunks for community: {report.metadata['community_id']}")
                 
-            
             except Exception as e:
                 logger.warning(f"Failed to enrich context with chunks from community: {report.metadata['community_id']}")
                 
-            context += f"CHUNKS: \n"
-            
-            if not use_adjacent_chunks:
-                
-                for chunk in community_chunks:
-                    context += f"{chunk.page_content} \n"
-                    
-            else: 
-                for chunk in community_chunks:
-
-                    current_chunk = Chunk(
-                        chunk_id=chunk.metadata["chunk_id"],
-                        text=chunk.page_content,
-                        filename=chunk.metadata["filename"]
-                    )
-                    # search adjacent chunks 
-                    with self.graph._driver.session() as session:
-                        prev_chunk, current_chunk, next_chunk = get_adjacent_chunks(session, current_chunk)
-                        session.close()
-                    
-                    context += f"{prev_chunk.text} \n" if prev_chunk is not None else ""
-                    context += f"{current_chunk.text} \n"
-                    context += f"{next_chunk.text} \n" if next_chunk is not None else ""
-                
-        answer: BaseMessage = self.qa_llm.invoke(
-            input=self.qa_prompt.format(
-                question=query, 
-                context=context, 
-                history=history
-            )
-        )
-        
-        return answer.content
+            builder.extend("chunks", self._chunk_pieces(community_chunks, use_adjacent_chunks))
             
+        context = self._build_context(builder, separators={"reports": " \n", "chunks": " \n"})
         
-    def answer_with_community_subgraph(
+        return self.qa_prompt.format(
+            question=query, 
+            context=f"SUMMARY OF CHUNKS: \n {context.text('reports')} \n CHUNKS: \n {context.text('chunks')}", 
+            history=history
+        )
+    
+    
+    @traced("responder.community_subgraph_prompt")
+    def _community_subgraph_prompt(
         self, 
         query: str, 
         community_type: str = "leiden",
-        history: str = None
-        ) -> str: 
+        history: str = None,
+        n_hops: int = 1
+        ) -> str:
         """ 
-        Answers after querying for communities:  
-        
-        * read the most relevant community reports 
-        * fetch chunks belonging to the most relevant community (the one from the community report)
-        * follow the MENTIONS relationship of each Chunk and obtain a dictionary 
-        * fetch the community subgraph under the form of another dictionary 
-        * passes the dictionaries + the report to a reconciler agent to decide how to answer 
+        Retrieves the most relevant Community Report, its subgraph and its Chunks with their mentioned entities, 
+        then builds the QA prompt for `answer_with_community_subgraph`.
         """
-        context = ""
+        builder = ContextBuilder(self.context_conf)
+        reports = []
         
         try:
-            reports = self.graph.cr_store.similarity_search(
+            reports = self.graph.report_store.similarity_search(
                 query=query, 
                 k=1, 
                 filter={"community_type": community_type},
@@ -251,7 +564,7 @@ class GraphAgentResponder:
             
         for report in reports:  
             
-            context += f"SUMMARY OF COMMUNITY CHUNKS: \n {report.page_content} \n"
+            builder.add("reports", report.page_content, key=report.metadata.get("community_id"))
             
             with self.graph._driver.session() as session:
                 
@@ -263,57 +576,525 @@ class GraphAgentResponder:
                 
                 session.close()
                 
-            context += f"COMMUNITY GRAPH: {community_subgraph} \n --------------------------------------- \n "
-            
-            context += f"COMMUNITY CHUNKS: "
+            for triple in community_subgraph:
+                builder.add("graph", str(triple), key=str(triple))
              
             try: 
                 # fetch only similar chunks in the community 
-                community_chunks = self.graph.vector_store.similarity_search(
-                    query=query,
+                community_chunks = self._search_chunks(
+                    query,
                     filter={f"community_{community_type}": report.metadata['community_id']}
                 )
                 logger.info(f"Retrieved {len(community_chunks)} Chunks for community: {report.metadata['community_id']}")
                 
-                for chunk in community_chunks:
-                    
-                    context += f" \n --------------------------------------- \n CHUNK CONTENT: \n {chunk.page_content} \n "
-                    context += f"MENTIONED ENTITIES: \n"
-                    
-                    current_chunk = Chunk(
-                        chunk_id=chunk.metadata["chunk_id"],
-                        text=chunk.page_content,
-                        filename=chunk.metadata["filename"]
+                # expand the entities of all chunks at once
+                with self.graph._driver.session() as session:
+                    chunk_entities = expand_mentioned_entities(
+                        session, 
+                        [
+                            Chunk(
+                                chunk_id=chunk.metadata["chunk_id"],
+                                text=chunk.page_content,
+                                filename=chunk.metadata["filename"]
+                            ) 
+                            for chunk, _ in community_chunks
+                        ], 
+                        n_hops=n_hops
                     )
+                    session.close()
+                
+                for chunk, score in community_chunks:
                     
-                    with self.graph._driver.session() as session:
-                        mentioned_entities = get_mentioned_entities(session, current_chunk, use_elementId=False)
-                        session.close()
-                        
-                        for ent_dict in mentioned_entities:
-                            context += f"{ent_dict['name']} \n"
+                    key = (chunk.metadata["filename"], chunk.metadata["chunk_id"])
+                    entities = chunk_entities.get(key, [])
+                    
+                    mentioned = "MENTIONED ENTITIES: \n"
+                    for ent_dict in entities:
+                        if ent_dict["hop"] == 1:
+                            mentioned += f"{ent_dict['name']} \n"
+                            
+                    related_entities = [ent_dict for ent_dict in entities if ent_dict["hop"] > 1]
+                    if related_entities:
+                        mentioned += f"RELATED ENTITIES: \n"
+                        for ent_dict in related_entities:
+                            mentioned += f"{ent_dict['name']} ({ent_dict['hop']} hops away) \n"
+                            
+                    builder.add("chunks", chunk.page_content, key=key, score=score, extra=f" \n {mentioned}")
                         
             except Exception as e:
                 logger.warning(f"Failed to enrich context with chunks from community: {report.metadata['community_id']}")
-
                 
+        chunk_separator = " \n --------------------------------------- \n CHUNK CONTENT: \n "
+        context = self._build_context(builder, separators={"graph": ", ", "chunks": chunk_separator})
+        
+        community_graph = f"[{context.text('graph')}]"
+        community_chunks = f"{chunk_separator}{context.text('chunks')}" if context.text("chunks") else ""
+        
+        return self.qa_prompt_with_subgraph.format(
+            question=query, 
+            context=(
+                f"SUMMARY OF COMMUNITY CHUNKS: \n {context.text('reports')} \n"
+                f"COMMUNITY GRAPH: {community_graph} \n --------------------------------------- \n "
+                f"COMMUNITY CHUNKS: {community_chunks}"
+            ), 
+            history=history
+        )
+    
+    
+    def _global_search_level(self, community_type: str="leiden") -> int:
+        """ 
+        Level of the community hierarchy read by the global search: the configured one if any, 
+        otherwise the finest level with at most `max_reports` reports (the coarsest one if all have more), 
+        so that the number of map calls, hence latency, stays bounded.
+        """
+        if self.global_search_conf.level is not None:
+            return self.global_search_conf.level
+        
+        counts = self.graph.count_community_reports(community_type)
+        eligible = [level for level, count in counts.items() if 0 < count <= self.global_search_conf.max_reports]
+        return max(eligible) if eligible else 0
+    
+    
+    def _map_batches(self, reports: List[CommunityReport]) -> List[str]:
+        """ 
+        Packs reports (largest communities first) into contexts of at most `map_batch_tokens` tokens, one per map call.
+        """
+        budget = self.global_search_conf.map_batch_tokens
+        batches, batch, batch_tokens = [], [], 0
+        
+        for report in reports:
+            text = truncate_to_tokens(f"COMMUNITY {report.community_id}: {report.summary}", budget)
+            tokens = count_tokens(text)
+            if batch and batch_tokens + tokens > budget:
+                batches.append(" \n\n".join(batch))
+                batch, batch_tokens = [], 0
+            batch.append(text)
+            batch_tokens += tokens
+            
+        if batch:
+            batches.append(" \n\n".join(batch))
+        return batches
+    
+    
+    @traced("responder.global_map")
+    def _map_partial_answers(self, query: str, reports: List[CommunityReport]) -> List[Tuple[str, int]]:
+        """ 
+        Map step of the global search: asks the question over batches of reports in parallel. 
+        Map calls still running after `map_timeout` seconds, failed ones and those rated below `min_score` are dropped. 
+        Returns partial answers with their helpfulness score, most helpful first.
+        
+        A running map call cannot be interrupted: one that times out is abandoned and completes in the background, 
+        on the pool of the request, so that it never holds the workers of other requests. 
+        Calls not started yet are cancelled.
+        """
+        start = time.perf_counter()
+        batches = self._map_batches(reports)
+        
+        executor = ThreadPoolExecutor(
+            max_workers=max(1, min(self.global_search_conf.max_workers, len(batches))), 
+            thread_name_prefix="graph-responder-map"
+        )
+        try:
+            futures: List[Future] = [
+                executor.submit(
+                    propagate(self.qa_llm.invoke), 
+                    input=self.global_map_prompt.format(question=query, context=batch)
+                )
+                for batch in batches
+            ]
+            done, not_done = wait(futures, timeout=self.global_search_conf.map_timeout)
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+        if not_done:
+            _degraded.set(True)
+            counter("global_search_map_timeouts_total", "Map calls of the global search abandoned after map_timeout").inc(len(not_done))
+            logger.warning(
+                f"{len(not_done)}/{len(futures)} map calls timed out after {self.global_search_conf.map_timeout}s, "
+                f"abandoned, proceeding without them"
+            )
+            
+        partial_answers = []
+        for future in futures:
+            if future not in done:
+                continue
+            try:
+                answer, score = _parse_partial_answer(future.result().content)
+            except Exception as e:
+                logger.warning(f"Map call failed with exception: {e}")
+                continue
+            if answer and score >= self.global_search_conf.min_score:
+                partial_answers.append((answer, score))
+                
+        current_span().set_attributes({
+            "global_search.reports": len(reports),
+            "global_search.batches": len(batches),
+            "global_search.timed_out": len(not_done),
+            "global_search.partial_answers": len(partial_answers)
+        })
+        logger.info(
+            f"Mapped {len(reports)} Community Reports in {len(batches)} batches in {time.perf_counter() - start:.2f}s, "
+            f"kept {len(partial_answers)} partial answers"
+        )
+        return sorted(partial_answers, key=lambda answer: answer[1], reverse=True)
+    
+    
+    @traced("responder.global_search_prompt")
+    def _global_search_prompt(
+        self, 
+        query: str, 
+        community_type: str="leiden",
+        level: Optional[int]=None,
+        history: str=None
+        ) -> str:
+        """ 
+        Maps the question over the Community Reports of a level of the hierarchy and builds the reduce prompt 
+        for `answer_with_global_search`, out of the most helpful partial answers within `reduce_budget` tokens.
+        """
+        level = self._global_search_level(community_type) if level is None else level
+        reports = self.graph.get_community_reports(community_type, level)
+        reports = sorted(reports, key=lambda report: report.rank, reverse=True)[:self.global_search_conf.max_reports]
+        logger.info(f"Global search over {len(reports)} Community Reports of {community_type} level {level}")
+        current_span().set_attributes({"community.type": community_type, "community.level": level})
+        
+        context, tokens = [], 0
+        for answer, score in self._map_partial_answers(query, reports) if reports else []:
+            text = f"(helpfulness {score}) {answer}"
+            answer_tokens = count_tokens(text)
+            if tokens + answer_tokens > self.global_search_conf.reduce_budget:
+                break
+            context.append(text)
+            tokens += answer_tokens
+            
+        return self.global_reduce_prompt.format(
+            history=history,
+            question=query, 
+            context=" \n\n".join(context)
+        )
+    
+    
+    @traced("responder.combined_prompt")
+    def _combined_prompt(
+        self, 
+        query: str, 
+        use_adjacent_chunks: bool=False, 
+        filter:Optional[Dict[str, Any]]=None,
+        history: str = None,
+        concurrent: bool=False,
+        vector_timeout: Optional[float]=10.0,
+        cypher_timeout: Optional[float]=30.0
+        ) -> str:
+        """ 
+        Retrieves context via vector search and Cypher queries, then builds the summarization prompt for `answer`.
+        """
+        if concurrent:
+            pieces, cypher_steps = self._concurrent_retrieval(
+                query=query, 
+                use_adjacent_chunks=use_adjacent_chunks, 
+                filter=filter, 
+                history=history,
+                vector_timeout=vector_timeout, 
+                cypher_timeout=cypher_timeout
+            )
+        else:
+            pieces = self._retrieve_vector_context(query, use_adjacent_chunks, filter)
+        
+            try: 
+                cypher_chain_answer, cypher_steps = self.answer_with_cypher(query=query, intermediate_steps=True)
+            except TypeError:
+                cypher_steps = None
+                logger.warning("Unable to run Cypher chain for this question")
+                
+        builder = ContextBuilder(self.context_conf)
+        builder.extend("chunks", pieces)
+        query_result = None
+        if cypher_steps:
+            # rows are kept in the order returned by the query, as far as the budget allows
+            for row in cypher_steps[-1]["context"]:
+                builder.add("cypher", str(row))
+        context = self._build_context(builder, separators={"cypher": ", "})
+        if cypher_steps:
+            # same rendering as the intermediate steps themselves, with the rows that fit
+            query_result = f"[{{'query': {cypher_steps[0]['query']!r}}}, {{'context': [{context.text('cypher')}]}}]"
+                
+        return self.summarize_prompt.format(
+            history=history,
+            question=query, 
+            retrieved_context=context.text("chunks"), 
+            query_result=query_result
+        )
+        
+        
+    @traced("responder.answer_with_cypher")
+    def answer_with_cypher(
+        self, 
+        query: str, 
+        intermediate_steps: bool=False, 
+        history: str=None
+        ) -> str | Tuple[str, List]:
+        """ 
+        Uses only the Cypher chain to answer the user's question.
+        """
+        probe = None if intermediate_steps else self._cache_lookup(query, "cypher", history)
+        if probe is not None and probe.answer is not None:
+            return probe.answer
+        
+        try:
+            question, cypher_steps = self._run_cypher_steps(query, history)
+            result = self.graph_qa_chain.qa_chain.invoke(
+                {"question": question, "context": cypher_steps[-1]["context"]}
+            )
+            if intermediate_steps:
+                return result, cypher_steps
+            else: 
+                self._cache_store(probe, result)
+                return result
+        except Exception as e:
+            logger.warning(f"Problem Answering with CYPHER chain: {e}")
+            
+            
+    def stream_answer_with_cypher(
+        self, 
+        query: str, 
+        history: str=None
+        ) -> Iterator[str]:
+        """ 
+        Streaming version of `answer_with_cypher`: the Cypher query is generated and run first, 
+        then the answer is streamed token by token.
+        """
+        probe = self._cache_lookup(query, "cypher", history)
+        if probe is not None and probe.answer is not None:
+            return iter([probe.answer])
+        
+        try:
+            question, cypher_steps = self._run_cypher_steps(query, history)
+        except Exception as e:
+            logger.warning(f"Problem Answering with CYPHER chain: {e}")
+            return iter(())
+        
+        return self._cache_stream(
+            probe, 
+            self.graph_qa_chain.qa_chain.stream(
+                {"question": question, "context": cypher_steps[-1]["context"]}
+            )
+        )
+            
+            
+    @traced("responder.answer_with_context")
+    def answer_with_context(
+        self, 
+        query: str, 
+        use_adjacent_chunks: bool=False, 
+        history: str=None
+        )-> str:
+        """ 
+        Uses only vanilla RAG to answer the user's question.  
+        If `use_adjacent_chunks=True` will query the graph for additional context 
+        compared to the Chunks retrieved by the similarity search. Latency will be higher due to expanded context. 
+        """
+        probe = self._cache_lookup(query, "context", history, use_adjacent_chunks=use_adjacent_chunks)
+        if probe is not None and probe.answer is not None:
+            return probe.answer
+        
         answer: BaseMessage = self.qa_llm.invoke(
-            input=self.qa_prompt_with_subgraph.format(
-                question=query, 
-                context=context, 
-                history=history
+            input=self._context_prompt(query, use_adjacent_chunks, history)
+        )
+        self._cache_store(probe, answer.content)
+
+        return answer.content
+    
+    
+    def stream_answer_with_context(
+        self, 
+        query: str, 
+        use_adjacent_chunks: bool=False, 
+        history: str=None
+        ) -> Iterator[str]:
+        """ 
+        Streaming version of `answer_with_context`: retrieval completes first, then the answer is streamed token by token.
+        """
+        probe = self._cache_lookup(query, "context", history, use_adjacent_chunks=use_adjacent_chunks)
+        if probe is not None and probe.answer is not None:
+            return iter([probe.answer])
+        
+        return self._cache_stream(
+            probe, 
+            self._stream_tokens(self._context_prompt(query, use_adjacent_chunks, history))
+        )
+    
+    
+    @traced("responder.answer_with_community_reports")
+    def answer_with_community_reports(
+        self, 
+        query: str, 
+        use_adjacent_chunks: bool=False, 
+        community_type: str="leiden",
+        history: str=None
+        ) -> str: 
+        """ 
+        Queries two vector indexes to get the user's answer out of an ensemble of contexts:
+            1. one made of a list of `CommunityReport`
+            2. one made of a list of `Chunk` from the same communities of the reports. 
+            
+        If `use_adjacent_chunks=True` will query the graph for additional context 
+        compared to the Chunks retrieved by the similarity search. Latency will be higher due to expanded context. 
+        """
+        probe = self._cache_lookup(
+            query, 
+            "community_reports", 
+            history,
+            use_adjacent_chunks=use_adjacent_chunks, 
+            community_type=community_type
+        )
+        if probe is not None and probe.answer is not None:
+            return probe.answer
+        
+        answer: BaseMessage = self.qa_llm.invoke(
+            input=self._community_reports_prompt(query, use_adjacent_chunks, community_type, history)
+        )
+        self._cache_store(probe, answer.content)
+        
+        return answer.content
+    
+    
+    def stream_answer_with_community_reports(
+        self, 
+        query: str, 
+        use_adjacent_chunks: bool=False, 
+        community_type: str="leiden",
+        history: str=None
+        ) -> Iterator[str]:
+        """ 
+        Streaming version of `answer_with_community_reports`: retrieval completes first, then the answer is streamed token by token.
+        """
+        probe = self._cache_lookup(
+            query, 
+            "community_reports", 
+            history,
+            use_adjacent_chunks=use_adjacent_chunks, 
+            community_type=community_type
+        )
+        if probe is not None and probe.answer is not None:
+            return iter([probe.answer])
+        
+        return self._cache_stream(
+            probe, 
+            self._stream_tokens(
+                self._community_reports_prompt(query, use_adjacent_chunks, community_type, history)
             )
         )
+            
+        
+    @traced("responder.answer_with_global_search")
+    def answer_with_global_search(
+        self, 
+        query: str, 
+        community_type: str="leiden",
+        level: Optional[int]=None,
+        history: str=None
+        ) -> str: 
+        """ 
+        Answers corpus-wide questions with a map-reduce over Community Reports:  
+        
+        * the question is asked in parallel over batches of the reports of a level of the community hierarchy 
+        (`level`, or the finest level with at most `max_reports` reports), each call returning a rated partial answer 
+        * the most helpful partial answers are merged into the final answer 
+        
+        Latency is bounded by the number of map calls (`max_reports`, `map_batch_tokens`, `max_workers`) and by `map_timeout`. 
+        """
+        probe = self._cache_lookup(query, "global_search", history, community_type=community_type, level=level)
+        if probe is not None and probe.answer is not None:
+            return probe.answer
+        
+        answer: BaseMessage = self.qa_llm.invoke(
+            input=self._global_search_prompt(query, community_type, level, history)
+        )
+        self._cache_store(probe, answer.content)
+        
+        return answer.content
+    
+    
+    def stream_answer_with_global_search(
+        self, 
+        query: str, 
+        community_type: str="leiden",
+        level: Optional[int]=None,
+        history: str=None
+        ) -> Iterator[str]:
+        """ 
+        Streaming version of `answer_with_global_search`: the map step completes first, then the reduced answer is streamed token by token.
+        """
+        probe = self._cache_lookup(query, "global_search", history, community_type=community_type, level=level)
+        if probe is not None and probe.answer is not None:
+            return iter([probe.answer])
+        
+        return self._cache_stream(
+            probe, 
+            self._stream_tokens(self._global_search_prompt(query, community_type, level, history))
+        )
+            
+        
+    @traced("responder.answer_with_community_subgraph")
+    def answer_with_community_subgraph(
+        self, 
+        query: str, 
+        community_type: str = "leiden",
+        history: str = None,
+        n_hops: int = 1
+        ) -> str: 
+        """ 
+        Answers after querying for communities:  
+        
+        * read the most relevant community reports 
+        * fetch chunks belonging to the most relevant community (the one from the community report)
+        * follow the MENTIONS relationship of each Chunk and obtain a dictionary 
+        * fetch the community subgraph under the form of another dictionary 
+        * passes the dictionaries + the report to a reconciler agent to decide how to answer 
+        
+        With `n_hops > 1`, entities related to the mentioned ones (up to `n_hops` relationship layers away, 
+        pruned by pagerank) are added to the context of each Chunk. 
+        """
+        probe = self._cache_lookup(query, "community_subgraph", history, community_type=community_type, n_hops=n_hops)
+        if probe is not None and probe.answer is not None:
+            return probe.answer
+        
+        answer: BaseMessage = self.qa_llm.invoke(
+            input=self._community_subgraph_prompt(query, community_type, history, n_hops)
+        )
+        self._cache_store(probe, answer.content)
         
         return answer.content
+    
+    
+    def stream_answer_with_community_subgraph(
+        self, 
+        query: str, 
+        community_type: str = "leiden",
+        history: str = None,
+        n_hops: int = 1
+        ) -> Iterator[str]:
+        """ 
+        Streaming version of `answer_with_community_subgraph`: retrieval completes first, then the answer is streamed token by token.
+        """
+        probe = self._cache_lookup(query, "community_subgraph", history, community_type=community_type, n_hops=n_hops)
+        if probe is not None and probe.answer is not None:
+            return iter([probe.answer])
+        
+        return self._cache_stream(
+            probe, 
+            self._stream_tokens(self._community_subgraph_prompt(query, community_type, history, n_hops))
+        )
 
 
+    @traced("responder.answer")
     def answer(
         self, 
         query: str, 
         use_adjacent_chunks: bool=False, 
         filter:Optional[Dict[str, Any]]=None,
-        history: str = None
+        history: str = None,
+        concurrent: bool=False,
+        vector_timeout: Optional[float]=10.0,
+        cypher_timeout: Optional[float]=30.0
         ) -> str:
         """ 
         Answers the user query performing text generation after having retrieved
@@ -322,49 +1103,61 @@ class GraphAgentResponder:
 
         If a configuration is provided for the rephrasing LLM, it will be used 
         to rephrase the user's query according to the `KnowledgeGraph` schema. 
-        """
-        context = ""
-        
-        try:
-            context_docs = self.graph.vector_store.similarity_search(query=query, filter=filter)
-        except Exception as e:
-            logger.warning(f"Failed to retrieve context with exception: {e}")
-            context_docs = []
-        
-        if use_adjacent_chunks:
-            for doc in context_docs:
-    
-                current_chunk = Chunk(
-                    chunk_id=doc.metadata["chunk_id"],
-                    text=doc.page_content,
-                    filename=doc.metadata["filename"]
-                )
-                # search adjacent chunks 
-                with self.graph._driver.session() as session:
-                    prev_chunk, current_chunk, next_chunk = get_adjacent_chunks(session, current_chunk)
-                    session.close()
-                
-                context += f"\n {prev_chunk.text}" if prev_chunk is not None else ""
-                context += f"\n {current_chunk.text}"
-                context += f"\n {next_chunk.text}" if next_chunk is not None else ""
-        else: 
-            for doc in context_docs:
-                context += f"\n {doc.page_content}"
         
-        try: 
-            cypher_chain_answer, cypher_steps = self.answer_with_cypher(query=query, intermediate_steps=True)
-        except TypeError:
-            cypher_steps = None
-            logger.warning("Unable to run Cypher chain for this question")
+        If `concurrent=True`, vector retrieval and Cypher generation/execution run in parallel, 
+        each bounded by its own timeout (`vector_timeout`, `cypher_timeout`, in seconds): 
+        the answer is synthetized from whichever branches complete in time, so latency is bounded 
+        by the slowest branch instead of their sum. 
+        """
+        probe = self._cache_lookup(query, "combined", history, use_adjacent_chunks=use_adjacent_chunks, filter=filter)
+        if probe is not None and probe.answer is not None:
+            return probe.answer
         
         final_answer: BaseMessage = self.qa_llm.invoke(
-            input=self.summarize_prompt.format(
-                history=history,
-                question=query, 
-                retrieved_context=context, 
-                query_result=cypher_steps
+            input=self._combined_prompt(
+                query, 
+                use_adjacent_chunks, 
+                filter, 
+                history, 
+                concurrent, 
+                vector_timeout, 
+                cypher_timeout
             )
         )
+        self._cache_store(probe, final_answer.content)
 
         return final_answer.content
-        
\ No newline at end of file
+    
+    
+    def stream_answer(
+        self, 
+        query: str, 
+        use_adjacent_chunks: bool=False, 
+        filter:Optional[Dict[str, Any]]=None,
+        history: str = None,
+        concurrent: bool=False,
+        vector_timeout: Optional[float]=10.0,
+        cypher_timeout: Optional[float]=30.0
+        ) -> Iterator[str]:
+        """ 
+        Streaming version of `answer`: retrieval (vector search and Cypher queries) completes first, 
+        then the synthetized answer is streamed token by token.
+        """
+        probe = self._cache_lookup(query, "combined", history, use_adjacent_chunks=use_adjacent_chunks, filter=filter)
+        if probe is not None and probe.answer is not None:
+            return iter([probe.answer])
+        
+        return self._cache_stream(
+            probe, 
+            self._stream_tokens(
+                self._combined_prompt(
+                    query, 
+                    use_adjacent_chunks, 
+                    filter, 
+                    history, 
+                    concurrent, 
+                    vector_timeout, 
+                    cypher_timeout
+                )
+            )
+        )
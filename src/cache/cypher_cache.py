@@ -0,0 +1,144 @@
+import hashlib
+import re
+import threading
+import numpy as np
+
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from langchain_core.embeddings import Embeddings
+
+from src.config import CypherCacheConf
+from src.utils.logger import get_logger
+from src.utils.metrics import counter
+
+
+logger = get_logger(__name__)
+
+
+def normalize_question(question: str) -> str:
+    """ Lowercases a question, strips punctuation and collapses whitespaces. """
+    question = re.sub(r"[^\w\s]", " ", question.lower())
+    return re.sub(r"\s+", " ", question).strip()
+
+
+def schema_hash(schema: str) -> str:
+    """ Short, stable fingerprint of a graph schema. """
+    return hashlib.sha256(schema.encode("utf-8")).hexdigest()[:16]
+
+
+class CypherQueryCache:
+    """
+    Cache of validated Cypher queries generated by the Cypher LLM.
+
+    Queries are keyed by the normalized question text plus a hash of the graph schema they were
+    generated against, so that a schema change never serves a stale query.
+    If an `Embeddings` model is given and `fuzzy_matching` is enabled, questions that do not match
+    exactly are compared by cosine similarity with the cached ones of the same schema.
+    """
+
+    def __init__(self, conf: CypherCacheConf, embeddings: Optional[Embeddings] = None):
+        self.max_entries = conf.max_entries
+        self.similarity_threshold = conf.similarity_threshold
+        self.embeddings = embeddings if conf.fuzzy_matching else None
+
+        self._queries: OrderedDict[Tuple[str, str], str] = OrderedDict()
+        self._embeddings: dict[Tuple[str, str], np.ndarray] = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+
+    def __len__(self) -> int:
+        return len(self._queries)
+
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+    def _embed(self, question: str) -> np.ndarray:
+        embedding = np.asarray(self.embeddings.embed_query(question), dtype=np.float32)
+        norm = np.linalg.norm(embedding)
+        return embedding / norm if norm > 0 else embedding
+
+
+    def get(self, question: str, schema: str) -> Optional[str]:
+        """
+        Returns the cached Cypher query for a question (or a close paraphrase of it) on the given schema, if any.
+        """
+        key = (normalize_question(question), schema_hash(schema))
+
+        with self._lock:
+            if key in self._queries:
+                self._queries.move_to_end(key)
+                self.hits += 1
+                counter("cache_requests_total", "Cache lookups, by cache and result", cache="cypher", result="hit").inc()
+                return self._queries[key]
+
+        if self.embeddings is not None:
+            try:
+                embedding = self._embed(key[0])
+            except Exception as e:
+                logger.warning(f"Unable to embed question for Cypher cache lookup: {e}")
+                embedding = None
+
+            if embedding is not None:
+                with self._lock:
+                    best_key, best_score = None, -1.0
+                    for cached_key, cached_embedding in self._embeddings.items():
+                        if cached_key[1] != key[1]:
+                            continue
+                        score = float(np.dot(cached_embedding, embedding))
+                        if score > best_score:
+                            best_key, best_score = cached_key, score
+
+                    if best_key is not None and best_score >= self.similarity_threshold:
+                        self._queries.move_to_end(best_key)
+                        self.hits += 1
+                        counter("cache_requests_total", "Cache lookups, by cache and result", cache="cypher", result="hit").inc()
+                        logger.info(f"Cypher cache fuzzy hit (similarity {best_score:.3f}) for question: {question}")
+                        return self._queries[best_key]
+
+        with self._lock:
+            self.misses += 1
+            counter("cache_requests_total", "Cache lookups, by cache and result", cache="cypher", result="miss").inc()
+        return None
+
+
+    def put(self, question: str, schema: str, cypher: str):
+        """
+        Caches a Cypher query that has been generated, corrected and successfully run for a question.
+        """
+        key = (normalize_question(question), schema_hash(schema))
+
+        embedding = None
+        if self.embeddings is not None:
+            try:
+                embedding = self._embed(key[0])
+            except Exception as e:
+                logger.warning(f"Unable to embed question for Cypher cache: {e}")
+
+        with self._lock:
+            self._queries[key] = cypher
+            self._queries.move_to_end(key)
+            if embedding is not None:
+                self._embeddings[key] = embedding
+
+            while len(self._queries) > self.max_entries:
+                evicted, _ = self._queries.popitem(last=False)
+                self._embeddings.pop(evicted, None)
+
+
+    def evict(self, schema: str, cypher: str):
+        """
+        Removes a cached query, i.e. when it fails to run against the graph.
+        """
+        schema_key = schema_hash(schema)
+        with self._lock:
+            for key in [k for k, q in self._queries.items() if k[1] == schema_key and q == cypher]:
+                del self._queries[key]
+                self._embeddings.pop(key, None)
@@ -0,0 +1,68 @@
+import json
+import os
+import time
+
+from pydantic import BaseModel
+from typing import Any, Dict, List, Optional
+
+from src.utils.logger import get_logger
+
+
+logger = get_logger(__name__)
+
+
+class SchemaSnapshot(BaseModel):
+    """
+    Persisted snapshot of the schema of a `KnowledgeGraph`.
+
+    -----------
+    Attributes:
+    -----------
+    `graph_version`: `int`
+        The `KnowledgeGraph.graph_version` the schema was introspected at
+    `structured_schema`: `Dict[str, Any]`
+        The structured schema, as returned by `Neo4jGraph.get_structured_schema`
+    `formatted_schema`: `str`
+        The formatted schema, as returned by `Neo4jGraph.get_schema`
+    `labels`: `List[str]`
+        Node labels in the graph
+    `relationships`: `List[str]`
+        Relationship types in the graph
+    `created_at`: `float`
+        Timestamp of the introspection
+    """
+    graph_version: int = 0
+    structured_schema: Dict[str, Any] = {}
+    formatted_schema: str = ""
+    labels: List[str] = []
+    relationships: List[str] = []
+    created_at: float = 0.0
+
+
+def load_schema_snapshot(path: str) -> Optional[SchemaSnapshot]:
+    """ Loads a `SchemaSnapshot` from a json file, if it exists and is readable. """
+    if not os.path.isfile(path):
+        return None
+    try:
+        with open(path, "r") as f:
+            snapshot = SchemaSnapshot(**json.load(f))
+        logger.info(f"Loaded schema snapshot at graph version {snapshot.graph_version} from {path}")
+        return snapshot
+    except Exception as e:
+        logger.warning(f"Unable to load schema snapshot from {path}: {e}")
+        return None
+
+
+def save_schema_snapshot(snapshot: SchemaSnapshot, path: str):
+    """ Persists a `SchemaSnapshot` to a json file, atomically replacing the previous one. """
+    if not snapshot.created_at:
+        snapshot.created_at = time.time()
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(snapshot.model_dump(), f, default=str)
+        os.replace(tmp_path, path)
+        logger.info(f"Saved schema snapshot at graph version {snapshot.graph_version} to {path}")
+    except Exception as e:
+        logger.warning(f"Unable to save schema snapshot to {path}: {e}")
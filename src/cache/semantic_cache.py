@@ -0,0 +1,161 @@
+import threading
+import time
+import numpy as np
+
+from collections import OrderedDict
+from typing import Hashable, NamedTuple, Optional
+
+from langchain_core.embeddings import Embeddings
+
+from src.config import SemanticCacheConf
+from src.utils.logger import get_logger
+from src.utils.metrics import counter
+
+
+logger = get_logger(__name__)
+
+
+class CacheProbe(NamedTuple):
+    """
+    Result of a lookup in the `SemanticAnswerCache`.
+    `answer` is `None` on a cache miss; the probe can then be passed to `SemanticAnswerCache.store`
+    so that the question is not embedded twice.
+    """
+    question: str
+    embedding: np.ndarray
+    scope: Hashable
+    graph_version: int
+    answer: Optional[str] = None
+
+
+class _CacheEntry(NamedTuple):
+    question: str
+    embedding: np.ndarray
+    scope: Hashable
+    graph_version: int
+    answer: str
+    created_at: float
+
+
+class SemanticAnswerCache:
+    """
+    Cache of answers matching new questions to previously answered ones by embedding similarity.
+
+    Entries are scoped (i.e. by answer method and community type) and stamped with the
+    `KnowledgeGraph.graph_version` they were produced on: entries from an older version of the graph
+    are never served and get dropped as soon as a newer version is seen.
+    Eviction is LRU (`max_entries`) with an optional TTL (`ttl_seconds`).
+    """
+
+    def __init__(self, embeddings: Embeddings, conf: SemanticCacheConf):
+        self.embeddings = embeddings
+        self.similarity_threshold = conf.similarity_threshold
+        self.max_entries = conf.max_entries
+        self.ttl_seconds = conf.ttl_seconds
+
+        self._entries: OrderedDict[int, _CacheEntry] = OrderedDict()
+        self._next_key = 0
+        self._graph_version: Optional[int] = None
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+    def _embed(self, question: str) -> np.ndarray:
+        embedding = np.asarray(self.embeddings.embed_query(question), dtype=np.float32)
+        norm = np.linalg.norm(embedding)
+        return embedding / norm if norm > 0 else embedding
+
+
+    def _expired(self, entry: _CacheEntry, now: float) -> bool:
+        return self.ttl_seconds is not None and now - entry.created_at > self.ttl_seconds
+
+
+    def _sync_graph_version(self, graph_version: int):
+        """ Drops every entry if the graph has changed since they were cached. Caller holds the lock. """
+        if self._graph_version is not None and graph_version != self._graph_version:
+            logger.info(f"Graph version changed ({self._graph_version} -> {graph_version}), invalidating {len(self._entries)} cached answers")
+            self._entries.clear()
+        self._graph_version = graph_version
+
+
+    def lookup(self, question: str, scope: Hashable, graph_version: int = 0) -> CacheProbe:
+        """
+        Looks for the most similar cached question in the same scope and graph version.
+        Returns a `CacheProbe` whose `answer` is set only if the similarity is above the threshold.
+        """
+        embedding = self._embed(question)
+
+        with self._lock:
+            self._sync_graph_version(graph_version)
+            now = time.time()
+
+            best_key, best_score = None, -1.0
+            for key, entry in list(self._entries.items()):
+                if self._expired(entry, now):
+                    del self._entries[key]
+                    continue
+                if entry.scope != scope:
+                    continue
+                score = float(np.dot(entry.embedding, embedding))
+                if score > best_score:
+                    best_key, best_score = key, score
+
+            if best_key is not None and best_score >= self.similarity_threshold:
+                self._entries.move_to_end(best_key)
+                self.hits += 1
+                counter("cache_requests_total", "Cache lookups, by cache and result", cache="semantic", result="hit").inc()
+                entry = self._entries[best_key]
+                logger.info(f"Semantic cache hit (similarity {best_score:.3f}) for question: {question}")
+                return CacheProbe(question, embedding, scope, graph_version, entry.answer)
+
+            self.misses += 1
+            counter("cache_requests_total", "Cache lookups, by cache and result", cache="semantic", result="miss").inc()
+            return CacheProbe(question, embedding, scope, graph_version)
+
+
+    def store(self, probe: CacheProbe, answer: str):
+        """
+        Caches the answer for a question previously looked up with `lookup`.
+        """
+        if not answer:
+            return
+
+        with self._lock:
+            if self._graph_version is not None and probe.graph_version != self._graph_version:
+                # the graph changed while the answer was being generated
+                return
+
+            self._entries[self._next_key] = _CacheEntry(
+                question=probe.question,
+                embedding=probe.embedding,
+                scope=probe.scope,
+                graph_version=probe.graph_version,
+                answer=answer,
+                created_at=time.time()
+            )
+            self._next_key += 1
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+    def invalidate(self):
+        """
+        Drops every cached answer.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._graph_version = None
+        logger.info("Semantic cache invalidated")
@@ -21,6 +21,7 @@ class ModelType(str, Enum):
     OPENAI = "openai"
     OLLAMA = "ollama"
     TRANSFORMERS = "trf"
+    FAKE = "fake"
 
 
 
@@ -33,6 +34,38 @@ class ChunkerType(str, Enum):
     # SEMANTIC = "semantic" # TODO implement SEMANTIC chunker
 
 
+class RetrievalMode(str, Enum):
+    """
+    First-stage retrievers of Chunks available to the `GraphAgentResponder`
+    """
+    VECTOR = "vector"
+    HYBRID = "hybrid"
+
+
+class GraphBackend(str, Enum):
+    """
+    Backends available to store and query the Knowledge Graph
+    """
+    NEO4J = "neo4j"
+    MEMORY = "memory"
+
+
+class TracingExporter(str, Enum):
+    """
+    Destinations of the spans recorded by the tracing layer
+    """
+    CONSOLE = "console"
+    FILE = "file"
+
+
+class QuantizationType(str, Enum):
+    """
+    Compact representations of embeddings in local indexes
+    """
+    FLOAT16 = "float16"
+    INT8 = "int8"
+    
+    
 class Source(BaseModel):
     folder: str
     # TODO add specific source configurations
@@ -44,6 +77,85 @@ class ChunkerConf(BaseModel):
     chunk_overlap: int = 100
 
 
+class FakeModelConf(BaseModel):
+    """
+    Configuration for the deterministic, offline models of type `fake`, used to benchmark and test the pipeline
+
+    -----------
+    attributes:
+    -----------
+    `response`: answer of the fake LLM to every prompt (structured outputs, i.e. `_Graph` extractions, are derived from the prompt)
+    `dimensions`: dimensions of the fake embeddings
+    `latency`: seconds slept by each call
+    `latency_jitter`: maximum seconds randomly added to `latency`
+    `error_rate`: probability for each call to fail with a `FakeModelError`
+    `max_concurrency`: calls beyond this number in flight fail with a `FakeRateLimitError` (429), as over the quota of a provider; `None` for no quota
+    `max_entities`: maximum number of entities of a fake `_Graph` extraction
+    `seed`: seed of the embeddings, of the jitter and of the injected errors
+    """
+    response: str = "The documents do not say."
+    dimensions: int = 768
+    latency: float = 0.0
+    latency_jitter: float = 0.0
+    error_rate: float = 0.0
+    max_concurrency: Optional[int] = None
+    max_entities: int = 12
+    seed: int = 0
+
+
+class RateLimitConf(BaseModel):
+    """
+    Configuration for the limits on the calls to a model, shared by every client of the same provider and model
+
+    -----------
+    attributes:
+    -----------
+    `requests_per_minute`: maximum number of requests per minute, `None` for no limit
+    `tokens_per_minute`: maximum number of tokens per minute (estimated before each call, corrected by the usage reported after it), `None` for no limit
+    `burst_seconds`: seconds worth of requests and tokens that can be spent at once
+    `max_concurrency`: maximum number of calls in flight
+    `min_concurrency`: lowest number of calls in flight the adaptive limit can decrease to
+    `initial_concurrency`: number of calls in flight allowed at first, `None` for `max_concurrency`
+    `latency_target`: seconds above which a call counts as congestion, as a rate limit error (429) does, `None` to only react to 429s
+    `decrease_factor`: on congestion, the limit of calls in flight is multiplied by this factor; it grows by one call per round of successful calls otherwise
+    """
+    requests_per_minute: Optional[float] = None
+    tokens_per_minute: Optional[float] = None
+    burst_seconds: float = 10.0
+    max_concurrency: int = 16
+    min_concurrency: int = 1
+    initial_concurrency: Optional[int] = None
+    latency_target: Optional[float] = None
+    decrease_factor: float = 0.5
+
+
+class ResilienceConf(BaseModel):
+    """
+    Configuration for the retries of failed calls to a model and for its circuit breaker, shared by every client of the same provider and model
+
+    -----------
+    attributes:
+    -----------
+    `max_attempts`: maximum number of attempts of a call, the first one included
+    `initial_backoff`: seconds waited before the first retry, multiplied by `backoff_multiplier` before each following one
+    `backoff_multiplier`: growth factor of the wait between retries
+    `max_backoff`: maximum seconds waited between retries
+    `jitter`: if `True`, each wait is drawn uniformly between 0 and its value ("full jitter"), so that concurrent workers do not retry in lockstep
+    `timeout`: deadline of each attempt in seconds, after which it fails and is retried, `None` (default) for no deadline: an attempt past its deadline
+    is abandoned but keeps running in its worker thread, prefer the request timeout of the client of the model when it has one
+    `failure_threshold`: consecutive failed attempts (rate limits, timeouts, server errors) after which the circuit breaker opens and calls fail fast
+    `recovery_seconds`: seconds the circuit breaker stays open before letting a single call probe the provider again
+    """
+    max_attempts: int = 4
+    initial_backoff: float = 0.5
+    backoff_multiplier: float = 2.0
+    max_backoff: float = 30.0
+    jitter: bool = True
+    timeout: Optional[float] = None
+    failure_threshold: int = 5
+    recovery_seconds: float = 30.0
+
+
 class LLMConf(BaseModel):
     """
     Configuration for an LLM
@@ -56,6 +168,9 @@ class LLMConf(BaseModel):
     `model`: represents the name of the model
     `api_key`: reference to the OpenAI (or Groq, or Azure OpenAI) API key, if any
     `endpoint`: reference to the endpoint of the model, if any
+    `fake_conf`: configuration of the model if its type is `fake`
+    `rate_limit`: limits on the calls to the model, if any
+    `resilience`: retries, deadlines and circuit breaking of the calls to the model, `None` to call it once and raise its errors
     """
     model: str
     temperature: float = 0.0
@@ -64,6 +179,9 @@ class LLMConf(BaseModel):
     api_key: Optional[str]=None
     endpoint: Optional[str]=None
     api_version: Optional[str] = None
+    fake_conf: Optional[FakeModelConf] = None
+    rate_limit: Optional[RateLimitConf] = None
+    resilience: Optional[ResilienceConf] = ResilienceConf()
 
 
 class EmbedderConf(BaseModel):
@@ -78,6 +196,9 @@ class EmbedderConf(BaseModel):
     `model`: represents the name of the model
     `api_key`: reference to the OpenAI (or Azure OpenAI) API key, if any
     `endpoint`: reference to the endpoint of the model, if any
+    `fake_conf`: configuration of the model if its type is `fake`
+    `rate_limit`: limits on the calls to the model, if any
+    `resilience`: retries, deadlines and circuit breaking of the calls to the model, `None` to call it once and raise its errors
     """
     type: ModelType = "openai"
     model: Optional[str] = "text-embedding-ada-002"
@@ -85,6 +206,201 @@ class EmbedderConf(BaseModel):
     api_key: Optional[str] = None
     endpoint: Optional[str] = None
     api_version: Optional[str] = None
+    fake_conf: Optional[FakeModelConf] = None
+    rate_limit: Optional[RateLimitConf] = None
+    resilience: Optional[ResilienceConf] = ResilienceConf()
+
+
+class SemanticCacheConf(BaseModel):
+    """
+    Configuration for the semantic cache of answers in front of the `GraphAgentResponder`
+
+    -----------
+    attributes:
+    -----------
+    `similarity_threshold`: minimum cosine similarity between two questions to reuse a cached answer
+    `max_entries`: maximum number of cached answers, least recently used ones are evicted first
+    `ttl_seconds`: time to live of a cached answer in seconds, if any
+    """
+    similarity_threshold: float = 0.95
+    max_entries: int = 256
+    ttl_seconds: Optional[int] = 3600
+
+
+class CypherCacheConf(BaseModel):
+    """
+    Configuration for the cache of generated Cypher queries of the `GraphAgentResponder`
+
+    -----------
+    attributes:
+    -----------
+    `max_entries`: maximum number of cached queries, least recently used ones are evicted first
+    `fuzzy_matching`: if `True`, questions not matching exactly are compared by embedding similarity
+    `similarity_threshold`: minimum cosine similarity between two questions to reuse a cached query
+    """
+    max_entries: int = 512
+    fuzzy_matching: bool = False
+    similarity_threshold: float = 0.97
+
+
+class ContextConf(BaseModel):
+    """
+    Configuration for the assembly of the context passed to the Q&A model of the `GraphAgentResponder`
+
+    -----------
+    attributes:
+    -----------
+    `chunks_budget`: maximum number of tokens of retrieved Chunks, `None` for no limit
+    `reports_budget`: maximum number of tokens of community reports, `None` for no limit
+    `graph_budget`: maximum number of tokens of community subgraphs, `None` for no limit
+    `cypher_budget`: maximum number of tokens of the rows returned by the Cypher query, `None` for no limit
+    `min_overlap_chars`: minimum length of the overlap between two pieces of text to be trimmed
+    `max_overlap_chars`: maximum length of the overlap between two pieces of text looked for
+    """
+    chunks_budget: Optional[int] = 4000
+    reports_budget: Optional[int] = 2000
+    graph_budget: Optional[int] = 2000
+    cypher_budget: Optional[int] = 2000
+    min_overlap_chars: int = 20
+    max_overlap_chars: int = 500
+
+
+class RetrievalConf(BaseModel):
+    """
+    Configuration for the retrieval of Chunks of the `GraphAgentResponder`
+
+    -----------
+    attributes:
+    -----------
+    `mode`: `vector` for similarity search only, `hybrid` to fuse it with full-text search
+    `k`: number of Chunks retrieved
+    `fetch_k`: number of candidates retrieved by each retriever before fusion, in `hybrid` mode
+    `rrf_k`: constant of reciprocal rank fusion, higher values flatten the contribution of top ranks
+    """
+    mode: RetrievalMode = RetrievalMode.VECTOR
+    k: int = 4
+    fetch_k: int = 20
+    rrf_k: int = 60
+
+
+class LocalIndexConf(BaseModel):
+    """
+    Configuration for the in-process ANN indexes mirroring the Chunk and CommunityReport vector indexes of Neo4j
+
+    -----------
+    attributes:
+    -----------
+    `path`: directory where the indexes are persisted, `None` to keep them in memory only
+    `n_lists`: number of clusters of the IVF index, `None` for the square root of the number of vectors
+    `n_probe`: number of clusters searched for each query
+    `min_train_size`: number of vectors below which search is exact and no clusters are trained
+    `quantization`: `float16` or `int8` (scalar, with a scale per vector) to store vectors compactly, `None` for `float32`
+    `rescore`: if `True`, quantized candidates are re-ranked with full precision vectors, memory-mapped from disk
+    `rescore_factor`: number of quantized candidates re-ranked for each result
+    """
+    path: Optional[str] = None
+    n_lists: Optional[int] = None
+    n_probe: int = 8
+    min_train_size: int = 1024
+    quantization: Optional[QuantizationType] = None
+    rescore: bool = False
+    rescore_factor: int = 4
+
+
+class EntityResolutionConf(BaseModel):
+    """
+    Configuration for the resolution of near-duplicate entities by the `EntityResolver`
+
+    -----------
+    attributes:
+    -----------
+    `use_embeddings`: if `True`, nearest neighbours of the embeddings of entity names are candidates too, not only names with the same blocking key
+    `similarity_threshold`: minimum cosine similarity between the embeddings of two entity names to merge them
+    `min_name_similarity`: minimum similarity of the normalized names of two entities (ratio of matching characters) to merge them on their embeddings
+    `n_neighbours`: number of nearest neighbours of each entity compared as candidates
+    `embedding_batch_size`: number of entity names embedded (and compared to all the others) at once
+    `merge_batch_size`: number of merges written to the graph in each transaction
+    `same_type`: if `True`, only entities with the same type label are merged
+    """
+    use_embeddings: bool = True
+    similarity_threshold: float = 0.92
+    min_name_similarity: float = 0.7
+    n_neighbours: int = 5
+    embedding_batch_size: int = 256
+    merge_batch_size: int = 100
+    same_type: bool = True
+
+
+class CheckpointConf(BaseModel):
+    """
+    Configuration for the checkpoints of the ingestion pipeline, written after each stage of each document
+
+    -----------
+    attributes:
+    -----------
+    `path`: directory of the checkpoints, a JSONL file per document (by name and content)
+    `resume`: if `True`, documents resume from their checkpoints at their first incomplete stage; if `False`, their checkpoints are overwritten
+    `keep_completed`: if `True`, checkpoints of documents stored in the Knowledge Graph are kept (so that ingesting them again costs no model call), deleted otherwise
+    """
+    path: str = ".cache/checkpoints"
+    resume: bool = True
+    keep_completed: bool = False
+
+
+class DeadLetterConf(BaseModel):
+    """
+    Configuration for the dead letters of the ingestion pipeline: Chunks whose embedding or graph extraction still failed after retries
+
+    -----------
+    attributes:
+    -----------
+    `path`: JSONL file of the dead letters, replayed by the next ingestion
+    """
+    path: str = ".cache/dead_letters.jsonl"
+
+
+class CommunityReportsConf(BaseModel):
+    """
+    Configuration for the generation of Community Reports by the `CommunitiesSummarizer`
+
+    -----------
+    attributes:
+    -----------
+    `max_workers`: maximum number of communities summarized concurrently
+    `embedding_batch_size`: number of summaries embedded (and handed over to be stored) at once
+    `max_input_tokens`: token budget of the Chunks passed to each summarization call, picked by entity coverage and pagerank
+    `map_reduce_factor`: communities with more than `max_input_tokens * map_reduce_factor` tokens of Chunks are summarized with map-reduce
+    `max_map_calls`: maximum number of partial summaries of a map-reduce summary, the least central Chunks are left out beyond it
+    """
+    max_workers: int = 4
+    embedding_batch_size: int = 32
+    max_input_tokens: int = 6000
+    map_reduce_factor: int = 4
+    max_map_calls: int = 8
+
+
+class GlobalSearchConf(BaseModel):
+    """
+    Configuration for the map-reduce global search over Community Reports of the `GraphAgentResponder`
+
+    -----------
+    attributes:
+    -----------
+    `level`: level of the community hierarchy whose reports are read, `None` for the finest level with at most `max_reports` reports
+    `max_reports`: maximum number of reports mapped for a question, the largest communities are kept first
+    `map_batch_tokens`: token budget of the reports passed to each map call
+    `max_workers`: maximum number of map calls running concurrently
+    `map_timeout`: seconds after which pending map calls are dropped from the reduce step, `None` to wait for all of them
+    `min_score`: partial answers rated below this helpfulness score (0-100) are discarded
+    `reduce_budget`: token budget of the partial answers passed to the reduce call
+    """
+    level: Optional[int] = None
+    max_reports: int = 50
+    map_batch_tokens: int = 3000
+    max_workers: int = 4
+    map_timeout: Optional[float] = 60.0
+    min_score: int = 20
+    reduce_budget: int = 4000
 
 
 class KnowledgeGraphConfig(BaseModel):
@@ -106,6 +422,13 @@ class KnowledgeGraphConfig(BaseModel):
     `timeout`: `int`
     `ontology`: `Ontology`
     `uri`: `str`
+    `schema_cache_path`: `str`, path of the json snapshot of the graph schema, if any
+    `local_index`: `LocalIndexConf`, configuration of the in-process vector indexes, if any
+    `fulltext_index_name`: `str`, name of the full-text index on the text of Chunks
+    `leiden_max_levels`: `int`, number of levels of the Leiden community hierarchy, `1` for a flat partition
+    `leiden_max_community_size`: `int`, communities larger than this are split again at the next level
+    `backend`: `GraphBackend`, `neo4j` or `memory` for the embedded, in-process graph (no database needed)
+    `memory_path`: `str`, directory where the in-memory graph is persisted, `None` to keep it in memory only
     """
     password: str
     db_schema :  Optional[str] = None
@@ -117,6 +440,45 @@ class KnowledgeGraphConfig(BaseModel):
     timeout: int=5000
     ontology: Optional[Ontology] = None
     uri: Optional[str] = None
+    schema_cache_path: Optional[str] = None
+    local_index: Optional[LocalIndexConf] = None
+    fulltext_index_name: str = "chunk_text"
+    leiden_max_levels: int = 1
+    leiden_max_community_size: int = 50
+    backend: GraphBackend = GraphBackend.NEO4J
+    memory_path: Optional[str] = None
+
+
+class TracingConf(BaseModel):
+    """
+    Configuration for the tracing of ingestion stages, LLM and embedding calls, Cypher queries and responder steps
+
+    -----------
+    attributes:
+    -----------
+    `exporter`: `console` to print finished spans, `file` to append them to `path`, one JSON object per line
+    `path`: file spans are appended to by the `file` exporter
+    `service_name`: `service.name` attribute of the resource of every span
+    `max_attribute_length`: string attributes (i.e. Cypher queries) are truncated to this number of characters
+    """
+    exporter: TracingExporter = TracingExporter.FILE
+    path: str = "traces.jsonl"
+    service_name: str = "neo4j_graphrag"
+    max_attribute_length: int = 1000
+
+
+class MetricsConf(BaseModel):
+    """
+    Configuration for the metrics registry (request counts, latencies, token usage, cache hits, queue depths)
+
+    -----------
+    attributes:
+    -----------
+    `port`: port metrics are served on in the Prometheus text format (at `/metrics`), `None` to only collect them in process
+    `host`: interface the metrics server listens on, local only by default
+    """
+    port: Optional[int] = 9464
+    host: str = "127.0.0.1"
 
 
 class Configuration(BaseModel):
@@ -133,7 +495,18 @@ class Configuration(BaseModel):
     `re_model_conf`: configuration for the LLM in charge of extracting relationships from documents
     `embedder_conf`: configuration for the Embeddings model that will create vectors out of documents
     `summarizer_conf`: configuration for the LLM in charge of summarizing communities out of Chunks and other nodes
+    `reports_conf`: configuration for the concurrency of Community Reports generation
+    `entity_resolution_conf`: configuration for the merge of near-duplicate entities after ingestion, if any
+    `checkpoint_conf`: configuration for the checkpoints of the ingestion pipeline, to resume interrupted ingestions, if any
+    `dead_letter_conf`: configuration for the dead letters of the ingestion pipeline, to replay Chunks that failed after retries, if any
     `qa_model`: configuration for the Q&A model (LLM) that will interact with the user
+    `cache_conf`: configuration for the semantic cache of answers, if any
+    `cypher_cache_conf`: configuration for the cache of generated Cypher queries, if any
+    `context_conf`: configuration for the token budgets of the context passed to the Q&A model
+    `retrieval_conf`: configuration for the retrieval of Chunks (vector or hybrid)
+    `global_search_conf`: configuration for the map-reduce global search over Community Reports
+    `tracing_conf`: configuration for the export of tracing spans, if any
+    `metrics_conf`: configuration for the metrics registry and its server, if any
     """
     database: KnowledgeGraphConfig
     chunker_conf: Optional[ChunkerConf] = None
@@ -141,7 +514,18 @@ class Configuration(BaseModel):
     re_model_conf: Optional[LLMConf] = None
     embedder_conf: Optional[EmbedderConf] = None
     summarizer_conf: Optional[LLMConf] = None
+    reports_conf: Optional[CommunityReportsConf] = None
+    entity_resolution_conf: Optional[EntityResolutionConf] = None
+    checkpoint_conf: Optional[CheckpointConf] = None
+    dead_letter_conf: Optional[DeadLetterConf] = None
     qa_model: Optional[LLMConf] = None
+    cache_conf: Optional[SemanticCacheConf] = None
+    cypher_cache_conf: Optional[CypherCacheConf] = None
+    context_conf: Optional[ContextConf] = None
+    retrieval_conf: Optional[RetrievalConf] = None
+    global_search_conf: Optional[GlobalSearchConf] = None
+    tracing_conf: Optional[TracingConf] = None
+    metrics_conf: Optional[MetricsConf] = None
     
     
     @classmethod
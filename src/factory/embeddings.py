@@ -1,20 +1,88 @@
+import time
+from contextlib import contextmanager
+from typing import Iterator, List, Union
+
+from langchain_core.embeddings import Embeddings
 from langchain_huggingface.embeddings import HuggingFaceEmbeddings
 from langchain_ollama.embeddings import OllamaEmbeddings
 from langchain_openai.embeddings import OpenAIEmbeddings, AzureOpenAIEmbeddings
-from typing import Union
+from src.factory.fake import FakeEmbeddings
+from src.factory.rate_limiter import RateLimitedEmbeddings, get_provider_limiter
+from src.factory.resilience import ResilientEmbeddings, get_resilience
 
-from src.config import EmbedderConf
+from src.config import EmbedderConf, FakeModelConf
 from src.utils.logger import get_logger
+from src.utils.tokens import count_tokens
+from src.utils.metrics import counter, histogram, metrics_enabled
+from src.utils.tracing import span, tracing_enabled
 
 
 logger = get_logger(__name__)
 
 
+class InstrumentedEmbeddings(Embeddings):
+    """ 
+    Wraps an embeddings model, recording a span and metrics (request count, latency and tokens per model) 
+    for each call, with the number of texts and their tokens. Any other attribute is read from the wrapped model.
+    """
+
+    def __init__(self, embeddings: Embeddings, model: str, provider: str):
+        self.embeddings = embeddings
+        self.model = model
+        self.provider = provider
+
+    @contextmanager
+    def _instrument(self, operation: str, texts: List[str]) -> Iterator[None]:
+        tokens = sum(count_tokens(text) for text in texts)
+        start = time.perf_counter()
+        error = False
+        try:
+            with span(
+                f"embeddings.{operation}", 
+                kind="CLIENT", 
+                **{
+                    "gen_ai.operation.name": "embeddings", 
+                    "gen_ai.system": self.provider,
+                    "gen_ai.request.model": self.model, 
+                    "embeddings.texts": len(texts), 
+                    "gen_ai.usage.input_tokens": tokens
+                }
+            ):
+                yield
+        except Exception:
+            error = True
+            raise
+        finally:
+            if metrics_enabled():
+                labels = {"model": self.model, "provider": self.provider}
+                counter("embedding_requests_total", "Embedding requests", status="error" if error else "ok", **labels).inc()
+                histogram("embedding_request_duration_seconds", "Latency of embedding requests", **labels).observe(time.perf_counter() - start)
+                counter("embedding_texts_total", "Texts embedded", **labels).inc(len(texts))
+                counter("embedding_tokens_total", "Tokens embedded", **labels).inc(tokens)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        with self._instrument("embed_documents", texts):
+            return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        with self._instrument("embed_query", [text]):
+            return self.embeddings.embed_query(text)
+
+    def __getattr__(self, name):
+        if name == "embeddings":
+            raise AttributeError(name)
+        return getattr(self.embeddings, name)
+
+
 def get_embeddings(conf: EmbedderConf) -> Union[
     HuggingFaceEmbeddings, 
     OllamaEmbeddings, 
     OpenAIEmbeddings, 
     AzureOpenAIEmbeddings, 
+    FakeEmbeddings,
+    InstrumentedEmbeddings,
+    RateLimitedEmbeddings,
+    ResilientEmbeddings,
     None
     ]:
 
@@ -43,8 +111,23 @@ def get_embeddings(conf: EmbedderConf) -> Union[
                 model=conf.model,
                 endpoint=conf.endpoint,
             )
+        elif conf.type == "fake":
+            embeddings = FakeEmbeddings(conf.fake_conf or FakeModelConf())
         else: 
             logger.warning(f"Embedder type '{conf.type}' not supported.")
             embeddings = None
+            
+        if embeddings is not None and (tracing_enabled() or metrics_enabled()):
+            embeddings = InstrumentedEmbeddings(embeddings, conf.model, conf.type)
+
+        limiter = get_provider_limiter(conf.type, conf.model, conf.rate_limit)
+        if embeddings is not None and limiter is not None:
+            # around instrumentation, so that waiting for the limiter is not counted as latency of the model
+            embeddings = RateLimitedEmbeddings(embeddings, limiter)
+
+        resilience = get_resilience(conf.type, conf.model, conf.resilience)
+        if embeddings is not None and resilience is not None:
+            # around the limiter, so that each attempt waits for it
+            embeddings = ResilientEmbeddings(embeddings, resilience)
 
         return embeddings
\ No newline at end of file
@@ -0,0 +1,187 @@
+import random
+import re
+import threading
+import time
+import numpy as np
+
+from hashlib import md5
+from types import SimpleNamespace
+from typing import Any, Dict, Iterator, List, Optional, Type
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import BaseModel, PrivateAttr
+
+from src.config import FakeModelConf
+from src.graph.graph_model import _Graph, _Node, _Relationship
+from src.utils.tokens import count_tokens
+
+
+_ENTITY = re.compile(r"\b[A-Z][a-z]{2,}\b")
+
+_INPUT_MARKER = "INPUT TEXT:"
+
+
+class FakeModelError(RuntimeError):
+    """ Error injected in a call of a fake model (see `FakeModelConf.error_rate`). """
+
+
+class FakeRateLimitError(FakeModelError):
+    """ Rate limit error (429) of a fake model, called beyond its quota (see `FakeModelConf.max_concurrency`). """
+    status_code = 429
+
+
+class _SyntheticCalls:
+    """
+    Synthetic latency and errors of a fake model, drawn from a seeded generator, with the number of calls
+    and the seconds spent in them. Thread safe, as models are shared by concurrent workers.
+    """
+
+    def __init__(self, conf: FakeModelConf):
+        self.conf = conf
+        self._random = random.Random(conf.seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.seconds = 0.0
+        self.rate_limited = 0
+        self._in_flight = 0
+
+    def run(self):
+        """
+        Sleeps for the latency of a call, then fails it with probability `error_rate`. A call started with `max_concurrency`
+        calls already in flight fails right away with a rate limit error, as a provider rejects calls over its quota.
+        """
+        start = time.perf_counter()
+        with self._lock:
+            if self.conf.max_concurrency is not None and self._in_flight >= self.conf.max_concurrency:
+                self.calls += 1
+                self.rate_limited += 1
+                raise FakeRateLimitError("Injected rate limit error of a fake model (429)")
+            jitter = self._random.uniform(0, self.conf.latency_jitter) if self.conf.latency_jitter > 0 else 0.0
+            fail = self._random.random() < self.conf.error_rate
+            self._in_flight += 1
+        try:
+            time.sleep(self.conf.latency + jitter)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+                self.calls += 1
+                self.seconds += time.perf_counter() - start
+        if fail:
+            raise FakeModelError("Injected error of a fake model")
+
+
+class FakeEmbeddings(Embeddings):
+    """
+    Deterministic embeddings: unit vectors of `dimensions` seeded by the hash of the text (and by `seed`),
+    so that the same text always gets the same vector. Each call sleeps and may fail (see `FakeModelConf`).
+    """
+
+    def __init__(self, conf: FakeModelConf):
+        self.dimensions = conf.dimensions
+        self.seed = conf.seed
+        self._synthetic = _SyntheticCalls(conf)
+
+    @property
+    def calls(self) -> int:
+        return self._synthetic.calls
+
+    @property
+    def seconds(self) -> float:
+        return self._synthetic.seconds
+
+    @property
+    def rate_limited(self) -> int:
+        return self._synthetic.rate_limited
+
+    def _embed(self, text: str) -> List[float]:
+        rng = np.random.default_rng([self.seed, int(md5(text.encode("utf-8")).hexdigest()[:16], 16)])
+        vector = rng.normal(size=self.dimensions)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self._synthetic.run()
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+def fake_graph(text: str, max_entities: int = 12) -> _Graph:
+    """
+    Graph of the capitalized words of a text (after its `INPUT TEXT:` marker, if any),
+    as `Concept` nodes linked in order of appearance.
+    """
+    names = list(dict.fromkeys(_ENTITY.findall(text.rsplit(_INPUT_MARKER, 1)[-1])))[:max_entities]
+    return _Graph(
+        nodes=[_Node(id=name, type="Concept") for name in names],
+        relationships=[
+            _Relationship(source=source, target=target, type="RELATED_TO")
+            for source, target in zip(names, names[1:])
+        ]
+    )
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Chat model answering every prompt with `conf.response`, streamed word by word. Each call sleeps and may fail
+    (see `FakeModelConf`). Also stands in for the OpenAI client used for structured outputs (`llm.chat.completions.parse`):
+    `_Graph` extractions are derived from the prompt (see `fake_graph`), other formats are parsed from `conf.response`.
+    """
+    conf: FakeModelConf = FakeModelConf()
+    _synthetic: _SyntheticCalls = PrivateAttr()
+
+    def model_post_init(self, __context: Any):
+        super().model_post_init(__context)
+        self._synthetic = _SyntheticCalls(self.conf)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake"
+
+    @property
+    def calls(self) -> int:
+        return self._synthetic.calls
+
+    @property
+    def seconds(self) -> float:
+        return self._synthetic.seconds
+
+    @property
+    def rate_limited(self) -> int:
+        return self._synthetic.rate_limited
+
+    @property
+    def chat(self) -> SimpleNamespace:
+        return SimpleNamespace(completions=SimpleNamespace(parse=self.parse))
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, **kwargs) -> ChatResult:
+        self._synthetic.run()
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.conf.response))])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        self._synthetic.run()
+        for word in re.split(r"(?<= )", self.conf.response):
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word))
+
+    def parse(self, messages: List[Dict[str, str]], response_format: Type[BaseModel], **kwargs) -> SimpleNamespace:
+        """ Same signature and result layout as `openai.OpenAI().chat.completions.parse`. """
+        self._synthetic.run()
+        prompt = messages[-1]["content"]
+        if issubclass(response_format, _Graph):
+            parsed = fake_graph(prompt, self.conf.max_entities)
+        else:
+            try:
+                parsed = response_format.model_validate_json(self.conf.response)
+            except ValueError:
+                parsed = response_format()
+        content = parsed.model_dump_json()
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content, parsed=parsed))],
+            usage=SimpleNamespace(
+                prompt_tokens=sum(count_tokens(message["content"]) for message in messages),
+                completion_tokens=count_tokens(content)
+            )
+        )
@@ -0,0 +1,19 @@
+from langchain_core.embeddings import Embeddings
+
+from src.config import GraphBackend, KnowledgeGraphConfig
+from src.graph.knowledge_graph import KnowledgeGraph
+from src.graph.memory_graph import InMemoryKnowledgeGraph
+from src.utils.logger import get_logger
+
+
+logger = get_logger(__name__)
+
+
+def get_knowledge_graph(conf: KnowledgeGraphConfig, embeddings_model: Embeddings, **kwargs) -> KnowledgeGraph:
+    """
+    Builds the Knowledge Graph on the configured backend: Neo4j, or the embedded in-memory graph.
+    """
+    if conf.backend == GraphBackend.MEMORY:
+        logger.info(f"Using the in-memory Knowledge Graph{f' persisted in {conf.memory_path}' if conf.memory_path else ''}")
+        return InMemoryKnowledgeGraph(conf=conf, embeddings_model=embeddings_model, **kwargs)
+    return KnowledgeGraph(conf=conf, embeddings_model=embeddings_model, **kwargs)
@@ -1,17 +1,105 @@
+import time
+from typing import Any, Dict, List, NamedTuple, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
 from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import LLMResult
 from langchain_google_genai.chat_models import ChatGoogleGenerativeAI
 from langchain_groq.chat_models import ChatGroq
 from langchain_ollama.chat_models import ChatOllama
 from langchain_openai.chat_models import ChatOpenAI, AzureChatOpenAI
 from openai import AzureOpenAI
 from langchain_huggingface.chat_models.huggingface import ChatHuggingFace
+from src.factory.fake import FakeChatModel
+from src.factory.rate_limiter import RateLimitCallback, get_provider_limiter
 from src.utils.logger import get_logger
+from src.utils.tokens import count_tokens
+from src.utils.metrics import counter, histogram, metrics_enabled
+from src.utils.tracing import Span, start_span, tracing_enabled
 
-from src.config import LLMConf
+from src.config import FakeModelConf, LLMConf
 
 logger = get_logger(__name__)
 
 
+def record_llm_metrics(
+    model: str, 
+    provider: str, 
+    seconds: float, 
+    input_tokens: Optional[int]=None, 
+    output_tokens: Optional[int]=None, 
+    error: bool=False
+    ):
+    """ 
+    Records a call of an LLM in the metrics registry: request count, latency and token usage per model. 
+    """
+    if not metrics_enabled():
+        return
+    counter("llm_requests_total", "LLM requests", model=model, provider=provider, status="error" if error else "ok").inc()
+    histogram("llm_request_duration_seconds", "Latency of LLM requests", model=model, provider=provider).observe(seconds)
+    if input_tokens:
+        counter("llm_tokens_total", "Tokens sent to and generated by LLMs", model=model, provider=provider, direction="input").inc(input_tokens)
+    if output_tokens:
+        counter("llm_tokens_total", "Tokens sent to and generated by LLMs", model=model, provider=provider, direction="output").inc(output_tokens)
+
+
+class _LLMCall(NamedTuple):
+    span: Span
+    start: float
+    input_tokens: int
+
+
+class LLMInstrumentationCallback(BaseCallbackHandler):
+    """ 
+    Records a span and metrics (see `record_llm_metrics`) for each call of a chat model (streamed ones included), 
+    with its token usage: as reported by the provider if available, estimated otherwise.
+    """
+
+    def __init__(self, model: str, provider: str):
+        self.model = model
+        self.provider = provider
+        self._calls: Dict[UUID, _LLMCall] = {}
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[List[BaseMessage]], *, run_id: UUID, **kwargs):
+        input_tokens = sum(count_tokens(str(m.content)) for batch in messages for m in batch)
+        span = start_span(
+            "llm.chat", 
+            kind="CLIENT", 
+            **{
+                "gen_ai.operation.name": "chat", 
+                "gen_ai.system": self.provider,
+                "gen_ai.request.model": self.model, 
+                "gen_ai.usage.input_tokens": input_tokens
+            }
+        )
+        self._calls[run_id] = _LLMCall(span, time.perf_counter(), input_tokens)
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs):
+        call = self._calls.pop(run_id, None)
+        if call is None:
+            return
+        generations = [generation for batch in response.generations for generation in batch]
+        usage = getattr(getattr(generations[0], "message", None), "usage_metadata", None) if generations else None
+        if usage:
+            input_tokens, output_tokens = usage.get("input_tokens"), usage.get("output_tokens")
+        else:
+            input_tokens, output_tokens = call.input_tokens, sum(count_tokens(generation.text) for generation in generations)
+            
+        call.span.set_attributes({"gen_ai.usage.input_tokens": input_tokens, "gen_ai.usage.output_tokens": output_tokens})
+        call.span.end()
+        record_llm_metrics(self.model, self.provider, time.perf_counter() - call.start, input_tokens, output_tokens)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs):
+        call = self._calls.pop(run_id, None)
+        if call is None:
+            return
+        call.span.record_exception(error)
+        call.span.end()
+        record_llm_metrics(self.model, self.provider, time.perf_counter() - call.start, error=True)
+
+
 def fetch_llm(conf: LLMConf) -> BaseChatModel | None:
     """
     Fetches the LLM model.
@@ -65,9 +153,19 @@ def fetch_llm(conf: LLMConf) -> BaseChatModel | None:
             endpoint=conf.endpoint,
             temperature=conf.temperature
         )
+    elif conf.type == "fake":
+        llm = FakeChatModel(conf=conf.fake_conf or FakeModelConf())
     else:
         logger.warning(f"LLM type '{conf.type}' not supported.")
         llm = None
     
+    limiter = get_provider_limiter(conf.type, conf.model, conf.rate_limit)
+    if limiter is not None and isinstance(llm, BaseChatModel):
+        # before instrumentation, so that waiting for the limiter is not counted as latency of the model
+        llm.callbacks = [*(llm.callbacks or []), RateLimitCallback(limiter)]
+
+    if (tracing_enabled() or metrics_enabled()) and isinstance(llm, BaseChatModel):
+        llm.callbacks = [*(llm.callbacks or []), LLMInstrumentationCallback(conf.model, conf.type)]
+    
     logger.info(f"Initialized LLM of type: '{conf.type}'")
     return llm 
\ No newline at end of file
@@ -0,0 +1,289 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.embeddings import Embeddings
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import LLMResult
+
+from src.config import RateLimitConf
+from src.utils.logger import get_logger
+from src.utils.metrics import counter, gauge, histogram, metrics_enabled
+from src.utils.tokens import count_tokens
+from src.utils.tracing import current_span
+
+
+logger = get_logger(__name__)
+
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    """ Whether an error of a provider is a rate limit one (HTTP 429), as raised by the OpenAI, Groq or Google clients. """
+    status = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    if status == 429:
+        return True
+    return "RateLimit" in type(error).__name__ or "429" in str(error) or "rate limit" in str(error).lower()
+
+
+class TokenBucket:
+    """
+    Budget refilled at `per_minute` units per minute, up to `capacity`. A call can take more than what is left
+    (i.e. a prompt longer than the capacity), leaving the bucket in debt until it is refilled.
+    Not thread safe by itself: used under the lock of its `ProviderLimiter`.
+    """
+
+    def __init__(self, per_minute: float, capacity: float):
+        self.rate = per_minute / 60
+        self.capacity = max(1.0, capacity)
+        self.level = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """ Seconds until `amount` units (at most the capacity) can be taken. """
+        self._refill()
+        needed = min(amount, self.capacity)
+        return 0.0 if self.level >= needed else (needed - self.level) / self.rate
+
+    def take(self, amount: float):
+        """ Takes `amount` units, or gives them back if negative. """
+        self._refill()
+        self.level = min(self.capacity, self.level - amount)
+
+
+class _Permit:
+    """ Call allowed by a `ProviderLimiter`, with its estimated tokens and, once known, the tokens it actually used. """
+
+    def __init__(self, estimated_tokens: int):
+        self.estimated_tokens = estimated_tokens
+        self.tokens: Optional[int] = None
+
+
+class ProviderLimiter:
+    """
+    Limits the calls to a model of a provider, shared by all its clients (see `get_provider_limiter`):
+    * token buckets on requests and tokens per minute (`requests_per_minute`, `tokens_per_minute`);
+    * an adaptive limit on the calls in flight (AIMD): it grows by one call per round of successful calls,
+    and is multiplied by `decrease_factor` on congestion, i.e. a rate limit error (429) or a call slower than `latency_target`,
+    at most once per round trip so that the failures of a single burst only count once.
+
+    Callers wait in `acquire` until every limit allows their call; waits, waiting callers, calls in flight,
+    the concurrency limit and congestion events are recorded in the metrics registry.
+    """
+
+    def __init__(self, provider: str, model: str, conf: RateLimitConf):
+        self.provider = provider
+        self.model = model
+        self.conf = conf
+        self.requests = TokenBucket(conf.requests_per_minute, conf.requests_per_minute * conf.burst_seconds / 60) if conf.requests_per_minute else None
+        self.tokens = TokenBucket(conf.tokens_per_minute, conf.tokens_per_minute * conf.burst_seconds / 60) if conf.tokens_per_minute else None
+        self.concurrency = float(min(conf.initial_concurrency or conf.max_concurrency, conf.max_concurrency))
+        self.in_flight = 0
+        self.waiting = 0
+        self._latency: Optional[float] = None
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+
+
+    @property
+    def counts_tokens(self) -> bool:
+        """ Whether calls need an estimate of their tokens, to be spent from the `tokens_per_minute` budget. """
+        return self.tokens is not None
+
+
+    def _record(self):
+        if not metrics_enabled():
+            return
+        labels = {"provider": self.provider, "model": self.model}
+        gauge("rate_limiter_waiting", "Calls waiting for a rate limiter", **labels).set(self.waiting)
+        gauge("rate_limiter_in_flight", "Calls in flight allowed by a rate limiter", **labels).set(self.in_flight)
+        gauge("rate_limiter_concurrency_limit", "Adaptive limit of calls in flight of a rate limiter", **labels).set(self.concurrency)
+
+
+    def acquire(self, tokens: int = 0) -> float:
+        """ Waits until a call of `tokens` (estimated) tokens is allowed, returns the seconds waited. """
+        start = time.perf_counter()
+        with self._condition:
+            self.waiting += 1
+            self._record()
+            try:
+                while True:
+                    timeout = None
+                    if self.in_flight < max(1, int(self.concurrency)):
+                        timeout = max(
+                            self.requests.wait_time(1) if self.requests else 0.0,
+                            self.tokens.wait_time(tokens) if self.tokens else 0.0
+                        )
+                        if timeout <= 0:
+                            break
+                    self._condition.wait(timeout=timeout)
+                if self.requests:
+                    self.requests.take(1)
+                if self.tokens:
+                    self.tokens.take(tokens)
+                self.in_flight += 1
+            finally:
+                self.waiting -= 1
+                self._record()
+
+        waited = time.perf_counter() - start
+        if metrics_enabled():
+            histogram(
+                "rate_limiter_wait_seconds", "Seconds waited for a rate limiter", provider=self.provider, model=self.model
+            ).observe(waited)
+        current_span().set_attribute("rate_limiter.wait_seconds", waited)
+        return waited
+
+
+    def release(self, seconds: float, estimated_tokens: int = 0, tokens: Optional[int] = None, rate_limited: bool = False):
+        """
+        Ends a call that lasted `seconds`: corrects the tokens budget with the `tokens` it actually used, if known,
+        and adapts the concurrency limit to its outcome.
+        """
+        slow = self.conf.latency_target is not None and seconds > self.conf.latency_target
+        with self._condition:
+            self.in_flight -= 1
+            if self.tokens and tokens is not None:
+                self.tokens.take(tokens - estimated_tokens)
+
+            if rate_limited or slow:
+                now = time.monotonic()
+                if now - self._last_decrease >= (self._latency or seconds):
+                    self.concurrency = max(float(self.conf.min_concurrency), self.concurrency * self.conf.decrease_factor)
+                    self._last_decrease = now
+                    logger.info(
+                        f"Concurrency of {self.provider} '{self.model}' decreased to {int(self.concurrency)} "
+                        f"({'rate limit error' if rate_limited else f'latency of {seconds:.2f}s'})"
+                    )
+            else:
+                self.concurrency = min(float(self.conf.max_concurrency), self.concurrency + 1 / self.concurrency)
+            if not rate_limited:
+                self._latency = seconds if self._latency is None else 0.8 * self._latency + 0.2 * seconds
+            self._condition.notify_all()
+            self._record()
+
+        if metrics_enabled() and (rate_limited or slow):
+            counter(
+                "rate_limiter_congestion_total", "Calls signalling congestion to a rate limiter",
+                provider=self.provider, model=self.model, reason="rate_limit" if rate_limited else "latency"
+            ).inc()
+
+
+    @contextmanager
+    def call(self, tokens: int = 0) -> Iterator[_Permit]:
+        """
+        Runs a call within the limits: the caller can set the `tokens` it actually used on the permit.
+        A rate limit error raised by the call decreases the concurrency limit and is raised again.
+        """
+        self.acquire(tokens)
+        permit = _Permit(tokens)
+        start = time.perf_counter()
+        try:
+            yield permit
+        except Exception as e:
+            self.release(time.perf_counter() - start, tokens, permit.tokens, rate_limited=is_rate_limit_error(e))
+            raise
+        self.release(time.perf_counter() - start, tokens, permit.tokens)
+
+
+_limiters: Dict[Tuple[str, str], ProviderLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_provider_limiter(provider: Any, model: Optional[str], conf: Optional[RateLimitConf]) -> Optional[ProviderLimiter]:
+    """
+    Returns the `ProviderLimiter` shared by every client of a provider and model (created with the first `conf` given),
+    or `None` if there is no `conf`.
+    """
+    if conf is None:
+        return None
+    key = (str(getattr(provider, "value", provider)), model or "")
+    with _limiters_lock:
+        if key not in _limiters:
+            _limiters[key] = ProviderLimiter(key[0], key[1], conf)
+            logger.info(
+                f"Rate limiting {key[0]} '{key[1]}': {conf.requests_per_minute or 'unlimited'} requests and "
+                f"{conf.tokens_per_minute or 'unlimited'} tokens per minute, up to {conf.max_concurrency} calls in flight"
+            )
+        return _limiters[key]
+
+
+@contextmanager
+def rate_limited(limiter: Optional[ProviderLimiter], tokens: int = 0) -> Iterator[Optional[_Permit]]:
+    """ Runs a call within the limits of `limiter` (see `ProviderLimiter.call`), or as is if there is none. """
+    if limiter is None:
+        yield None
+        return
+    with limiter.call(tokens) as permit:
+        yield permit
+
+
+class RateLimitCallback(BaseCallbackHandler):
+    """
+    Makes each call of a chat model (streamed ones included) go through a `ProviderLimiter`: the call waits at its start
+    until it is allowed, and its end (with the tokens used, as reported by the provider if available) or its error
+    is reported back to the limiter.
+    """
+
+    def __init__(self, limiter: ProviderLimiter):
+        self.limiter = limiter
+        self._calls: Dict[UUID, Tuple[float, int]] = {}
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[List[BaseMessage]], *, run_id: UUID, **kwargs):
+        tokens = sum(count_tokens(str(m.content)) for batch in messages for m in batch) if self.limiter.counts_tokens else 0
+        self.limiter.acquire(tokens)
+        self._calls[run_id] = (time.perf_counter(), tokens)
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs):
+        call = self._calls.pop(run_id, None)
+        if call is None:
+            return
+        start, estimated = call
+        tokens = None
+        if self.limiter.counts_tokens:
+            generations = [generation for batch in response.generations for generation in batch]
+            usage = getattr(getattr(generations[0], "message", None), "usage_metadata", None) if generations else None
+            if usage:
+                tokens = (usage.get("input_tokens") or 0) + (usage.get("output_tokens") or 0)
+            else:
+                tokens = estimated + sum(count_tokens(generation.text) for generation in generations)
+        self.limiter.release(time.perf_counter() - start, estimated, tokens)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs):
+        call = self._calls.pop(run_id, None)
+        if call is None:
+            return
+        start, estimated = call
+        self.limiter.release(time.perf_counter() - start, estimated, rate_limited=is_rate_limit_error(error))
+
+
+class RateLimitedEmbeddings(Embeddings):
+    """
+    Wraps an embeddings model, making each call go through a `ProviderLimiter`. Any other attribute is read from the wrapped model.
+    """
+
+    def __init__(self, embeddings: Embeddings, limiter: ProviderLimiter):
+        self.embeddings = embeddings
+        self.limiter = limiter
+
+    def _tokens(self, texts: List[str]) -> int:
+        return sum(count_tokens(text) for text in texts) if self.limiter.counts_tokens else 0
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        with self.limiter.call(self._tokens(texts)):
+            return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        with self.limiter.call(self._tokens([text])):
+            return self.embeddings.embed_query(text)
+
+    def __getattr__(self, name):
+        if name == "embeddings":
+            raise AttributeError(name)
+        return getattr(self.embeddings, name)
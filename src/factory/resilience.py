@@ -0,0 +1,220 @@
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple, TypeVar
+
+from langchain_core.embeddings import Embeddings
+
+from src.config import ResilienceConf
+from src.factory.rate_limiter import is_rate_limit_error
+from src.utils.logger import get_logger
+from src.utils.metrics import counter, gauge, metrics_enabled
+from src.utils.tracing import current_span, propagate
+
+
+logger = get_logger(__name__)
+
+T = TypeVar("T")
+
+
+class CircuitOpenError(RuntimeError):
+    """ Raised without calling a provider while its circuit breaker is open. """
+
+
+class DeadlineExceededError(TimeoutError):
+    """ Raised when an attempt of a call does not complete within its deadline (see `ResilienceConf.timeout`). """
+
+
+def is_retryable(error: BaseException) -> bool:
+    """
+    Whether a failed call may succeed if retried: rate limits, timeouts, connection and server (5xx) errors, or errors
+    without a status code; not client errors (4xx), invalid arguments, or calls rejected by an open circuit breaker.
+    """
+    if isinstance(error, CircuitOpenError):
+        return False
+    if is_rate_limit_error(error) or isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    status = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    if isinstance(status, int):
+        return status in (408, 409) or status >= 500
+    return not isinstance(error, (ValueError, TypeError, KeyError))
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker of a provider: closed while calls succeed, it opens after `failure_threshold` consecutive failed attempts,
+    rejecting calls right away (`CircuitOpenError`) instead of letting each one wait for a provider that is down.
+    After `recovery_seconds`, it is half open: a single call probes the provider, closing the breaker if it succeeds
+    or opening it again if it fails.
+    """
+
+    CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+
+    def __init__(self, name: str, conf: ResilienceConf, **labels):
+        self.name = name
+        self.conf = conf
+        self.labels = labels
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+
+    def _set_state(self, state: str):
+        if state != self.state:
+            log = logger.warning if state == self.OPEN else logger.info
+            log(f"Circuit breaker of {self.name} {state.replace('_', ' ')}")
+        self.state = state
+        if metrics_enabled():
+            gauge(
+                "circuit_breaker_state", "State of a circuit breaker: 0 closed, 1 half open, 2 open", **self.labels
+            ).set((self.CLOSED, self.HALF_OPEN, self.OPEN).index(state))
+
+
+    def before_call(self):
+        """ Lets a call through, or raises a `CircuitOpenError` while the breaker is open (or already probing). """
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.conf.recovery_seconds:
+                self._set_state(self.HALF_OPEN)
+                return
+            if self.state == self.CLOSED:
+                return
+        counter("circuit_breaker_rejections_total", "Calls rejected by an open circuit breaker", **self.labels).inc()
+        raise CircuitOpenError(f"Circuit breaker of {self.name} is open, call rejected")
+
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._set_state(self.CLOSED)
+
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.conf.failure_threshold:
+                self._opened_at = time.monotonic()
+                self._set_state(self.OPEN)
+
+
+class Resilience:
+    """
+    Retries failed calls to a model of a provider, shared by all its clients (see `get_resilience`):
+    * each attempt may have a deadline (`timeout`, none by default), after which it is abandoned, still running, and counts as failed;
+    * retryable errors (see `is_retryable`) are retried up to `max_attempts` times, after an exponential backoff with jitter;
+    * a `CircuitBreaker` fails calls fast while the provider is down.
+
+    The last error is raised once retries are exhausted, so that callers can dead-letter what failed.
+    """
+
+    def __init__(self, provider: str, model: str, conf: ResilienceConf):
+        self.provider = provider
+        self.model = model
+        self.conf = conf
+        self.breaker = CircuitBreaker(f"{provider} '{model}'", conf, provider=provider, model=model)
+        self._random = random.Random()
+
+
+    def backoff(self, attempt: int) -> float:
+        """ Seconds to wait before retrying a call after its `attempt`-th failed attempt. """
+        cap = min(self.conf.max_backoff, self.conf.initial_backoff * self.conf.backoff_multiplier ** (attempt - 1))
+        return self._random.uniform(0, cap) if self.conf.jitter else cap
+
+
+    def _attempt(self, fn: Callable[..., T], *args, **kwargs) -> T:
+        """ Runs an attempt of a call within its deadline, in a worker thread that is abandoned if it is exceeded. """
+        if self.conf.timeout is None:
+            return fn(*args, **kwargs)
+
+        outcome: Dict[str, Any] = {}
+
+        def target():
+            try:
+                outcome["result"] = fn(*args, **kwargs)
+            except BaseException as e:
+                outcome["error"] = e
+
+        worker = threading.Thread(target=propagate(target), name=f"call-{self.provider}", daemon=True)
+        worker.start()
+        worker.join(self.conf.timeout)
+        if worker.is_alive():
+            raise DeadlineExceededError(f"Call to {self.provider} '{self.model}' exceeded its deadline of {self.conf.timeout}s")
+        if "error" in outcome:
+            raise outcome["error"]
+        return outcome["result"]
+
+
+    def call(self, fn: Callable[..., T], *args, **kwargs) -> T:
+        """ Calls `fn(*args, **kwargs)`, retrying it on retryable errors; raises the last error once retries are exhausted. """
+        attempt = 0
+        while True:
+            attempt += 1
+            self.breaker.before_call()
+            try:
+                result = self._attempt(fn, *args, **kwargs)
+            except Exception as e:
+                if not is_retryable(e):
+                    # the provider answered: it is up
+                    self.breaker.record_success()
+                    raise
+                self.breaker.record_failure()
+                if attempt >= self.conf.max_attempts:
+                    current_span().set_attribute("resilience.attempts", attempt)
+                    raise
+                delay = self.backoff(attempt)
+                logger.info(
+                    f"Attempt {attempt}/{self.conf.max_attempts} of a call to {self.provider} '{self.model}' failed "
+                    f"({type(e).__name__}: {e}), retrying in {delay:.2f}s"
+                )
+                counter("llm_retries_total", "Retried calls to a model", provider=self.provider, model=self.model).inc()
+                time.sleep(delay)
+                continue
+            self.breaker.record_success()
+            current_span().set_attribute("resilience.attempts", attempt)
+            return result
+
+
+_resiliences: Dict[Tuple[str, str], Resilience] = {}
+_resiliences_lock = threading.Lock()
+
+
+def get_resilience(provider: Any, model: Optional[str], conf: Optional[ResilienceConf]) -> Optional[Resilience]:
+    """
+    Returns the `Resilience` (and circuit breaker) shared by every client of a provider and model (created with the first `conf` given),
+    or `None` if there is no `conf`.
+    """
+    if conf is None:
+        return None
+    key = (str(getattr(provider, "value", provider)), model or "")
+    with _resiliences_lock:
+        if key not in _resiliences:
+            _resiliences[key] = Resilience(key[0], key[1], conf)
+        return _resiliences[key]
+
+
+def call_with_resilience(resilience: Optional[Resilience], fn: Callable[..., T], *args, **kwargs) -> T:
+    """ Calls `fn(*args, **kwargs)` with the retries of `resilience` (see `Resilience.call`), or once if there is none. """
+    if resilience is None:
+        return fn(*args, **kwargs)
+    return resilience.call(fn, *args, **kwargs)
+
+
+class ResilientEmbeddings(Embeddings):
+    """
+    Wraps an embeddings model, retrying its failed calls (see `Resilience`). Any other attribute is read from the wrapped model.
+    """
+
+    def __init__(self, embeddings: Embeddings, resilience: Resilience):
+        self.embeddings = embeddings
+        self.resilience = resilience
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.resilience.call(self.embeddings.embed_documents, texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.resilience.call(self.embeddings.embed_query, text)
+
+    def __getattr__(self, name):
+        if name == "embeddings":
+            raise AttributeError(name)
+        return getattr(self.embeddings, name)
@@ -5,7 +5,7 @@ from igraph import Graph
 from leidenalg import find_partition, ModularityVertexPartition
 from src.utils.logger import get_logger
 from neo4j import Query, Session
-from typing import Any, Dict, Tuple
+from typing import Any, Dict, Optional, Tuple
 
 
 logger = get_logger(__name__)
@@ -69,6 +69,78 @@ def detect_leiden_communities(G: nx.DiGraph, return_modularity:bool=True) -> nx.
         return G, modularity
     
 
+def community_level_type(community_type: str, level: int = 0) -> str:
+    """
+    Name of the communities of a hierarchy level: level `0` is the community type itself (i.e. `leiden`),
+    finer levels are suffixed with their number (i.e. `leiden_1`), so that they are stored on nodes
+    as `community_leiden_1` and can be queried like any other community type.
+    """
+    return community_type if level == 0 else f"{community_type}_{level}"
+
+
+def detect_hierarchical_leiden_communities(
+    G: nx.DiGraph,
+    max_levels: int = 3,
+    max_community_size: int = 50,
+    return_modularity: bool = True
+    ) -> nx.DiGraph | Tuple[nx.DiGraph, float]:
+    """
+    Detects a hierarchy of Leiden communities for a `networkx` Directed Graph.
+
+    Level `0` is the flat Leiden partition (`community_leiden`). At each following level,
+    communities larger than `max_community_size` are partitioned again into sub-communities
+    (`community_leiden_1`, `community_leiden_2`, ...), while smaller ones are carried over,
+    so that every level is a partition of the whole graph. Stops early when no community can be split.
+    The number of levels is stored in `G.graph["leiden_levels"]`.
+    If `return_modularity`, also return the modularity of the level `0` partition.
+    """
+    G, modularity = detect_leiden_communities(G, return_modularity=True)
+    G.graph["leiden_levels"] = 1
+
+    for level in range(1, max_levels):
+        parent_property = f"community_{community_level_type('leiden', level - 1)}"
+        level_property = f"community_{community_level_type('leiden', level)}"
+
+        members: Dict[int, list] = {}
+        for node, data in G.nodes(data=True):
+            members.setdefault(data[parent_property], []).append(node)
+
+        next_id = 0
+        split = False
+        for parent_id in sorted(members):
+            nodes = members[parent_id]
+            parts = [nodes]
+            if len(nodes) > max_community_size:
+                subgraph = G.subgraph(nodes)
+                mapping = {node: i for i, node in enumerate(subgraph.nodes())}
+                ig_G = Graph(directed=True)
+                ig_G.add_vertices(len(mapping))
+                ig_G.add_edges([(mapping[u], mapping[v]) for u, v in subgraph.edges()])
+                partition = find_partition(ig_G, ModularityVertexPartition)
+                if len(partition) > 1:
+                    reverse_mapping = {i: node for node, i in mapping.items()}
+                    parts = [[reverse_mapping[i] for i in comm] for comm in partition]
+                    split = True
+
+            for part in parts:
+                for node in part:
+                    G.nodes[node][level_property] = next_id
+                next_id += 1
+
+        if not split:
+            for _, data in G.nodes(data=True):
+                del data[level_property]
+            break
+
+        G.graph["leiden_levels"] = level + 1
+        logger.info(f"Leiden level {level}: {next_id} communities out of {len(members)}")
+
+    if not return_modularity:
+        return G
+
+    return G, modularity
+
+
 def compute_centralities(G: nx.DiGraph | nx.Graph) -> nx.DiGraph | nx.Graph:
     """
     Compute PageRank, Betweenness and Closeness Centralities and store them as metadata in the graph
@@ -117,12 +189,14 @@ def build_update_query(
         louvain_communities=False,
         community_leiden: int=-1, 
         community_louvain: int=-1, 
+        community_levels: Optional[Dict[str, int]]=None,
         pagerank: float=0.0, 
         betweenness: float=0.0,
         closeness: float=0.0 
     ) -> Tuple[Query, Dict[str, Any]]:
     """ 
-    Returns `Query` and `dict`with parameters to update node properies
+    Returns `Query` and `dict`with parameters to update node properies.  
+    `community_levels` maps the properties of finer Leiden levels (i.e. `community_leiden_1`) to their value.
     """
     
     # Base query
@@ -135,6 +209,9 @@ def build_update_query(
     if leiden_communities:
         set_clauses.append("n.community_leiden = $community_leiden")
         parameters["community_leiden"] = community_leiden
+        for i, (level_property, value) in enumerate((community_levels or {}).items()):
+            set_clauses.append(f"n.{level_property} = $community_level_{i}")
+            parameters[f"community_level_{i}"] = value
 
     if louvain_communities:
         set_clauses.append("n.community_louvain = $community_louvain")
@@ -1,42 +1,19 @@
 import re
+import hashlib
 import networkx as nx
 import pandas as pd
 
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, NamedTuple, Optional
 from pydantic import BaseModel, ConfigDict
 
 from langchain_core.documents import Document
-from langchain_core.load.serializable import Serializable
 from langchain_neo4j.graphs.graph_document import Node, Relationship, GraphDocument
 
-from src.schema import Chunk
+from src.schema import Chunk, _Graph, _Node, _Relationship
+from src.utils.logger import get_logger
 
 
-class _Node(Serializable):
-    id: str
-    type: str
-    properties: Optional[Dict[str, str]] = None
-
-
-class _Relationship(Serializable):
-    source: str
-    target: str
-    type: str
-    properties: Optional[Dict[str, str]] = None
-
-
-class _Graph(Serializable):
-    """ 
-    Represents a graph consisting of nodes and relationships.  
-    
-    -----------
-    Attributes:
-    -----------
-        `nodes (List[_Node])`: A list of nodes in the graph.
-        `relationships (List[_Relationship])`: A list of relationships in the graph.
-    """
-    nodes: List[_Node]
-    relationships: List[_Relationship]
+logger = get_logger(__name__)
 
 
 class Ontology(BaseModel):
@@ -66,10 +43,14 @@ class Community(BaseModel):
         The identifier of this community in the graph nodes properties
     `community_size`: `Optional[int]`
         The number of nodes in the graph with attribute 'community_type: community_id'
+    `level`: `int`
+        The level of the community in the Leiden hierarchy, `0` being the coarsest
     `entity_ids`: `Optional[List[str]]`
         List of entity IDs related to the community
     `relationship_ids`: `Optional[List[str]]`
         List of relationship IDs related to the community
+    `chunk_ids`: `Optional[List[str]]`
+        List of IDs of the Chunks in the community
     `table_repr`: `Optional[pd.DataFrame]`
         Table Representation of the community
     `attributes`: `Optional[Dict[str, Any]]`
@@ -78,17 +59,29 @@ class Community(BaseModel):
     community_type: str
     community_id: int
     community_size: Optional[int] = None
+    level: int = 0
     entity_ids: Optional[List[str]] = None
     entity_names: Optional[List[str]] = None
     relationship_ids: Optional[List[str]] = None
     relationship_types:  Optional[List[str]] = None
     attributes: Optional[Dict[str, Any]] = None
+    chunk_ids: Optional[List[str]] = None
     chunks: Optional[List[Chunk]] = None
     table_repr: Optional[pd.DataFrame] = None # TODO how to fetch this?
     
     model_config = ConfigDict(arbitrary_types_allowed=True)
     
     
+    def fingerprint(self) -> str:
+        """ 
+        Hash of the IDs of the member entities and Chunks of the community: it only changes when 
+        its members do, regardless of the (arbitrary) `community_id` assigned by community detection.
+        """
+        chunk_ids = self.chunk_ids if self.chunk_ids is not None else [str(chunk.chunk_id) for chunk in self.chunks or []]
+        content = "|".join(sorted(self.entity_ids or [])) + "#" + "|".join(sorted(chunk_ids))
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+    
+    
 class CommunityReport(BaseModel):
     """ 
     Summary report from a given `Community`
@@ -100,8 +93,12 @@ class CommunityReport(BaseModel):
         The type of community, such as `leiden` or `louvain`
     `community_id`: `int`
         The identifier of this community in the graph nodes properties
+    `community_level`: `int`
+        The level of the community in the Leiden hierarchy, `0` being the coarsest
     `summary`: `str`
         Summary of the report
+    `fingerprint`: `Optional[str]`
+        Fingerprint of the community when the report was generated (see `Community.fingerprint`)
     community_size`: `Optional[int]`
         The number of nodes in the graph with attribute 'community_type: community_id'
     `rank`: `float`
@@ -111,11 +108,20 @@ class CommunityReport(BaseModel):
     """
     communtiy_type: str
     community_id: int
+    community_level: int = 0
     summary: str = ""
     rank: float = 0.0
     community_size: Optional[int] = None
+    fingerprint: Optional[str] = None
     attributes: Optional[Dict[str, Any]] = None   
     summary_embeddings: Optional[List[float]] = None
+
+    @property
+    def report_id(self) -> str:
+        """ 
+        Id of the stored report: one per community and fingerprint, so that communities with identical summaries get distinct reports. 
+        """
+        return f"{self.communtiy_type}:{self.community_level}:{self.community_id}:{self.fingerprint}"
     
     
 def graph_document_to_digraph(graph_doc: GraphDocument) -> nx.DiGraph:
@@ -272,4 +278,90 @@ def map_to_lc_graph(graph: _Graph, source_content: str) -> GraphDocument:
         source=Document(page_content=source_content)
     )
 
-    return graph_doc
\ No newline at end of file
+    return graph_doc
+
+
+class GraphRows(NamedTuple):
+    """ 
+    Parameter rows of the `UNWIND` writes of a graph: nodes (`{id, properties}`) grouped by label, 
+    relationships (`{source, target, properties}`) grouped by type, so that each write has a fixed query text 
+    (cached by Neo4j) whatever the size of the graph. `entity_ids` are the ids of the nodes, mentioned by their Chunk.
+    """
+    nodes: Dict[str, List[Dict[str, Any]]]
+    relationships: Dict[str, List[Dict[str, Any]]]
+    entity_ids: List[str]
+
+    @property
+    def number_of_nodes(self) -> int:
+        return sum(len(rows) for rows in self.nodes.values())
+
+    @property
+    def number_of_relationships(self) -> int:
+        return sum(len(rows) for rows in self.relationships.values())
+
+
+def format_label(label: str) -> str:
+    """ Label of a node, safe to interpolate between backticks in a Cypher query. """
+    return label.replace("`", "")
+
+
+def format_relationship_type(rel_type: str) -> str:
+    """ Type of a relationship as written by `Neo4jGraph.add_graph_documents`, safe to interpolate between backticks. """
+    return rel_type.replace(" ", "_").upper().replace("`", "")
+
+
+def graph_to_rows(graph: _Graph) -> GraphRows:
+    """
+    Maps a `_Graph` straight to `GraphRows`, normalizing ids, labels and `name` as `map_to_lc_graph` does: 
+    endpoints of relationships are resolved with a lookup by id instead of a scan of the nodes, 
+    relationships whose endpoints are not among the nodes are dropped.
+    """
+    ids: Dict[str, str] = {}
+    nodes: Dict[str, List[Dict[str, Any]]] = {}
+    for node in graph.nodes:
+        node_id = node.id.title()
+        # first node with a given id wins, as in `map_to_lc_relationship`
+        ids.setdefault(node.id, node_id)
+        nodes.setdefault(format_label(node.type.capitalize()), []).append(
+            {"id": node_id, "properties": {**(node.properties or {}), "name": node_id}}
+        )
+
+    relationships: Dict[str, List[Dict[str, Any]]] = {}
+    dropped = 0
+    for rel in graph.relationships:
+        if rel.source not in ids or rel.target not in ids:
+            dropped += 1
+            continue
+        relationships.setdefault(format_relationship_type(rel.type), []).append(
+            {"source": ids[rel.source], "target": ids[rel.target], "properties": rel.properties or {}}
+        )
+    if dropped:
+        logger.warning(f"Dropped {dropped} relationships between nodes missing from the extracted graph")
+
+    return GraphRows(nodes=nodes, relationships=relationships, entity_ids=list(dict.fromkeys(ids.values())))
+
+
+def lc_to_rows(nodes: List[Node], relationships: List[Relationship]) -> GraphRows:
+    """ Maps `langchain_neo4j` nodes and relationships (i.e. of Chunks built by hand) to `GraphRows`, as they are. """
+    node_rows: Dict[str, List[Dict[str, Any]]] = {}
+    for node in nodes:
+        node_rows.setdefault(format_label(node.type), []).append({"id": node.id, "properties": node.properties or {}})
+
+    rel_rows: Dict[str, List[Dict[str, Any]]] = {}
+    for rel in relationships:
+        rel_rows.setdefault(format_relationship_type(rel.type), []).append(
+            {"source": rel.source.id, "target": rel.target.id, "properties": rel.properties or {}}
+        )
+    return GraphRows(nodes=node_rows, relationships=rel_rows, entity_ids=list(dict.fromkeys(node.id for node in nodes)))
+
+
+def chunk_graph_rows(chunk: Chunk) -> Optional[GraphRows]:
+    """ 
+    `GraphRows` of the graph extracted from a Chunk: its `graph` if mined, its `nodes` and `relationships` otherwise, 
+    `None` if it has neither.
+    """
+    if chunk.graph is not None:
+        return graph_to_rows(chunk.graph)
+    if chunk.nodes is not None:
+        return lc_to_rows(chunk.nodes, chunk.relationships or [])
+    return None
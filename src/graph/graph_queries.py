@@ -4,6 +4,7 @@ from neo4j import Query, Session
 
 from src.graph.graph_model import Node, Relationship, Community, CommunityReport
 from src.graph.knowledge_graph import KnowledgeGraph
+from src.graph.memory_graph import InMemorySession
 from src.schema import Chunk
 from src.utils.logger import get_logger
 
@@ -19,6 +20,9 @@ def document_metadata(session: Session, filename: str, version: Optional[int]) -
 def get_chunk_element_id(session: Session, chunk: Chunk) -> str | None:
     """ Returns the unique elementId in the graph for a given `Chunk`"""
     
+    if isinstance(session, InMemorySession):
+        return session.chunk_element_id(chunk.filename, chunk.chunk_id, chunk.text)
+    
     query = """ 
         MATCH (c:Chunk {filename: $filename, chunk_id: $chunk_id, text: $text})
         RETURN elementId(c) AS element_id
@@ -47,7 +51,10 @@ def get_adjacent_chunks(
     given an initial node characterised by a `filename` and a `chunk_id`.  
     If `use_elementId` is set to `True`, will use the elementId of the chunk instead. 
     """
-    if use_elementId:
+    if isinstance(session, InMemorySession):
+        record = session.adjacent_chunks(chunk.chunk_id, chunk.filename, use_elementId=use_elementId)
+        
+    elif use_elementId:
         base_query = """ 
             MATCH (current:Chunk)
             WHERE elementId(current) = $elementId
@@ -55,7 +62,8 @@ def get_adjacent_chunks(
             OPTIONAL MATCH (prev:Chunk)-[:NEXT]->(current)
             OPTIONAL MATCH (current)-[:NEXT]->(next:Chunk)
 
-            RETURN prev AS previous_chunk, current, next AS next_chunk
+            RETURN prev {.chunk_id, .filename, .text} AS previous_chunk, current {.chunk_id, .filename, .text} AS current, 
+                next {.chunk_id, .filename, .text} AS next_chunk
         """
         try: 
             result = session.run(base_query, elementId=chunk.chunk_id)
@@ -72,7 +80,8 @@ def get_adjacent_chunks(
             OPTIONAL MATCH (prev:Chunk)-[:NEXT]->(current)
             OPTIONAL MATCH (current)-[:NEXT]->(next:Chunk)
 
-            RETURN prev AS previous_chunk, current, next AS next_chunk
+            RETURN prev {.chunk_id, .filename, .text} AS previous_chunk, current {.chunk_id, .filename, .text} AS current, 
+                next {.chunk_id, .filename, .text} AS next_chunk
         """
         
         try: 
@@ -103,62 +112,141 @@ def get_adjacent_chunks(
 
 
 
-def get_mentioned_entities(
+def _build_expansion_query(n_hops: int, use_elementId: bool) -> str:
+    """ 
+    Builds the query expanding the entities mentioned by a batch of chunks for `n_hops` relationship layers. 
+    The first layer is made of the entities the chunk `MENTIONS`; each following layer is made of the neighbours 
+    of the previous one not seen yet, filtered by relationship type and pagerank and capped to the 
+    `$max_per_hop` neighbours with the highest pagerank.
+    """
+    if use_elementId:
+        match_chunk = "MATCH (c:Chunk) WHERE elementId(c) = key.element_id"
+    else:
+        match_chunk = "MATCH (c:Chunk) WHERE c.chunk_id = key.chunk_id AND c.filename = key.filename"
+    
+    query = f"""
+        UNWIND $chunks AS key
+        {match_chunk}
+        MATCH (c)-[:MENTIONS]->(mentioned)
+        WITH key, collect(DISTINCT mentioned) AS frontier
+        WITH key, frontier, frontier AS seen, [n IN frontier | n {{.*, labels: labels(n), hop: 1}}] AS entities
+    """
+    
+    for hop in range(2, n_hops + 1):
+        query += f"""
+        CALL {{
+            WITH frontier, seen
+            UNWIND frontier AS f
+            MATCH (f)-[r]-(m:__Entity__)
+            WHERE NOT m IN seen
+                AND ($relationship_types IS NULL OR type(r) IN $relationship_types)
+                AND coalesce(m.pagerank, 0.0) >= $min_pagerank
+            WITH DISTINCT m
+            ORDER BY coalesce(m.pagerank, 0.0) DESC
+            LIMIT $max_per_hop
+            RETURN collect(m) AS hop_nodes
+        }}
+        WITH key, hop_nodes AS frontier, seen + hop_nodes AS seen, 
+            entities + [n IN hop_nodes | n {{.*, labels: labels(n), hop: {hop}}}] AS entities
+        """
+    
+    query += """
+        RETURN key, entities
+    """
+    return query
+
+
+def expand_mentioned_entities(
     session: Session, 
-    chunk: Chunk,
+    chunks: List[Chunk],
     n_hops: int=1, 
+    max_per_hop: int=10,
+    relationship_types: Optional[List[str]]=None,
+    min_pagerank: float=0.0,
     use_elementId: bool = False
-    ) -> List[Dict[str, Any]]:
+    ) -> Dict[Any, List[Dict[str, Any]]]:
     """ 
-    Follows the `MENTIONS` relationships of a given Chunk in the Graph and collects mentioned entities. 
-    `n_hops` is used to indicate the number of relationship layers that could be done following entities linking.  
+    Collects the entities mentioned by a batch of Chunks and expands them for up to `n_hops` relationship layers, 
+    in a single query. 
+    
+    -------
+    params:
+    -------
+    `chunks`: `List[Chunk]`
+        Chunks to expand, identified by `filename` and `chunk_id` (or by elementId in `chunk_id` if `use_elementId`)
+    `n_hops`: `int`
+        Number of relationship layers to follow; `1` only returns the entities each chunk `MENTIONS`
+    `max_per_hop`: `int`
+        Maximum number of new entities added to each chunk's context at every hop after the first
+    `relationship_types`: `Optional[List[str]]`
+        If given, only relationships of these types are followed when expanding
+    `min_pagerank`: `float`
+        Entities with a lower `pagerank` are pruned from the expansion
+    
+    Returns a dictionary mapping each chunk (its elementId if `use_elementId`, else `(filename, chunk_id)`) 
+    to the list of its entities' properties, each with the `labels` of the entity and the `hop` it was reached at. 
     """
-    nodes = []
+    if not chunks:
+        return {}
     
-    # TODO perform n-hops retrieval
     if use_elementId:
-        base_query = """
-            MATCH (c:Chunk)
-            WHERE elementId(c) = $elementId
-            MATCH (c)-[:MENTIONS]->(mentioned)
-            RETURN collect(mentioned) AS mentioned_nodes
-        """
-        try: 
-            result= session.run(base_query, elementId=chunk.chunk_id)
-            record = result.single()
-            mentioned_nodes = record["mentioned_nodes"] if record else []
-            for node in mentioned_nodes:
-                nodes.append(dict(node))
-        
-            logger.info(f"Retrieved {len(nodes)} entities for chunk {chunk.chunk_id}")
-            
-            return nodes
-        
-        except Exception as e:
-            logger.warning(f"No mentioned entities retrieved with exception: {e}")
-            return []
+        keys = [{"element_id": chunk.chunk_id} for chunk in chunks]
+    else:
+        keys = [{"chunk_id": chunk.chunk_id, "filename": chunk.filename} for chunk in chunks]
     
-    else: 
-        base_query = """ 
-            MATCH (c:Chunk)
-            WHERE c.chunk_id = $chunk_id AND c.filename = $filename
-            MATCH (c)-[:MENTIONS]->(mentioned)
-            RETURN collect(mentioned) AS mentioned_nodes
-        """
-        try: 
-            result= session.run(base_query, chunk_id=chunk.chunk_id, filename=chunk.filename)
-            record = result.single()
-            mentioned_nodes = record["mentioned_nodes"] if record else []
-            for node in mentioned_nodes:
-                nodes.append(dict(node))
+    try:
+        if isinstance(session, InMemorySession):
+            result = session.expand_mentioned_entities(
+                keys, 
+                n_hops=max(n_hops, 1), 
+                max_per_hop=max_per_hop, 
+                relationship_types=relationship_types, 
+                min_pagerank=min_pagerank,
+                use_elementId=use_elementId
+            )
+        else:
+            result = session.run(
+                _build_expansion_query(max(n_hops, 1), use_elementId), 
+                chunks=keys, 
+                max_per_hop=max_per_hop, 
+                relationship_types=relationship_types, 
+                min_pagerank=min_pagerank
+            )
         
-            logger.info(f"Retrieved {len(nodes)} entities for chunk {chunk.chunk_id}")
+        entities = {}
+        for record in result:
+            key = record["key"]
+            chunk_key = key["element_id"] if use_elementId else (key["filename"], key["chunk_id"])
+            entities[chunk_key] = record["entities"]
             
-            return nodes
+        logger.info(f"Retrieved {sum(len(e) for e in entities.values())} entities for {len(chunks)} chunks within {n_hops} hops")
         
-        except Exception as e:
-            logger.warning(f"No mentioned entities retrieved with exception: {e}")
-            return []
+        return entities
+    
+    except Exception as e:
+        logger.warning(f"No mentioned entities retrieved with exception: {e}")
+        return {}
+
+
+def get_mentioned_entities(
+    session: Session, 
+    chunk: Chunk,
+    n_hops: int=1, 
+    use_elementId: bool = False
+    ) -> List[Dict[str, Any]]:
+    """ 
+    Follows the `MENTIONS` relationships of a given Chunk in the Graph and collects mentioned entities. 
+    `n_hops` is used to indicate the number of relationship layers that could be done following entities linking.  
+    See `expand_mentioned_entities` to expand a batch of chunks at once.
+    """
+    entities = expand_mentioned_entities(
+        session, 
+        [chunk], 
+        n_hops=n_hops, 
+        use_elementId=use_elementId
+    )
+    
+    return next(iter(entities.values()), [])
         
         
 def filter_graph_by_communities(session: Session, community_ids: List[int], community_type: str="leiden") -> List[Dict[str, Any]]:
@@ -179,7 +267,10 @@ def filter_graph_by_communities(session: Session, community_ids: List[int], comm
     }
     
     try:
-        result = session.run(query, community_values=community_ids)
+        if isinstance(session, InMemorySession):
+            result = session.community_triples(community_ids, community_type)
+        else:
+            result = session.run(query, community_values=community_ids)
         
         subgraph = []
     
@@ -0,0 +1,218 @@
+import sys
+import time
+import neo4j
+from typing import Any, List
+
+from src.utils.metrics import counter, histogram, metrics_enabled
+from src.utils.tracing import start_span, tracing_enabled
+
+
+_SKIPPED_MODULES = (__name__, "src.utils.tracing")
+
+
+def _query_name() -> str:
+    """ 
+    Name of a query for metrics: the qualified name of the function of this package that sent it 
+    (i.e. `KnowledgeGraph.create_mentions_relationships`), directly or through a library (i.e. `Neo4jVector`).
+    """
+    frame = sys._getframe(2)
+    while frame is not None:
+        module = frame.f_globals.get("__name__", "")
+        if module.startswith("src.") and module not in _SKIPPED_MODULES:
+            return frame.f_code.co_qualname
+        frame = frame.f_back
+    return "unknown"
+
+
+class _QueryCall:
+    """ Span and metrics of a query, recorded when the query ends (see `finish`). """
+
+    def __init__(self, query: Any):
+        self.name = _query_name()
+        self.start = time.perf_counter()
+        self.span = start_span(
+            "neo4j.query",
+            kind="CLIENT",
+            **{
+                "db.system.name": "neo4j", 
+                "db.operation.name": self.name, 
+                "db.query.text": " ".join(str(getattr(query, "text", query)).split())
+            }
+        )
+
+    def finish(self, rows: int = 0, error: BaseException | None = None):
+        if error is not None:
+            self.span.record_exception(error)
+        else:
+            self.span.set_attribute("db.response.returned_rows", rows)
+        self.span.end()
+        if metrics_enabled():
+            histogram("neo4j_query_duration_seconds", "Latency of Neo4j queries, results fetching included", query=self.name).observe(
+                time.perf_counter() - self.start
+            )
+            if error is not None:
+                counter("neo4j_query_errors_total", "Failed Neo4j queries", query=self.name).inc()
+
+
+class _InstrumentedResult:
+    """
+    Result of a query, ending the span of the query once its records are consumed.
+    Records are streamed by the driver, so the span covers both running the query and fetching its rows.
+    """
+
+    def __init__(self, result, call: _QueryCall):
+        self._result = result
+        self._call = call
+        self._rows = 0
+
+    def finish(self):
+        if self._call is not None:
+            self._call.finish(self._rows)
+            self._call = None
+
+    def __iter__(self):
+        for record in self._result:
+            self._rows += 1
+            yield record
+        self.finish()
+
+    def single(self, *args, **kwargs):
+        record = self._result.single(*args, **kwargs)
+        self._rows += record is not None
+        self.finish()
+        return record
+
+    def value(self, *args, **kwargs):
+        values = self._result.value(*args, **kwargs)
+        self._rows += len(values)
+        self.finish()
+        return values
+
+    def values(self, *args, **kwargs):
+        values = self._result.values(*args, **kwargs)
+        self._rows += len(values)
+        self.finish()
+        return values
+
+    def data(self, *args, **kwargs):
+        data = self._result.data(*args, **kwargs)
+        self._rows += len(data)
+        self.finish()
+        return data
+
+    def consume(self):
+        summary = self._result.consume()
+        self.finish()
+        return summary
+
+    def __getattr__(self, name):
+        return getattr(self._result, name)
+
+
+class _InstrumentedRunner:
+    """ Wraps a session or a transaction, recording a span and metrics for each query it runs. """
+
+    def __init__(self, runner):
+        self._runner = runner
+        self._results: List[_InstrumentedResult] = []
+
+    def run(self, query, *args, **kwargs) -> _InstrumentedResult:
+        call = _QueryCall(query)
+        try:
+            result = _InstrumentedResult(self._runner.run(query, *args, **kwargs), call)
+        except Exception as e:
+            call.finish(error=e)
+            raise
+        self._results.append(result)
+        return result
+
+    def finish(self):
+        """ Ends the spans of results that were never consumed, as their records are discarded by now. """
+        for result in self._results:
+            result.finish()
+        self._results = []
+
+    def __getattr__(self, name):
+        return getattr(self._runner, name)
+
+
+class _InstrumentedSession(_InstrumentedRunner):
+
+    def __enter__(self):
+        self._runner.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        try:
+            return self._runner.__exit__(*exc)
+        finally:
+            self.finish()
+
+    def close(self):
+        try:
+            self._runner.close()
+        finally:
+            self.finish()
+
+    def _instrumented_work(self, fn):
+        def work(tx, *args, **kwargs):
+            instrumented_tx = _InstrumentedRunner(tx)
+            try:
+                return fn(instrumented_tx, *args, **kwargs)
+            finally:
+                instrumented_tx.finish()
+        return work
+
+    def execute_read(self, fn, *args, **kwargs):
+        return self._runner.execute_read(self._instrumented_work(fn), *args, **kwargs)
+
+    def execute_write(self, fn, *args, **kwargs):
+        return self._runner.execute_write(self._instrumented_work(fn), *args, **kwargs)
+
+
+class InstrumentedDriver(neo4j.Driver):
+    """
+    Wraps a Neo4j driver, recording for each Cypher query a span, with its text and the number of rows returned, 
+    and its latency in the metrics, by query name (see `_query_name`).
+    It is a `neo4j.Driver` only to pass the type checks of `neo4j_graphrag`: every call goes to the wrapped driver.
+    """
+
+    def __init__(self, driver):
+        self._driver = driver
+
+    def __del__(self):
+        pass
+
+    def session(self, **kwargs) -> _InstrumentedSession:
+        return _InstrumentedSession(self._driver.session(**kwargs))
+
+    def execute_query(self, query, *args, **kwargs):
+        call = _QueryCall(query)
+        try:
+            result = self._driver.execute_query(query, *args, **kwargs)
+        except Exception as e:
+            call.finish(error=e)
+            raise
+        call.finish(len(result.records))
+        return result
+
+    def verify_connectivity(self, **kwargs):
+        return self._driver.verify_connectivity(**kwargs)
+
+    def verify_authentication(self, *args, **kwargs) -> bool:
+        return self._driver.verify_authentication(*args, **kwargs)
+
+    def close(self):
+        self._driver.close()
+
+    def __getattr__(self, name):
+        if name == "_driver":
+            raise AttributeError(name)
+        return getattr(self._driver, name)
+
+
+def instrument_driver(driver):
+    """ Wraps `driver` in an `InstrumentedDriver` if tracing or metrics are enabled (and it is not wrapped yet). """
+    if driver is None or not (tracing_enabled() or metrics_enabled()) or isinstance(driver, InstrumentedDriver):
+        return driver
+    return InstrumentedDriver(driver)
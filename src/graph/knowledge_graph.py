@@ -1,30 +1,55 @@
+import os
+import re
+import threading
+import time
 import networkx as nx
 
 from langchain_core.documents import Document
 from langchain_core.embeddings import Embeddings
-from langchain_neo4j.graphs.graph_document import GraphDocument
+from langchain_core.vectorstores import VectorStore
+from langchain_neo4j.graphs.graph_document import Node
 from langchain_neo4j.graphs.neo4j_graph import Neo4jGraph
 from langchain_neo4j.vectorstores.neo4j_vector import Neo4jVector
 from neo4j import ManagedTransaction
-from typing import List, Optional
+from neo4j_graphrag.filters import get_metadata_filter
+from typing import Any, Dict, List, Optional, Tuple
 
+from src.cache.schema_cache import SchemaSnapshot, load_schema_snapshot, save_schema_snapshot
 from src.config import KnowledgeGraphConfig
-from src.graph.graph_model import Community, CommunityReport
+from src.graph.graph_model import Community, CommunityReport, GraphRows, chunk_graph_rows
 from src.graph.graph_ds import (
     build_update_query,
+    community_level_type,
     compute_centralities, 
+    detect_hierarchical_leiden_communities,
     detect_leiden_communities, 
     detect_louvain_communities, 
     update_modularity
 )
+from src.graph.instrumented_driver import instrument_driver
+from src.index.local_store import LocalVectorStore
 from src.schema import Chunk, ProcessedDocument
 from src.utils.logger import get_logger
+from src.utils.metrics import ingestion_queue
+from src.utils.tracing import current_span, traced
 
 
 logger = get_logger(__name__)
 
 BASE_ENTITY_LABEL = "__Entity__"
 
+_LUCENE_SPECIAL_CHARS = re.compile(r'([+\-&|!(){}\[\]^"~*?:\\/])')
+_LUCENE_OPERATORS = re.compile(r"\b(AND|OR|NOT)\b")
+
+
+def escape_lucene(text: str) -> str:
+    """ 
+    Escapes Lucene special characters, so that identifiers (i.e. `art. 12-bis`, `CODE:42`) are searched verbatim. 
+    Boolean operators (`AND`, `OR`, `NOT`, operators only in upper case) are lowercased, so that they are searched as words. 
+    """
+    text = _LUCENE_OPERATORS.sub(lambda match: match.group(1).lower(), text)
+    return _LUCENE_SPECIAL_CHARS.sub(r"\\\1", text)
+
 
 class KnowledgeGraph(Neo4jGraph):
     """
@@ -33,6 +58,14 @@ class KnowledgeGraph(Neo4jGraph):
         
         If an `Ontology` is provided (see `KnowledgeGraphConfig.ontology`), will not allow for nodes and relationships
         to be created outside of the given sets of allowed labels and relationships.
+        
+        If a `schema_cache_path` is provided (see `KnowledgeGraphConfig.schema_cache_path`), the schema is loaded 
+        from a persisted snapshot instead of introspecting the database at startup; the snapshot is refreshed 
+        in the background when it is older than the graph, and after every ingestion.
+        
+        If a `local_index` is provided (see `KnowledgeGraphConfig.local_index`), Chunk and CommunityReport embeddings 
+        are mirrored in in-process ANN indexes, kept up to date by the write path: similarity search is then served 
+        locally (see `chunk_store` and `report_store`) and Neo4j only serves graph lookups.
     """
 
     def __init__(
@@ -52,6 +85,9 @@ class KnowledgeGraph(Neo4jGraph):
         self.database = conf.database
         self.timeout = conf.timeout
         self.index_name = conf.index_name
+        self.fulltext_index_name = conf.fulltext_index_name
+        self.leiden_max_levels = conf.leiden_max_levels
+        self.leiden_max_community_size = conf.leiden_max_community_size
 
         if conf.ontology: # TODO 
             self.allowed_labels = conf.ontology.allowed_labels
@@ -60,6 +96,7 @@ class KnowledgeGraph(Neo4jGraph):
         self.embeddings = embeddings_model
 
         self._labels_ = None 
+        self._labels = None
         self._number_of_entities_ = None
         self._number_of_labels_ = None
         self._number_of_relationships_ = None
@@ -69,6 +106,12 @@ class KnowledgeGraph(Neo4jGraph):
         self._number_of_leiden_communities = None
         self._louvain_modularity = None
         self._number_of_louvain_communities = None
+        
+        self._entity_constraint = False
+        self.schema_cache_path = conf.schema_cache_path
+        self._schema_stale = False
+        self._schema_refresh_lock = threading.Lock()
+        self._schema_refresh_thread: Optional[threading.Thread] = None
 
         try: 
             self.vector_store = Neo4jVector(
@@ -100,6 +143,22 @@ class KnowledgeGraph(Neo4jGraph):
         except Exception as e:
             logger.warning(f"Error connecting to Neo4jVector: {e}")
 
+        self.local_chunks: Optional[LocalVectorStore] = None
+        self.local_reports: Optional[LocalVectorStore] = None
+        if conf.local_index is not None:
+            for name in ("chunks", "reports"):
+                store = LocalVectorStore(
+                    embedding=self.embeddings,
+                    path=os.path.join(conf.local_index.path, name) if conf.local_index.path else None,
+                    n_lists=conf.local_index.n_lists,
+                    n_probe=conf.local_index.n_probe,
+                    min_train_size=conf.local_index.min_train_size,
+                    quantization=conf.local_index.quantization,
+                    rescore=conf.local_index.rescore,
+                    rescore_factor=conf.local_index.rescore_factor
+                )
+                setattr(self, f"local_{name}", store)
+
         super().__init__(
             url=self.url, 
             username=self.username,
@@ -107,16 +166,228 @@ class KnowledgeGraph(Neo4jGraph):
             database=self.database,
             timeout=self.timeout,
             sanitize=sanitize, 
-            refresh_schema=refresh_schema,
+            refresh_schema=refresh_schema and self.schema_cache_path is None,
             enhanced_schema=enhanced_schema
         )
         
+        self._driver = instrument_driver(self._driver)
+        for store in (getattr(self, "vector_store", None), getattr(self, "cr_store", None)):
+            if store is not None:
+                store._driver = instrument_driver(store._driver)
+        
+        if self.schema_cache_path is not None and refresh_schema:
+            self._load_schema()
+            
+        if conf.local_index is not None:
+            self.rebuild_local_index(only_empty=True)
+            
+            
+    @property
+    def chunk_store(self) -> VectorStore:
+        """ 
+        Vector store serving similarity search over Chunks: the local index if enabled, Neo4j otherwise.
+        """
+        return self.local_chunks if self.local_chunks is not None else self.vector_store
+    
+    
+    @property
+    def report_store(self) -> VectorStore:
+        """ 
+        Vector store serving similarity search over Community Reports: the local index if enabled, Neo4j otherwise.
+        """
+        return self.local_reports if self.local_reports is not None else self.cr_store
+    
+    
+    def _fetch_index_entries(self, label: str, text_property: str, embedding_property: str) -> List[Dict[str, Any]]:
+        return self.query(
+            f"""
+            MATCH (n:{label}) 
+            WHERE n.{embedding_property} IS NOT NULL
+            RETURN n.id AS id, n.{text_property} AS text, n.{embedding_property} AS embedding, 
+                n {{.*, {text_property}: Null, {embedding_property}: Null, id: Null}} AS metadata
+            """
+        )
+    
+    
+    def rebuild_local_index(self, only_empty: bool=False):
+        """ 
+        Rebuilds the local indexes out of the Chunk and CommunityReport nodes stored in Neo4j, 
+        i.e. when they are enabled on an already populated graph. With `only_empty=True`, 
+        indexes already loaded from disk are left untouched.
+        """
+        for store, label, text_property, embedding_property in (
+            (self.local_chunks, "Chunk", "text", "embedding"),
+            (self.local_reports, "CommunityReport", "summary", "summary_embeddings")
+        ):
+            if store is None or (only_empty and len(store)):
+                continue
+            try:
+                entries = self._fetch_index_entries(label, text_property, embedding_property)
+            except Exception as e:
+                logger.warning(f"Unable to fetch {label} nodes to rebuild the local index: {e}")
+                continue
+            if not entries:
+                continue
+            store.add_embeddings(
+                texts=[entry["text"] or "" for entry in entries],
+                embeddings=[entry["embedding"] for entry in entries],
+                metadatas=[{k: v for k, v in entry["metadata"].items() if v is not None} for entry in entries],
+                ids=[entry["id"] for entry in entries]
+            )
+            store.save()
+            logger.info(f"Rebuilt local index of {len(store)} {label} nodes")
+            
+            
+    def sync_local_index(self):
+        """ 
+        Copies the communities assigned to Chunk nodes into the metadata of the local index, 
+        so that community filters work as they do on Neo4j.
+        """
+        if self.local_chunks is None:
+            return
+        try:
+            records = self.query(
+                """
+                MATCH (c:Chunk) 
+                RETURN c.id AS id, [k IN keys(c) WHERE k STARTS WITH 'community_' | [k, c[k]]] AS communities
+                """
+            )
+        except Exception as e:
+            logger.warning(f"Unable to sync communities into the local index: {e}")
+            return
+        self.local_chunks.update_metadata(
+            {
+                record["id"]: {k: v for k, v in record["communities"] if v is not None} 
+                for record in records
+            }
+        )
+        self.local_chunks.save()
+        
+        
+    def save_local_index(self):
+        """ 
+        Persists the local indexes, if enabled.
+        """
+        for store in (self.local_chunks, self.local_reports):
+            if store is not None:
+                store.save()
+        
+
+    def _load_schema(self):
+        """ 
+        Loads the schema from the persisted snapshot. If there is no snapshot the schema is introspected now, 
+        if the snapshot is older than the graph it is used as is and refreshed in the background. 
+        """
+        snapshot = load_schema_snapshot(self.schema_cache_path)
+        
+        if snapshot is None:
+            self.refresh_schema()
+            return
+        
+        self.structured_schema = snapshot.structured_schema
+        self.schema = snapshot.formatted_schema
+        self._labels = snapshot.labels
+        self._relationships_ = snapshot.relationships
+        
+        if snapshot.graph_version != self.graph_version:
+            logger.info(f"Schema snapshot is older than the graph (version {snapshot.graph_version}), refreshing it in the background")
+            self.refresh_schema_in_background()
+            
+
+    def refresh_schema(self) -> None:
+        """ 
+        Refreshes the schema information from the database and, if a `schema_cache_path` is set, 
+        persists it as a snapshot stamped with the current graph version. 
+        """
+        version = self.graph_version if self.schema_cache_path is not None else None
+        
+        super().refresh_schema()
+        
+        self._schema_stale = False
+        
+        if self.schema_cache_path is not None:
+            self._labels = self._fetch_labels()
+            self._relationships_ = self._fetch_relationships()
+            save_schema_snapshot(
+                SchemaSnapshot(
+                    graph_version=version,
+                    structured_schema=self.structured_schema,
+                    formatted_schema=self.schema,
+                    labels=self._labels,
+                    relationships=self._relationships_,
+                    created_at=time.time()
+                ),
+                self.schema_cache_path
+            )
+            
+            
+    def _refresh_schema_worker(self):
+        try:
+            self.refresh_schema()
+        except Exception as e:
+            logger.warning(f"Background schema refresh failed: {e}")
+            
+            
+    def refresh_schema_in_background(self) -> threading.Thread:
+        """ 
+        Refreshes the schema in a background thread, unless a refresh is already running. 
+        Until it completes, the previous schema keeps being served. 
+        """
+        with self._schema_refresh_lock:
+            if self._schema_refresh_thread is None or not self._schema_refresh_thread.is_alive():
+                self._schema_refresh_thread = threading.Thread(
+                    target=self._refresh_schema_worker, 
+                    name="schema-refresh",
+                    daemon=True
+                )
+                self._schema_refresh_thread.start()
+            return self._schema_refresh_thread
+        
+        
+    def mark_schema_stale(self):
+        """ 
+        Flags the cached schema as outdated: it will be refreshed lazily, the next time it is read. 
+        """
+        self._schema_stale = True
+        
+        
+    @property
+    def get_schema(self) -> str:
+        """ Returns the (cached) schema of the Graph, scheduling a background refresh if it is stale. """
+        if self._schema_stale:
+            self.refresh_schema_in_background()
+        return self.schema
+    
+    
+    @property
+    def get_structured_schema(self) -> Dict[str, Any]:
+        """ Returns the (cached) structured schema of the Graph, scheduling a background refresh if it is stale. """
+        if self._schema_stale:
+            self.refresh_schema_in_background()
+        return self.structured_schema
+    
+    
+    def _fetch_labels(self) -> List[str]:
+        with self._driver.session(database=self._database) as session:
+            query = "CALL db.labels() YIELD label RETURN COLLECT(label) AS labels"
+            result = session.run(query)
+            return result.single()["labels"]
+        
+        
+    def _fetch_relationships(self) -> List[str]:
+        with self._driver.session(database=self._database) as session:
+            query = "CALL db.relationshipTypes() YIELD relationshipType RETURN COLLECT(relationshipType) AS relationship_types"
+            result = session.run(query)
+            return result.single()["relationship_types"]
+        
 
     @property
     def labels(self) -> List[str]:
         """
         Returns a list of labels in the Knowledge Graph.
         """
+        if self.schema_cache_path is not None and self._labels is not None:
+            return self._labels
         with self._driver.session(database=self._database) as session:
             query = "CALL db.labels() YIELD label RETURN COLLECT(label) AS labels"
             result = session.run(query)
@@ -129,6 +400,8 @@ class KnowledgeGraph(Neo4jGraph):
         """
         Returns a list of relationships in the Knowledge Graph.
         """
+        if self.schema_cache_path is not None and self._relationships_ is not None:
+            return self._relationships_
         with self._driver.session(database=self._database) as session:
             query = "CALL db.relationshipTypes() YIELD relationshipType RETURN COLLECT(relationshipType) AS relationship_types"
             result = session.run(query)
@@ -208,6 +481,55 @@ class KnowledgeGraph(Neo4jGraph):
             except Exception as e:
                 logger.warning("Louvain Modularity has not been computed")
                 
+                
+    @property
+    def leiden_levels(self) -> int:
+        """ 
+        Number of levels of the Leiden community hierarchy (`1` if communities were detected as a flat partition).
+        """
+        query = """MATCH (m:GraphMetric WHERE m.name = 'leiden_levels') RETURN m.value AS levels"""
+        with self._driver.session(database=self._database) as session:
+            try: 
+                record = session.run(query).single()
+                return record["levels"] if record else 1
+            except Exception as e:
+                logger.warning(f"Unable to read the number of Leiden levels: {e}")
+                return 1
+                
+                
+    @property
+    def graph_version(self) -> int:
+        """ 
+        Returns the version stamp of the Knowledge Graph, increased every time documents are ingested 
+        or communities are recomputed. Used to invalidate caches built on top of the graph.
+        """
+        query = """MATCH (m:GraphMetric WHERE m.name = 'graph_version') RETURN m.value AS version"""
+        with self._driver.session(database=self._database) as session:
+            try: 
+                record = session.run(query).single()
+                return record["version"] if record else 0
+            except Exception as e:
+                logger.warning(f"Unable to read graph version: {e}")
+                return 0
+                
+                
+    def bump_graph_version(self) -> int:
+        """ 
+        Increases the version stamp of the Knowledge Graph and returns the new version.
+        """
+        query = """
+            MERGE (m:GraphMetric {name: 'graph_version'}) 
+            SET m.value = coalesce(m.value, 0) + 1 
+            RETURN m.value AS version
+        """
+        with self._driver.session(database=self._database) as session:
+            try:
+                version = session.run(query).single()["version"]
+                logger.info(f"Knowledge Graph version bumped to {version}")
+                return version
+            except Exception as e:
+                logger.warning(f"Unable to bump graph version: {e}")
+                
     
     @property
     def number_of_louvain_communities(self) -> int:
@@ -244,7 +566,7 @@ class KnowledgeGraph(Neo4jGraph):
     @staticmethod
     def _create_document_node(tx: ManagedTransaction, doc: ProcessedDocument):
         query = """
-            CREATE (d:Document {
+            MERGE (d:Document {
                 filename: $filename,
                 document_version: $document_version
             })
@@ -318,6 +640,52 @@ class KnowledgeGraph(Neo4jGraph):
             logger.warning(f"Error creating MENTIONS relationships for {node_id}: {e}")
             
             
+    @staticmethod
+    def _write_graph(
+        tx: ManagedTransaction, 
+        rows: GraphRows,
+        chunk_id: int,
+        filename: str,
+        document_version: int
+        ):
+        """ 
+        Merges the nodes (as `__Entity__` nodes, by `id`) and relationships of `GraphRows` with an `UNWIND` query 
+        per label and per relationship type, then the MENTIONS relationships from their Chunk.
+        """
+        for label, node_rows in rows.nodes.items():
+            tx.run(
+                f"""
+                UNWIND $rows AS row
+                MERGE (n:{BASE_ENTITY_LABEL} {{id: row.id}})
+                SET n:`{label}`, n += row.properties
+                """,
+                rows=node_rows
+            )
+        for rel_type, rel_rows in rows.relationships.items():
+            tx.run(
+                f"""
+                UNWIND $rows AS row
+                MERGE (s:{BASE_ENTITY_LABEL} {{id: row.source}})
+                MERGE (t:{BASE_ENTITY_LABEL} {{id: row.target}})
+                MERGE (s)-[r:`{rel_type}`]->(t)
+                SET r += row.properties
+                """,
+                rows=rel_rows
+            )
+        tx.run(
+            f"""
+            MATCH (c:Chunk {{chunk_id: $chunk_id, filename: $filename, document_version: $document_version}})
+            UNWIND $entity_ids AS entity_id
+            MATCH (e:{BASE_ENTITY_LABEL} {{id: entity_id}})
+            MERGE (c)-[:MENTIONS]->(e)
+            """,
+            chunk_id=chunk_id, 
+            filename=filename, 
+            document_version=document_version, 
+            entity_ids=rows.entity_ids
+        )
+            
+            
     @staticmethod
     def _fetch_communities(tx: ManagedTransaction, comm_type: str="leiden"): 
         query = f""" 
@@ -348,13 +716,35 @@ class KnowledgeGraph(Neo4jGraph):
     
     
     @staticmethod
-    def _fetch_chunk(tx: ManagedTransaction, element_id: str):
-        query = f"""
+    def _fetch_chunks(tx: ManagedTransaction, element_ids: List[str]):
+        query = """
             MATCH (c:Chunk) 
-            WHERE elementId(c) = "{element_id}"
-            RETURN elementId(c) AS chunk_id, c.text AS text
+            WHERE elementId(c) IN $element_ids
+            OPTIONAL MATCH (c)-[:MENTIONS]->(e)
+            WITH c, collect(DISTINCT CASE WHEN e IS NULL THEN NULL ELSE {id: elementId(e), type: head(labels(e)), pagerank: e.pagerank} END) AS entities
+            RETURN elementId(c) AS chunk_id, c.text AS text, entities
         """
-        return list(tx.run(query))
+        return list(tx.run(query, element_ids=element_ids))
+    
+    
+    @staticmethod
+    def _merge_entities(tx: ManagedTransaction, merges: List[Dict[str, Any]]) -> int:
+        query = f"""
+            UNWIND $merges AS merge
+            MATCH (survivor:{BASE_ENTITY_LABEL}) WHERE elementId(survivor) = merge.survivor
+            MATCH (duplicate:{BASE_ENTITY_LABEL}) WHERE elementId(duplicate) IN merge.duplicates
+            WITH survivor, merge, collect(duplicate) AS duplicates
+            SET survivor.aliases = [
+                alias IN apoc.coll.toSet(coalesce(survivor.aliases, []) + merge.aliases) WHERE alias <> survivor.id
+            ]
+            WITH survivor, duplicates
+            CALL apoc.refactor.mergeNodes([survivor] + duplicates, {{properties: "discard", mergeRels: true}}) YIELD node
+            OPTIONAL MATCH (node)-[loop]->(node)
+            DELETE loop
+            RETURN count(DISTINCT node) AS merged
+        """
+        record = tx.run(query, merges=merges).single()
+        return record["merged"] if record else 0
         
 
     def index_exists(self) -> bool:
@@ -368,14 +758,69 @@ class KnowledgeGraph(Neo4jGraph):
     def create_index(self) -> bool:
         try:
             self.vector_store.create_new_index()
+            self.create_fulltext_index()
             return True
         except:
             return False
+        
+        
+    def create_fulltext_index(self):
+        """ 
+        Creates (if missing) the full-text index on the text of Chunks, used by hybrid retrieval.
+        """
+        try:
+            self.query(
+                f"CREATE FULLTEXT INDEX {self.fulltext_index_name} IF NOT EXISTS FOR (c:Chunk) ON EACH [c.text]"
+            )
+        except Exception as e:
+            logger.warning(f"Error creating full-text index for chunks: {e}")
+            
+            
+    def fulltext_search(
+        self, 
+        query: str, 
+        k: int = 4, 
+        filter: Optional[Dict[str, Any]] = None
+        ) -> List[Tuple[Document, float]]:
+        """ 
+        Lexical search over the text of Chunks with the full-text index, returning Documents shaped 
+        as the ones of the vector store with their BM25 score. `filter` has the same syntax as `Neo4jVector` filters.
+        """
+        filter_snippet, params = get_metadata_filter(filter, node_alias="node") if filter else ("", {})
+        
+        records = self.query(
+            f"""
+            CALL db.index.fulltext.queryNodes($index_name, $query, {{limit: $limit}}) 
+            YIELD node, score
+            {f"WHERE {filter_snippet}" if filter_snippet else ""}
+            RETURN node.text AS text, node {{.*, text: Null, embedding: Null, id: Null}} AS metadata, score
+            ORDER BY score DESC
+            LIMIT $k
+            """,
+            params={
+                "index_name": self.fulltext_index_name,
+                "query": escape_lucene(query),
+                # filtered out nodes count in the limit of the index
+                "limit": k if not filter else max(10 * k, 100),
+                "k": k,
+                **params
+            }
+        )
+        return [
+            (
+                Document(
+                    page_content=record["text"] or "", 
+                    metadata={key: value for key, value in record["metadata"].items() if value is not None}
+                ), 
+                record["score"]
+            ) 
+            for record in records
+        ]
     
 
     def create_document_node(self, doc: ProcessedDocument):
         """
-        Creates a Document node in the Knowledge Graph.
+        Creates (or matches, if already stored) a Document node in the Knowledge Graph.
         """
         with self._driver.session(database=self._database) as session:
             session.execute_write(
@@ -420,65 +865,151 @@ class KnowledgeGraph(Neo4jGraph):
                 document_version
             )
             logger.info(f"MENTIONS relationships created!")
+            
+            
+    def create_entity_constraint(self):
+        """ 
+        Creates (if missing) the uniqueness constraint on the `id` of entities, backing the MERGEs of `write_graph`. 
+        """
+        if self._entity_constraint:
+            return
+        try:
+            self.query(f"CREATE CONSTRAINT IF NOT EXISTS FOR (e:{BASE_ENTITY_LABEL}) REQUIRE e.id IS UNIQUE")
+            self._entity_constraint = True
+        except Exception as e:
+            logger.warning(f"Error creating the uniqueness constraint on entities: {e}")
 
 
-    def store_chunks_for_doc(self, doc: ProcessedDocument):
+    def write_graph(
+            self, 
+            rows: GraphRows,
+            chunk_id: int,
+            filename: str,
+            document_version: int
+        ):
+        """ 
+        Writes the graph extracted from a Chunk (see `chunk_graph_rows`) and its MENTIONS relationships in a single transaction. 
         """
-        Stores Chunk nodes for a `ProcessedDocument` into the Knowledge Graph and updates the
-        Knowledge Graph itself with the graphs extracted from each chunk, if any.
+        with self._driver.session(database=self._database) as session:
+            session.execute_write(
+                self._write_graph, 
+                rows,
+                chunk_id,
+                filename,
+                document_version
+            )
+
+
+    def get_entities(self) -> List[Dict[str, Any]]:
+        """ 
+        Returns the `element_id`, `id`, `type` (first label besides `__Entity__`), `aliases` and `degree` of every entity.
+        """
+        return self.query(
+            f"""
+            MATCH (e:{BASE_ENTITY_LABEL})
+            RETURN elementId(e) AS element_id, e.id AS id, 
+                [label IN labels(e) WHERE label <> '{BASE_ENTITY_LABEL}'][0] AS type,
+                coalesce(e.aliases, []) AS aliases, 
+                COUNT {{ (e)--() }} AS degree
+            """
+        )
+    
+    
+    def merge_entities(self, merges: List[Dict[str, Any]], batch_size: int = 100) -> int:
+        """ 
+        Merges duplicate entities into a surviving one, given as a list of `{"survivor": elementId, "duplicates": [elementId], "aliases": [str]}`: 
+        relationships of the duplicates are moved to the survivor (merging the ones of the same type between the same nodes), 
+        the survivor keeps its properties and labels and records the `aliases`. Merges are written in a transaction per batch. 
+        Returns the number of surviving entities.
+        """
+        merged = 0
+        with self._driver.session(database=self._database) as session:
+            for start in range(0, len(merges), batch_size):
+                batch = merges[start:start + batch_size]
+                try:
+                    merged += session.execute_write(self._merge_entities, batch)
+                except Exception as e:
+                    logger.warning(f"Error merging a batch of {len(batch)} duplicate entities: {e}")
+        logger.info(f"Merged duplicates into {merged} entities")
+        return merged
+
+
+    @staticmethod
+    def _chunk_metadata(doc: ProcessedDocument, chunk: Chunk) -> Dict[str, Any]:
+        """ 
+        Properties of the Chunk node of a `ProcessedDocument` besides its text and embedding.
+        """
+        # doc level metadata
+        if doc.metadata: 
+            metadata = doc.metadata
+        else: 
+            metadata = {}
+        metadata["filename"] = doc.filename
+        metadata["document_version"] = doc.document_version
+        # chunk level metadata
+        metadata["chunk_id"] = chunk.chunk_id
+        metadata["chunk_size"] = chunk.chunk_size
+        metadata["chunk_overlap"] = chunk.chunk_overlap
+        metadata["embeddings_model"] = chunk.embeddings_model
+        return metadata
+
+
+    @traced("ingestion.store_chunk")
+    def _store_chunk(self, doc: ProcessedDocument, chunk: Chunk):
         """
+        Stores a Chunk node of a `ProcessedDocument` with its embedding, and the graph extracted from it, if any.
+        """
+        rows = chunk_graph_rows(chunk)
+        current_span().set_attributes({
+            "filename": doc.filename, 
+            "chunk_id": chunk.chunk_id, 
+            "graph.nodes": rows.number_of_nodes if rows else 0, 
+            "graph.relationships": rows.number_of_relationships if rows else 0
+        })
         
-        for chunk in doc.chunks:
-            
-            # doc level metadata
-            if doc.metadata: 
-                metadata = doc.metadata
-            else: 
-                metadata = {}
-            metadata["filename"] = doc.filename
-            metadata["document_version"] = doc.document_version
-            # chunk level metadata
-            metadata["chunk_id"] = chunk.chunk_id
-            metadata["chunk_size"] = chunk.chunk_size
-            metadata["chunk_overlap"] = chunk.chunk_overlap
-            metadata["embeddings_model"] = chunk.embeddings_model
+        metadata = self._chunk_metadata(doc, chunk)
 
-            try:
-                self.vector_store.add_embeddings(
+        try:
+            ids = self.vector_store.add_embeddings(
+                texts=[chunk.text],
+                embeddings=chunk.embedding,
+                metadatas=[metadata]
+            )
+            if self.local_chunks is not None:
+                self.local_chunks.add_embeddings(
                     texts=[chunk.text],
                     embeddings=chunk.embedding,
-                    metadatas=[metadata]
+                    metadatas=[dict(metadata)],
+                    ids=ids
                 )
-            except Exception as e:
-                logger.warning(f"Error storing chunk for document {doc.filename}: {e}")
-
-            # store chunk's graph
-            if chunk.nodes is not None :
+        except Exception as e:
+            current_span().record_exception(e)
+            logger.warning(f"Error storing chunk for document {doc.filename}: {e}")
 
-                graph_doc: GraphDocument = GraphDocument(
-                    nodes=chunk.nodes,
-                    relationships=chunk.relationships if chunk.relationships is not None else [],
-                    source=Document(
-                        page_content=chunk.text
-                    )
+        # store chunk's graph
+        if rows is not None:
+            try:
+                self.write_graph(
+                    rows=rows, 
+                    chunk_id=chunk.chunk_id, 
+                    filename=doc.filename, 
+                    document_version=doc.document_version
                 )
+            except Exception as e:
+                current_span().record_exception(e)
+                logger.warning(f"Error storing graph for chunk {chunk.chunk_id} in document {doc.filename}: {e}")
 
-                try:
-                    self.add_graph_documents(
-                        graph_documents=[graph_doc], 
-                        include_source=False,
-                        baseEntityLabel=True
-                    )
 
-                    for node in chunk.nodes:
-                        self.create_mentions_relationships(
-                            node_id=node.id, 
-                            chunk_id=chunk.chunk_id, 
-                            filename=doc.filename, 
-                            document_version=doc.document_version
-                        )
-                except Exception as e:
-                    logger.warning(f"Error storing graph for chunk {chunk.chunk_id} in document {doc.filename}: {e}")
+    @traced("ingestion.store_document")
+    def store_chunks_for_doc(self, doc: ProcessedDocument):
+        """
+        Stores Chunk nodes for a `ProcessedDocument` into the Knowledge Graph and updates the
+        Knowledge Graph itself with the graphs extracted from each chunk, if any.
+        """
+        current_span().set_attributes({"filename": doc.filename, "chunks": len(doc.chunks)})
+        
+        for chunk in doc.chunks:
+            self._store_chunk(doc, chunk)
 
         try:
             self.create_next_relationships(
@@ -499,9 +1030,22 @@ class KnowledgeGraph(Neo4jGraph):
             logger.warning(f"Error creating Index for chunks: {e}")
 
 
+    @traced("ingestion.store")
     def add_documents(self, docs: List[ProcessedDocument]): 
-        for doc in docs:
+        current_span().set_attribute("documents", len(docs))
+        if docs:
+            self.create_entity_constraint()
+        for doc in ingestion_queue("store", docs):
             self.store_chunks_for_doc(doc)
+            
+        if docs:
+            self.create_fulltext_index()
+            self.save_local_index()
+            self.bump_graph_version()
+            
+            if self.schema_cache_path is not None:
+                self.mark_schema_stale()
+                self.refresh_schema_in_background()
 
 
     def get_digraph(self) -> nx.DiGraph:
@@ -510,7 +1054,8 @@ class KnowledgeGraph(Neo4jGraph):
         """
         query_nodes = """
             MATCH (n)  
-            RETURN elementId(n) AS node_id, labels(n) AS labels, properties(n) AS properties;
+            RETURN elementId(n) AS node_id, labels(n) AS labels, 
+                [key IN keys(n) WHERE NOT key IN $excluded_properties | [key, n[key]]] AS properties;
         """
 
         query_rels = """
@@ -522,9 +1067,10 @@ class KnowledgeGraph(Neo4jGraph):
         
         with self._driver.session() as session:
             
-            nodes = session.run(query_nodes)
+            # embeddings are left in the database, they are not needed for graph algorithms
+            nodes = session.run(query_nodes, excluded_properties=["embedding", "summary_embeddings"])
             for record in nodes:
-                G.add_node(record["node_id"], labels=record["labels"], **record["properties"])
+                G.add_node(record["node_id"], labels=record["labels"], **dict(record["properties"]))
 
             relationships = session.run(query_rels)
             for record in relationships:
@@ -543,8 +1089,12 @@ class KnowledgeGraph(Neo4jGraph):
         louvain_communities: bool=False, 
         leiden_modularity: Optional[float] = None,
         louvain_modularity: Optional[float] = None, 
+        leiden_levels: Optional[int] = None
         ):
-        """Update Neo4j nodes with Leiden/Louvain communities and centrality scores"""
+        """
+        Update Neo4j nodes with Leiden/Louvain communities and centrality scores.  
+        With `leiden_levels`, finer levels of the Leiden hierarchy (`community_leiden_1`, ...) are updated as well.
+        """
         with self._driver.session() as session:
             
             if any([centralities, leiden_communities, louvain_communities]) == True: 
@@ -558,6 +1108,10 @@ class KnowledgeGraph(Neo4jGraph):
                         louvain_communities=louvain_communities,
                         community_leiden=int(data.get("community_leiden", -1)),
                         community_louvain=int(data.get("community_louvain", -1)),
+                        community_levels={
+                            f"community_{community_level_type('leiden', level)}": int(data.get(f"community_{community_level_type('leiden', level)}", -1))
+                            for level in range(1, leiden_levels or 1)
+                        } if leiden_communities else None,
                         pagerank=float(data.get("pagerank", 0.0)), 
                         betweenness=float(data.get("betweenness", 0.0)),
                         closeness=float(data.get("closeness", 0.0))
@@ -577,7 +1131,15 @@ class KnowledgeGraph(Neo4jGraph):
                 update_modularity(session, louvain_modularity, "louvain")
                 logger.info("Updated Louvain Modularity property in Graph")  
                 
+            if leiden_levels is not None:
+                session.run(
+                    """MERGE (m:GraphMetric {name: 'leiden_levels'}) SET m.value = $levels""", 
+                    levels=leiden_levels
+                )
+                logger.info(f"Updated number of Leiden levels ({leiden_levels}) in Graph")
+                
     
+    @traced("graph.update_centralities_and_communities")
     def update_centralities_and_communities(self):
         """ 
         Computes centralities measures and detects communities in nodes across the Knowledge Graph. 
@@ -587,6 +1149,7 @@ class KnowledgeGraph(Neo4jGraph):
         louvain_mod = None
         ld = False
         leiden_mod = None
+        leiden_levels = None
         centralities = False
 
         G = self.get_digraph()
@@ -598,7 +1161,16 @@ class KnowledgeGraph(Neo4jGraph):
             logger.warning(f"Something went wrong detecting Louvain Communities: {e}")
         
         try:
-            G, leiden_mod = detect_leiden_communities(G, return_modularity=True)
+            if self.leiden_max_levels > 1:
+                G, leiden_mod = detect_hierarchical_leiden_communities(
+                    G, 
+                    max_levels=self.leiden_max_levels, 
+                    max_community_size=self.leiden_max_community_size, 
+                    return_modularity=True
+                )
+            else:
+                G, leiden_mod = detect_leiden_communities(G, return_modularity=True)
+            leiden_levels = G.graph.get("leiden_levels", 1)
             ld = True
         except Exception as e:
             logger.warning(f"Something went wrong detecting Leiden Communities: {e}")
@@ -610,51 +1182,72 @@ class KnowledgeGraph(Neo4jGraph):
             logger.warning(f"Something went wrong computing Centralities degrees on graph: {e}")
         
         try:
-            self.update_properties(G, centralities, ld, lv, leiden_mod, louvain_mod)
+            self.update_properties(G, centralities, ld, lv, leiden_mod, louvain_mod, leiden_levels)
         except Exception as e:
             logger.warning(f"Something went wrong while updating properties on graph nodes: {e}")
+            
+        self.sync_local_index()
+            
+        self.bump_graph_version()
 
 
-    def get_communities(self, comm_type: str = "leiden") -> List[Community]:
+    def get_communities(self, comm_type: str = "leiden", level: int = 0) -> List[Community]:
         """ 
-        Fetches communities from the Knowledge Graph 
+        Fetches communities from the Knowledge Graph.  
+        With `level > 0`, communities of a finer level of the Leiden hierarchy are fetched 
+        (their `community_type` is suffixed with the level, i.e. `leiden_1`).
         """
         
-        if comm_type in ["leiden", "louvain"]:
+        if comm_type in ["leiden", "louvain"] and (level == 0 or comm_type == "leiden"):
             
             communities = []
+            level_type = community_level_type(comm_type, level)
+            results = []
             
             with self._driver.session() as session:
                 
                 try:
-                    results = session.execute_read(self._fetch_communities) 
+                    results = session.execute_read(self._fetch_communities, comm_type=level_type) 
                 except Exception as e:
+                    # raised, not returned as no communities: callers would take every stored report for stale
                     logger.warning(f"Issue fetching communities for type {comm_type}: {e}")
+                    raise
                     
                 for r in results: 
                     
                     if r['names'] not in [["leiden_modularity"], ["louvain_modularity"]]: # avoid GraphMetric
                         
                         comm = Community(
-                            community_type=comm_type, 
+                            community_type=level_type, 
                             community_id=r["community_id"], 
+                            level=level,
                             community_size=r["community_size"],
                             entity_ids=r["entity_ids"],
                             entity_names=r["names"],
                             relationship_ids=r["relationship_ids"],
-                            relationship_types=r["relationship_types"]
+                            relationship_types=r["relationship_types"],
+                            chunk_ids=r["chunk_ids"]
                         )
                         
-                        # add chunks to community
+                        # add chunks to community, with the entities they mention
                         comm.chunks = []
                         if len(r["chunk_ids"]) > 0:
-                            for id in r["chunk_ids"]:
-                                try: 
-                                    c_res = session.execute_read(self._fetch_chunk, element_id=id)
-                                    
-                                    comm.chunks.append(Chunk(chunk_id=c_res[0]["chunk_id"], text=c_res[0]["text"]))
-                                except Exception as e:
-                                    logger.warning(f"Issue fetching chunk with elementId {id}: {e}")
+                            try: 
+                                c_res = session.execute_read(self._fetch_chunks, element_ids=r["chunk_ids"])
+                                
+                                comm.chunks = [
+                                    Chunk(
+                                        chunk_id=c["chunk_id"], 
+                                        text=c["text"], 
+                                        nodes=[
+                                            Node(id=e["id"], type=e["type"] or "Node", properties={"pagerank": e["pagerank"] or 0.0})
+                                            for e in c["entities"]
+                                        ]
+                                    ) 
+                                    for c in c_res
+                                ]
+                            except Exception as e:
+                                logger.warning(f"Issue fetching chunks of community {level_type}: {r['community_id']}: {e}")
                         
                         communities.append(comm)
                 
@@ -664,29 +1257,166 @@ class KnowledgeGraph(Neo4jGraph):
             raise NotImplementedError("This Community type has not been implemented.")  
         
         
-    def store_community_reports(self, reports: List[CommunityReport]):
+    def store_community_reports(self, reports: List[CommunityReport]) -> List[str]:
         """ 
-        Stores Community Reports in the Graph, to make them available for GraphRAG strategies.
+        Stores Community Reports in the Graph, to make them available for GraphRAG strategies.  
+        Reports are written in a single batch, so it can be called with each batch of reports as they are generated.
+        Returns the ids of the stored reports (reports without embeddings are skipped), raises if they could not be stored.
         """
-        
-        for report in reports:
+        embedded_reports = [report for report in reports if report.summary_embeddings is not None]
+        if len(embedded_reports) < len(reports):
+            logger.warning(f"Skipping {len(reports) - len(embedded_reports)} Community Reports without embeddings")
             
-            metadatas = {
+        texts = [report.summary for report in embedded_reports]
+        embeddings = [report.summary_embeddings for report in embedded_reports]
+        metadatas = [
+            {
                 "community_type": report.communtiy_type,
                 "community_id": report.community_id,
-                "community_size": report.community_size
+                "community_level": report.community_level,
+                "community_size": report.community_size,
+                "fingerprint": report.fingerprint
             }
-            
+            for report in embedded_reports
+        ]
+        
+        ids = []
+        if embedded_reports:
             try:
-                self.cr_store.add_embeddings(
-                    texts=[report.summary],
-                    embeddings=[report.summary_embeddings],
-                    metadatas=[metadatas]
+                ids = self.cr_store.add_embeddings(
+                    texts=texts,
+                    embeddings=embeddings,
+                    metadatas=metadatas,
+                    ids=[report.report_id for report in embedded_reports]
                 )
+                if self.local_reports is not None:
+                    self.local_reports.add_embeddings(
+                        texts=texts,
+                        embeddings=embeddings,
+                        metadatas=metadatas,
+                        ids=ids
+                    )
             except Exception as e:
-                logger.warning(f"Error saving Community Report: {e}")
+                logger.warning(f"Error saving {len(embedded_reports)} Community Reports: {e}")
+                raise
+                
+        if self.local_reports is not None:
+            self.local_reports.save()
                 
         try:
             self.cr_store.create_new_index()
         except Exception as e:
-            logger.warning(f"Error creating Index for CommunityReports: {e}")       
\ No newline at end of file
+            logger.warning(f"Error creating Index for CommunityReports: {e}")
+        return ids
+
+
+    def get_community_reports(self, comm_type: str = "leiden", level: int = 0) -> List[CommunityReport]:
+        """ 
+        Fetches all the Community Reports of a level of the community hierarchy, largest communities first.
+        """
+        level_type = community_level_type(comm_type, level)
+        try:
+            records = self.query(
+                """
+                MATCH (r:CommunityReport) 
+                WHERE r.community_type = $community_type
+                RETURN r.community_id AS community_id, r.summary AS summary, r.community_size AS community_size
+                ORDER BY community_size DESC
+                """,
+                params={"community_type": level_type}
+            )
+        except Exception as e:
+            logger.warning(f"Unable to fetch Community Reports for {level_type}: {e}")
+            return []
+        
+        return [
+            CommunityReport(
+                communtiy_type=level_type,
+                community_id=record["community_id"],
+                community_level=level,
+                summary=record["summary"] or "",
+                community_size=record["community_size"],
+                rank=float(record["community_size"] or 0)
+            )
+            for record in records
+        ]
+    
+    
+    def count_community_reports(self, comm_type: str = "leiden") -> Dict[int, int]:
+        """ 
+        Number of Community Reports stored for each level of the community hierarchy of a given type.
+        """
+        counts = {}
+        for level in range(self.leiden_levels if comm_type == "leiden" else 1):
+            try:
+                records = self.query(
+                    """MATCH (r:CommunityReport) WHERE r.community_type = $community_type RETURN count(r) AS reports""",
+                    params={"community_type": community_level_type(comm_type, level)}
+                )
+                counts[level] = records[0]["reports"] if records else 0
+            except Exception as e:
+                logger.warning(f"Unable to count Community Reports for {comm_type} level {level}: {e}")
+        return counts
+
+    
+    
+    def get_report_fingerprints(self, comm_type: str = "leiden", level: int = 0) -> List[Dict[str, Any]]:
+        """ 
+        Returns the node `id`, `community_id` and `fingerprint` of the stored Community Reports of a level of the community hierarchy.
+        Raises if they could not be fetched, rather than returning no reports.
+        """
+        try:
+            return self.query(
+                """
+                MATCH (r:CommunityReport) 
+                WHERE r.community_type = $community_type
+                RETURN r.id AS id, r.community_id AS community_id, r.fingerprint AS fingerprint
+                """,
+                params={"community_type": community_level_type(comm_type, level)}
+            )
+        except Exception as e:
+            logger.warning(f"Unable to fetch Community Reports fingerprints: {e}")
+            raise
+        
+        
+    def relabel_community_reports(self, community_ids: Dict[str, int]):
+        """ 
+        Updates the `community_id` of stored Community Reports, given as a dictionary of report node id -> community id, 
+        i.e. when community detection assigned a new id to an unchanged community.
+        """
+        if not community_ids:
+            return
+        try:
+            self.query(
+                """
+                UNWIND $reports AS report
+                MATCH (r:CommunityReport {id: report.id}) 
+                SET r.community_id = report.community_id
+                """,
+                params={"reports": [{"id": id, "community_id": community_id} for id, community_id in community_ids.items()]}
+            )
+        except Exception as e:
+            logger.warning(f"Error relabeling {len(community_ids)} Community Reports: {e}")
+            return
+        if self.local_reports is not None:
+            self.local_reports.update_metadata({id: {"community_id": community_id} for id, community_id in community_ids.items()})
+            self.local_reports.save()
+            
+            
+    def delete_community_reports(self, ids: List[str]):
+        """ 
+        Deletes Community Reports given their node ids.
+        """
+        if not ids:
+            return
+        try:
+            self.query(
+                """MATCH (r:CommunityReport) WHERE r.id IN $ids DETACH DELETE r""",
+                params={"ids": ids}
+            )
+        except Exception as e:
+            logger.warning(f"Error deleting {len(ids)} Community Reports: {e}")
+            return
+        if self.local_reports is not None:
+            self.local_reports.delete(ids)
+            self.local_reports.save()
@@ -0,0 +1,1082 @@
+import json
+import math
+import os
+import re
+import threading
+import networkx as nx
+
+from array import array
+from collections import Counter
+from hashlib import md5
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_neo4j.graphs.graph_document import GraphDocument, Node
+from neo4j_graphrag.schema import format_schema
+
+from src.config import KnowledgeGraphConfig, LocalIndexConf
+from src.graph.graph_ds import community_level_type
+from src.graph.graph_model import Community, CommunityReport, GraphRows, chunk_graph_rows, lc_to_rows
+from src.graph.knowledge_graph import BASE_ENTITY_LABEL, KnowledgeGraph
+from src.index.ivf import match_filter
+from src.index.local_store import LocalVectorStore
+from src.schema import Chunk, ProcessedDocument
+from src.utils.logger import get_logger
+from src.utils.tracing import current_span, traced
+
+
+logger = get_logger(__name__)
+
+_TOKEN = re.compile(r"\w+")
+
+# BM25 parameters of the Lucene similarity used by Neo4j full-text indexes
+_BM25_K1 = 1.2
+_BM25_B = 0.75
+
+_NODE_PROPERTIES_EXCLUDED = ("text", "embedding", "id")
+
+
+def _tokenize(text: str) -> List[str]:
+    return _TOKEN.findall(text.lower())
+
+
+def _property_type(value: Any) -> str:
+    if isinstance(value, bool):
+        return "BOOLEAN"
+    if isinstance(value, int):
+        return "INTEGER"
+    if isinstance(value, float):
+        return "FLOAT"
+    if isinstance(value, (list, tuple)):
+        return "LIST"
+    return "STRING"
+
+
+class InMemorySession:
+    """
+    Session over an `InMemoryKnowledgeGraph`, standing in for a Neo4j `Session` in `graph_queries`:
+    each query used by the retrieval strategies has a method returning the records of its Cypher counterpart.
+    """
+
+    def __init__(self, graph: "InMemoryKnowledgeGraph"):
+        self.graph = graph
+
+    def __enter__(self) -> "InMemorySession":
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        pass
+
+    def run(self, query: str, parameters: Optional[Dict[str, Any]] = None, **kwargs):
+        raise NotImplementedError("Cypher is not supported by the in-memory backend")
+
+    def chunk_element_id(self, filename: str, chunk_id: int | str, text: str) -> str | None:
+        for node in self.graph._find_chunks(chunk_id, filename):
+            if self.graph._props[node].get("text") == text:
+                return str(node)
+        return None
+
+    def adjacent_chunks(
+        self,
+        chunk_id: int | str,
+        filename: Optional[str] = None,
+        use_elementId: bool = False
+        ) -> Dict[str, Optional[Dict[str, Any]]]:
+        """ Same record as the adjacent chunks query: the `previous_chunk`, `current` and `next_chunk` of a Chunk. """
+        graph = self.graph
+        if use_elementId:
+            nodes = [int(chunk_id)] if graph._is_node(chunk_id, "Chunk") else []
+        else:
+            nodes = graph._find_chunks(chunk_id, filename)
+        if not nodes:
+            return {"previous_chunk": None, "current": None, "next_chunk": None}
+
+        current = nodes[-1]
+        previous = next(iter(graph._neighbours(current, "in", ["NEXT"])), None)
+        following = next(iter(graph._neighbours(current, "out", ["NEXT"])), None)
+        return {
+            "previous_chunk": graph._chunk_projection(previous) if previous is not None else None,
+            "current": graph._chunk_projection(current),
+            "next_chunk": graph._chunk_projection(following) if following is not None else None
+        }
+
+    def expand_mentioned_entities(
+        self,
+        keys: List[Dict[str, Any]],
+        n_hops: int = 1,
+        max_per_hop: int = 10,
+        relationship_types: Optional[List[str]] = None,
+        min_pagerank: float = 0.0,
+        use_elementId: bool = False
+        ) -> List[Dict[str, Any]]:
+        """ Same records as the query of `_build_expansion_query`: the `key` of each Chunk and its `entities`. """
+        graph = self.graph
+        records = []
+        for key in keys:
+            if use_elementId:
+                nodes = [int(key["element_id"])] if graph._is_node(key["element_id"], "Chunk") else []
+            else:
+                nodes = graph._find_chunks(key["chunk_id"], key["filename"])
+
+            for node in nodes:
+                frontier = list(dict.fromkeys(graph._neighbours(node, "out", ["MENTIONS"])))
+                if not frontier:
+                    continue
+                seen = set(frontier)
+                entities = [graph._entity_projection(entity, 1) for entity in frontier]
+
+                for hop in range(2, n_hops + 1):
+                    candidates = {
+                        m for f in frontier for m in graph._neighbours(f, "both", relationship_types)
+                        if m not in seen
+                            and BASE_ENTITY_LABEL in graph._node_labels[m]
+                            and (graph._props[m].get("pagerank") or 0.0) >= min_pagerank
+                    }
+                    frontier = sorted(candidates, key=lambda m: graph._props[m].get("pagerank") or 0.0, reverse=True)[:max_per_hop]
+                    seen.update(frontier)
+                    entities.extend(graph._entity_projection(entity, hop) for entity in frontier)
+
+                records.append({"key": key, "entities": entities})
+        return records
+
+    def community_triples(self, community_ids: List[int], community_type: str = "leiden") -> List[Dict[str, Dict[str, Any]]]:
+        """ Same records as the community subgraph query: the `n`, `r` and `m` of the relationships starting in the communities. """
+        graph = self.graph
+        values = set(community_ids)
+        triples = []
+        for node, props in enumerate(graph._props):
+            if props.get(f"community_{community_type}") not in values or "Chunk" in graph._node_labels[node]:
+                continue
+            for rel in graph._out[node]:
+                target = graph._targets[rel]
+                if "Chunk" not in graph._node_labels[target]:
+                    triples.append({"n": props, "r": graph._rel_props[rel], "m": graph._props[target]})
+        return triples
+
+
+class _InMemoryDriver:
+    """ Stands in for the Neo4j driver of the `InMemoryKnowledgeGraph`, handing out `InMemorySession`s. """
+
+    def __init__(self, graph: "InMemoryKnowledgeGraph"):
+        self._graph = graph
+
+    def session(self, **kwargs) -> InMemorySession:
+        return InMemorySession(self._graph)
+
+    def verify_connectivity(self, **kwargs):
+        pass
+
+    def verify_authentication(self, **kwargs) -> bool:
+        return True
+
+    def close(self):
+        pass
+
+
+class InMemoryKnowledgeGraph(KnowledgeGraph):
+    """
+        Embedded `KnowledgeGraph`, held in process memory: no Neo4j instance is needed, i.e. for local
+        development, tests and small corpora. Supports ingestion (Chunk, Document and `__Entity__` nodes with
+        `NEXT`, `PART_OF` and `MENTIONS` relationships), vector and full-text search, communities, centralities
+        and Community Reports, so that every answer mode but Cypher generation works as on Neo4j.
+
+        Nodes are identified by their position (their elementId is its string), relationships by their position
+        in arrays of sources, targets and types, and each node keeps the arrays of its outgoing and incoming
+        relationships. Embeddings of Chunks and Community Reports are held by `LocalVectorStore`s (see `conf.local_index`).
+
+        If a `memory_path` is provided (see `KnowledgeGraphConfig.memory_path`), the graph and its indexes
+        are loaded from that directory at startup and persisted there after each write.
+    """
+
+    def __init__(
+            self,
+            conf: KnowledgeGraphConfig,
+            embeddings_model: Embeddings,
+            **kwargs
+        ):
+        self.index_name = conf.index_name
+        self.fulltext_index_name = conf.fulltext_index_name
+        self.leiden_max_levels = conf.leiden_max_levels
+        self.leiden_max_community_size = conf.leiden_max_community_size
+        self.memory_path = conf.memory_path
+
+        if conf.ontology: # TODO
+            self.allowed_labels = conf.ontology.allowed_labels
+            self.allowed_relationships = conf.ontology.allowed_relations
+
+        self.embeddings = embeddings_model
+
+        self.schema_cache_path = None
+        self._schema_stale = False
+        self._schema_refresh_lock = threading.Lock()
+        self._schema_refresh_thread: Optional[threading.Thread] = None
+        self._enhanced_schema = False
+        self._database = None
+        self._driver = _InMemoryDriver(self)
+        self._lock = threading.RLock()
+
+        index_conf = conf.local_index or LocalIndexConf()
+        for name in ("chunks", "reports"):
+            store = LocalVectorStore(
+                embedding=self.embeddings,
+                path=os.path.join(self.memory_path, name) if self.memory_path else None,
+                n_lists=index_conf.n_lists,
+                n_probe=index_conf.n_probe,
+                min_train_size=index_conf.min_train_size,
+                quantization=index_conf.quantization,
+                rescore=index_conf.rescore,
+                rescore_factor=index_conf.rescore_factor
+            )
+            setattr(self, f"local_{name}", store)
+        self.vector_store = self.local_chunks
+        self.cr_store = self.local_reports
+
+        self._reset()
+
+        # graph-wide metrics (`GraphMetric` nodes on Neo4j) and Community Reports, by id
+        self._metrics: Dict[str, Any] = {}
+        self._reports: Dict[str, Dict[str, Any]] = {}
+
+        if self.memory_path is not None:
+            self._load_state()
+
+        self.refresh_schema()
+
+
+    # ---------------------------------------------------------------- storage
+
+    def _reset(self):
+        """ Empties the nodes and relationships of the graph, with their lookups and indexes. """
+        # nodes
+        self._node_labels: List[List[str]] = []
+        self._props: List[Dict[str, Any]] = []
+        self._out: List[array] = []
+        self._in: List[array] = []
+        # relationships
+        self._sources = array("q")
+        self._targets = array("q")
+        self._type_codes = array("i")
+        self._types: List[str] = []
+        self._rel_props: List[Dict[str, Any]] = []
+        # lookups
+        self._type_index: Dict[str, int] = {}
+        self._rel_index: Dict[Tuple[int, int, int], int] = {}
+        self._by_label: Dict[str, Set[int]] = {}
+        self._entities: Dict[str, int] = {}
+        self._chunk_ids: Dict[str, int] = {}
+        self._doc_chunks: Dict[Tuple[str, int], Dict[Any, int]] = {}
+        self._documents: Dict[Tuple[str, int], int] = {}
+        # full-text index (BM25) over the text of Chunks
+        self._postings: Dict[str, Dict[int, int]] = {}
+        self._lengths: Dict[int, int] = {}
+
+
+    @property
+    def _state_path(self) -> str:
+        return os.path.join(self.memory_path, "graph.json")
+
+
+    def _load_state(self):
+        if not os.path.exists(self._state_path):
+            return
+        with open(self._state_path) as f:
+            state = json.load(f)
+        for node in state["nodes"]:
+            self._add_node(node["labels"], node["properties"])
+        for rel in state["relationships"]:
+            self._merge_relationship(rel["source"], rel["target"], rel["type"], rel["properties"])
+        self._metrics = state.get("metrics", {})
+        self._reports = state.get("reports", {})
+        logger.info(f"Loaded in-memory graph with {len(self._props)} nodes and {len(self._sources)} relationships from {self.memory_path}")
+
+
+    def _save_state(self):
+        if self.memory_path is None:
+            return
+        with self._lock:
+            state = {
+                "nodes": [{"labels": labels, "properties": props} for labels, props in zip(self._node_labels, self._props)],
+                "relationships": [
+                    {"source": source, "target": target, "type": self._types[code], "properties": props}
+                    for source, target, code, props in zip(self._sources, self._targets, self._type_codes, self._rel_props)
+                ],
+                "metrics": self._metrics,
+                "reports": self._reports
+            }
+            os.makedirs(self.memory_path, exist_ok=True)
+            tmp_path = f"{self._state_path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(state, f, default=str)
+            os.replace(tmp_path, self._state_path)
+
+
+    def _add_node(self, labels: Iterable[str], props: Dict[str, Any]) -> int:
+        node = len(self._props)
+        self._node_labels.append([])
+        self._props.append(dict(props))
+        self._out.append(array("q"))
+        self._in.append(array("q"))
+        self._add_labels(node, labels)
+        return node
+
+
+    def _add_labels(self, node: int, labels: Iterable[str]):
+        for label in labels:
+            if label not in self._node_labels[node]:
+                self._node_labels[node].append(label)
+                self._by_label.setdefault(label, set()).add(node)
+        self._index_node(node)
+
+
+    def _set_properties(self, node: int, props: Dict[str, Any]):
+        if "Chunk" in self._node_labels[node] and "text" in props:
+            self._unindex_text(node)
+        self._props[node].update(props)
+        self._index_node(node)
+
+
+    def _index_node(self, node: int):
+        """ Keeps the lookups of Entities, Chunks and Documents (and the full-text index) up to date with a node. """
+        labels, props = self._node_labels[node], self._props[node]
+        if BASE_ENTITY_LABEL in labels and "id" in props:
+            self._entities[props["id"]] = node
+        if "Chunk" in labels:
+            if "id" in props:
+                self._chunk_ids[props["id"]] = node
+            if "filename" in props:
+                doc_key = (props["filename"], props.get("document_version"))
+                self._doc_chunks.setdefault(doc_key, {})[props.get("chunk_id")] = node
+            if "text" in props and node not in self._lengths:
+                self._index_text(node, props["text"] or "")
+        if "Document" in labels:
+            self._documents[(props.get("filename"), props.get("document_version"))] = node
+
+
+    def _index_text(self, node: int, text: str):
+        tokens = _tokenize(text)
+        self._lengths[node] = len(tokens)
+        for token, frequency in Counter(tokens).items():
+            self._postings.setdefault(token, {})[node] = frequency
+
+
+    def _unindex_text(self, node: int):
+        if self._lengths.pop(node, None) is None:
+            return
+        for token in set(_tokenize(self._props[node].get("text") or "")):
+            self._postings.get(token, {}).pop(node, None)
+
+
+    def _merge_node(self, label: str, key: Dict[str, Any], lookup: Dict[Any, int], lookup_key: Any) -> int:
+        node = lookup.get(lookup_key)
+        if node is None:
+            node = self._add_node([label], key)
+        return node
+
+
+    def _merge_relationship(self, source: int, target: int, rel_type: str, props: Optional[Dict[str, Any]] = None) -> int:
+        code = self._type_index.get(rel_type)
+        if code is None:
+            code = self._type_index[rel_type] = len(self._types)
+            self._types.append(rel_type)
+        rel = self._rel_index.get((source, code, target))
+        if rel is None:
+            rel = len(self._sources)
+            self._sources.append(source)
+            self._targets.append(target)
+            self._type_codes.append(code)
+            self._rel_props.append({})
+            self._out[source].append(rel)
+            self._in[target].append(rel)
+            self._rel_index[(source, code, target)] = rel
+        if props:
+            self._rel_props[rel].update(props)
+        return rel
+
+
+    def _compact(self, redirect: Dict[int, int]):
+        """ 
+        Rebuilds the graph without the nodes in `redirect`, moving their relationships to the node they are redirected to 
+        (merged with the ones of the same type between the same nodes, self loops left by the move are dropped). 
+        Nodes get new positions, hence new elementIds.
+        """
+        labels, props, types = self._node_labels, self._props, self._types
+        rels = list(zip(self._sources, self._targets, self._type_codes, self._rel_props))
+        self._reset()
+
+        positions = {node: self._add_node(labels[node], props[node]) for node in range(len(props)) if node not in redirect}
+        for source, target, code, rel_props in rels:
+            new_source, new_target = positions[redirect.get(source, source)], positions[redirect.get(target, target)]
+            if new_source == new_target and source != target:
+                continue
+            self._merge_relationship(new_source, new_target, types[code], rel_props)
+
+
+    def _neighbours(self, node: int, direction: str = "out", types: Optional[List[str]] = None) -> Iterator[int]:
+        codes = None if types is None else {self._type_index[t] for t in types if t in self._type_index}
+        if direction in ("out", "both"):
+            for rel in self._out[node]:
+                if codes is None or self._type_codes[rel] in codes:
+                    yield self._targets[rel]
+        if direction in ("in", "both"):
+            for rel in self._in[node]:
+                if codes is None or self._type_codes[rel] in codes:
+                    yield self._sources[rel]
+
+
+    def _is_node(self, element_id: Any, label: str) -> bool:
+        try:
+            return label in self._node_labels[int(element_id)]
+        except (ValueError, IndexError):
+            return False
+
+
+    def _find_chunks(self, chunk_id: Any, filename: Optional[str]) -> List[int]:
+        """ Chunk nodes with a given `chunk_id` in a file, of every version of the file. """
+        return [
+            chunks[chunk_id]
+            for (name, _), chunks in sorted(self._doc_chunks.items(), key=lambda item: (item[0][0], item[0][1] or 0))
+            if name == filename and chunk_id in chunks
+        ]
+
+
+    def _head_label(self, node: int) -> Optional[str]:
+        return next((label for label in self._node_labels[node] if label != BASE_ENTITY_LABEL), None)
+
+
+    def _chunk_projection(self, node: int) -> Dict[str, Any]:
+        props = self._props[node]
+        return {"chunk_id": props.get("chunk_id"), "filename": props.get("filename"), "text": props.get("text")}
+
+
+    def _entity_projection(self, node: int, hop: int) -> Dict[str, Any]:
+        return {**self._props[node], "labels": list(self._node_labels[node]), "hop": hop}
+
+
+    # ---------------------------------------------------------------- write path
+
+    def add_graph_documents(
+            self,
+            graph_documents: List[GraphDocument],
+            include_source: bool = False,
+            baseEntityLabel: bool = False
+        ) -> None:
+        """
+        Merges the nodes (as `__Entity__` nodes, by `id`) and relationships of `GraphDocument`s into the graph.
+        """
+        with self._lock:
+            for document in graph_documents:
+                self._merge_rows(lc_to_rows(document.nodes, document.relationships))
+
+
+    def _merge_rows(self, rows: GraphRows) -> List[int]:
+        """ Merges the nodes and relationships of `GraphRows` into the graph, returns the entities of `rows.entity_ids`. """
+        for label, node_rows in rows.nodes.items():
+            for row in node_rows:
+                entity = self._merge_node(BASE_ENTITY_LABEL, {"id": row["id"]}, self._entities, row["id"])
+                self._add_labels(entity, [label])
+                self._set_properties(entity, row["properties"])
+        for rel_type, rel_rows in rows.relationships.items():
+            for row in rel_rows:
+                source = self._merge_node(BASE_ENTITY_LABEL, {"id": row["source"]}, self._entities, row["source"])
+                target = self._merge_node(BASE_ENTITY_LABEL, {"id": row["target"]}, self._entities, row["target"])
+                self._merge_relationship(source, target, rel_type, row["properties"])
+        return [self._entities[entity_id] for entity_id in rows.entity_ids]
+
+
+    def write_graph(
+            self,
+            rows: GraphRows,
+            chunk_id: int,
+            filename: str,
+            document_version: int
+        ):
+        """
+        Writes the graph extracted from a Chunk (see `chunk_graph_rows`) and its MENTIONS relationships.
+        """
+        with self._lock:
+            entities = self._merge_rows(rows)
+            chunk = self._doc_chunks.get((filename, document_version), {}).get(chunk_id)
+            if chunk is not None:
+                for entity in entities:
+                    self._merge_relationship(chunk, entity, "MENTIONS")
+
+
+    def create_document_node(self, doc: ProcessedDocument):
+        """
+        Creates a Document node in the Knowledge Graph, with the `PART_OF` relationships of its Chunks.
+        """
+        key = (doc.filename, doc.document_version)
+        with self._lock:
+            document = self._merge_node(
+                "Document",
+                {"filename": doc.filename, "document_version": doc.document_version},
+                self._documents,
+                key
+            )
+            for chunk in self._doc_chunks.get(key, {}).values():
+                self._merge_relationship(chunk, document, "PART_OF")
+        logger.info(f"Document node created for file: {doc.filename}")
+
+
+    def create_next_relationships(self, filename: str, doc_version: int):
+        """
+        Creates NEXT relationships between Chunk Nodes from a Document.
+        """
+        with self._lock:
+            chunks = self._doc_chunks.get((filename, doc_version), {})
+            for chunk_id, chunk in chunks.items():
+                if isinstance(chunk_id, int) and chunk_id + 1 in chunks:
+                    self._merge_relationship(chunk, chunks[chunk_id + 1], "NEXT")
+        logger.info(f"NEXT relationships created for Document {filename} version {doc_version}")
+
+
+    def create_mentions_relationships(
+            self,
+            node_id: str,
+            chunk_id: int,
+            filename: str,
+            document_version: int
+        ):
+        """ Creates MENTIONS relationships between Chunk and __Entity__ nodes. """
+        with self._lock:
+            chunk = self._doc_chunks.get((filename, document_version), {}).get(chunk_id)
+            entity = self._entities.get(node_id)
+            if chunk is not None and entity is not None:
+                self._merge_relationship(chunk, entity, "MENTIONS")
+
+
+    def get_entities(self) -> List[Dict[str, Any]]:
+        """
+        Returns the `element_id`, `id`, `type` (first label besides `__Entity__`), `aliases` and `degree` of every entity.
+        """
+        return [
+            {
+                "element_id": str(node),
+                "id": self._props[node].get("id"),
+                "type": self._head_label(node),
+                "aliases": self._props[node].get("aliases") or [],
+                "degree": len(self._out[node]) + len(self._in[node])
+            }
+            for node in sorted(self._by_label.get(BASE_ENTITY_LABEL, ()))
+        ]
+
+
+    def merge_entities(self, merges: List[Dict[str, Any]], batch_size: int = 100) -> int:
+        """
+        Merges duplicate entities into a surviving one, given as a list of `{"survivor": elementId, "duplicates": [elementId], "aliases": [str]}`:
+        relationships of the duplicates are moved to the survivor (merging the ones of the same type between the same nodes),
+        the survivor keeps its properties, gets the labels of the duplicates and records the `aliases`.
+        All merges are applied at once (`batch_size` is only used by Neo4j). Returns the number of surviving entities.
+        """
+        with self._lock:
+            redirect = {}
+            for merge in merges:
+                survivor = int(merge["survivor"])
+                for duplicate in map(int, merge["duplicates"]):
+                    redirect[duplicate] = survivor
+                    self._add_labels(survivor, self._node_labels[duplicate])
+                aliases = [*(self._props[survivor].get("aliases") or []), *merge["aliases"]]
+                self._props[survivor]["aliases"] = [alias for alias in dict.fromkeys(aliases) if alias != self._props[survivor].get("id")]
+            if redirect:
+                self._compact(redirect)
+        self._save_state()
+        logger.info(f"Merged duplicates into {len(merges)} entities")
+        return len(merges)
+
+
+    @traced("ingestion.store_chunk")
+    def _store_chunk(self, doc: ProcessedDocument, chunk: Chunk):
+        """
+        Stores a Chunk node of a `ProcessedDocument` with its embedding, and the graph extracted from it, if any.
+        """
+        rows = chunk_graph_rows(chunk)
+        current_span().set_attributes({
+            "filename": doc.filename,
+            "chunk_id": chunk.chunk_id,
+            "graph.nodes": rows.number_of_nodes if rows else 0,
+            "graph.relationships": rows.number_of_relationships if rows else 0
+        })
+
+        metadata = self._chunk_metadata(doc, chunk)
+        id = md5(chunk.text.encode("utf-8")).hexdigest()
+
+        with self._lock:
+            node = self._merge_node("Chunk", {"id": id}, self._chunk_ids, id)
+            self._set_properties(node, {**metadata, "text": chunk.text})
+
+        if chunk.embedding:
+            self.local_chunks.add_embeddings(
+                texts=[chunk.text],
+                embeddings=chunk.embedding,
+                metadatas=[dict(metadata)],
+                ids=[id]
+            )
+
+        if rows is not None:
+            self.write_graph(
+                rows=rows,
+                chunk_id=chunk.chunk_id,
+                filename=doc.filename,
+                document_version=doc.document_version
+            )
+
+
+    @traced("ingestion.store_document")
+    def store_chunks_for_doc(self, doc: ProcessedDocument):
+        """
+        Stores Chunk nodes for a `ProcessedDocument` into the Knowledge Graph and updates the
+        Knowledge Graph itself with the graphs extracted from each chunk, if any.
+        """
+        current_span().set_attributes({"filename": doc.filename, "chunks": len(doc.chunks)})
+
+        for chunk in doc.chunks:
+            self._store_chunk(doc, chunk)
+        self.create_next_relationships(filename=doc.filename, doc_version=doc.document_version)
+        self.create_document_node(doc=doc)
+
+
+    def add_documents(self, docs: List[ProcessedDocument]):
+        super().add_documents(docs)
+        if docs:
+            self.refresh_schema()
+
+
+    # ---------------------------------------------------------------- indexes
+
+    def index_exists(self) -> bool:
+        return len(self.local_chunks) > 0
+
+
+    def create_index(self) -> bool:
+        return True
+
+
+    def create_fulltext_index(self):
+        """
+        The full-text index of the in-memory graph is kept up to date by the write path.
+        """
+
+
+    def create_entity_constraint(self):
+        """
+        Entities of the in-memory graph are unique by `id` by construction.
+        """
+
+
+    def fulltext_search(
+        self,
+        query: str,
+        k: int = 4,
+        filter: Optional[Dict[str, Any]] = None
+        ) -> List[Tuple[Document, float]]:
+        """
+        Lexical search over the text of Chunks, scored with BM25 as Neo4j full-text indexes do.
+        `filter` has the same syntax as `Neo4jVector` filters.
+        """
+        if not self._lengths:
+            return []
+
+        n_docs = len(self._lengths)
+        avg_length = sum(self._lengths.values()) / n_docs
+        scores: Dict[int, float] = {}
+        for token in set(_tokenize(query)):
+            postings = self._postings.get(token)
+            if not postings:
+                continue
+            idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            for node, frequency in postings.items():
+                norm = _BM25_K1 * (1 - _BM25_B + _BM25_B * self._lengths[node] / avg_length)
+                scores[node] = scores.get(node, 0.0) + idf * frequency * (_BM25_K1 + 1) / (frequency + norm)
+
+        results = []
+        for node, score in sorted(scores.items(), key=lambda item: item[1], reverse=True):
+            metadata = {key: value for key, value in self._props[node].items() if key not in _NODE_PROPERTIES_EXCLUDED and value is not None}
+            if filter and not match_filter(metadata, filter):
+                continue
+            results.append((Document(page_content=self._props[node].get("text") or "", metadata=metadata), score))
+            if len(results) == k:
+                break
+        return results
+
+
+    def rebuild_local_index(self, only_empty: bool=False):
+        """
+        The local indexes are the only store of embeddings of the in-memory graph, there is nothing to rebuild them from.
+        """
+
+
+    def sync_local_index(self):
+        """
+        Copies the communities assigned to Chunk nodes into the metadata of the local index,
+        so that community filters work on vector search.
+        """
+        self.local_chunks.update_metadata(
+            {
+                self._props[node]["id"]: {k: v for k, v in self._props[node].items() if k.startswith("community_") and v is not None}
+                for node in self._by_label.get("Chunk", ()) if "id" in self._props[node]
+            }
+        )
+        self.save_local_index()
+
+
+    def save_local_index(self):
+        """
+        Persists the graph and its indexes, if a `memory_path` is set.
+        """
+        if self.memory_path is None:
+            return
+        self.local_chunks.save()
+        self.local_reports.save()
+        self._save_state()
+
+
+    # ---------------------------------------------------------------- schema & statistics
+
+    def query(self, query: str, params: dict = {}, session_params: dict = {}) -> List[Dict[str, Any]]:
+        raise NotImplementedError("Cypher is not supported by the in-memory backend")
+
+
+    def refresh_schema(self) -> None:
+        """
+        Refreshes the schema from the labels, properties and relationship types of the stored nodes.
+        """
+        with self._lock:
+            node_props: Dict[str, Dict[str, str]] = {}
+            rel_props: Dict[str, Dict[str, str]] = {}
+            patterns: Set[Tuple[str, str, str]] = set()
+            for labels, props in zip(self._node_labels, self._props):
+                for label in labels:
+                    if label == BASE_ENTITY_LABEL:
+                        continue
+                    types = node_props.setdefault(label, {})
+                    for key, value in props.items():
+                        if key != "embedding" and value is not None:
+                            types.setdefault(key, _property_type(value))
+            for source, target, code, props in zip(self._sources, self._targets, self._type_codes, self._rel_props):
+                types = rel_props.setdefault(self._types[code], {})
+                for key, value in props.items():
+                    if value is not None:
+                        types.setdefault(key, _property_type(value))
+                for start in self._node_labels[source]:
+                    for end in self._node_labels[target]:
+                        if BASE_ENTITY_LABEL not in (start, end):
+                            patterns.add((start, self._types[code], end))
+
+        self.structured_schema = {
+            "node_props": {label: [{"property": k, "type": t} for k, t in props.items()] for label, props in node_props.items()},
+            "rel_props": {rel: [{"property": k, "type": t} for k, t in props.items()] for rel, props in rel_props.items() if props},
+            "relationships": [{"start": start, "type": rel, "end": end} for start, rel, end in sorted(patterns)],
+            "metadata": {"constraint": [], "index": []}
+        }
+        self.schema = format_schema(self.structured_schema, self._enhanced_schema)
+        self._schema_stale = False
+
+
+    @property
+    def labels(self) -> List[str]:
+        """
+        Returns a list of labels in the Knowledge Graph.
+        """
+        labels = [label for label, nodes in self._by_label.items() if nodes]
+        return labels + ["CommunityReport"] if self._reports else labels
+
+
+    @property
+    def relationships(self) -> List[str]:
+        """
+        Returns a list of relationships in the Knowledge Graph.
+        """
+        return list(self._types)
+
+
+    @property
+    def number_of_nodes(self) -> int:
+        return len(self._props) + len(self._reports)
+
+
+    @property
+    def number_of_labels(self) -> int:
+        return len(self.labels)
+
+
+    @property
+    def number_of_relationships(self) -> int:
+        return len(self._sources)
+
+
+    @property
+    def number_of_docs(self) -> int:
+        return len(self._documents)
+
+
+    @property
+    def leiden_modularity(self) -> float:
+        return self._metrics.get("leiden_modularity")
+
+
+    @property
+    def louvain_modularity(self) -> float:
+        return self._metrics.get("louvain_modularity")
+
+
+    @property
+    def leiden_levels(self) -> int:
+        return self._metrics.get("leiden_levels", 1)
+
+
+    @property
+    def graph_version(self) -> int:
+        return self._metrics.get("graph_version", 0)
+
+
+    def bump_graph_version(self) -> int:
+        with self._lock:
+            self._metrics["graph_version"] = self.graph_version + 1
+        self._save_state()
+        logger.info(f"Knowledge Graph version bumped to {self.graph_version}")
+        return self.graph_version
+
+
+    def _count_communities(self, comm_type: str) -> int:
+        return len({props[f"community_{comm_type}"] for props in self._props if props.get(f"community_{comm_type}") is not None})
+
+
+    @property
+    def number_of_louvain_communities(self) -> int:
+        return self._count_communities("louvain")
+
+
+    @property
+    def number_of_leiden_communities(self) -> int:
+        return self._count_communities("leiden")
+
+
+    # ---------------------------------------------------------------- communities
+
+    def get_digraph(self) -> nx.DiGraph:
+        """
+        Returns the Knowledge Graph under its `networkx.DiGraph` representation.
+        """
+        G = nx.DiGraph()
+        with self._lock:
+            for node, (labels, props) in enumerate(zip(self._node_labels, self._props)):
+                G.add_node(str(node), labels=list(labels), **{k: v for k, v in props.items() if k != "embedding"})
+            for source, target, code, props in zip(self._sources, self._targets, self._type_codes, self._rel_props):
+                G.add_edge(str(source), str(target), type=self._types[code], **props)
+
+        logger.info(f"DiGraph with {len(G.nodes)} nodes and {len(G.edges)} relationships")
+        return G
+
+
+    def update_properties(
+        self,
+        G: Optional[nx.DiGraph] = None,
+        centralities: bool=False,
+        leiden_communities: bool=False,
+        louvain_communities: bool=False,
+        leiden_modularity: Optional[float] = None,
+        louvain_modularity: Optional[float] = None,
+        leiden_levels: Optional[int] = None
+        ):
+        """
+        Update nodes with Leiden/Louvain communities and centrality scores.
+        With `leiden_levels`, finer levels of the Leiden hierarchy (`community_leiden_1`, ...) are updated as well.
+        """
+        with self._lock:
+            if any([centralities, leiden_communities, louvain_communities]):
+                for node, data in G.nodes(data=True):
+                    props = {}
+                    if leiden_communities:
+                        props["community_leiden"] = int(data.get("community_leiden", -1))
+                        for level in range(1, leiden_levels or 1):
+                            level_property = f"community_{community_level_type('leiden', level)}"
+                            props[level_property] = int(data.get(level_property, -1))
+                    if louvain_communities:
+                        props["community_louvain"] = int(data.get("community_louvain", -1))
+                    if centralities:
+                        for centrality in ("pagerank", "betweenness", "closeness"):
+                            props[centrality] = float(data.get(centrality, 0.0))
+                    self._set_properties(int(node), props)
+                logger.info("Updated nodes properties in Graph")
+
+            if leiden_modularity is not None:
+                self._metrics["leiden_modularity"] = leiden_modularity
+            if louvain_modularity is not None:
+                self._metrics["louvain_modularity"] = louvain_modularity
+            if leiden_levels is not None:
+                self._metrics["leiden_levels"] = leiden_levels
+
+
+    def get_communities(self, comm_type: str = "leiden", level: int = 0) -> List[Community]:
+        """
+        Fetches communities from the Knowledge Graph.
+        With `level > 0`, communities of a finer level of the Leiden hierarchy are fetched
+        (their `community_type` is suffixed with the level, i.e. `leiden_1`).
+        """
+        if comm_type not in ["leiden", "louvain"] or (level > 0 and comm_type != "leiden"):
+            raise NotImplementedError("This Community type has not been implemented.")
+
+        level_type = community_level_type(comm_type, level)
+        key = f"community_{level_type}"
+        members: Dict[int, List[int]] = {}
+        chunks: Dict[int, List[int]] = {}
+        with self._lock:
+            for node, props in enumerate(self._props):
+                community_id = props.get(key)
+                if community_id is None:
+                    continue
+                if "Chunk" in self._node_labels[node]:
+                    chunks.setdefault(community_id, []).append(node)
+                # only nodes with relationships, as `MATCH (n)-[r]-(m)` does on Neo4j
+                if len(self._out[node]) or len(self._in[node]):
+                    members.setdefault(community_id, []).append(node)
+
+            communities = []
+            for community_id, nodes in members.items():
+                rels = list(dict.fromkeys(rel for node in nodes for rel in (*self._out[node], *self._in[node])))
+                community = Community(
+                    community_type=level_type,
+                    community_id=community_id,
+                    level=level,
+                    community_size=len(nodes),
+                    entity_ids=[str(node) for node in nodes],
+                    entity_names=list(dict.fromkeys(self._props[node]["name"] for node in nodes if self._props[node].get("name") is not None)),
+                    relationship_ids=[f"r{rel}" for rel in rels],
+                    relationship_types=list(dict.fromkeys(self._types[self._type_codes[rel]] for rel in rels)),
+                    chunk_ids=[str(chunk) for chunk in chunks.get(community_id, [])]
+                )
+                # add chunks to community, with the entities they mention
+                community.chunks = [
+                    Chunk(
+                        chunk_id=str(chunk),
+                        text=self._props[chunk].get("text") or "",
+                        nodes=[
+                            Node(id=str(entity), type=self._head_label(entity) or "Node", properties={"pagerank": self._props[entity].get("pagerank") or 0.0})
+                            for entity in dict.fromkeys(self._neighbours(chunk, "out", ["MENTIONS"]))
+                        ]
+                    )
+                    for chunk in chunks.get(community_id, [])
+                ]
+                communities.append(community)
+
+        return sorted(communities, key=lambda community: community.community_size, reverse=True)
+
+
+    def store_community_reports(self, reports: List[CommunityReport]) -> List[str]:
+        """
+        Stores Community Reports in the local index, to make them available for GraphRAG strategies.
+        Reports are written in a single batch, so it can be called with each batch of reports as they are generated.
+        Returns the ids of the stored reports (reports without embeddings are skipped).
+        """
+        embedded_reports = [report for report in reports if report.summary_embeddings is not None]
+        if len(embedded_reports) < len(reports):
+            logger.warning(f"Skipping {len(reports) - len(embedded_reports)} Community Reports without embeddings")
+        if not embedded_reports:
+            return []
+
+        metadatas = [
+            {
+                "community_type": report.communtiy_type,
+                "community_id": report.community_id,
+                "community_level": report.community_level,
+                "community_size": report.community_size,
+                "fingerprint": report.fingerprint
+            }
+            for report in embedded_reports
+        ]
+        ids = self.local_reports.add_embeddings(
+            texts=[report.summary for report in embedded_reports],
+            embeddings=[report.summary_embeddings for report in embedded_reports],
+            metadatas=metadatas,
+            ids=[report.report_id for report in embedded_reports]
+        )
+        with self._lock:
+            for id, report, metadata in zip(ids, embedded_reports, metadatas):
+                self._reports[id] = {**metadata, "summary": report.summary}
+        self.save_local_index()
+        return ids
+
+
+    def _reports_of(self, level_type: str) -> List[Tuple[str, Dict[str, Any]]]:
+        return [(id, report) for id, report in self._reports.items() if report["community_type"] == level_type]
+
+
+    def get_community_reports(self, comm_type: str = "leiden", level: int = 0) -> List[CommunityReport]:
+        """
+        Fetches all the Community Reports of a level of the community hierarchy, largest communities first.
+        """
+        level_type = community_level_type(comm_type, level)
+        reports = sorted(
+            (report for _, report in self._reports_of(level_type)),
+            key=lambda report: report["community_size"] or 0,
+            reverse=True
+        )
+        return [
+            CommunityReport(
+                communtiy_type=level_type,
+                community_id=report["community_id"],
+                community_level=level,
+                summary=report["summary"] or "",
+                community_size=report["community_size"],
+                rank=float(report["community_size"] or 0)
+            )
+            for report in reports
+        ]
+
+
+    def count_community_reports(self, comm_type: str = "leiden") -> Dict[int, int]:
+        """
+        Number of Community Reports stored for each level of the community hierarchy of a given type.
+        """
+        return {
+            level: len(self._reports_of(community_level_type(comm_type, level)))
+            for level in range(self.leiden_levels if comm_type == "leiden" else 1)
+        }
+
+
+    def get_report_fingerprints(self, comm_type: str = "leiden", level: int = 0) -> List[Dict[str, Any]]:
+        """
+        Returns the `id`, `community_id` and `fingerprint` of the stored Community Reports of a level of the community hierarchy.
+        """
+        return [
+            {"id": id, "community_id": report["community_id"], "fingerprint": report.get("fingerprint")}
+            for id, report in self._reports_of(community_level_type(comm_type, level))
+        ]
+
+
+    def relabel_community_reports(self, community_ids: Dict[str, int]):
+        """
+        Updates the `community_id` of stored Community Reports, given as a dictionary of report id -> community id,
+        i.e. when community detection assigned a new id to an unchanged community.
+        """
+        if not community_ids:
+            return
+        with self._lock:
+            for id, community_id in community_ids.items():
+                if id in self._reports:
+                    self._reports[id]["community_id"] = community_id
+        self.local_reports.update_metadata({id: {"community_id": community_id} for id, community_id in community_ids.items()})
+        self.save_local_index()
+
+
+    def delete_community_reports(self, ids: List[str]):
+        """
+        Deletes Community Reports given their ids.
+        """
+        if not ids:
+            return
+        with self._lock:
+            for id in ids:
+                self._reports.pop(id, None)
+        self.local_reports.delete(ids)
+        self.save_local_index()
+
+
+    def close(self) -> None:
+        """
+        Nothing to release: the graph is persisted after every write.
+        """
@@ -0,0 +1,426 @@
+import json
+import os
+import threading
+import numpy as np
+
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.config import QuantizationType
+from src.index.quantization import SCAN_BATCH_SIZE, QuantizedVectors
+from src.utils.logger import get_logger
+
+
+logger = get_logger(__name__)
+
+_OPERATORS = {
+    "$eq": lambda value, other: value == other,
+    "$ne": lambda value, other: value != other,
+    "$in": lambda value, other: value in other,
+    "$nin": lambda value, other: value not in other,
+    "$gt": lambda value, other: value is not None and value > other,
+    "$gte": lambda value, other: value is not None and value >= other,
+    "$lt": lambda value, other: value is not None and value < other,
+    "$lte": lambda value, other: value is not None and value <= other,
+}
+
+
+def match_filter(metadata: Dict[str, Any], filter: Dict[str, Any]) -> bool:
+    """
+    Evaluates a metadata filter with the same syntax as `Neo4jVector`:
+    `{"key": value}` for equality, `{"key": {"$op": value}}` for comparisons, `$and`/`$or` lists of filters.
+    """
+    for key, condition in filter.items():
+        if key == "$and":
+            if not all(match_filter(metadata, sub_filter) for sub_filter in condition):
+                return False
+        elif key == "$or":
+            if not any(match_filter(metadata, sub_filter) for sub_filter in condition):
+                return False
+        elif isinstance(condition, dict):
+            value = metadata.get(key)
+            for operator, other in condition.items():
+                if operator not in _OPERATORS:
+                    raise ValueError(f"Unsupported filter operator: {operator}")
+                if not _OPERATORS[operator](value, other):
+                    return False
+        elif metadata.get(key) != condition:
+            return False
+    return True
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _spherical_kmeans(vectors: np.ndarray, n_lists: int, n_iter: int = 10, seed: int = 0) -> np.ndarray:
+    """ K-means over unit vectors with cosine similarity, returns unit centroids. """
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), size=n_lists, replace=False)].copy()
+    for _ in range(n_iter):
+        assignments = np.argmax(vectors @ centroids.T, axis=1)
+        for i in range(n_lists):
+            members = vectors[assignments == i]
+            # empty lists are re-seeded with a random vector
+            centroids[i] = members.sum(axis=0) if len(members) else vectors[rng.integers(len(vectors))]
+        centroids = _normalize(centroids)
+    return centroids
+
+
+class IVFIndex:
+    """
+    Inverted file index over unit-normalized embeddings, kept in memory as NumPy arrays.
+
+    Vectors are partitioned into `n_lists` clusters (spherical k-means): a query is only compared with
+    the vectors of its `n_probe` closest clusters. Below `min_train_size` vectors (and for filtered searches,
+    which are usually selective) search is exact.
+    Vectors can be added one at a time: they are assigned to the closest existing cluster, and clusters
+    are re-trained when the index has doubled in size since the last training.
+
+    Each vector has a unique id (adding an existing id replaces it), a text and a metadata dictionary
+    used for filtering. Equality filters on scalar metadata are resolved with an inverted index.
+
+    Vectors can be stored quantized (`float16`, or `int8` with a scale per vector, see `QuantizedVectors`):
+    with `rescore=True`, the best `k * rescore_factor` candidates of the quantized scan are re-ranked
+    with full precision vectors.
+    """
+
+    def __init__(
+        self,
+        n_lists: Optional[int] = None,
+        n_probe: int = 8,
+        min_train_size: int = 1024,
+        quantization: Optional[QuantizationType] = None,
+        rescore: bool = False,
+        rescore_factor: int = 4
+    ):
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.min_train_size = min_train_size
+        self.quantization = quantization
+        self.rescore = rescore
+        self.rescore_factor = rescore_factor
+
+        self.dimensions: Optional[int] = None
+        self._storage: Optional[QuantizedVectors] = None
+        self._size = 0
+        self.ids: List[Optional[str]] = []
+        self.texts: List[str] = []
+        self.metadatas: List[Dict[str, Any]] = []
+        self._rows: Dict[str, int] = {}
+        self._inverted: Dict[str, Dict[Any, set]] = {}
+
+        self._centroids: Optional[np.ndarray] = None
+        self._assignments = np.zeros(0, dtype=np.int32)
+        self._trained_size = 0
+
+        self._lock = threading.RLock()
+
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+
+    @property
+    def nbytes(self) -> int:
+        """ Bytes of vectors held in memory. """
+        return self._storage.nbytes if self._storage is not None else 0
+
+
+    def _grow(self, rows: int):
+        """ Amortized growth of the vectors buffer. """
+        if self._size + rows <= len(self._storage):
+            return
+        capacity = max(self._size + rows, 2 * len(self._storage), 64)
+        self._storage.resize(capacity)
+        assignments = np.full(capacity, -1, dtype=np.int32)
+        assignments[: self._size] = self._assignments[: self._size]
+        self._assignments = assignments
+
+
+    def _index_metadata(self, row: int, metadata: Dict[str, Any]):
+        for key, value in metadata.items():
+            try:
+                self._inverted.setdefault(key, {}).setdefault(value, set()).add(row)
+            except TypeError: # unhashable values are only matched by scanning
+                continue
+
+
+    def _unindex_metadata(self, row: int, metadata: Dict[str, Any]):
+        for key, value in metadata.items():
+            try:
+                self._inverted.get(key, {}).get(value, set()).discard(row)
+            except TypeError:
+                continue
+
+
+    def add(
+        self,
+        ids: List[str],
+        embeddings: List[List[float]],
+        texts: List[str],
+        metadatas: Optional[List[Dict[str, Any]]] = None
+    ):
+        """
+        Adds (or replaces, if their id is already indexed) vectors with their text and metadata.
+        """
+        if not ids:
+            return
+        vectors = _normalize(np.asarray(embeddings, dtype=np.float32).reshape(len(ids), -1))
+        metadatas = metadatas or [{} for _ in ids]
+
+        with self._lock:
+            if self.dimensions is None:
+                self.dimensions = vectors.shape[1]
+                self._storage = QuantizedVectors(self.dimensions, self.quantization, self.rescore)
+            elif vectors.shape[1] != self.dimensions:
+                raise ValueError(f"Expected embeddings of {self.dimensions} dimensions, got {vectors.shape[1]}")
+
+            for id, vector, text, metadata in zip(ids, vectors, texts, metadatas):
+                metadata = dict(metadata)
+                row = self._rows.get(id)
+                if row is None:
+                    self._grow(1)
+                    # the vector is written first, so that a failure leaves the row as it was
+                    self._storage.set(self._size, vector)
+                    row = self._size
+                    self._size += 1
+                    self._rows[id] = row
+                    self.ids.append(id)
+                    self.texts.append(text)
+                    self.metadatas.append(metadata)
+                else:
+                    self._storage.set(row, vector)
+                    self._unindex_metadata(row, self.metadatas[row])
+                    self.texts[row] = text
+                    self.metadatas[row] = metadata
+
+                self._index_metadata(row, metadata)
+                if self._centroids is not None:
+                    self._assignments[row] = int(np.argmax(self._centroids @ vector))
+
+            if len(self) >= self.min_train_size and len(self) >= 2 * self._trained_size:
+                self.train()
+
+
+    def update_metadata(self, id: str, metadata: Dict[str, Any]):
+        """
+        Merges new metadata into an indexed vector (i.e. communities assigned after ingestion).
+        """
+        with self._lock:
+            row = self._rows.get(id)
+            if row is None:
+                return
+            self._unindex_metadata(row, self.metadatas[row])
+            self.metadatas[row].update(metadata)
+            self._index_metadata(row, self.metadatas[row])
+
+
+    def delete(self, ids: List[str]):
+        """
+        Removes vectors from the index. Their rows are left empty until the index is compacted by `train`.
+        """
+        with self._lock:
+            for id in ids:
+                row = self._rows.pop(id, None)
+                if row is None:
+                    continue
+                self._unindex_metadata(row, self.metadatas[row])
+                self.ids[row] = None
+                self._assignments[row] = -1
+
+
+    def _compact(self):
+        """ Drops the rows of deleted vectors. Caller holds the lock. """
+        live = [row for row, id in enumerate(self.ids) if id is not None]
+        if len(live) == self._size:
+            return
+        self._storage.select(np.asarray(live, dtype=np.int64))
+        self._assignments = self._assignments[live].copy()
+        self._size = len(live)
+        self.ids = [self.ids[row] for row in live]
+        self.texts = [self.texts[row] for row in live]
+        self.metadatas = [self.metadatas[row] for row in live]
+        self._rows = {id: row for row, id in enumerate(self.ids)}
+        self._inverted = {}
+        for row, metadata in enumerate(self.metadatas):
+            self._index_metadata(row, metadata)
+
+
+    def train(self):
+        """
+        (Re-)trains the clusters of the index over all its vectors, compacting deleted rows.
+        """
+        with self._lock:
+            self._compact()
+            if self._size == 0:
+                return
+            n_lists = self.n_lists or max(1, int(np.sqrt(self._size)))
+            n_lists = min(n_lists, self._size)
+
+            # train on a sample, then assign every vector
+            rng = np.random.default_rng(0)
+            sample_size = min(self._size, 64 * n_lists)
+            sample = self._storage.get(np.sort(rng.choice(self._size, size=sample_size, replace=False)))
+            self._centroids = _spherical_kmeans(_normalize(sample), n_lists)
+            self._assignments = np.full(len(self._storage), -1, dtype=np.int32)
+            for start in range(0, self._size, SCAN_BATCH_SIZE):
+                rows = np.arange(start, min(start + SCAN_BATCH_SIZE, self._size))
+                self._assignments[rows] = np.argmax(self._storage.get(rows) @ self._centroids.T, axis=1)
+            self._trained_size = self._size
+            logger.info(f"Trained IVF index with {n_lists} lists over {self._size} vectors")
+
+
+    def _filtered_rows(self, filter: Dict[str, Any]) -> np.ndarray:
+        """ Rows matching a metadata filter, narrowed with the inverted index for equality conditions. """
+        candidates = None
+        for key, condition in filter.items():
+            if key.startswith("$") or isinstance(condition, dict):
+                continue
+            try:
+                rows = self._inverted.get(key, {}).get(condition, set())
+            except TypeError:
+                continue
+            candidates = set(rows) if candidates is None else candidates & rows
+
+        if candidates is None:
+            candidates = self._rows.values()
+        return np.fromiter(
+            (row for row in sorted(candidates) if match_filter(self.metadatas[row], filter)),
+            dtype=np.int64
+        )
+
+
+    def _probed_rows(self, query: np.ndarray) -> np.ndarray:
+        """ Rows in the `n_probe` clusters closest to the query. """
+        n_probe = min(self.n_probe, len(self._centroids))
+        lists = np.argpartition(-(self._centroids @ query), n_probe - 1)[:n_probe]
+        return np.flatnonzero(np.isin(self._assignments[: self._size], lists))
+
+
+    def search(
+        self,
+        embedding: List[float],
+        k: int = 4,
+        filter: Optional[Dict[str, Any]] = None
+    ) -> List[Tuple[str, str, Dict[str, Any], float]]:
+        """
+        Returns the `k` entries most similar to a query embedding as `(id, text, metadata, cosine similarity)`.
+        """
+        query = _normalize(np.asarray(embedding, dtype=np.float32).reshape(-1))
+
+        with self._lock:
+            if not len(self):
+                return []
+
+            if filter:
+                rows = self._filtered_rows(filter)
+            elif self._centroids is not None:
+                rows = self._probed_rows(query)
+                if len(rows) < k: # too few vectors in the probed clusters
+                    rows = None
+            else:
+                rows = None
+
+            if rows is None:
+                rows = np.fromiter(sorted(self._rows.values()), dtype=np.int64)
+            if len(rows) == 0:
+                return []
+            scores = self._storage.scores(rows, query)
+
+            if self._storage.rescore:
+                # re-rank the best quantized candidates in full precision
+                n_candidates = min(k * self.rescore_factor, len(rows))
+                candidates = np.argpartition(-scores, n_candidates - 1)[:n_candidates]
+                rows, scores = rows[candidates], self._storage.exact_scores(rows[candidates], query)
+
+            k = min(k, len(rows))
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [
+                (self.ids[rows[i]], self.texts[rows[i]], dict(self.metadatas[rows[i]]), float(scores[i])) 
+                for i in top
+            ]
+
+
+    def save(self, path: str):
+        """
+        Persists the index to a directory (vectors codes and clusters as `.npy`, ids, texts and metadata as json),
+        atomically replacing the previous files.
+        """
+        with self._lock:
+            self._compact()
+            try:
+                os.makedirs(path, exist_ok=True)
+                if self._storage is not None:
+                    self._storage.save(path, self._size)
+                arrays = {}
+                if self._centroids is not None:
+                    arrays["centroids"] = self._centroids
+                    arrays["assignments"] = self._assignments[: self._size]
+                for name, array in arrays.items():
+                    with open(os.path.join(path, f"{name}.npy.tmp"), "wb") as f:
+                        np.save(f, array)
+                with open(os.path.join(path, "entries.json.tmp"), "w") as f:
+                    json.dump(
+                        {
+                            "ids": self.ids,
+                            "texts": self.texts,
+                            "metadatas": self.metadatas,
+                            "trained_size": self._trained_size,
+                            "quantization": self._storage.quantization if self._storage is not None else self.quantization
+                        },
+                        f,
+                        default=str
+                    )
+                for name in list(arrays) + ["entries"]:
+                    extension = "json" if name == "entries" else "npy"
+                    os.replace(os.path.join(path, f"{name}.{extension}.tmp"), os.path.join(path, f"{name}.{extension}"))
+                if "centroids" not in arrays:
+                    for name in ("centroids", "assignments"):
+                        if os.path.isfile(os.path.join(path, f"{name}.npy")):
+                            os.remove(os.path.join(path, f"{name}.npy"))
+                logger.info(f"Saved index of {len(self)} vectors to {path}")
+            except Exception as e:
+                logger.warning(f"Unable to save index to {path}: {e}")
+
+
+    def load(self, path: str) -> bool:
+        """
+        Loads an index persisted with `save`. Returns `False` if there is none (or it is unreadable).
+        """
+        if not os.path.isfile(os.path.join(path, "entries.json")):
+            return False
+        try:
+            with open(os.path.join(path, "entries.json"), "r") as f:
+                entries = json.load(f)
+            storage = None
+            if os.path.isfile(os.path.join(path, "codes.npy")):
+                storage = QuantizedVectors.load(path, self.quantization, self.rescore, entries.get("quantization"))
+
+            with self._lock:
+                self.ids = entries["ids"]
+                self.texts = entries["texts"]
+                self.metadatas = entries["metadatas"]
+                self._trained_size = entries.get("trained_size", 0)
+                self._storage = storage
+                self._size = len(storage) if storage is not None else 0
+                self.dimensions = storage.dimensions if storage is not None else None
+                self._rows = {id: row for row, id in enumerate(self.ids)}
+                self._inverted = {}
+                for row, metadata in enumerate(self.metadatas):
+                    self._index_metadata(row, metadata)
+
+                if os.path.isfile(os.path.join(path, "centroids.npy")):
+                    self._centroids = np.load(os.path.join(path, "centroids.npy"))
+                    self._assignments = np.load(os.path.join(path, "assignments.npy")).astype(np.int32)
+                else:
+                    self._centroids = None
+                    self._assignments = np.full(self._size, -1, dtype=np.int32)
+
+            logger.info(f"Loaded index of {len(self)} vectors from {path}")
+            return True
+        except Exception as e:
+            logger.warning(f"Unable to load index from {path}: {e}")
+            return False
@@ -0,0 +1,176 @@
+from hashlib import md5
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+from src.config import QuantizationType
+from src.index.ivf import IVFIndex
+from src.utils.logger import get_logger
+
+
+logger = get_logger(__name__)
+
+
+class LocalVectorStore(VectorStore):
+    """
+    In-process `VectorStore` backed by an `IVFIndex`, mirroring the nodes of a `Neo4jVector` index
+    (same ids, texts, metadata and filter syntax) so that similarity search does not go over the network.
+
+    Scores follow the `Neo4jVector` cosine convention, `(1 + cosine) / 2`, so that thresholds
+    tuned on Neo4j keep working.
+    If a `path` is given, the index is loaded from it at startup and persisted there by `save`.
+    """
+
+    def __init__(
+        self,
+        embedding: Embeddings,
+        path: Optional[str] = None,
+        n_lists: Optional[int] = None,
+        n_probe: int = 8,
+        min_train_size: int = 1024,
+        quantization: Optional[QuantizationType] = None,
+        rescore: bool = False,
+        rescore_factor: int = 4
+    ):
+        self.embedding = embedding
+        self.path = path
+        self.index = IVFIndex(
+            n_lists=n_lists, 
+            n_probe=n_probe, 
+            min_train_size=min_train_size,
+            quantization=quantization,
+            rescore=rescore,
+            rescore_factor=rescore_factor
+        )
+        if path is not None:
+            self.index.load(path)
+
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self.embedding
+
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: List[str],
+        embedding: Embeddings,
+        metadatas: Optional[List[dict]] = None,
+        **kwargs: Any
+    ) -> "LocalVectorStore":
+        store = cls(embedding=embedding, **kwargs)
+        store.add_texts(texts, metadatas)
+        return store
+
+
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None,
+        **kwargs: Any
+    ) -> List[str]:
+        texts = list(texts)
+        return self.add_embeddings(texts, self.embedding.embed_documents(texts), metadatas, ids)
+
+
+    def add_embeddings(
+        self,
+        texts: Iterable[str],
+        embeddings: List[List[float]],
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None,
+        **kwargs: Any
+    ) -> List[str]:
+        """
+        Adds already computed embeddings, with the same default ids as `Neo4jVector.add_embeddings` (md5 of the text).
+        """
+        texts = list(texts)
+        if ids is None:
+            ids = [md5(text.encode("utf-8")).hexdigest() for text in texts]
+        self.index.add(ids, embeddings, texts, metadatas)
+        return ids
+
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        if ids:
+            self.index.delete(ids)
+        return True
+
+
+    def update_metadata(self, metadatas: Dict[str, Dict[str, Any]]):
+        """
+        Merges new metadata into indexed entries, given as a dictionary of id -> metadata.
+        """
+        for id, metadata in metadatas.items():
+            self.index.update_metadata(id, metadata)
+
+
+    def save(self):
+        if self.path is not None:
+            self.index.save(self.path)
+
+
+    def _select_relevance_score_fn(self) -> Callable[[float], float]:
+        return lambda score: score
+
+
+    def similarity_search_with_score_by_vector(
+        self,
+        embedding: List[float],
+        k: int = 4,
+        filter: Optional[Dict[str, Any]] = None,
+        **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        results = []
+        for _, text, metadata, similarity in self.index.search(embedding, k=k, filter=filter):
+            results.append((Document(page_content=text, metadata=metadata), (1.0 + similarity) / 2.0))
+        return results
+
+
+    def similarity_search_with_score(
+        self,
+        query: str,
+        k: int = 4,
+        filter: Optional[Dict[str, Any]] = None,
+        **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        return self.similarity_search_with_score_by_vector(
+            self.embedding.embed_query(query), k=k, filter=filter
+        )
+
+
+    def similarity_search_by_vector(
+        self,
+        embedding: List[float],
+        k: int = 4,
+        filter: Optional[Dict[str, Any]] = None,
+        **kwargs: Any
+    ) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k=k, filter=filter)]
+
+
+    def similarity_search(
+        self,
+        query: str,
+        k: int = 4,
+        filter: Optional[Dict[str, Any]] = None,
+        **kwargs: Any
+    ) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k=k, filter=filter)]
+
+
+    def _similarity_search_with_relevance_scores(
+        self,
+        query: str,
+        k: int = 4,
+        **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        return self.similarity_search_with_score(query, k=k, filter=kwargs.get("filter"))
@@ -0,0 +1,178 @@
+import os
+import numpy as np
+
+from typing import Optional, Tuple
+
+from src.config import QuantizationType
+from src.utils.logger import get_logger
+
+
+logger = get_logger(__name__)
+
+# rows scored at once, bounds the float32 copy of quantized codes made while scanning
+SCAN_BATCH_SIZE = 8192
+
+
+def quantize(vectors: np.ndarray, quantization: Optional[QuantizationType]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Quantizes a batch of vectors, returning their codes and their per-vector scales:
+
+    * `None`: codes are the `float32` vectors themselves;
+    * `float16`: codes are the vectors cast to half precision;
+    * `int8`: symmetric scalar quantization, each vector is divided by `max(|v|) / 127` and rounded.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    quantization = QuantizationType(quantization) if quantization is not None else None
+    scales = np.ones(len(vectors), dtype=np.float32)
+
+    if quantization is None:
+        return vectors, scales
+    if quantization == QuantizationType.FLOAT16:
+        return vectors.astype(np.float16), scales
+    if quantization == QuantizationType.INT8:
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+        return codes, scales.astype(np.float32)
+    raise ValueError(f"Unsupported quantization: {quantization}")
+
+
+def dequantize(codes: np.ndarray, scales: np.ndarray) -> np.ndarray:
+    """ Approximate `float32` vectors out of their codes and scales. """
+    return codes.astype(np.float32) * scales[:, None]
+
+
+class QuantizedVectors:
+    """
+    Growable storage of vectors, kept as quantized codes (see `quantize`) and scored against queries
+    without materializing the whole matrix in full precision.
+
+    With `rescore=True` the full precision vectors are kept as well, so that the best candidates
+    of a quantized scan can be re-ranked exactly: once persisted, they are memory-mapped from disk
+    and only the rows of the candidates are read.
+    """
+
+    def __init__(self, dimensions: int, quantization: Optional[QuantizationType] = None, rescore: bool = False):
+        self.dimensions = dimensions
+        self.quantization = QuantizationType(quantization) if quantization is not None else None
+        self.rescore = rescore and quantization is not None
+
+        dtype = {None: np.float32, QuantizationType.FLOAT16: np.float16, QuantizationType.INT8: np.int8}[self.quantization]
+        self.codes = np.zeros((0, dimensions), dtype=dtype)
+        self.scales = np.zeros(0, dtype=np.float32)
+        self.full: Optional[np.ndarray] = np.zeros((0, dimensions), dtype=np.float32) if self.rescore else None
+
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+
+    @property
+    def nbytes(self) -> int:
+        """ Bytes held in memory (memory-mapped full precision vectors are not counted). """
+        nbytes = self.codes.nbytes + self.scales.nbytes
+        if self.full is not None and not isinstance(self.full, np.memmap):
+            nbytes += self.full.nbytes
+        return nbytes
+
+
+    def resize(self, capacity: int):
+        """ Grows (or shrinks) the buffers to `capacity` rows, keeping the existing ones (memory-mapped rows are read in memory). """
+        rows = min(capacity, len(self))
+
+        codes = np.zeros((capacity, self.dimensions), dtype=self.codes.dtype)
+        codes[:rows] = self.codes[:rows]
+        scales = np.ones(capacity, dtype=np.float32)
+        scales[:rows] = self.scales[:rows]
+        self.codes, self.scales = codes, scales
+
+        if self.full is not None:
+            full = np.zeros((capacity, self.dimensions), dtype=np.float32)
+            full[:rows] = self.full[:rows]
+            self.full = full
+
+
+    def set(self, row: int, vector: np.ndarray):
+        codes, scales = quantize(vector[None, :], self.quantization)
+        self.codes[row] = codes[0]
+        self.scales[row] = scales[0]
+        if self.full is not None:
+            self.full[row] = vector
+
+
+    def select(self, rows: np.ndarray):
+        """ Keeps only the given rows, in the given order. """
+        self.codes = self.codes[rows].copy()
+        self.scales = self.scales[rows].copy()
+        if self.full is not None:
+            self.full = np.asarray(self.full[rows], dtype=np.float32)
+
+
+    def get(self, rows: np.ndarray) -> np.ndarray:
+        """ Vectors at the given rows, in full precision if available, dequantized otherwise. """
+        if self.full is not None:
+            return np.asarray(self.full[rows], dtype=np.float32)
+        return dequantize(self.codes[rows], self.scales[rows])
+
+
+    def scores(self, rows: np.ndarray, query: np.ndarray) -> np.ndarray:
+        """ Approximate dot products between the query and the vectors at the given rows. """
+        if self.quantization is None:
+            return self.codes[rows] @ query
+        scores = np.empty(len(rows), dtype=np.float32)
+        for start in range(0, len(rows), SCAN_BATCH_SIZE):
+            batch = rows[start: start + SCAN_BATCH_SIZE]
+            scores[start: start + len(batch)] = (self.codes[batch].astype(np.float32) @ query) * self.scales[batch]
+        return scores
+
+
+    def exact_scores(self, rows: np.ndarray, query: np.ndarray) -> np.ndarray:
+        """ Full precision dot products, for rescoring. """
+        return np.asarray(self.full[rows], dtype=np.float32) @ query
+
+
+    def save(self, path: str, size: int):
+        """ Writes the first `size` rows to `codes.npy`, `scales.npy` (and `vectors.npy` for full precision). """
+        arrays = {"codes": self.codes[:size], "scales": self.scales[:size]}
+        if self.full is not None:
+            arrays["vectors"] = self.full[:size]
+        for name, array in arrays.items():
+            with open(os.path.join(path, f"{name}.npy.tmp"), "wb") as f:
+                np.save(f, array)
+        for name in arrays:
+            os.replace(os.path.join(path, f"{name}.npy.tmp"), os.path.join(path, f"{name}.npy"))
+        if self.full is None and os.path.isfile(os.path.join(path, "vectors.npy")):
+            os.remove(os.path.join(path, "vectors.npy"))
+
+
+    @classmethod
+    def load(
+        cls,
+        path: str,
+        quantization: Optional[QuantizationType] = None,
+        rescore: bool = False,
+        saved_quantization: Optional[QuantizationType] = None
+    ) -> "QuantizedVectors":
+        """
+        Loads vectors saved with `save`. If they were saved with a different quantization, they are re-quantized.
+        """
+        codes = np.load(os.path.join(path, "codes.npy"))
+        scales = np.load(os.path.join(path, "scales.npy"))
+        full_path = os.path.join(path, "vectors.npy")
+        # copy-on-write: rows are read from disk lazily, and can still be overwritten in memory (i.e. re-added ids)
+        full = np.load(full_path, mmap_mode="c") if os.path.isfile(full_path) else None
+
+        storage = cls(codes.shape[1], quantization, rescore)
+        if storage.quantization == (QuantizationType(saved_quantization) if saved_quantization else None):
+            storage.codes, storage.scales = codes, scales.astype(np.float32)
+        else:
+            source = np.asarray(full, dtype=np.float32) if full is not None else dequantize(codes, scales)
+            storage.codes, storage.scales = quantize(source, quantization)
+            logger.info(f"Re-quantized {len(codes)} vectors from {saved_quantization} to {quantization}")
+
+        if storage.rescore:
+            if full is None:
+                logger.warning(f"No full precision vectors in {path}, rescoring with dequantized ones")
+                full = dequantize(codes, scales)
+            storage.full = full
+        return storage
@@ -0,0 +1,185 @@
+import json
+import os
+
+from hashlib import md5
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from src.config import CheckpointConf
+from src.schema import Chunk, ProcessedDocument, _Graph
+from src.utils.logger import get_logger
+from src.utils.tracing import current_span, traced
+
+
+logger = get_logger(__name__)
+
+
+class IngestionCheckpoints:
+    """
+    Checkpoints of the ingestion pipeline: the output of each stage of each document (cleaned text, chunks, embeddings,
+    extracted graphs) is appended to a JSONL file per document, named after the hash of its name and loaded content,
+    so that an interrupted ingestion resumes each document at its first incomplete stage.
+
+    Graphs are checkpointed Chunk by Chunk as they are extracted (see `save_chunk_graph`), so no LLM call completed
+    before an interruption is issued again. A line cut short by an interruption is ignored when reading.
+    """
+
+    def __init__(self, conf: CheckpointConf):
+        self.conf = conf
+        self._keys: Dict[Tuple[str, int], str] = {}
+        self._completed: Dict[str, Set[str]] = {}
+        os.makedirs(conf.path, exist_ok=True)
+
+
+    def _key(self, doc: ProcessedDocument) -> str:
+        """ Key of a document, from its name and its content as loaded (before cleaning changes it). """
+        return self._keys.setdefault(
+            (doc.filename, doc.document_version),
+            md5(f"{doc.filename}\0{doc.source}".encode("utf-8")).hexdigest()
+        )
+
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.conf.path, f"{key}.jsonl")
+
+
+    def _append(self, doc: ProcessedDocument, record: Dict[str, Any]):
+        with open(self._path(self._key(doc)), "ab+") as f:
+            # a line cut short by an interruption is ended first, so that the record is not joined to it
+            end = f.seek(0, os.SEEK_END)
+            if end:
+                f.seek(end - 1)
+                if f.read(1) != b"\n":
+                    f.write(b"\n")
+            f.write((json.dumps(record, default=str) + "\n").encode("utf-8"))
+
+
+    def _read(self, key: str) -> List[Dict[str, Any]]:
+        path = self._path(key)
+        if not os.path.isfile(path):
+            return []
+        records = []
+        with open(path, "r") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    logger.warning(f"Ignoring an incomplete checkpoint in {path}")
+        return records
+
+
+    @staticmethod
+    def _restore(doc: ProcessedDocument, records: List[Dict[str, Any]]) -> Set[str]:
+        """ Replays the checkpoints of a document on it, returns its completed stages. """
+        completed = set()
+        chunks: Dict[Any, Chunk] = {}
+        for record in records:
+            stage = record["stage"]
+            if stage == "clean":
+                doc.source = record["source"]
+            elif stage == "chunk":
+                doc.chunks = [Chunk(**chunk) for chunk in record["chunks"]]
+                chunks = {chunk.chunk_id: chunk for chunk in doc.chunks}
+            elif stage == "embed":
+                for item in record["chunks"]:
+                    if item["chunk_id"] in chunks:
+                        chunks[item["chunk_id"]].embedding = item["embedding"]
+                        chunks[item["chunk_id"]].embeddings_model = item["embeddings_model"]
+                # Chunks dead-lettered at embedding are left out, as they were
+                embedded = {item["chunk_id"] for item in record["chunks"]}
+                doc.chunks = [chunk for chunk in doc.chunks if chunk.chunk_id in embedded]
+            elif stage == "mine" and "chunk_id" in record:
+                if record["chunk_id"] in chunks:
+                    chunks[record["chunk_id"]].graph = _Graph(**record["graph"])
+                # a graph of a single Chunk does not complete the stage
+                continue
+            completed.add(stage)
+        return completed
+
+
+    @staticmethod
+    def _stage_record(stage: str, doc: ProcessedDocument) -> Dict[str, Any]:
+        """ Checkpoint of the output of a stage for a document. """
+        record: Dict[str, Any] = {"stage": stage}
+        if stage == "clean":
+            record["source"] = doc.source
+        elif stage == "chunk":
+            record["chunks"] = [
+                chunk.model_dump(include={"chunk_id", "text", "filename", "chunk_size", "chunk_overlap"})
+                for chunk in doc.chunks or []
+            ]
+        elif stage == "embed":
+            record["chunks"] = [
+                {"chunk_id": chunk.chunk_id, "embedding": chunk.embedding, "embeddings_model": chunk.embeddings_model}
+                for chunk in doc.chunks or []
+            ]
+        return record
+
+
+    @traced("ingestion.resume")
+    def resume(self, docs: List[ProcessedDocument]) -> List[ProcessedDocument]:
+        """
+        Restores loaded documents from their checkpoints (or, if not `resume`, deletes them): to call right after loading,
+        before any other stage.
+        """
+        resumed = 0
+        for doc in docs:
+            key = self._key(doc)
+            if not self.conf.resume:
+                self._completed[key] = set()
+                if os.path.isfile(self._path(key)):
+                    os.remove(self._path(key))
+                continue
+            self._completed[key] = self._restore(doc, self._read(key))
+            resumed += bool(self._completed[key])
+
+        current_span().set_attributes({"documents": len(docs), "resumed": resumed})
+        if resumed:
+            logger.info(f"Resumed {resumed} of {len(docs)} documents from checkpoints in {self.conf.path}")
+        return docs
+
+
+    def pending(self, stage: str, docs: List[ProcessedDocument]) -> List[ProcessedDocument]:
+        """ Documents for which a stage is not complete. """
+        return [doc for doc in docs if stage not in self._completed.get(self._key(doc), set())]
+
+
+    def complete(self, stage: str, docs: List[ProcessedDocument]):
+        """
+        Checkpoints the output of a stage for documents. Mining is complete only once every Chunk has a graph,
+        Chunks whose extraction failed are mined again on resume; once stored, checkpoints are deleted, unless `keep_completed`.
+        """
+        for doc in docs:
+            if stage == "mine" and any(chunk.graph is None for chunk in doc.chunks or []):
+                continue
+            key = self._key(doc)
+            self._completed.setdefault(key, set()).add(stage)
+            if stage == "store" and not self.conf.keep_completed:
+                if os.path.isfile(self._path(key)):
+                    os.remove(self._path(key))
+                continue
+            self._append(doc, self._stage_record(stage, doc))
+
+
+    def save_chunk_graph(self, doc: ProcessedDocument, chunk: Chunk):
+        """ Checkpoints the graph extracted from a Chunk, as soon as it is extracted. """
+        self._append(doc, {"stage": "mine", "chunk_id": chunk.chunk_id, "graph": chunk.graph.model_dump()})
+
+
+    def run(
+            self,
+            stage: str,
+            docs: List[ProcessedDocument],
+            fn: Callable[[List[ProcessedDocument]], Optional[List[ProcessedDocument]]]
+        ) -> List[ProcessedDocument]:
+        """
+        Runs a stage of the pipeline (`fn`) on the documents for which it is not complete, then checkpoints its output.
+        """
+        pending = self.pending(stage, docs)
+        if not pending:
+            logger.info(f"Stage '{stage}' already complete for all {len(docs)} documents")
+            return docs
+
+        outputs = fn(pending) or pending
+        self.complete(stage, outputs)
+        replaced = {id(doc): output for doc, output in zip(pending, outputs)}
+        return [replaced.get(id(doc), doc) for doc in docs]
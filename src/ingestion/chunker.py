@@ -2,6 +2,8 @@ from typing import List
 
 from langchain_text_splitters import RecursiveCharacterTextSplitter, TextSplitter
 from src.utils.logger import get_logger
+from src.utils.metrics import ingestion_queue
+from src.utils.tracing import current_span, traced
 
 from src.config import ChunkerConf
 from src.schema import ProcessedDocument, Chunk
@@ -53,6 +55,7 @@ class Chunker:
         ]
     
 
+    @traced("ingestion.chunk_document")
     def chunk_document(self, doc: ProcessedDocument) -> ProcessedDocument:
         """
         Chunks the text of a `ProcessedDocument` instance.
@@ -60,17 +63,19 @@ class Chunker:
         chunks_dict = self.get_chunked_document_with_ids(doc.source)
         
         doc.chunks = [Chunk(**chunk) for chunk in chunks_dict]
+        current_span().set_attributes({"filename": doc.filename, "chunks": len(doc.chunks)})
 
         logger.info(f"DOcument {doc.filename} has been chunked into {len(doc.chunks)} chunks.")
         
         return doc
 
     
+    @traced("ingestion.chunk")
     def chunk_documents(self, docs: List[ProcessedDocument]) -> List[ProcessedDocument]:
         """
         Chunks the text of a list of `ProcessedDocument` instances.
         """
         updated_docs = []
-        for doc in docs:
+        for doc in ingestion_queue("chunk", docs):
             updated_docs.append(self.chunk_document(doc))
         return updated_docs
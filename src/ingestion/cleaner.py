@@ -1,5 +1,7 @@
 import re
 from src.utils.logger import get_logger
+from src.utils.metrics import ingestion_queue
+from src.utils.tracing import current_span, traced
 from typing import List
 
 from src.schema import ProcessedDocument
@@ -55,16 +57,19 @@ class Cleaner:
         return text.strip()
 
 
+    @traced("ingestion.clean_document")
     def clean_document(self, doc: ProcessedDocument) -> ProcessedDocument:
         """
         Cleans the text of a `ProcessedDocument` instance.
         """
         doc.source = self._clean_text(doc.source)
+        current_span().set_attributes({"filename": doc.filename, "characters": len(doc.source)})
         return doc
     
 
+    @traced("ingestion.clean")
     def clean_documents(self, docs: List[ProcessedDocument]) -> List[ProcessedDocument]:
         """
         Cleans the text of a list of `ProcessedDocument` instances.
         """
-        return [self.clean_document(doc) for doc in docs]
\ No newline at end of file
+        return [self.clean_document(doc) for doc in ingestion_queue("clean", docs)]
\ No newline at end of file
@@ -0,0 +1,119 @@
+import json
+import os
+import threading
+import time
+
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.config import DeadLetterConf
+from src.schema import Chunk, ProcessedDocument
+from src.utils.logger import get_logger
+from src.utils.metrics import counter
+
+
+logger = get_logger(__name__)
+
+
+class DeadLetters:
+    """
+    Dead letters of the ingestion pipeline: Chunks whose embedding (`embed`) or graph extraction (`mine`) still failed
+    after retries, appended to a JSONL file with their document and the last error, to be replayed later
+    (see `replay_dead_letters`) instead of being silently left out of the Knowledge Graph.
+    A line cut short by an interruption is ignored when reading, and a Chunk dead-lettered again is kept once.
+    """
+
+    def __init__(self, conf: DeadLetterConf):
+        self.conf = conf
+        self._lock = threading.Lock()
+        if os.path.dirname(conf.path):
+            os.makedirs(os.path.dirname(conf.path), exist_ok=True)
+
+
+    @staticmethod
+    def _letter_key(letter: Dict[str, Any]) -> Tuple[str, str, int, Any]:
+        return (letter["stage"], letter["filename"], letter["document_version"], letter["chunk"]["chunk_id"])
+
+
+    def _read(self) -> List[Dict[str, Any]]:
+        """ Dead letters in the file, the last one of a Chunk dead-lettered more than once at a stage. """
+        if not os.path.isfile(self.conf.path):
+            return []
+        letters: Dict[Tuple[str, str, int, Any], Dict[str, Any]] = {}
+        with open(self.conf.path, "r") as f:
+            for line in f:
+                try:
+                    letter = json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning(f"Ignoring an incomplete dead letter in {self.conf.path}")
+                    continue
+                letters.pop(self._letter_key(letter), None)
+                letters[self._letter_key(letter)] = letter
+        return list(letters.values())
+
+
+    def add(self, stage: str, doc: ProcessedDocument, chunk: Chunk, error: BaseException):
+        """ Dead-letters a Chunk of a document that failed a stage of the pipeline. """
+        letter = {
+            "stage": stage,
+            "filename": doc.filename,
+            "document_version": doc.document_version,
+            "metadata": doc.metadata,
+            "chunk": chunk.model_dump(include={"chunk_id", "text", "filename", "chunk_size", "chunk_overlap"}),
+            "error": f"{type(error).__name__}: {error}",
+            "time": time.time()
+        }
+        with self._lock:
+            with open(self.conf.path, "ab+") as f:
+                # a line cut short by an interruption is ended first, so that the letter is not joined to it
+                end = f.seek(0, os.SEEK_END)
+                if end:
+                    f.seek(end - 1)
+                    if f.read(1) != b"\n":
+                        f.write(b"\n")
+                f.write((json.dumps(letter, default=str) + "\n").encode("utf-8"))
+        counter("dead_letters_total", "Chunks dead-lettered after retries", stage=stage).inc()
+        logger.warning(f"Dead-lettered chunk {chunk.chunk_id} of {doc.filename} at stage '{stage}'")
+
+
+    def letters(self, stage: Optional[str] = None) -> List[Dict[str, Any]]:
+        """ Dead letters, of a stage if given. """
+        with self._lock:
+            return [letter for letter in self._read() if stage is None or letter["stage"] == stage]
+
+
+    def __len__(self) -> int:
+        return len(self.letters())
+
+
+    def documents(self, stage: str) -> List[ProcessedDocument]:
+        """
+        Chunks dead-lettered at a stage, grouped back into their documents (with their metadata).
+        Their dead letters are kept until they are replayed successfully (see `resolve`).
+        """
+        docs: Dict[Tuple[str, int], ProcessedDocument] = {}
+        for letter in self.letters(stage):
+            key = (letter["filename"], letter["document_version"])
+            if key not in docs:
+                docs[key] = ProcessedDocument(
+                    filename=letter["filename"],
+                    document_version=letter["document_version"],
+                    metadata=letter.get("metadata"),
+                    chunks=[]
+                )
+            docs[key].chunks.append(Chunk(**letter["chunk"]))
+        return list(docs.values())
+
+
+    def resolve(self, stage: str, docs: List[ProcessedDocument]):
+        """ Removes the dead letters of a stage of the Chunks of `docs`, once they have been replayed successfully. """
+        resolved = {
+            (stage, doc.filename, doc.document_version, chunk.chunk_id)
+            for doc in docs for chunk in doc.chunks or []
+        }
+        if not resolved:
+            return
+        with self._lock:
+            kept = [letter for letter in self._read() if self._letter_key(letter) not in resolved]
+            with open(f"{self.conf.path}.tmp", "w") as f:
+                f.writelines(json.dumps(letter, default=str) + "\n" for letter in kept)
+            os.replace(f"{self.conf.path}.tmp", self.conf.path)
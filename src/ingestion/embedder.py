@@ -1,9 +1,12 @@
-from typing import List
+from typing import List, Optional
 
 from src.config import EmbedderConf
 from src.factory.embeddings import get_embeddings
+from src.ingestion.dead_letters import DeadLetters
 from src.schema import ProcessedDocument
 from src.utils.logger import get_logger
+from src.utils.metrics import ingestion_queue
+from src.utils.tracing import span, traced
 
 
 logger = get_logger(__name__)
@@ -11,34 +14,51 @@ logger = get_logger(__name__)
 
 class ChunkEmbedder:
     """ Contains methods to embed Chunks from a (list of) `ProcessedDocument`."""
-    def __init__(self, conf: EmbedderConf):
+    def __init__(self, conf: EmbedderConf, dead_letters: Optional[DeadLetters]=None):
         self.conf = conf
         self.embeddings = get_embeddings(conf)
+        self.dead_letters = dead_letters
 
         if self.embeddings:
             logger.info(f"Embedder of type '{self.conf.type}' initialized.")
     
 
+    @traced("ingestion.embed_document")
     def embed_document_chunks(self, doc: ProcessedDocument) -> ProcessedDocument:
         """
         Embeds the chunks of a `ProcessedDocument` instance.
+        With `dead_letters`, Chunks whose embedding still fails after retries are dead-lettered and left out of the document,
+        so that they are neither mined nor stored without an embedding; without, the error is raised.
         """
         if self.embeddings is not None:
+            failed = []
             for chunk in doc.chunks:
-                chunk.embedding = self.embeddings.embed_documents([chunk.text])
+                with span("ingestion.embed_chunk", filename=doc.filename, chunk_id=chunk.chunk_id) as chunk_span:
+                    try:
+                        chunk.embedding = self.embeddings.embed_documents([chunk.text])
+                    except Exception as e:
+                        if self.dead_letters is None:
+                            raise
+                        chunk_span.record_exception(e)
+                        self.dead_letters.add("embed", doc, chunk, e)
+                        failed.append(chunk)
+                        continue
                 chunk.embeddings_model = self.conf.model
+            if failed:
+                doc.chunks = [chunk for chunk in doc.chunks if all(chunk is not other for other in failed)]
             logger.info(f"Embedded {len(doc.chunks)} chunks.")
             return doc
         else: 
             logger.warning(f"Embedder type '{self.conf.type}' is not yet implemented")
 
 
+    @traced("ingestion.embed")
     def embed_documents_chunks(self, docs: List[ProcessedDocument]) -> List[ProcessedDocument]:
         """
         Embeds the chunks of a list of `ProcessedDocument` instances.
         """
         if self.embeddings is not None:
-            for doc in docs:
+            for doc in ingestion_queue("embed", docs):
                 doc = self.embed_document_chunks(doc)
             return docs
         else: 
@@ -0,0 +1,198 @@
+import re
+import time
+import unicodedata
+import numpy as np
+
+from difflib import SequenceMatcher
+from typing import Any, Dict, List, NamedTuple, Optional, Set, Tuple
+
+from langchain_core.embeddings import Embeddings
+
+from src.config import EntityResolutionConf
+from src.graph.knowledge_graph import KnowledgeGraph
+from src.utils.logger import get_logger
+from src.utils.tracing import current_span, traced
+
+
+logger = get_logger(__name__)
+
+# words left out of blocking keys: articles and prepositions (English and Italian) and legal forms of companies
+_STOPWORDS = {
+    "a", "an", "and", "at", "for", "in", "of", "on", "the", "to",
+    "d", "da", "de", "dei", "del", "della", "delle", "di", "e", "il", "la", "le", "lo", "gli",
+}
+_LEGAL_FORMS = {
+    "ag", "bv", "co", "corp", "corporation", "company", "gmbh", "inc", "incorporated", "limited",
+    "llc", "ltd", "nv", "plc", "sa", "sas", "spa", "srl", "sarl",
+}
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def blocking_key(name: str) -> str:
+    """
+    Normalized name of an entity: accents, case, punctuation, articles, prepositions and legal forms are dropped,
+    i.e. `Bank of Italy`, `Bank Of Italy S.p.A.` and `The Bank of Italy` share the key `bank italy`.
+    """
+    text = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode("ascii").lower()
+    # dotted abbreviations (`S.p.A.`, `Inc.`) are joined before splitting
+    text = text.replace(".", "")
+    return " ".join(token for token in _TOKEN.findall(text) if token not in _STOPWORDS and token not in _LEGAL_FORMS)
+
+
+class ResolutionStats(NamedTuple):
+    entities: int
+    key_candidates: int
+    embedding_candidates: int
+    clusters: int
+    merged: int
+    seconds: float
+
+
+class EntityResolver:
+    """
+    Resolves near-duplicate entities of the Knowledge Graph (i.e. `Bank Of Italy`, `Bank Of Italy Spa`, `Banca D'Italia`),
+    which extraction creates as distinct nodes, into a single one.
+
+    Candidate pairs are generated by blocking, without comparing every pair of entities: entities sharing a normalized name
+    (see `blocking_key`) and, if `use_embeddings`, the nearest neighbours of the embedding of each name, searched in batches.
+    Candidates are grouped transitively into clusters; in each one, the entity with the most relationships survives,
+    takes over the relationships of the others and records their names as `aliases`.
+    """
+
+    def __init__(self, conf: EntityResolutionConf, embeddings: Optional[Embeddings] = None):
+        self.conf = conf
+        self.embeddings = embeddings
+
+        if conf.use_embeddings and embeddings is None:
+            logger.warning("No embeddings model given to the EntityResolver, candidates will only be generated by name")
+
+
+    def _same_type(self, a: Dict[str, Any], b: Dict[str, Any]) -> bool:
+        return not self.conf.same_type or a["type"] == b["type"]
+
+
+    def key_candidates(self, entities: List[Dict[str, Any]]) -> List[Tuple[int, int]]:
+        """
+        Pairs of entities (by position) sharing a blocking key (and a type, if `same_type`): each entity of a block
+        is paired with the first one, which is enough to cluster them.
+        """
+        blocks: Dict[Tuple[Optional[str], str], List[int]] = {}
+        for i, entity in enumerate(entities):
+            key = blocking_key(entity["id"] or "")
+            if key:
+                blocks.setdefault((entity["type"] if self.conf.same_type else None, key), []).append(i)
+        return [(block[0], i) for block in blocks.values() for i in block[1:]]
+
+
+    def embedding_candidates(self, entities: List[Dict[str, Any]]) -> List[Tuple[int, int]]:
+        """
+        Pairs of entities (by position) whose names are among the `n_neighbours` nearest neighbours of each other's
+        embeddings with a cosine similarity of at least `similarity_threshold`, and whose normalized names are similar enough
+        (`min_name_similarity`) not to merge i.e. `Bank Of Italy` with `Bank Of France`.
+        Names are embedded, and compared to all the others, `embedding_batch_size` at a time.
+        """
+        if self.embeddings is None or len(entities) < 2:
+            return []
+
+        names = [entity["id"] or "" for entity in entities]
+        vectors = np.vstack([
+            np.asarray(self.embeddings.embed_documents(names[start:start + self.conf.embedding_batch_size]), dtype=np.float32)
+            for start in range(0, len(names), self.conf.embedding_batch_size)
+        ])
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        vectors /= norms
+
+        k = min(self.conf.n_neighbours, len(entities) - 1)
+        keys = [blocking_key(name) for name in names]
+        pairs: Set[Tuple[int, int]] = set()
+        for start in range(0, len(entities), self.conf.embedding_batch_size):
+            similarities = vectors[start:start + self.conf.embedding_batch_size] @ vectors.T
+            rows = np.arange(similarities.shape[0])
+            similarities[rows, rows + start] = -np.inf
+            neighbours = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+            for row, columns in enumerate(neighbours):
+                i = start + row
+                for j in columns:
+                    j = int(j)
+                    if (
+                        similarities[row, j] >= self.conf.similarity_threshold
+                        and self._same_type(entities[i], entities[j])
+                        and SequenceMatcher(None, keys[i], keys[j]).ratio() >= self.conf.min_name_similarity
+                    ):
+                        pairs.add((min(i, j), max(i, j)))
+        return sorted(pairs)
+
+
+    @staticmethod
+    def clusters(n: int, pairs: List[Tuple[int, int]]) -> List[List[int]]:
+        """ Groups `n` entities into clusters of duplicates (with more than one entity), given candidate pairs (union-find). """
+        parent = list(range(n))
+
+        def find(i: int) -> int:
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        for i, j in pairs:
+            root_i, root_j = find(i), find(j)
+            if root_i != root_j:
+                parent[max(root_i, root_j)] = min(root_i, root_j)
+
+        groups: Dict[int, List[int]] = {}
+        for i in range(n):
+            groups.setdefault(find(i), []).append(i)
+        return [group for group in groups.values() if len(group) > 1]
+
+
+    @staticmethod
+    def merge_of(cluster: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Merge of a cluster of duplicates: the entity with the most relationships (then the shortest name) survives,
+        the names and aliases of the others become its aliases.
+        """
+        survivor = max(cluster, key=lambda entity: (entity["degree"] or 0, -len(entity["id"] or "")))
+        duplicates = [entity for entity in cluster if entity is not survivor]
+        return {
+            "survivor": survivor["element_id"],
+            "duplicates": [entity["element_id"] for entity in duplicates],
+            "aliases": list(dict.fromkeys(
+                alias for entity in duplicates for alias in [entity["id"], *(entity["aliases"] or [])] if alias
+            ))
+        }
+
+
+    @traced("ingestion.resolve_entities")
+    def resolve(self, graph: KnowledgeGraph) -> ResolutionStats:
+        """
+        Finds and merges the near-duplicate entities of a Knowledge Graph, to run after ingestion and before communities
+        and centralities are computed.
+        """
+        start = time.perf_counter()
+        entities = graph.get_entities()
+
+        key_pairs = self.key_candidates(entities)
+        embedding_pairs = self.embedding_candidates(entities) if self.conf.use_embeddings else []
+        clusters = self.clusters(len(entities), [*key_pairs, *embedding_pairs])
+        merges = [self.merge_of([entities[i] for i in cluster]) for cluster in clusters]
+
+        if merges:
+            graph.merge_entities(merges, batch_size=self.conf.merge_batch_size)
+            graph.bump_graph_version()
+            graph.mark_schema_stale()
+
+        stats = ResolutionStats(
+            entities=len(entities),
+            key_candidates=len(key_pairs),
+            embedding_candidates=len(embedding_pairs),
+            clusters=len(clusters),
+            merged=sum(len(merge["duplicates"]) for merge in merges),
+            seconds=time.perf_counter() - start
+        )
+        current_span().set_attributes(stats._asdict())
+        logger.info(
+            f"Resolved {stats.entities} entities: {stats.merged} duplicates merged into {stats.clusters} entities "
+            f"({stats.key_candidates} candidates by name, {stats.embedding_candidates} by embeddings)"
+        )
+        return stats
@@ -1,9 +1,13 @@
 from src.utils.logger import get_logger
+from src.utils.metrics import ingestion_queue
+from src.utils.tracing import current_span, span, traced
 from typing import List, Optional
 
 from src.agents.graph_extractor import GraphExtractor
-from src.graph.graph_model import _Graph, Ontology, map_to_lc_graph
+from src.graph.graph_model import _Graph, Ontology
 from src.config import LLMConf
+from src.ingestion.checkpoints import IngestionCheckpoints
+from src.ingestion.dead_letters import DeadLetters
 from src.schema import ProcessedDocument
 
 logger = get_logger(__name__)
@@ -12,37 +16,58 @@ logger = get_logger(__name__)
 class GraphMiner:
     """ Contains methods to mine graphs from a (list of) `ProcessedDocument`."""
 
-    def __init__(self, conf: LLMConf, ontology: Optional[Ontology]=None):
+    def __init__(
+            self, 
+            conf: LLMConf, 
+            ontology: Optional[Ontology]=None, 
+            checkpoints: Optional[IngestionCheckpoints]=None, 
+            dead_letters: Optional[DeadLetters]=None
+        ):
         self.graph_extractor = GraphExtractor(conf=conf, ontology=ontology)
+        self.checkpoints = checkpoints
+        self.dead_letters = dead_letters
 
         if self.graph_extractor:
             logger.info(f"GraphMiner initialized.")
 
 
+    @traced("ingestion.mine_document")
     def mine_graph_from_doc_chunks(self, doc: ProcessedDocument) -> ProcessedDocument:
         """
         Mines a graph from a `ProcessedDocument` instance. 
+        Chunks that already have a graph (i.e. restored from checkpoints) are skipped; 
+        with `checkpoints`, each graph is checkpointed as soon as it is extracted;
+        with `dead_letters`, Chunks whose extraction still fails after retries are dead-lettered, to be replayed later.
         """
+        current_span().set_attributes({"filename": doc.filename, "chunks": len(doc.chunks)})
         
         for chunk in doc.chunks:
-            try:
-                graph: _Graph = self.graph_extractor.extract_graph(chunk.text)
+            if chunk.graph is not None:
+                continue
+            with span("ingestion.mine_chunk", filename=doc.filename, chunk_id=chunk.chunk_id) as chunk_span:
+                try:
+                    graph: _Graph = self.graph_extractor.extract_graph(chunk.text)
 
-                graph_doc = map_to_lc_graph(graph, source_content=chunk.text)
-
-                chunk.nodes = graph_doc.nodes
-                chunk.relationships = graph_doc.relationships
-                logger.info(f"Created a graph representation for {len(doc.chunks)} chunks.")
-                
-            except Exception as e:
-                logger.warning(f"Error while mining graph: {e}")
+                    # written as is by the KnowledgeGraph (see `chunk_graph_rows`)
+                    chunk.graph = graph
+                    if self.checkpoints is not None:
+                        self.checkpoints.save_chunk_graph(doc, chunk)
+                    chunk_span.set_attributes({"graph.nodes": len(graph.nodes), "graph.relationships": len(graph.relationships)})
+                    logger.info(f"Created a graph representation for {len(doc.chunks)} chunks.")
+                    
+                except Exception as e:
+                    chunk_span.record_exception(e)
+                    logger.warning(f"Error while mining graph: {e}")
+                    if self.dead_letters is not None:
+                        self.dead_letters.add("mine", doc, chunk, e)
         
         return doc
 
 
+    @traced("ingestion.mine")
     def mine_graph_from_docs(self, docs: List[ProcessedDocument]) -> List[ProcessedDocument]:
         """
         Mines graphs from a list of `ProcessedDocument` instances.
         """
-        return [self.mine_graph_from_doc_chunks(doc) for doc in docs]
+        return [self.mine_graph_from_doc_chunks(doc) for doc in ingestion_queue("mine", docs)]
     
\ No newline at end of file
@@ -6,6 +6,7 @@ from typing import List, Tuple, Optional, Dict, Any
 from langchain_core.documents import Document
 from langchain_community.document_loaders import TextLoader, Docx2txtLoader, PDFPlumberLoader, BSHTMLLoader
 from src.utils.logger import get_logger
+from src.utils.tracing import current_span, traced
 
 from src.config import Source
 from src.schema import ProcessedDocument
@@ -87,6 +88,7 @@ class Ingestor:
         return processed_doc
 
     
+    @traced("ingestion.load_file")
     def ingest(self, filename: str, metadata: Dict[str, Any]) -> ProcessedDocument | None:
         """ 
         Loads a file from a path and turn it into a `ProcessedDocument`
@@ -95,6 +97,7 @@ class Ingestor:
         base_name = os.path.basename(filename)
 
         document_pages = self.load_file(filename, metadata)
+        current_span().set_attributes({"filename": base_name, "pages": len(document_pages or [])})
 
         try: 
             document_content = self.merge_pages(document_pages)
@@ -107,9 +110,11 @@ class Ingestor:
                 document_content, 
                 metadata
             )
+            current_span().set_attribute("characters", len(document_content))
             return processed_doc
         
     
+    @traced("ingestion.load")
     def batch_ingest(self) -> List[ProcessedDocument]:
         """
         Ingests all files in a folder
@@ -120,4 +125,5 @@ class Ingestor:
             processed_doc = self.ingest(file, metadata)
             if processed_doc:
                 processed_documents.append(processed_doc)
+        current_span().set_attribute("documents", len(processed_documents))
         return processed_documents
\ No newline at end of file
@@ -0,0 +1,62 @@
+from src.graph.graph_model import chunk_graph_rows
+from src.graph.knowledge_graph import KnowledgeGraph
+from src.ingestion.dead_letters import DeadLetters
+from src.ingestion.embedder import ChunkEmbedder
+from src.ingestion.graph_miner import GraphMiner
+from src.utils.logger import get_logger
+from src.utils.tracing import current_span, traced
+
+
+logger = get_logger(__name__)
+
+
+@traced("ingestion.replay")
+def replay_dead_letters(
+        dead_letters: DeadLetters,
+        embedder: ChunkEmbedder,
+        graph_miner: GraphMiner,
+        knowledge_graph: KnowledgeGraph
+    ) -> int:
+    """
+    Replays the Chunks dead-lettered by previous ingestions, i.e. once their provider is back:
+    Chunks whose embedding failed (never stored) are embedded, mined and stored; Chunks whose graph extraction failed
+    (stored without a graph) are mined and their graphs written. The embedder and the miner should dead-letter
+    to `dead_letters`, so that Chunks failing again are kept for the next replay; the dead letters of the others
+    are removed once they are stored.
+
+    Returns the number of Chunks replayed successfully.
+    """
+    unembedded = dead_letters.documents("embed")
+    unmined = dead_letters.documents("mine")
+    taken = sum(len(doc.chunks) for doc in [*unembedded, *unmined])
+    if not taken:
+        return 0
+    logger.info(f"Replaying {taken} dead-lettered chunks")
+
+    replayed = 0
+    if unembedded:
+        # Chunks failing to embed again are dropped from their documents (and dead-lettered again)
+        docs = [doc for doc in embedder.embed_documents_chunks(unembedded) if doc.chunks]
+        knowledge_graph.add_documents(graph_miner.mine_graph_from_docs(docs))
+        dead_letters.resolve("embed", docs)
+        replayed += sum(len(doc.chunks) for doc in docs)
+
+    written = []
+    try:
+        for doc in graph_miner.mine_graph_from_docs(unmined):
+            for chunk in doc.chunks:
+                rows = chunk_graph_rows(chunk)
+                if rows is not None:
+                    knowledge_graph.write_graph(rows, chunk.chunk_id, doc.filename, doc.document_version)
+                    written.append(doc.model_copy(update={"chunks": [chunk]}))
+    finally:
+        # the graphs written before a failure are not replayed again
+        dead_letters.resolve("mine", written)
+        if written:
+            knowledge_graph.bump_graph_version()
+            knowledge_graph.mark_schema_stale()
+    replayed += len(written)
+
+    current_span().set_attributes({"dead_letters.replayed": replayed, "dead_letters.failed_again": taken - replayed})
+    logger.info(f"Replayed {replayed} dead-lettered chunks, {taken - replayed} still failing")
+    return replayed
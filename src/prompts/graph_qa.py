@@ -125,4 +125,63 @@ def get_summarization_prompt() -> PromptTemplate:
 
     template.input_variables = ['history', 'question', 'retrieved_context', 'query_result']
 
-    return template
\ No newline at end of file
+    return template
+
+def get_global_map_prompt() -> PromptTemplate:
+    
+    prompt = """ 
+        You are a helpful virtual assistant.  
+        
+        Your task is to provide a partial answer to the user's question, using only the given summaries of communities of a Knowledge Graph.  
+        Other assistants are answering from other summaries: your answer will be merged with theirs, 
+        so only report what these summaries say about the question.
+        
+        Do not make things up or add any information on your own.  
+        If the summaries are not relevant to the user's question, answer that you don't know.
+        
+        After your answer, on a new line, rate how helpful your answer is to the question 
+        with an integer between 0 (not relevant at all) and 100 (fully answers the question), in the format: 
+        SCORE: <score>
+        
+        QUESTION: {question}
+        
+        COMMUNITY SUMMARIES: {context}
+        
+        PARTIAL ANSWER: 
+    """
+    
+    template = PromptTemplate.from_template(prompt)
+    
+    template.input_variables = ["question", "context"]
+    
+    return template
+
+
+def get_global_reduce_prompt() -> PromptTemplate:
+    
+    prompt = """ 
+        You are a helpful virtual assistant.  
+        
+        Your task is to provide a relevant and comprehensive answer to the user's question, 
+        merging the partial answers that other assistants gave out of different parts of a Knowledge Graph.  
+        Partial answers are sorted from the most to the least helpful.
+        You might also be given the conversation record of your previous interactions with the user.
+        
+        Do not make things up or add any information on your own.  
+        Remove redundancies, and reconcile partial answers when they overlap.
+        If no partial answer is relevant to the user's question, just say that you don't know.
+        
+        CHAT HISTORY: {history}  
+        
+        QUESTION: {question}
+        
+        PARTIAL ANSWERS: {context}
+        
+        HELPFUL ANSWER: 
+    """
+    
+    template = PromptTemplate.from_template(prompt)
+    
+    template.input_variables = ["history", "question", "context"]
+    
+    return template
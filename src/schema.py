@@ -5,6 +5,33 @@ from langchain_core.load.serializable import Serializable
 from langchain_neo4j.graphs.graph_document import Node, Relationship
 
 
+class _Node(Serializable):
+    id: str
+    type: str
+    properties: Optional[Dict[str, str]] = None
+
+
+class _Relationship(Serializable):
+    source: str
+    target: str
+    type: str
+    properties: Optional[Dict[str, str]] = None
+
+
+class _Graph(Serializable):
+    """ 
+    Represents a graph consisting of nodes and relationships.  
+    
+    -----------
+    Attributes:
+    -----------
+        `nodes (List[_Node])`: A list of nodes in the graph.
+        `relationships (List[_Relationship])`: A list of relationships in the graph.
+    """
+    nodes: List[_Node]
+    relationships: List[_Relationship]
+
+
 class Chunk(BaseModel):
     chunk_id: int | str
     text: str
@@ -15,6 +42,7 @@ class Chunk(BaseModel):
     embeddings_model: Optional[str] = None
     nodes: Optional[List[Node]] = None
     relationships: Optional[List[Relationship]] = None
+    graph: Optional[_Graph] = None
 
 
 class ProcessedDocument(BaseModel):
@@ -0,0 +1,35 @@
+from typing import Callable, Hashable, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+
+def chunk_key(doc: Document) -> Hashable:
+    """ Identity of a retrieved Chunk: `(filename, chunk_id)` if available, its text otherwise. """
+    if "filename" in doc.metadata and "chunk_id" in doc.metadata:
+        return (doc.metadata["filename"], doc.metadata["chunk_id"])
+    return doc.page_content
+
+
+def reciprocal_rank_fusion(
+    rankings: List[List[Tuple[Document, float]]],
+    k: int = 60,
+    top_n: Optional[int] = None,
+    key: Callable[[Document], Hashable] = chunk_key
+) -> List[Tuple[Document, float]]:
+    """
+    Merges ranked lists of documents (i.e. from vector and full-text search) with reciprocal rank fusion:
+    each document scores `sum(1 / (k + rank))` over the lists it appears in, so that documents ranked high
+    by several retrievers come first regardless of how each retriever scales its scores.
+    Returns the fused documents with their fused score, best first.
+    """
+    scores = {}
+    documents = {}
+
+    for ranking in rankings:
+        for rank, (doc, _) in enumerate(ranking, start=1):
+            doc_key = key(doc)
+            scores[doc_key] = scores.get(doc_key, 0.0) + 1.0 / (k + rank)
+            documents.setdefault(doc_key, doc)
+
+    fused = sorted(scores, key=scores.get, reverse=True)[:top_n]
+    return [(documents[doc_key], scores[doc_key]) for doc_key in fused]
@@ -0,0 +1,281 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, TypeVar
+
+from src.config import MetricsConf
+from src.utils.logger import get_logger
+
+
+logger = get_logger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_Labels = Tuple[Tuple[str, str], ...]
+
+T = TypeVar("T")
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: _Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [*labels, extra] if extra else list(labels)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Counter:
+    """ Monotonically increasing value, i.e. number of requests. """
+
+    def __init__(self, lock: threading.Lock):
+        self._lock = lock
+        self.value = 0.0
+
+    def inc(self, value: float = 1.0):
+        with self._lock:
+            self.value += value
+
+    def samples(self, name: str, labels: _Labels) -> List[str]:
+        return [f"{name}{_format_labels(labels)} {_format_value(self.value)}"]
+
+
+class Gauge:
+    """ Value going up and down, i.e. the depth of a queue. """
+
+    def __init__(self, lock: threading.Lock):
+        self._lock = lock
+        self.value = 0.0
+
+    def set(self, value: float):
+        with self._lock:
+            self.value = value
+
+    def inc(self, value: float = 1.0):
+        with self._lock:
+            self.value += value
+
+    def dec(self, value: float = 1.0):
+        with self._lock:
+            self.value -= value
+
+    def samples(self, name: str, labels: _Labels) -> List[str]:
+        return [f"{name}{_format_labels(labels)} {_format_value(self.value)}"]
+
+
+class Histogram:
+    """ Distribution of observed values (i.e. latencies) in cumulative buckets, with their sum and count. """
+
+    def __init__(self, lock: threading.Lock, buckets: Sequence[float]):
+        self._lock = lock
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def samples(self, name: str, labels: _Labels) -> List[str]:
+        lines, cumulative = [], 0
+        for bound, count in zip([*self.buckets, float("inf")], self.counts):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else _format_value(bound)
+            lines.append(f"{name}_bucket{_format_labels(labels, ('le', le))} {cumulative}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(self.sum)}")
+        lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+        return lines
+
+
+class _NoOpMetric:
+    """ Metric returned while metrics are disabled: every operation does nothing. """
+
+    def inc(self, value: float = 1.0):
+        pass
+
+    def dec(self, value: float = 1.0):
+        pass
+
+    def set(self, value: float):
+        pass
+
+    def observe(self, value: float):
+        pass
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        yield
+
+
+NOOP_METRIC = _NoOpMetric()
+
+
+class MetricsRegistry:
+    """
+    Registry of metric families (a name, a type and a description) and of their series, one per set of label values.
+    Rendered in the Prometheus text exposition format.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._families: Dict[str, Tuple[str, str]] = {}
+        self._series: Dict[str, Dict[_Labels, Counter | Gauge | Histogram]] = {}
+
+    def _get(self, kind: str, name: str, description: str, labels: Dict[str, str], buckets: Sequence[float] = LATENCY_BUCKETS):
+        key = tuple(sorted((label, str(getattr(value, "value", value))) for label, value in labels.items()))
+        series = self._series.get(name)
+        if series is not None and key in series:
+            return series[key]
+
+        with self._lock:
+            family = self._families.setdefault(name, (kind, description))
+            if family[0] != kind:
+                raise ValueError(f"Metric '{name}' is already registered as a {family[0]}")
+            series = self._series.setdefault(name, {})
+            if key not in series:
+                lock = threading.Lock()
+                series[key] = Histogram(lock, buckets) if kind == "histogram" else (Counter(lock) if kind == "counter" else Gauge(lock))
+            return series[key]
+
+    def counter(self, name: str, description: str, **labels) -> Counter:
+        return self._get("counter", name, description, labels)
+
+    def gauge(self, name: str, description: str, **labels) -> Gauge:
+        return self._get("gauge", name, description, labels)
+
+    def histogram(self, name: str, description: str, buckets: Sequence[float] = LATENCY_BUCKETS, **labels) -> Histogram:
+        return self._get("histogram", name, description, labels, buckets)
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            families = list(self._families.items())
+            series = {name: list(self._series[name].items()) for name, _ in families}
+        for name, (kind, description) in sorted(families):
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, metric in series[name]:
+                lines.extend(metric.samples(name, labels))
+        return "\n".join(lines) + "\n"
+
+
+def _handler(registry: MetricsRegistry):
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return MetricsHandler
+
+
+_registry: Optional[MetricsRegistry] = None
+_server: Optional[ThreadingHTTPServer] = None
+
+
+def configure_metrics(conf: Optional[MetricsConf]) -> Optional[MetricsRegistry]:
+    """
+    Enables metrics, serving them at `http://<host>:<port>/metrics` if a `port` is configured, or disables them if `conf` is `None`.
+    Already enabled metrics are kept (with their values and server), so it can be called on every run of a Streamlit page.
+    LLMs, embeddings and Neo4j drivers are instrumented when created, so metrics should be configured before building them.
+    """
+    global _registry, _server
+    if conf is None:
+        if _server is not None:
+            _server.shutdown()
+        _registry, _server = None, None
+        return None
+
+    if _registry is None:
+        _registry = MetricsRegistry()
+    if conf.port is not None and _server is None:
+        try:
+            _server = ThreadingHTTPServer((conf.host, conf.port), _handler(_registry))
+            threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True).start()
+            logger.info(f"Serving metrics at http://{conf.host}:{conf.port}/metrics")
+        except OSError as e:
+            logger.warning(f"Unable to serve metrics on {conf.host}:{conf.port}: {e}")
+    return _registry
+
+
+def metrics_enabled() -> bool:
+    return _registry is not None
+
+
+def get_registry() -> Optional[MetricsRegistry]:
+    return _registry
+
+
+def counter(name: str, description: str, **labels) -> Counter | _NoOpMetric:
+    if _registry is None:
+        return NOOP_METRIC
+    return _registry.counter(name, description, **labels)
+
+
+def gauge(name: str, description: str, **labels) -> Gauge | _NoOpMetric:
+    if _registry is None:
+        return NOOP_METRIC
+    return _registry.gauge(name, description, **labels)
+
+
+def histogram(name: str, description: str, buckets: Sequence[float] = LATENCY_BUCKETS, **labels) -> Histogram | _NoOpMetric:
+    if _registry is None:
+        return NOOP_METRIC
+    return _registry.histogram(name, description, buckets, **labels)
+
+
+def render() -> str:
+    """ Current metrics in the Prometheus text exposition format (empty if metrics are disabled). """
+    return _registry.render() if _registry is not None else ""
+
+
+def ingestion_queue(stage: str, docs: Sequence[T]) -> Iterator[T]:
+    """
+    Iterates over the documents waiting for an ingestion `stage`, tracking the depth of its queue
+    and counting the documents (and their chunks) once the stage is done with each of them.
+    """
+    if _registry is None:
+        yield from docs
+        return
+
+    depth = gauge("ingestion_queue_depth", "Items waiting for an ingestion stage", stage=stage)
+    documents = counter("ingestion_documents_total", "Documents processed by an ingestion stage", stage=stage)
+    chunks = counter("ingestion_chunks_total", "Chunks processed by an ingestion stage", stage=stage)
+    depth.inc(len(docs))
+    remaining = len(docs)
+    try:
+        for doc in docs:
+            yield doc
+            remaining -= 1
+            depth.dec()
+            documents.inc()
+            chunks.inc(len(getattr(doc, "chunks", None) or []))
+    finally:
+        depth.dec(remaining)
@@ -0,0 +1,44 @@
+from functools import lru_cache
+
+from src.utils.logger import get_logger
+
+
+logger = get_logger(__name__)
+
+DEFAULT_ENCODING = "cl100k_base"
+
+
+@lru_cache(maxsize=None)
+def _get_encoding(encoding_name: str):
+    try:
+        import tiktoken
+        return tiktoken.get_encoding(encoding_name)
+    except Exception as e:
+        logger.warning(f"Tokenizer '{encoding_name}' not available, token counts will be estimated: {e}")
+        return None
+
+
+def count_tokens(text: str, encoding_name: str = DEFAULT_ENCODING) -> int:
+    """
+    Counts the tokens of a text with `tiktoken`.
+    If the tokenizer is not available (i.e. offline), estimates them as one token every 4 characters.
+    """
+    if not text:
+        return 0
+    encoding = _get_encoding(encoding_name)
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text: str, max_tokens: int, encoding_name: str = DEFAULT_ENCODING) -> str:
+    """
+    Truncates a text to at most `max_tokens` tokens.
+    """
+    if max_tokens <= 0:
+        return ""
+    encoding = _get_encoding(encoding_name)
+    if encoding is None:
+        return text[: max_tokens * 4]
+    tokens = encoding.encode(text, disallowed_special=())
+    return text if len(tokens) <= max_tokens else encoding.decode(tokens[:max_tokens])
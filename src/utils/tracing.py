@@ -0,0 +1,233 @@
+import contextvars
+import functools
+import json
+import os
+import secrets
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from src.config import TracingConf, TracingExporter
+from src.utils.logger import get_logger
+
+
+logger = get_logger(__name__)
+
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+
+
+def _iso_time(time_ns: int) -> str:
+    return datetime.fromtimestamp(time_ns / 1e9, tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+class Span:
+    """
+    A timed operation, following the data model of OpenTelemetry spans: a 128 bit trace id shared by all the spans
+    of a trace, a 64 bit span id, the id of the parent span, attributes and events.
+    """
+
+    def __init__(self, tracer: "Tracer", name: str, kind: str, parent: Optional["Span"], attributes: Dict[str, Any]):
+        self._tracer = tracer
+        self.name = name
+        self.kind = kind
+        self.trace_id = parent.trace_id if parent is not None else secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent.span_id if parent is not None else None
+        self.start_time = time.time_ns()
+        self.end_time: Optional[int] = None
+        self.attributes: Dict[str, Any] = {}
+        self.events: List[Dict[str, Any]] = []
+        self.status: Dict[str, str] = {"status_code": "UNSET"}
+        self.set_attributes(attributes)
+
+    def set_attribute(self, key: str, value: Any):
+        if value is None:
+            return
+        if isinstance(value, str) and len(value) > self._tracer.max_attribute_length:
+            value = value[:self._tracer.max_attribute_length]
+        elif not isinstance(value, (str, bool, int, float, list, tuple)):
+            value = str(value)
+        self.attributes[key] = value
+
+    def set_attributes(self, attributes: Dict[str, Any]):
+        for key, value in attributes.items():
+            self.set_attribute(key, value)
+
+    def record_exception(self, e: BaseException):
+        self.status = {"status_code": "ERROR", "description": f"{type(e).__name__}: {e}"}
+        self.events.append({
+            "name": "exception",
+            "timestamp": _iso_time(time.time_ns()),
+            "attributes": {
+                "exception.type": type(e).__name__,
+                "exception.message": str(e),
+                "exception.stacktrace": "".join(traceback.format_exception(e))[-self._tracer.max_attribute_length:]
+            }
+        })
+
+    def end(self):
+        if self.end_time is not None:
+            return
+        self.end_time = time.time_ns()
+        self._tracer.export(self)
+
+    @property
+    def duration(self) -> float:
+        """ Seconds from the start of the span to its end (or to now, if it has not ended). """
+        return ((self.end_time or time.time_ns()) - self.start_time) / 1e9
+
+    def to_dict(self) -> Dict[str, Any]:
+        """ Same layout as the JSON representation of spans printed by the console exporter of the OpenTelemetry SDK. """
+        return {
+            "name": self.name,
+            "context": {"trace_id": f"0x{self.trace_id}", "span_id": f"0x{self.span_id}", "trace_state": "[]"},
+            "kind": f"SpanKind.{self.kind}",
+            "parent_id": f"0x{self.parent_id}" if self.parent_id else None,
+            "start_time": _iso_time(self.start_time),
+            "end_time": _iso_time(self.end_time or time.time_ns()),
+            "status": self.status,
+            "attributes": self.attributes,
+            "events": self.events,
+            "links": [],
+            "resource": {"attributes": {"service.name": self._tracer.service_name}, "schema_url": ""}
+        }
+
+
+class _NoOpSpan:
+    """ Span returned while tracing is disabled: every operation does nothing. """
+    name = ""
+    duration = 0.0
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+    def set_attributes(self, attributes: Dict[str, Any]):
+        pass
+
+    def record_exception(self, e: BaseException):
+        pass
+
+    def end(self):
+        pass
+
+
+NOOP_SPAN = _NoOpSpan()
+
+
+class Tracer:
+    """
+    Records spans and writes each of them, once ended, to the console or to a file (one JSON object per line).
+    """
+
+    def __init__(self, conf: TracingConf):
+        self.exporter = conf.exporter
+        self.path = conf.path
+        self.service_name = conf.service_name
+        self.max_attribute_length = conf.max_attribute_length
+        self._lock = threading.Lock()
+
+        if self.exporter == TracingExporter.FILE and os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+    def start_span(self, name: str, kind: str = "INTERNAL", **attributes) -> Span:
+        return Span(self, name, kind, _current_span.get(), attributes)
+
+    def export(self, span: Span):
+        line = json.dumps(span.to_dict(), default=str)
+        try:
+            with self._lock:
+                if self.exporter == TracingExporter.CONSOLE:
+                    print(line, flush=True)
+                else:
+                    with open(self.path, "a") as f:
+                        f.write(line + "\n")
+        except Exception as e:
+            logger.warning(f"Failed to export span '{span.name}': {e}")
+
+
+_tracer: Optional[Tracer] = None
+
+
+def configure_tracing(conf: Optional[TracingConf]):
+    """
+    Enables tracing with the given configuration, or disables it if `conf` is `None`.
+    LLMs, embeddings and Neo4j drivers are instrumented when they are created, so tracing
+    should be configured before building the ingestion pipeline or the `GraphAgentResponder`.
+    """
+    global _tracer
+    _tracer = Tracer(conf) if conf is not None else None
+    if conf is not None:
+        logger.info(f"Tracing enabled, exporting spans to {conf.path if conf.exporter == TracingExporter.FILE else conf.exporter.value}")
+
+
+def tracing_enabled() -> bool:
+    return _tracer is not None
+
+
+def current_span() -> Span | _NoOpSpan:
+    """ The innermost active span of the current thread (or context), to add attributes to it. """
+    if _tracer is None:
+        return NOOP_SPAN
+    return _current_span.get() or NOOP_SPAN
+
+
+def start_span(name: str, kind: str = "INTERNAL", **attributes) -> Span | _NoOpSpan:
+    """
+    Starts a span, child of the active one, without making it active: the caller must `end` it.
+    Used for operations ending outside the block that started them (i.e. streamed query results).
+    """
+    if _tracer is None:
+        return NOOP_SPAN
+    return _tracer.start_span(name, kind, **attributes)
+
+
+@contextmanager
+def span(name: str, kind: str = "INTERNAL", **attributes) -> Iterator[Span | _NoOpSpan]:
+    """
+    Runs the block within a span, child of the active one, which is active until the block exits.
+    Exceptions raised by the block are recorded on the span and re-raised.
+    """
+    if _tracer is None:
+        yield NOOP_SPAN
+        return
+
+    current = _tracer.start_span(name, kind, **attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.record_exception(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        current.end()
+
+
+def traced(name: str, kind: str = "INTERNAL") -> Callable:
+    """
+    Decorator running each call of the function within a span named `name`.
+    The function can add attributes to its span through `current_span()`.
+    """
+    def decorator(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _tracer is None:
+                return fn(*args, **kwargs)
+            with span(name, kind):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def propagate(fn: Callable) -> Callable:
+    """
+    Binds `fn` to the current context, so that spans it starts in a worker thread
+    are children of the span active when it was submitted.
+    """
+    if _tracer is None:
+        return fn
+    context = contextvars.copy_context()
+    return functools.partial(context.run, fn)